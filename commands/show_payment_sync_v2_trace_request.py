@@ -3,53 +3,28 @@ Show a single Payment Sync V2 trace request (grouped by rid).
 
 Usage:
   python commands/show_payment_sync_v2_trace_request.py 2158e6f225
-  python commands/show_payment_sync_v2_trace_request.py 2158e6f225 logs/payment_sync_v2_trace.json
+  python commands/show_payment_sync_v2_trace_request.py 2158e6f225 logs/payment_sync_v2_trace.jsonl
+
+Looks the rid up in the sidecar offset index of the trace and its rotated
+segments and only reads those events (see mysite/trace_reader.py).
 """
 
 from __future__ import annotations
 
 import json
+import os
 import sys
+from pathlib import Path
 
 
-def iter_json_objects(path: str):
-    # File currently contains multiple JSON objects concatenated (not valid JSON array).
-    # We'll parse by scanning braces.
-    with open(path, "r", encoding="utf-8") as f:
-        s = f.read()
-
-    depth = 0
-    start = None
-    in_str = False
-    esc = False
+def _import_reader():
+    # When running as "python commands/...", ensure project root is on sys.path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from mysite import trace_reader
 
-    for i, ch in enumerate(s):
-        if in_str:
-            if esc:
-                esc = False
-            elif ch == "\\":
-                esc = True
-            elif ch == '"':
-                in_str = False
-            continue
-        else:
-            if ch == '"':
-                in_str = True
-                continue
-
-        if ch == "{":
-            if depth == 0:
-                start = i
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0 and start is not None:
-                chunk = s[start : i + 1]
-                start = None
-                try:
-                    yield json.loads(chunk)
-                except Exception:
-                    continue
+    return trace_reader
 
 
 def main():
@@ -57,19 +32,20 @@ def main():
         print("missing rid")
         sys.exit(1)
 
+    trace_reader = _import_reader()
     rid = sys.argv[1].strip()
-    path = sys.argv[2] if len(sys.argv) > 2 else "logs/payment_sync_v2_trace.json"
-
-    events = [e for e in iter_json_objects(path) if str(e.get("rid")) == rid]
-    if not events:
-        print(f"no events for rid={rid} in {path}")
-        return
+    path = sys.argv[2] if len(sys.argv) > 2 else (
+        os.getenv("PAYMENT_SYNC_V2_TRACE_PATH") or "logs/payment_sync_v2_trace.jsonl"
+    )
 
+    found = False
     # Preserve file order; optionally also sort by step when needed.
-    for e in events:
+    for e in trace_reader.query(path, rid=rid):
+        found = True
         print(json.dumps(e, indent=2, ensure_ascii=False))
+    if not found:
+        print(f"no events for rid={rid} in {path}")
 
 
 if __name__ == "__main__":
     main()
-
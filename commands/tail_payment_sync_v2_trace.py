@@ -1,47 +1,84 @@
 """
-Tail the Payment Sync V2 trace file (JSONL).
+Tail / query the Payment Sync V2 trace (JSONL), including rotated .gz segments.
 
 Usage:
   python commands/tail_payment_sync_v2_trace.py
   python commands/tail_payment_sync_v2_trace.py 200
+  python commands/tail_payment_sync_v2_trace.py 50 --step 'fetch_db_payments_for_matching.*'
+  python commands/tail_payment_sync_v2_trace.py --rid 2158e6f225 --all
+  python commands/tail_payment_sync_v2_trace.py --since 2h --until 30m --all --compact
+  python commands/tail_payment_sync_v2_trace.py 20 -f
+
+Reads go through the sidecar offset index (<trace>.jsonl.idx), which is
+extended incrementally, so memory use does not grow with the trace size.
 """
 
 from __future__ import annotations
 
+import argparse
 import json
 import os
 import sys
+from pathlib import Path
 
 
-def main():
-    n = 80
-    if len(sys.argv) > 1:
-        try:
-            n = int(sys.argv[1])
-        except Exception:
-            n = 80
+def _import_reader():
+    # When running as "python commands/...", ensure project root is on sys.path
+    project_root = Path(__file__).resolve().parents[1]
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from mysite import trace_reader
+
+    return trace_reader
+
+
+def _print(event, compact):
+    if compact:
+        print(json.dumps(event, ensure_ascii=False))
+    else:
+        print(json.dumps(event, indent=2, ensure_ascii=False))
 
-    path = os.getenv("PAYMENT_SYNC_V2_TRACE_PATH") or "logs/payment_sync_v2_trace.jsonl"
+
+def main():
+    trace_reader = _import_reader()
+    parser = argparse.ArgumentParser(description="Tail / query the Payment Sync V2 trace")
+    parser.add_argument("n", nargs="?", type=int, default=80, help="number of events to show (default 80)")
+    parser.add_argument("--path", default=os.getenv("PAYMENT_SYNC_V2_TRACE_PATH") or "logs/payment_sync_v2_trace.jsonl")
+    parser.add_argument("--rid", help="request id")
+    parser.add_argument("--step", help="step name or pattern, e.g. 'fetch_db_*'")
+    parser.add_argument("--since", help="ISO date/time or age (15m, 2h, 1d)")
+    parser.add_argument("--until", help="ISO date/time or age (15m, 2h, 1d)")
+    parser.add_argument("--all", action="store_true", help="all matching events in file order instead of the last n")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep printing new matching events")
+    parser.add_argument("--compact", action="store_true", help="one JSON line per event")
+    args = parser.parse_args()
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"missing: {path}")
+        filters = {
+            "rid": args.rid,
+            "step": args.step,
+            "since": trace_reader.parse_time(args.since),
+            "until": trace_reader.parse_time(args.until),
+        }
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not trace_reader.trace_segments(args.path) and not args.follow:
+        print(f"missing: {args.path}")
         return
 
-    for line in lines[-n:]:
-        line = line.strip()
-        if not line:
-            continue
+    events = trace_reader.query(args.path, **filters) if args.all else trace_reader.tail(args.path, args.n, **filters)
+    for event in events:
+        _print(event, args.compact)
+
+    if args.follow:
         try:
-            obj = json.loads(line)
-        except Exception:
-            print(line)
-            continue
-        print(json.dumps(obj, indent=2, ensure_ascii=False))
+            for event in trace_reader.follow(args.path, **filters):
+                _print(event, args.compact)
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == "__main__":
     main()
-
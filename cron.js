@@ -160,4 +160,20 @@ cron.schedule('0 21 * * *', function () {
         '/usr/bin/python3 /home/superuser/site/manage.py telegram_manager_activity',
         '/home/superuser/site/'
     );
-});
\ No newline at end of file
+});
+// Roll up closed hours of the audit/error/system logs for the activity report and dashboard
+cron.schedule('*/15 * * * *', function () {
+    executeCronCommand(
+        'Compact Activity Rollups',
+        '/usr/bin/python3 /home/superuser/site/manage.py compact_activity_rollups',
+        '/home/superuser/site/'
+    );
+});
+// Fail report exports whose background thread died with its worker (restart, deploy)
+cron.schedule('*/15 * * * *', function () {
+    executeCronCommand(
+        'Fail Stale Report Exports',
+        '/usr/bin/python3 /home/superuser/site/manage.py fail_stale_report_exports',
+        '/home/superuser/site/'
+    );
+});
@@ -0,0 +1,294 @@
+"""
+Hourly rollups of AuditLog, ErrorLog and SystemLog for the manager activity
+report and the database activity dashboard.
+
+``compact`` closes every hour that ended more than SETTLE_SECONDS ago: the
+raw rows of those hours are counted once per (user, kind, action, apartment)
+into ActivityRollup and the source's ActivityRollupCursor moves forward, so
+each raw row is read by the compactor exactly once. It only runs from cron
+(compact_activity_rollups), so the first run after deploy backfills the
+history outside any request; until then readers count the raw rows.
+
+``counts`` answers "how many rows between start and now" per any of the
+dimensions: closed hours come from the rollup, only the partial first hour
+and the hours not closed yet are counted from the raw table, so the cost
+depends on the window length and not on how many rows were logged.
+
+Dimensions per source:
+    audit   user=changed_by  kind=model_name  action=action    apartment_id
+    error   user=username    kind=source      action=severity
+    system  user=username    kind=category    action=level
+
+Audit updates that only touched auto-updated fields (``has_real_changes``) are
+also counted in ``noise``; the daily report leaves them out.
+
+Environment:
+    ACTIVITY_ROLLUP_SETTLE_SECONDS   age of an hour's end before it is rolled up (default 300)
+"""
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import OperationalError, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+logger = logging.getLogger('mysite.common')
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+# Late rows (error aggregator flushes, slow transactions) must be in before an hour is closed
+SETTLE_SECONDS = _env_int('ACTIVITY_ROLLUP_SETTLE_SECONDS', 300)
+# Hours rolled up per transaction when catching up on history
+CHUNK_HOURS = 24
+# Readers re-read the rollup cursors at most this often per process
+COMPACT_CHECK_SECONDS = 60
+
+DIMENSIONS = ('user', 'kind', 'action', 'apartment_id')
+
+SOURCES = {
+    'audit': {'model': 'AuditLog', 'user': 'changed_by', 'kind': 'model_name', 'action': 'action', 'apartment_id': 'apartment_id'},
+    'error': {'model': 'ErrorLog', 'user': 'username', 'kind': 'source', 'action': 'severity'},
+    'system': {'model': 'SystemLog', 'user': 'username', 'kind': 'category', 'action': 'level'},
+}
+
+# Fields to ignore (auto-updated timestamps and tracking fields, not real changes)
+IGNORED_FIELDS = [
+    'updated_at', 'created_at', 'modified_at', 'last_modified', 'timestamp',
+    'last_updated_by', 'last_updated_at', 'modified_by', 'created_by'
+]
+
+
+def format_value(value):
+    """Format a value for display (no shortening; only trim whitespace)."""
+    if value is None:
+        return "None"
+    # Keep full value; just trim edges and avoid multiline breaking formatting.
+    value_str = str(value).strip()
+    value_str = " ".join(value_str.splitlines()).strip()
+    return value_str
+
+
+def _real_update(changed_fields, old_values, new_values):
+    for field in changed_fields or []:
+        if field in IGNORED_FIELDS:
+            continue
+        old_val = old_values.get(field) if old_values else None
+        new_val = new_values.get(field) if new_values else None
+        if format_value(old_val) != format_value(new_val):
+            return True
+    return False
+
+
+def has_real_changes(log):
+    """
+    Check if a log entry has real changes (not just auto-updated timestamps).
+    Returns True if there are meaningful field changes.
+    Also filters out false positives where old and new values display the same (e.g. 3300.0 → 3300.0).
+    """
+    if log.action != 'update':
+        return True  # Creates and deletes are always real changes
+    return _real_update(log.changed_fields, log.old_values, log.new_values)
+
+
+def floor_hour(dt):
+    return dt.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(dt):
+    floor = floor_hour(dt)
+    return floor if floor == dt else floor + timedelta(hours=1)
+
+
+def _raw_model(source):
+    from django.apps import apps
+
+    return apps.get_model('mysite', SOURCES[source]['model'])
+
+
+def raw_lookups(source, lookups):
+    """Translate ``{'user__icontains': ...}`` style lookups to the raw model's field names."""
+    spec = SOURCES[source]
+    translated = {}
+    for lookup, value in (lookups or {}).items():
+        name, sep, rest = lookup.partition('__')
+        if name not in spec or name == 'model':
+            raise ValueError(f"{source} rollups have no '{name}' dimension")
+        translated[spec[name] + sep + rest] = value
+    return translated
+
+
+def _aggregate(source, queryset, noise=True):
+    """{(period_start, user, kind, action, apartment_id): [count, noise]} for raw rows."""
+    spec = SOURCES[source]
+    fields = [spec[d] for d in DIMENSIONS if d in spec]
+    utc = dt_timezone.utc
+    totals = defaultdict(lambda: [0, 0])
+
+    def key(row):
+        return (row['period'], row[spec['user']] or '', row[spec['kind']] or '', row[spec['action']] or '',
+                row.get(spec.get('apartment_id')) or 0)
+
+    grouped = (queryset.annotate(period=TruncHour('timestamp', tzinfo=utc)).values('period', *fields)
+               .annotate(n=Count('id')).order_by())
+    for row in grouped:
+        totals[key(row)][0] += row['n']
+    if source == 'audit' and noise:
+        updates = (queryset.filter(action='update').annotate(period=TruncHour('timestamp', tzinfo=utc))
+                   .values('period', *fields, 'changed_fields', 'old_values', 'new_values'))
+        for row in updates.iterator(chunk_size=2000):
+            if not _real_update(row['changed_fields'], row['old_values'], row['new_values']):
+                totals[key(row)][1] += 1
+    return totals
+
+
+def _compact_chunk(source, closed_until):
+    """Roll up the next chunk of closed hours; returns rows written or None when up to date / locked."""
+    from mysite.models import ActivityRollup, ActivityRollupCursor
+
+    raw = _raw_model(source).objects
+    with transaction.atomic():
+        cursor = ActivityRollupCursor.objects.select_for_update(nowait=True).get(source=source)
+        start = cursor.closed_until
+        if start is None:
+            first = raw.order_by('timestamp').values_list('timestamp', flat=True).first()
+            start = floor_hour(first) if first else closed_until
+        if start >= closed_until:
+            if cursor.closed_until is None:
+                cursor.closed_until = closed_until
+                cursor.save(update_fields=['closed_until'])
+            _remember_closed(source, cursor.closed_until)
+            return None
+        end = min(closed_until, start + timedelta(hours=CHUNK_HOURS))
+        totals = _aggregate(source, raw.filter(timestamp__gte=start, timestamp__lt=end))
+        ActivityRollup.objects.filter(source=source, period_start__gte=start, period_start__lt=end).delete()
+        ActivityRollup.objects.bulk_create([
+            ActivityRollup(source=source, period_start=period, user=user[:255], kind=kind[:100], action=action[:20],
+                           apartment_id=apartment_id, count=count, noise=noise)
+            for (period, user, kind, action, apartment_id), (count, noise) in totals.items()
+        ], batch_size=1000)
+        cursor.closed_until = end
+        cursor.save(update_fields=['closed_until'])
+        _remember_closed(source, end)
+        return len(totals)
+
+
+def compact(now=None):
+    """
+    Roll up every hour that closed before ``now - SETTLE_SECONDS`` and was
+    not rolled up yet. Returns the number of rollup rows written; a source
+    another process is compacting right now is skipped.
+    """
+    from mysite.models import ActivityRollupCursor
+
+    closed_until = floor_hour((now or timezone.now()) - timedelta(seconds=SETTLE_SECONDS))
+    written = 0
+    for source in SOURCES:
+        ActivityRollupCursor.objects.get_or_create(source=source)
+        while True:
+            try:
+                rows = _compact_chunk(source, closed_until)
+            except OperationalError:
+                logger.info(f"Activity rollup for {source} is being compacted by another process")
+                break
+            if rows is None:
+                break
+            written += rows
+    return written
+
+
+# Cursors only move forward, so an older closed_until just means a longer raw tail
+_closed = {}
+_closed_checked_at = 0.0
+
+
+def _remember_closed(source, value):
+    transaction.on_commit(lambda: _closed.__setitem__(source, value))
+
+
+def closed_until(source):
+    """Where the rollup of ``source`` ends (None before the first compaction); cached for COMPACT_CHECK_SECONDS."""
+    global _closed, _closed_checked_at
+    from mysite.models import ActivityRollupCursor
+
+    now = time.monotonic()
+    if now - _closed_checked_at >= COMPACT_CHECK_SECONDS:
+        _closed = dict(ActivityRollupCursor.objects.values_list('source', 'closed_until'))
+        _closed_checked_at = now
+    return _closed.get(source)
+
+
+def counts(source, start, end=None, group_by=('action',), filters=None, excludes=None, noise=True):
+    """
+    Row counts of ``source`` with timestamp in [start, end) grouped by
+    ``group_by`` (any of DIMENSIONS), as dicts with the group fields plus
+    ``count`` and ``noise``. ``filters``/``excludes`` are lookups on the
+    dimension names, e.g. {'user__icontains': 'anna', 'kind__in': [...]}.
+    Pass noise=False when the audit noise count is not needed (one query less).
+    """
+    from mysite.models import ActivityRollup
+
+    end = end or timezone.now()
+    totals = defaultdict(lambda: [0, 0])
+    rolled_from = ceil_hour(start)
+    closed = closed_until(source)
+    rolled_to = min(closed, floor_hour(end)) if closed else rolled_from
+    in_raw = Q(timestamp__gte=start, timestamp__lt=end)
+
+    if rolled_to > rolled_from:
+        # Partial first hour and the hours not rolled up yet, in one query
+        in_raw = Q(timestamp__gte=start, timestamp__lt=rolled_from) | Q(timestamp__gte=rolled_to, timestamp__lt=end)
+        rollups = (ActivityRollup.objects.filter(source=source, period_start__gte=rolled_from, period_start__lt=rolled_to)
+                   .filter(**(filters or {})).exclude(**(excludes or {}))
+                   .values(*group_by).annotate(n=Sum('count'), noise_n=Sum('noise')).order_by())
+        for row in rollups:
+            total = totals[tuple(row[field] for field in group_by)]
+            total[0] += row['n']
+            total[1] += row['noise_n']
+
+    raw = (_raw_model(source).objects.filter(in_raw).filter(**raw_lookups(source, filters))
+           .exclude(**raw_lookups(source, excludes)))
+    positions = [DIMENSIONS.index(field) + 1 for field in group_by]
+    for key, (count, noise_count) in _aggregate(source, raw, noise=noise).items():
+        total = totals[tuple(key[i] for i in positions)]
+        total[0] += count
+        total[1] += noise_count
+
+    return [{**dict(zip(group_by, key)), 'count': count, 'noise': noise_count}
+            for key, (count, noise_count) in totals.items()]
+
+
+def count_by(source, field, start, **kwargs):
+    """{value of ``field``: count} over [start, now), see ``counts``."""
+    kwargs.setdefault('noise', False)
+    return {row[field]: row['count'] for row in counts(source, start, group_by=(field,), **kwargs)}
+
+
+def distinct_values(source, *fields):
+    """
+    {field: every value of that dimension ever logged for ``source``}
+    from the rollup plus the raw rows not rolled up yet (two queries).
+    """
+    from mysite.models import ActivityRollup
+
+    values = {field: set() for field in fields}
+    spec = SOURCES[source]
+    raw = _raw_model(source).objects
+    closed = closed_until(source)
+    if closed:
+        raw = raw.filter(timestamp__gte=closed)
+    rows = list(ActivityRollup.objects.filter(source=source).values_list(*fields).distinct())
+    rows += raw.values_list(*[spec[field] for field in fields]).distinct()
+    for row in rows:
+        for field, value in zip(fields, row):
+            values[field].add(value or '')
+    return values
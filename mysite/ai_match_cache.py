@@ -0,0 +1,142 @@
+"""
+Persistent cache and usage stats for AI payment matching (payment sync v2).
+
+The cache key is a SHA-256 over the model, the exact system and user messages
+(which contain the composite selection and every serialized candidate) and
+the candidate (id, updated_at) pairs. Re-running a selection whose inputs
+did not change returns the stored answer without calling the model. Saving
+a candidate payment (or QuerySet.update(), which skips signals) changes its
+updated_at or serialized fields and so the key; deleting one deletes the
+entries that listed it (see ``invalidate_payments`` in mysite/signals.py).
+
+Usage:
+    key = match_cache_key(model, system_msg, user_msg, candidates)
+    entries = lookup([key], stats)          # {key: AIMatchCacheEntry}, hits recorded
+    store(key, model, parsed, [p.id for p in candidates], usage)
+"""
+import hashlib
+import json
+import threading
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+
+def match_cache_key(model, system_msg, user_msg, candidate_payments):
+    versions = sorted(
+        (p.id, p.updated_at.isoformat() if getattr(p, 'updated_at', None) else None) for p in candidate_payments
+    )
+    raw = json.dumps([model, system_msg, user_msg, versions], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def usage_from_response(resp):
+    usage = getattr(resp, 'usage', None)
+    return {
+        'prompt_tokens': int(getattr(usage, 'prompt_tokens', 0) or 0),
+        'completion_tokens': int(getattr(usage, 'completion_tokens', 0) or 0),
+    }
+
+
+class AIMatchStats:
+    """Hit/miss and token counters for one request or batch (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tokens_saved = 0
+
+    def hit(self, entry):
+        with self._lock:
+            self.requests += 1
+            self.cache_hits += 1
+            self.tokens_saved += entry.prompt_tokens + entry.completion_tokens
+
+    def miss(self, usage=None, error=False):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            if usage:
+                self.prompt_tokens += usage.get('prompt_tokens', 0)
+                self.completion_tokens += usage.get('completion_tokens', 0)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'hit_rate': round(self.cache_hits / self.requests, 3) if self.requests else 0.0,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_saved': self.tokens_saved,
+        }
+
+
+def lookup(keys, stats=None):
+    """Cached entries for ``keys`` in one query; records the hits."""
+    from mysite.models import AIMatchCacheEntry
+
+    entries = {entry.key: entry for entry in AIMatchCacheEntry.objects.filter(key__in=set(keys))}
+    if entries:
+        AIMatchCacheEntry.objects.filter(key__in=list(entries)).update(
+            hit_count=F('hit_count') + 1, last_hit_at=timezone.now()
+        )
+        if stats is not None:
+            for key in keys:
+                if key in entries:
+                    stats.hit(entries[key])
+    return entries
+
+
+def store(key, model, response, payment_ids, usage=None):
+    from mysite.models import AIMatchCacheEntry
+
+    usage = usage or {}
+    AIMatchCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={
+            'model': model,
+            'response': response,
+            'payment_ids': sorted(set(payment_ids)),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+        },
+    )
+
+
+def invalidate_payments(payment_ids):
+    from mysite.models import AIMatchCacheEntry
+
+    ids = [pid for pid in payment_ids if pid is not None]
+    if not ids:
+        return 0
+    condition = reduce(or_, (Q(payment_ids__contains=[pid]) for pid in ids))
+    deleted, _ = AIMatchCacheEntry.objects.filter(condition).delete()
+    return deleted
+
+
+def cache_stats():
+    """Totals over all cached entries: entries, hits, tokens spent filling the cache and tokens saved by hits."""
+    from mysite.models import AIMatchCacheEntry
+
+    totals = AIMatchCacheEntry.objects.aggregate(
+        entries=Count('id'),
+        total_hits=Sum('hit_count'),
+        total_prompt_tokens=Sum('prompt_tokens'),
+        total_completion_tokens=Sum('completion_tokens'),
+        total_tokens_saved=Sum((F('prompt_tokens') + F('completion_tokens')) * F('hit_count')),
+    )
+    return {
+        'entries': totals['entries'],
+        'hits': totals['total_hits'] or 0,
+        'prompt_tokens': totals['total_prompt_tokens'] or 0,
+        'completion_tokens': totals['total_completion_tokens'] or 0,
+        'tokens_saved': totals['total_tokens_saved'] or 0,
+    }
@@ -3,6 +3,11 @@ ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served through ASGI, the live chat stream (/chat/<sid>/stream/) waits for new
+messages without holding a worker thread and stays open up to
+CHAT_STREAM_MAX_SECONDS; under WSGI the same URL answers one short poll as
+JSON and the page polls every CHAT_POLL_SECONDS (see mysite/chat_stream.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
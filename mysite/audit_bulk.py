@@ -1,18 +1,29 @@
 """
-Audit logging for QuerySet.update(), which bypasses model save() and post_save signals.
+Audit logging for QuerySet.update(), bulk_create() and bulk_update(), which
+bypass model save() and the post_save signals. They also bump the view cache
+versions the signals would have bumped, once the transaction commits (see
+mysite/view_cache.py).
 """
 from mysite.signals import (
     _values_equal,
+    get_audit_contexts,
     get_current_user_info,
+    get_model_fields,
     serialize_value,
     should_track_model,
 )
+from mysite.view_cache import bump_model_versions
 
 
 def _field_values_from_instance(obj, field_names):
     return {f: serialize_value(getattr(obj, f)) for f in field_names}
 
 
+def audit_snapshot(obj, field_names):
+    """Serialized values of ``field_names`` on ``obj``; take it before changing obj for audit_bulk_update()."""
+    return _field_values_from_instance(obj, field_names)
+
+
 def audit_queryset_update(queryset, *, changed_by=None, **kwargs):
     """
     Run queryset.update(**kwargs) and append AuditLog rows for each affected object,
@@ -23,7 +34,10 @@ def audit_queryset_update(queryset, *, changed_by=None, **kwargs):
 
     model = queryset.model
     if not should_track_model(model()):
-        return queryset.update(**kwargs)
+        rows_updated = queryset.update(**kwargs)
+        if rows_updated:
+            bump_model_versions(model.__name__)
+        return rows_updated
 
     from mysite.models import AuditLog
 
@@ -37,10 +51,13 @@ def audit_queryset_update(queryset, *, changed_by=None, **kwargs):
         old_rows[obj.pk] = _field_values_from_instance(obj, fields)
 
     rows_updated = queryset.update(**kwargs)
+    if rows_updated:
+        bump_model_versions(model.__name__)
 
     by = changed_by if changed_by is not None else get_current_user_info()
 
     after_by_pk = {o.pk: o for o in model.objects.filter(pk__in=pks)}
+    contexts = dict(zip(after_by_pk, get_audit_contexts(after_by_pk.values())))
 
     for pk in pks:
         obj = after_by_pk.get(pk)
@@ -64,6 +81,79 @@ def audit_queryset_update(queryset, *, changed_by=None, **kwargs):
             old_values={f: old_subset.get(f) for f in changed_fields},
             new_values={f: new_subset.get(f) for f in changed_fields},
             changed_fields=changed_fields,
+            **contexts[pk],
         )
 
     return rows_updated
+
+
+def audit_bulk_create(model, objs, *, changed_by=None, batch_size=None):
+    """
+    Run model.objects.bulk_create(objs) and write one 'create' AuditLog per
+    object with a single bulk insert, matching the shape of the post_save
+    create logs. Load the relations used by str(obj) beforehand, otherwise
+    each object costs a query.
+    """
+    objs = model.objects.bulk_create(objs, batch_size=batch_size)
+    if objs:
+        bump_model_versions(model.__name__)
+    if not objs or not should_track_model(objs[0]):
+        return objs
+
+    from mysite.models import AuditLog
+
+    by = changed_by if changed_by is not None else get_current_user_info()
+    logs = []
+    for obj, context in zip(objs, get_audit_contexts(objs)):
+        new_values = get_model_fields(obj)
+        logs.append(AuditLog(
+            model_name=model.__name__,
+            object_id=str(obj.pk),
+            object_repr=str(obj),
+            action="create",
+            changed_by=by,
+            new_values=new_values,
+            changed_fields=list(new_values.keys()),
+            **context,
+        ))
+    AuditLog.objects.bulk_create(logs, batch_size=batch_size)
+    return objs
+
+
+def audit_bulk_update(objs, fields, before, *, changed_by=None, batch_size=None):
+    """
+    Run bulk_update(objs, fields) and write one 'update' AuditLog per object
+    whose ``fields`` changed, with a single bulk insert. ``before`` maps pk to
+    audit_snapshot(obj, fields) taken before the objects were modified.
+    """
+    if not objs:
+        return 0
+    model = type(objs[0])
+    rows_updated = model.objects.bulk_update(objs, fields, batch_size=batch_size)
+    bump_model_versions(model.__name__)
+    if not should_track_model(objs[0]):
+        return rows_updated
+
+    from mysite.models import AuditLog
+
+    by = changed_by if changed_by is not None else get_current_user_info()
+    logs = []
+    for obj, context in zip(objs, get_audit_contexts(objs)):
+        new_subset = _field_values_from_instance(obj, fields)
+        old_subset = before.get(obj.pk, {})
+        changed_fields = [f for f in fields if not _values_equal(old_subset.get(f), new_subset.get(f))]
+        if not changed_fields:
+            continue
+        logs.append(AuditLog(
+            model_name=model.__name__,
+            object_id=str(obj.pk),
+            object_repr=str(obj),
+            action="update",
+            changed_by=by,
+            old_values={f: old_subset.get(f) for f in changed_fields},
+            new_values={f: new_subset.get(f) for f in changed_fields},
+            changed_fields=changed_fields,
+            **context,
+        ))
+    AuditLog.objects.bulk_create(logs, batch_size=batch_size)
+    return rows_updated
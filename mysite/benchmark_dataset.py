@@ -0,0 +1,260 @@
+"""
+Deterministic synthetic dataset for benchmarks (see benchmark_suite).
+
+``generate_dataset(scale, seed, anchor)`` bulk-creates apartments, tenants,
+bookings, payments, cleanings, parking, Twilio conversations/messages and
+audit log rows. The same (scale, seed, anchor) always produces the same
+rows; dates are laid out around ``anchor`` (default: today) so date-window
+views see current, past and future stays. Call it inside a transaction that
+is rolled back afterwards:
+
+    with transaction.atomic():
+        dataset = generate_dataset(scale=2, seed=42)
+        ...
+        transaction.set_rollback(True)
+
+Rows are created with bulk_create, so model save() side effects
+(notifications, contracts, per-row audit) do not run.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+# Rows per unit of scale
+APARTMENTS_PER_SCALE = 40
+PARKINGS_PER_SCALE = 20
+AUDIT_LOGS_PER_SCALE = 5000
+BOOKINGS_PER_APARTMENT = 12
+PARKING_BOOKINGS_PER_SPOT = 6
+CONVERSATION_SHARE = 0.25
+MESSAGES_PER_CONVERSATION = 30
+CLEANERS = 4
+MANAGERS = 3
+
+BUILDINGS = ('Ocean Tower', 'Palm Court', 'Bay Harbor', 'Sunset Plaza', 'Coral Way')
+STREETS = ('Collins Ave', 'Ocean Dr', 'Biscayne Blvd', 'Brickell Ave', 'Alton Rd')
+FIRST_NAMES = ('Anna', 'Ben', 'Carla', 'David', 'Elena', 'Felix', 'Grace', 'Hugo', 'Ivy', 'Jonas', 'Kira', 'Leo')
+LAST_NAMES = ('Smith', 'Garcia', 'Muller', 'Rossi', 'Novak', 'Silva', 'Kim', 'Dubois', 'Ivanov', 'Cohen')
+QUESTIONS = (
+    "What is the wifi password?",
+    "Where can I park the car?",
+    "What time is check-out?",
+    "Is there a hair dryer in the apartment?",
+    "How do I use the washing machine?",
+    "Can we check in earlier tomorrow?",
+)
+ANSWERS = (
+    "Wifi details are on the fridge.",
+    "Parking spot is in the garage, level 2.",
+    "Check-out is at 11 AM.",
+    "Yes, in the bathroom cabinet.",
+    "Instructions are next to the machine.",
+)
+
+
+@dataclass
+class BenchmarkDataset:
+    seed: int
+    scale: float
+    anchor: date
+    admin: object = None
+    manager: object = None
+    payment_types: dict = field(default_factory=dict)
+    apartment_ids: list = field(default_factory=list)
+    booking_ids: list = field(default_factory=list)
+    conversations: list = field(default_factory=list)  # [(conversation_sid, tenant_phone)]
+    counts: dict = field(default_factory=dict)
+
+
+def _scaled(base, scale):
+    return max(1, int(round(base * scale)))
+
+
+def generate_dataset(scale=1.0, seed=42, anchor=None, prefix='bench'):
+    from mysite.models import (
+        Apartment, AuditLog, Booking, Cleaning, Parking, ParkingBooking, PaymenType, Payment,
+        PaymentMethod, TwilioConversation, TwilioMessage, User,
+    )
+
+    rng = random.Random(seed)
+    anchor = anchor or date.today()
+    tag = f"{prefix}-{seed}"
+    dataset = BenchmarkDataset(seed=seed, scale=scale, anchor=anchor)
+
+    # Staff
+    dataset.admin = User.objects.create(email=f'{tag}-admin@example.com', full_name='Benchmark Admin', role='Admin')
+    managers = User.objects.bulk_create([
+        User(email=f'{tag}-manager-{i}@example.com', full_name=f'Benchmark Manager {i}', role='Manager',
+             phone=f'+1305900{i:04d}')
+        for i in range(MANAGERS)
+    ])
+    dataset.manager = managers[0]
+    cleaners = User.objects.bulk_create([
+        User(email=f'{tag}-cleaner-{i}@example.com', full_name=f'Benchmark Cleaner {i}', role='Cleaner')
+        for i in range(CLEANERS)
+    ])
+    owner = User.objects.create(email=f'{tag}-owner@example.com', full_name='Benchmark Owner', role='Owner')
+
+    # Reference data
+    for name, kind in (('Rent', 'In'), ('Security Deposit', 'In'), ('Cleaning Fee', 'Out'), ('Utilities', 'Out')):
+        dataset.payment_types[name] = PaymenType.objects.create(
+            name=f'{name} ({tag})', type=kind, category='Operating',
+            balance_sheet_name='Receivables' if kind == 'In' else 'Paybels',
+        )
+    methods = PaymentMethod.objects.bulk_create([
+        PaymentMethod(name=f'Zelle {tag}', type='Payment Method'),
+        PaymentMethod(name=f'Cash {tag}', type='Payment Method'),
+    ])
+    banks = PaymentMethod.objects.bulk_create([PaymentMethod(name=f'Bank {tag}', type='Bank')])
+
+    # Apartments
+    apartment_count = _scaled(APARTMENTS_PER_SCALE, scale)
+    apartments = Apartment.objects.bulk_create([
+        Apartment(
+            name=f'{BUILDINGS[i % len(BUILDINGS)]} {100 + i} ({tag})',
+            building_n=str(100 + i % 50), street=STREETS[i % len(STREETS)], apartment_n=str(100 + i),
+            state='FL', city='Miami', zip_index='33139',
+            bedrooms=1 + i % 3, bathrooms=1 + i % 2,
+            apartment_type='In Management' if i % 4 else 'In Ownership', status='Available',
+            default_price=Decimal(1800 + (i % 10) * 150), owner=owner,
+            knowledge_base=f'Wifi: Bench{i}. Parking: level {i % 3 + 1}.',
+        )
+        for i in range(apartment_count)
+    ])
+    Apartment.managers.through.objects.bulk_create([
+        Apartment.managers.through(apartment_id=apartment.id, user_id=managers[i % MANAGERS].id)
+        for i, apartment in enumerate(apartments)
+    ])
+    dataset.apartment_ids = [a.id for a in apartments]
+
+    # Tenants and bookings: sequential, non-overlapping stays per apartment around the anchor
+    tenants, bookings = [], []
+    for i, apartment in enumerate(apartments):
+        day = anchor - timedelta(days=300 + rng.randint(0, 30))
+        for j in range(BOOKINGS_PER_APARTMENT):
+            length = rng.choice((7, 14, 30, 30, 31, 45, 60))
+            start, end = day, day + timedelta(days=length)
+            n = len(tenants)
+            tenants.append(User(
+                email=f'{tag}-tenant-{n}@example.com',
+                full_name=f'{FIRST_NAMES[n % len(FIRST_NAMES)]} {LAST_NAMES[(n // len(FIRST_NAMES)) % len(LAST_NAMES)]} {n}',
+                role='Tenant', phone=f'+1786{n:07d}',
+            ))
+            status = 'Confirmed' if end < anchor or rng.random() < 0.8 else rng.choice(('Waiting Contract', 'Waiting Payment'))
+            bookings.append(Booking(
+                apartment=apartment, start_date=start, end_date=end, status=status,
+                tenants_n=Decimal(rng.randint(1, 4)), source=rng.choice(('Airbnb', 'Referral', 'Returning', 'Other')),
+                visit_purpose=rng.choice(('Tourism', 'Work Travel', 'Relocation')), notes=f'{tag} booking',
+            ))
+            day = end + timedelta(days=rng.randint(0, 10))
+    tenants = User.objects.bulk_create(tenants)
+    for booking, tenant in zip(bookings, tenants):
+        booking.tenant = tenant
+    bookings = Booking.objects.bulk_create(bookings)
+    dataset.booking_ids = [b.id for b in bookings]
+
+    # Payments: deposit + monthly rent per booking, monthly utilities per apartment
+    payments = []
+    for booking in bookings:
+        price = booking.apartment.default_price
+        paid = booking.end_date < anchor
+        payments.append(Payment(
+            booking=booking, payment_date=booking.start_date - timedelta(days=7), amount=price / 2,
+            payment_type=dataset.payment_types['Security Deposit'], payment_status='Completed' if paid else 'Pending',
+            payment_method=methods[0], bank=banks[0], notes=f'{tag} deposit',
+        ))
+        month = booking.start_date
+        while month < booking.end_date:
+            payments.append(Payment(
+                booking=booking, payment_date=month, amount=price + rng.randint(-50, 50),
+                payment_type=dataset.payment_types['Rent'],
+                payment_status='Completed' if month < anchor else 'Pending',
+                payment_method=methods[rng.randint(0, 1)], bank=banks[0], notes=f'{tag} rent',
+            ))
+            month += timedelta(days=30)
+    for apartment in apartments:
+        for k in range(12):
+            payments.append(Payment(
+                apartment=apartment, payment_date=anchor - timedelta(days=30 * k), amount=Decimal(rng.randint(80, 220)),
+                payment_type=dataset.payment_types['Utilities'], payment_status='Completed',
+                bank=banks[0], notes=f'{tag} utilities',
+            ))
+    Payment.objects.bulk_create(payments, batch_size=1000)
+
+    # Cleanings after each stay
+    cleanings = Cleaning.objects.bulk_create([
+        Cleaning(date=booking.end_date, booking=booking, apartment=booking.apartment, cleaner=cleaners[i % CLEANERS],
+                 status='Completed' if booking.end_date < anchor else 'Scheduled', tasks='Full cleaning')
+        for i, booking in enumerate(bookings)
+    ], batch_size=1000)
+
+    # Parking
+    parking_count = _scaled(PARKINGS_PER_SCALE, scale)
+    parkings = Parking.objects.bulk_create([
+        Parking(number=str(i + 1), building=BUILDINGS[i % len(BUILDINGS)], notes=tag) for i in range(parking_count)
+    ])
+    parking_bookings = []
+    for i, parking in enumerate(parkings):
+        day = anchor - timedelta(days=60)
+        for j in range(PARKING_BOOKINGS_PER_SPOT):
+            length = rng.randint(3, 25)
+            parking_bookings.append(ParkingBooking(
+                parking=parking, start_date=day, end_date=day + timedelta(days=length),
+                status=rng.choice(('Booked', 'Unavailable', 'No Car')), notes=tag,
+                apartment=apartments[(i + j) % len(apartments)],
+            ))
+            day += timedelta(days=length + rng.randint(1, 8))
+    ParkingBooking.objects.bulk_create(parking_bookings)
+
+    # Twilio conversations for a share of current/upcoming stays
+    active = [b for b in bookings if b.end_date >= anchor - timedelta(days=30)]
+    with_chat = active[:_scaled(len(active) * CONVERSATION_SHARE, 1)]
+    conversations = TwilioConversation.objects.bulk_create([
+        TwilioConversation(conversation_sid=f'CH{tag}{i:06d}', friendly_name=f'{b.tenant.full_name} - {b.apartment.name}',
+                           booking=b, apartment=b.apartment)
+        for i, b in enumerate(with_chat)
+    ])
+    dataset.conversations = [(c.conversation_sid, b.tenant.phone) for c, b in zip(conversations, with_chat)]
+    messages = []
+    for c, b in zip(conversations, with_chat):
+        for k in range(MESSAGES_PER_CONVERSATION):
+            inbound = k % 2 == 0
+            messages.append(TwilioMessage(
+                message_sid=f'IM{tag}{c.id}-{k:04d}', conversation=c, conversation_sid=c.conversation_sid,
+                author=b.tenant.phone if inbound else 'ASSISTANT',
+                body=QUESTIONS[(k // 2) % len(QUESTIONS)] if inbound else ANSWERS[(k // 2) % len(ANSWERS)],
+                direction='inbound' if inbound else 'outbound',
+            ))
+    TwilioMessage.objects.bulk_create(messages, batch_size=1000)
+
+    # Audit trail
+    audit_count = _scaled(AUDIT_LOGS_PER_SCALE, scale)
+    audit_logs = []
+    for i in range(audit_count):
+        booking = bookings[rng.randrange(len(bookings))]
+        action = rng.choice(('create', 'update', 'update', 'update', 'delete'))
+        audit_logs.append(AuditLog(
+            model_name=rng.choice(('Booking', 'Payment', 'Cleaning')), object_id=str(booking.id),
+            object_repr=str(booking.apartment.name), action=action, changed_by=managers[i % MANAGERS].email,
+            changed_fields=['status'] if action == 'update' else None,
+            old_values={'status': 'Pending'} if action == 'update' else None,
+            new_values={'status': booking.status, 'booking_id': booking.id},
+            booking_id=booking.id, apartment_id=booking.apartment_id, apartment_name=booking.apartment.name,
+            tenant_id=booking.tenant_id, tenant_name=booking.tenant.full_name,
+        ))
+    AuditLog.objects.bulk_create(audit_logs, batch_size=1000)
+
+    dataset.counts = {
+        'apartments': len(apartments),
+        'tenants': len(tenants),
+        'bookings': len(bookings),
+        'payments': len(payments),
+        'cleanings': len(cleanings),
+        'parkings': len(parkings),
+        'parking_bookings': len(parking_bookings),
+        'conversations': len(conversations),
+        'messages': len(messages),
+        'audit_logs': len(audit_logs),
+    }
+    return dataset
@@ -0,0 +1,629 @@
+"""
+Batch import of Rental Guru bookings with nested payments.
+
+``import_bookings`` takes a list of bookings keyed by ``source_id`` (each with
+optional ``payments`` keyed by their own ``source_id``) and upserts them
+together instead of one BookingForm round trip per booking:
+
+- Validation loads apartments, tenants, payment types/methods, parking
+  spots, cleaners and the bookings and payments being updated, in one query
+  each.
+- Valid items are written in one transaction. It first locks the apartments
+  and parking spots of the batch (in id order, so concurrent imports check
+  overlaps one at a time), then loads every booking and parking booking that
+  could overlap in one query each; overlaps (also between items of the
+  batch) are checked in memory, in item order. Then new tenants, bookings, their
+  Start/End notifications, payments and payment notifications with bulk
+  inserts, plain field changes with bulk updates, AuditLog rows in bulk
+  (see mysite/audit_bulk.py). Bookings whose dates, apartment, status or car
+  changed go through Booking.save() in a savepoint, so parking, cleanings,
+  notifications and payments beyond the new end date follow as in the form.
+- The BookingForm options ``parking_number`` and ``assigned_cleaner`` (new
+  bookings) and ``send_contract`` / ``create_chat`` (created or updated
+  bookings) are applied after the bulk write, one Booking call per item that
+  asks for them, as Booking.save does with form_data.
+- External side effects (contracts, welcome messages, contract updates,
+  conversation links) run after the transaction commits.
+
+Invalid items are reported with form-style ``errors`` and not written; the
+rest of the batch is still imported.
+
+Usage:
+    from mysite.booking_import import import_bookings
+
+    results = import_bookings(request.data.get('bookings'))
+    # [{'index': 0, 'source_id': 'rg-1', 'action': 'created', 'booking_id': 12,
+    #   'payments': [{'source_id': 'rg-p-1', 'payment_id': 40, 'action': 'created'}]}, ...]
+"""
+import copy
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+RENTAL_GURU_SOURCE = 'Rental Guru'
+
+# Items accepted per request and rows per bulk INSERT / UPDATE statement
+MAX_ITEMS = 1000
+BATCH_SIZE = 500
+
+BOOKING_FIELDS = (
+    'apartment', 'start_date', 'end_date', 'status', 'notes', 'keywords', 'other_tenants', 'tenants_n',
+    'animals', 'visit_purpose', 'is_rent_car', 'car_model', 'car_price', 'car_rent_days',
+)
+# Changes with side effects in Booking.save() (parking, cleanings, notifications, payments)
+STRUCTURAL_FIELDS = {'apartment', 'start_date', 'end_date', 'status', 'is_rent_car', 'car_model'}
+REQUIRED_BOOKING_FIELDS = ('apartment', 'start_date', 'end_date')
+
+PAYMENT_FIELDS = (
+    'payment_date', 'amount', 'payment_type', 'payment_status', 'payment_method', 'bank',
+    'notes', 'tenant_notes', 'keywords', 'invoice_url',
+)
+REQUIRED_PAYMENT_FIELDS = ('payment_date', 'amount', 'payment_type')
+
+# Same placeholders as BookingForm.clean
+PLACEHOLDER_TENANTS = {
+    'Blocked': ('blocked@gmail.com', 'Blocked'),
+    'Pending': ('pending@gmail.com', 'Pending'),
+    'Problem Booking': ('problem_booking@gmail.com', 'Problem Booking'),
+}
+# Saved without notifications and payments (BookingForm.save -> saveEmpty, _create_booking_notifications)
+NO_SCHEDULE_STATUSES = {'Blocked', 'Pending', 'Problem Booking', 'Cancelled'}
+
+TRACKING_FIELDS = ['last_updated_by', 'updated_at']
+
+
+class _Item:
+    """One booking of the batch while it is validated and written."""
+
+    def __init__(self, index, raw):
+        self.index = index
+        self.raw = raw if isinstance(raw, dict) else {}
+        self.source_id = str(self.raw.get('source_id') or '').strip()
+        self.errors = defaultdict(list)
+        self.current = None  # existing booking
+        self.booking = None  # booking as it will be saved
+        self.values = {}
+        self.tenant = None  # (email, full_name or None, phone or None)
+        self.payments = []  # [(source_id, values, existing payment or None)]
+        self.options = {}  # parking_number / assigned_cleaner / send_contract / create_chat
+        self.action = None
+        self.saved_by_model = False  # went through Booking.save(), which links conversations itself
+        self.payment_results = []
+
+    def error(self, field, message):
+        self.errors[field].append(message)
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def result(self):
+        result = {
+            'index': self.index,
+            'source_id': self.source_id,
+            'action': self.action if self.valid else 'error',
+            'booking_id': self.booking.pk if self.valid and self.booking is not None else None,
+            'payments': self.payment_results,
+        }
+        if not self.valid:
+            result['errors'] = dict(self.errors)
+        return result
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _clean_field(model, name, value, item, label):
+    try:
+        return model._meta.get_field(name).clean(value, None)
+    except ValidationError as e:
+        for message in e.messages:
+            item.error(label, message)
+
+
+def _load_references(items):
+    """Everything validation needs, one query per model."""
+    from mysite.models import Apartment, Booking, PaymenType, Parking, Payment, PaymentMethod, User
+    from mysite.reference_data import get_reference_data
+
+    source_ids = [item.source_id for item in items if item.source_id]
+    bookings = {b.source_id: b for b in Booking.objects.select_related('tenant', 'apartment').filter(source_id__in=source_ids)}
+
+    apartment_ids, emails, type_ids, method_ids, payment_source_ids = set(), set(), set(), set(), set()
+    parking_ids, cleaner_ids = set(), set()
+    for item in items:
+        apartment_ids.add(_as_id(item.raw.get('apartment')))
+        emails.add(str(item.raw.get('tenant_email') or '').strip())
+        parking_ids.add(_as_id(item.raw.get('parking_number')))
+        cleaner_ids.add(_as_id(item.raw.get('assigned_cleaner')))
+        for row in item.raw.get('payments') or []:
+            if isinstance(row, dict):
+                type_ids.add(_as_id(row.get('payment_type')))
+                method_ids.update((_as_id(row.get('payment_method')), _as_id(row.get('bank'))))
+                payment_source_ids.add(str(row.get('source_id') or '').strip())
+    emails.update(email for email, _ in PLACEHOLDER_TENANTS.values())
+    apartment_ids.update(b.apartment_id for b in bookings.values())
+    for ids in (type_ids, method_ids, parking_ids, cleaner_ids):
+        ids.discard(None)
+    payment_source_ids.discard('')
+
+    return {
+        'bookings': bookings,
+        'apartments': Apartment.objects.in_bulk([i for i in apartment_ids if i is not None]),
+        'users': {u.email: u for u in User.objects.filter(email__in=[e for e in emails if e])},
+        'payment_types': PaymenType.objects.in_bulk(type_ids),
+        'payment_methods': PaymentMethod.objects.in_bulk(method_ids),
+        'payments': {p.source_id: p for p in Payment.objects.select_related('payment_type').filter(
+            source=RENTAL_GURU_SOURCE, source_id__in=payment_source_ids)},
+        'parkings': Parking.objects.in_bulk(parking_ids),
+        'cleaners': User.objects.filter(role='Cleaner').in_bulk(cleaner_ids),
+        'deposit_return_type': get_reference_data().payment_type_by_name("Damage Deposit", type="Out"),
+    }
+
+
+def _clean_booking(item, refs):
+    from mysite.models import Booking, validate_and_format_phone
+    from mysite.views.messaging import is_reserved_phone
+
+    raw = item.raw
+    item.current = refs['bookings'].get(item.source_id)
+    if item.current is not None and item.current.source != RENTAL_GURU_SOURCE:
+        item.error('source_id', f"Booking {item.source_id} belongs to another source ({item.current.source or 'none'})")
+        return
+
+    for name in BOOKING_FIELDS:
+        if name not in raw:
+            continue
+        value = raw[name]
+        if name == 'apartment':
+            apartment = refs['apartments'].get(_as_id(value))
+            if apartment is None:
+                item.error(name, "Select a valid choice. That choice is not one of the available choices.")
+            else:
+                item.values[name] = apartment
+            continue
+        field = Booking._meta.get_field(name)
+        if value is None and not field.null:
+            continue  # same as omitted
+        cleaned = _clean_field(Booking, name, value, item, name)
+        if name not in item.errors:
+            item.values[name] = cleaned
+    if item.current is None:
+        for name in REQUIRED_BOOKING_FIELDS:
+            if name not in item.values and name not in item.errors:
+                item.error(name, "This field is required.")
+    if not item.valid:
+        return
+
+    booking = copy.copy(item.current) if item.current is not None else Booking(source_id=item.source_id)
+    for name, value in item.values.items():
+        setattr(booking, name, value)
+    booking.source = RENTAL_GURU_SOURCE
+    if not booking.status:
+        booking.status = 'Waiting Contract'
+    item.booking = booking
+
+    if booking.status in PLACEHOLDER_TENANTS:
+        item.tenant = PLACEHOLDER_TENANTS[booking.status] + (None,)
+    elif raw.get('tenant_email'):
+        email = str(raw['tenant_email']).strip()
+        try:
+            validate_email(email)
+        except ValidationError as e:
+            item.error('tenant_email', e.messages[0])
+        phone = raw.get('tenant_phone')
+        if phone:
+            if is_reserved_phone(phone):
+                item.error('tenant_phone', f"Tenant phone '{phone}' belongs to a manager or system number. "
+                                           f"Please enter the actual tenant's phone number.")
+            elif not validate_and_format_phone(phone):
+                item.error('tenant_phone', f"Invalid phone number: '{phone}'. Please use format +1XXXXXXXXXX "
+                                           f"for US numbers or +[country code][number] for international numbers.")
+            else:
+                phone = validate_and_format_phone(phone)
+        item.tenant = (email, raw.get('tenant_full_name') or None, phone or None)
+    elif item.current is None or item.current.tenant_id is None:
+        item.error('__all__', "Tenant is information is necessary for booking use temprorary genrated email if you don't know it")
+
+    apartment = refs['apartments'].get(booking.apartment_id)
+    if apartment is not None and apartment.status == 'Unavailable' and 'apartment' in item.values:
+        item.error('__all__', "The selected apartment is currently unavailable.")
+    if booking.start_date > booking.end_date:
+        item.error('__all__', "The start date cannot be later than the end date.")
+
+
+def _clean_options(item, refs):
+    """BookingForm options applied after the write (see _apply_options), checked like BookingForm.clean."""
+    raw, booking = item.raw, item.booking
+    for name, choices in (('parking_number', refs['parkings']), ('assigned_cleaner', refs['cleaners'])):
+        if raw.get(name) in (None, ''):
+            continue
+        if item.current is not None:
+            item.error(name, "Only accepted for new bookings.")
+        elif choices.get(_as_id(raw[name])) is None:
+            item.error(name, "Select a valid choice. That choice is not one of the available choices.")
+        else:
+            item.options[name] = choices[_as_id(raw[name])]
+
+    if raw.get('send_contract') not in (None, '', 0, '0'):
+        template_id = booking._normalize_template_id(raw['send_contract'])
+        if template_id is None:
+            item.error('send_contract', "Select a valid choice. That choice is not one of the available choices.")
+        else:
+            item.options['send_contract'] = template_id
+    if booking._normalize_boolean(raw.get('create_chat')):
+        if item.tenant is not None:
+            tenant = refs['users'].get(item.tenant[0])
+            phone = item.tenant[2] or (tenant.phone if tenant is not None else None)
+        else:
+            phone = item.current.tenant.phone if item.current is not None and item.current.tenant else None
+        if not phone:
+            item.error('create_chat', "Phone number is required when 'Create Chat' is selected.")
+        else:
+            item.options['create_chat'] = True
+
+
+def _clean_payments(item, refs, seen):
+    from mysite.models import Payment
+
+    rows = item.raw.get('payments') or []
+    if not isinstance(rows, list):
+        item.error('payments', "payments must be a list")
+        return
+    for position, row in enumerate(rows):
+        label = f'payments[{position}]'
+        if not isinstance(row, dict):
+            item.error(label, "must be an object")
+            continue
+        source_id = str(row.get('source_id') or '').strip()
+        if not source_id:
+            item.error(label, "source_id is required")
+            continue
+        if source_id in seen:
+            item.error(label, f"payment source_id {source_id} appears more than once in this batch")
+            continue
+        seen.add(source_id)
+
+        existing = refs['payments'].get(source_id)
+        if existing is not None and (item.current is None or existing.booking_id != item.current.pk):
+            item.error(label, f"payment {source_id} belongs to another booking")
+            continue
+
+        values, errors_before = {}, sum(len(messages) for messages in item.errors.values())
+        for name in PAYMENT_FIELDS:
+            value = row.get(name)
+            if value is None:
+                continue
+            if name in ('payment_type', 'payment_method', 'bank'):
+                reference = (refs['payment_types'] if name == 'payment_type' else refs['payment_methods']).get(_as_id(value))
+                expected_type = {'payment_method': 'Payment Method', 'bank': 'Bank'}.get(name)
+                if reference is None or (expected_type and reference.type != expected_type):
+                    item.error(label, f"{name}: Select a valid choice. That choice is not one of the available choices.")
+                else:
+                    values[name] = reference
+                continue
+            cleaned = _clean_field(Payment, name, value, item, f'{label}.{name}')
+            if cleaned is not None:
+                values[name] = abs(cleaned) if name == 'amount' else cleaned
+        if existing is None:
+            for name in REQUIRED_PAYMENT_FIELDS:
+                if name not in values:
+                    item.error(label, f"{name}: This field is required.")
+        if values.get('amount') == 0:
+            item.error(label, "Payment amount cannot be 0. Please enter a valid payment amount.")
+        if (existing is None and getattr(values.get('payment_type'), 'name', None) == "Damage Deposit"
+                and refs['deposit_return_type'] is None):
+            item.error(label, "payment_type: Damage Deposit return type (Damage Deposit, Out) not found.")
+        if sum(len(messages) for messages in item.errors.values()) == errors_before:
+            item.payments.append((source_id, values, existing))
+
+
+def _first_clash(intervals, key, booking):
+    """Earliest (start, end) of ``intervals`` other than ``key`` overlapping ``booking``, or None."""
+    return min(
+        ((other_start, other_end) for other_key, (other_start, other_end) in intervals.items()
+         if other_key != key and other_start < booking.end_date and other_end > booking.start_date),
+        default=None,
+    )
+
+
+def _check_overlaps(items):
+    """
+    Form overlap rules (apartment and parking spot) over existing rows and the
+    batch itself, in item order, without a query per item. Runs inside the
+    write transaction: the apartments and parking spots are locked first, so
+    a concurrent import waits instead of checking against rows it cannot see.
+    """
+    from mysite.models import Apartment, Booking, Parking, ParkingBooking
+
+    candidates = [item for item in items if item.valid]
+    if not candidates:
+        return
+    apartment_ids = sorted({item.booking.apartment_id for item in candidates})
+    parking_ids = sorted({item.options['parking_number'].id for item in candidates if 'parking_number' in item.options})
+    list(Apartment.objects.select_for_update().filter(id__in=apartment_ids).order_by('id').values_list('id'))
+    if parking_ids:
+        list(Parking.objects.select_for_update().filter(id__in=parking_ids).order_by('id').values_list('id'))
+
+    start = min(item.booking.start_date for item in candidates)
+    end = max(item.booking.end_date for item in candidates)
+    intervals = defaultdict(dict)  # apartment_id -> {booking key: (start, end)}
+    for booking_id, apartment_id, booking_start, booking_end in Booking.objects.filter(
+            apartment_id__in=apartment_ids, start_date__lt=end, end_date__gt=start,
+    ).exclude(status='Cancelled').values_list('id', 'apartment_id', 'start_date', 'end_date'):
+        intervals[apartment_id][booking_id] = (booking_start, booking_end)
+    parking_intervals = defaultdict(dict)  # parking_id -> {parking booking key: (start, end)}
+    if parking_ids:
+        for parking_booking_id, parking_id, parking_start, parking_end in ParkingBooking.objects.filter(
+                parking_id__in=parking_ids, start_date__lt=end, end_date__gt=start,
+        ).exclude(booking__status='Cancelled').values_list('id', 'parking_id', 'start_date', 'end_date'):
+            parking_intervals[parking_id][parking_booking_id] = (parking_start, parking_end)
+
+    for item in candidates:
+        booking = item.booking
+        key = booking.pk or ('new', item.index)
+        clash = _first_clash(intervals[booking.apartment_id], key, booking)
+        if clash:
+            item.error('__all__', f"The apartment is already booked from {clash[0]} to {clash[1]}.")
+            continue
+        parking = item.options.get('parking_number')
+        clash = parking and _first_clash(parking_intervals[parking.id], None, booking)
+        if clash:
+            item.error('parking_number', f"The parking spot is already booked from {clash[0]} to {clash[1]}. "
+                                         f"Building {parking.building} #{parking.number}")
+            continue
+        for apartment_intervals in intervals.values():
+            apartment_intervals.pop(key, None)
+        if booking.status != 'Cancelled':
+            intervals[booking.apartment_id][key] = (booking.start_date, booking.end_date)
+            if parking:
+                parking_intervals[parking.id][('new', item.index)] = (booking.start_date, booking.end_date)
+
+
+def _write_tenants(items, refs):
+    """Create or update the tenants named by valid items; returns {email: user}."""
+    from mysite.audit_bulk import audit_bulk_create, audit_bulk_update, audit_snapshot
+    from mysite.models import User
+    from mysite.request_context import apply_user_tracking
+
+    wanted = {}
+    for item in items:
+        if item.valid and item.tenant is not None:
+            email, full_name, phone = item.tenant
+            name_was, phone_was = wanted.get(email, (None, None))
+            wanted[email] = (full_name or name_was, phone or phone_was)
+
+    users, created, updated, before = dict(refs['users']), [], [], {}
+    now = timezone.now()
+    for email, (full_name, phone) in wanted.items():
+        user = users.get(email)
+        if user is None:
+            user = User(email=email, full_name=full_name or email, phone=phone, role='Tenant')
+            user.set_unusable_password()
+            apply_user_tracking(user)
+            users[email] = user
+            created.append(user)
+        elif (full_name and full_name != user.full_name) or (phone and phone != user.phone):
+            before[user.pk] = audit_snapshot(user, ['full_name', 'phone'] + TRACKING_FIELDS)
+            user.full_name, user.phone, user.updated_at = full_name or user.full_name, phone or user.phone, now
+            apply_user_tracking(user)
+            updated.append(user)
+    audit_bulk_create(User, created, batch_size=BATCH_SIZE)
+    audit_bulk_update(updated, ['full_name', 'phone'] + TRACKING_FIELDS, before, batch_size=BATCH_SIZE)
+    return users, bool(created or updated)
+
+
+def _write_bookings(items, users, refs):
+    """Bulk insert new bookings, bulk update plain changes, Booking.save() structural ones."""
+    from mysite.audit_bulk import audit_bulk_create, audit_bulk_update, audit_snapshot
+    from mysite.models import Booking, Notification
+    from mysite.request_context import apply_user_tracking
+
+    created, updated, update_fields, notifications = [], [], set(), []
+    now = timezone.now()
+    for item in items:
+        if not item.valid:
+            continue
+        booking = item.booking
+        booking.apartment = refs['apartments'][booking.apartment_id]
+        if item.tenant is not None:
+            booking.tenant = users[item.tenant[0]]
+        if item.current is None:
+            apply_user_tracking(booking)
+            created.append(booking)
+            item.action = 'created'
+            continue
+
+        changed = [name for name in ('tenant',) + BOOKING_FIELDS + ('source',)
+                   if getattr(item.current, Booking._meta.get_field(name).attname)
+                   != getattr(booking, Booking._meta.get_field(name).attname)]
+        if not changed:
+            item.action = 'unchanged'
+        elif STRUCTURAL_FIELDS & set(changed):
+            try:
+                with transaction.atomic():
+                    if booking.status in PLACEHOLDER_TENANTS:
+                        booking.saveEmpty()
+                    else:
+                        booking.save(defer_external=True)
+                item.action, item.saved_by_model = 'updated', True
+            except Exception as e:
+                item.booking = None
+                item.error('__all__', str(e))
+        else:
+            booking.updated_at = now
+            apply_user_tracking(booking)
+            updated.append((booking, item.current))
+            update_fields.update(changed)
+            item.action = 'updated'
+
+    audit_bulk_create(Booking, created, batch_size=BATCH_SIZE)
+    fields = sorted(update_fields) + TRACKING_FIELDS
+    before = {booking.pk: audit_snapshot(current, fields) for booking, current in updated}
+    audit_bulk_update([booking for booking, _ in updated], fields, before, batch_size=BATCH_SIZE)
+
+    for booking in created:
+        if booking.status in NO_SCHEDULE_STATUSES:
+            continue
+        for message, day in (("Start Booking", booking.start_date), ("End Booking", booking.end_date)):
+            notification = Notification(date=day, message=message, booking=booking, apartment=booking.apartment,
+                                        send_in_telegram=True)
+            apply_user_tracking(notification)
+            notifications.append(notification)
+    return notifications
+
+
+def _write_payments(items, refs):
+    """Bulk insert new payments (plus damage deposit returns) and bulk update changed ones."""
+    from mysite.audit_bulk import audit_bulk_create, audit_bulk_update, audit_queryset_update, audit_snapshot
+    from mysite.models import Notification, Payment
+    from mysite.request_context import apply_user_tracking
+
+    created, updated, update_fields, results, moved = [], [], set(), [], defaultdict(list)
+    now = timezone.now()
+    for item in items:
+        if not item.valid:
+            continue
+        booking = item.booking
+        for source_id, values, existing in item.payments:
+            result = {'source_id': source_id, 'payment_id': existing.pk if existing else None, 'action': 'skipped'}
+            item.payment_results.append(result)
+            if booking.status in NO_SCHEDULE_STATUSES:
+                continue  # BookingForm.save does not write payments for these either
+            if existing is None:
+                payment = Payment(booking=booking, source=RENTAL_GURU_SOURCE, source_id=source_id, **values)
+                apply_user_tracking(payment)
+                created.append(payment)
+                results.append((result, payment))
+                if payment.payment_type.name == "Damage Deposit":
+                    deposit = Payment(payment_type=refs['deposit_return_type'], amount=payment.amount, booking=booking,
+                                      notes="Damage Deposit Return", payment_date=booking.end_date)
+                    apply_user_tracking(deposit)
+                    created.append(deposit)
+                continue
+            changed = [name for name, value in values.items()
+                       if getattr(existing, Payment._meta.get_field(name).attname)
+                       != getattr(value, 'pk', value)]
+            if not changed:
+                result['action'] = 'unchanged'
+                continue
+            original = copy.copy(existing)
+            for name in changed:
+                setattr(existing, name, values[name])
+            existing.booking, existing.updated_at = booking, now
+            apply_user_tracking(existing)
+            updated.append((existing, original))
+            if 'payment_date' in changed:
+                moved[existing.payment_date].append(existing.pk)
+            update_fields.update(changed)
+            result['action'] = 'updated'
+
+    audit_bulk_create(Payment, created, batch_size=BATCH_SIZE)
+    for result, payment in results:
+        result['payment_id'], result['action'] = payment.pk, 'created'
+    fields = sorted(update_fields) + TRACKING_FIELDS
+    before = {payment.pk: audit_snapshot(original, fields) for payment, original in updated}
+    audit_bulk_update([payment for payment, _ in updated], fields, before, batch_size=BATCH_SIZE)
+
+    # As in Payment.save(): notifications follow a moved payment date
+    for day, payment_ids in moved.items():
+        audit_queryset_update(Notification.objects.filter(payment_id__in=payment_ids), date=day)
+
+    notifications = []
+    for payment in created:
+        if 'mortage' in payment.payment_type.name.lower():
+            continue
+        notification = Notification(date=payment.payment_date, message='Payment', payment=payment,
+                                    send_in_telegram=True)
+        apply_user_tracking(notification)
+        notifications.append(notification)
+    return notifications, [payment.pk for payment, _ in updated]
+
+
+def _apply_options(items):
+    """
+    Parking, cleaning, contract and welcome message of the items that asked
+    for them, as Booking.save / saveEmpty do with form_data: parking for any
+    status, the rest not for Blocked / Pending / Problem Booking / Cancelled
+    bookings. Contracts and messages are sent after the transaction commits.
+    """
+    for item in items:
+        if not item.valid or not item.options or item.action not in ('created', 'updated'):
+            continue
+        booking = item.booking
+        if 'parking_number' in item.options:
+            booking._create_parking_booking(item.options['parking_number'].id)
+        if booking.status in NO_SCHEDULE_STATUSES:
+            continue
+        if 'assigned_cleaner' in item.options:
+            booking.schedule_cleaning({'assigned_cleaner': item.options['assigned_cleaner']})
+        form_data = {name: item.options[name] for name in ('send_contract', 'create_chat') if name in item.options}
+        if form_data:
+            booking._defer_external = True
+            booking._run_external(lambda b, data=form_data: b._handle_contract_and_messaging(data), "Send Contract")
+
+
+def import_bookings(raw_items):
+    """
+    Validate and upsert ``raw_items`` (see module docstring); returns one
+    result dict per item, in order. Raises ValueError when the batch itself
+    is malformed.
+    """
+    from mysite.ai_match_cache import invalidate_payments
+    from mysite.audit_bulk import audit_bulk_create
+    from mysite.chat_directory import bump_chat_directory_version
+    from mysite.models import Notification
+
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError("bookings must be a non-empty list")
+    if len(raw_items) > MAX_ITEMS:
+        raise ValueError(f"bookings accepts at most {MAX_ITEMS} items per request")
+
+    items = [_Item(index, raw) for index, raw in enumerate(raw_items)]
+    seen_bookings, seen_payments = set(), set()
+    for item in items:
+        if not isinstance(item.raw, dict) or not item.raw:
+            item.error('__all__', "must be an object")
+        elif not item.source_id:
+            item.error('source_id', "This field is required.")
+        elif item.source_id in seen_bookings:
+            item.error('source_id', f"source_id {item.source_id} appears more than once in this batch")
+        seen_bookings.add(item.source_id)
+
+    refs = _load_references([item for item in items if item.valid])
+    for item in items:
+        if item.valid:
+            _clean_booking(item, refs)
+        if item.valid:
+            _clean_options(item, refs)
+        if item.valid:
+            _clean_payments(item, refs, seen_payments)
+
+    with transaction.atomic():
+        _check_overlaps(items)
+        users, tenants_written = _write_tenants(items, refs)
+        notifications = _write_bookings(items, users, refs)
+        payment_notifications, updated_payment_ids = _write_payments(items, refs)
+        audit_bulk_create(Notification, notifications + payment_notifications, batch_size=BATCH_SIZE)
+        _apply_options(items)
+
+        written = [item.booking for item in items if item.valid and item.action in ('created', 'updated')]
+        if written or tenants_written:
+            # Tenant names and booking dates are shown in the chat sidebar
+            bump_chat_directory_version()
+        if updated_payment_ids:
+            invalidate_payments(updated_payment_ids)
+        for item in items:
+            booking = item.booking
+            if (item.valid and item.action in ('created', 'updated') and not item.saved_by_model
+                    and booking.tenant is not None and booking.tenant.phone and booking.status != 'Cancelled'):
+                transaction.on_commit(booking.update_conversation_links)
+
+    return [item.result() for item in items]
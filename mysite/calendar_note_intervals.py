@@ -0,0 +1,96 @@
+"""
+Calendar notes of the booking availability page as date intervals.
+
+Notes overlapping the visible window are read with one range query (served
+by the (end_date, start_date) index) and kept as intervals instead of being
+copied into every day they cover:
+
+- ``has_note(apartment_id, day)`` answers the per-cell highlight with a
+  bisect over the merged, clipped intervals of the apartment and of the
+  global notes;
+- ``to_payload()`` is the compact form the page embeds once; ``notesForDay``
+  in templates/booking_availability.html expands it for the hovered or
+  clicked cell:
+
+    {
+        "apartments": {"7": "Ocean 1"},
+        "notes": [[12, 7, "2026-03-01", "2026-05-31", "Painting"], [9, null, "2026-04-10", "2026-04-10", "Holiday"]]
+    }
+
+``notes`` rows are [id, apartment_id (null = global), start_date, end_date,
+note] in CalendarNote ordering; the page lists a day's global notes first,
+then the apartment's. Building the intervals costs one step per note, not per
+note-day.
+
+Usage:
+    from mysite.calendar_note_intervals import CalendarNoteIntervals
+
+    intervals = CalendarNoteIntervals.load(start_date, end_date, apartment_ids)
+    intervals.has_note(apartment.id, day)
+    json.dumps(intervals.to_payload())
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+
+def _merge(ranges):
+    """Sorted, non-overlapping (starts, ends) covering the union of ``ranges``."""
+    starts, ends = [], []
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + timedelta(days=1):
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class CalendarNoteIntervals:
+    """Notes overlapping ``start_date``..``end_date`` (inclusive) with per-apartment coverage."""
+
+    def __init__(self, notes, start_date, end_date):
+        self.notes = notes
+        self.start_date = start_date
+        self.end_date = end_date
+
+        ranges = {}
+        for note in notes:
+            clipped = (max(note['start_date'], start_date), min(note['end_date'], end_date))
+            if clipped[0] <= clipped[1]:
+                ranges.setdefault(note['apartment_id'], []).append(clipped)
+        self._coverage = {apartment_id: _merge(r) for apartment_id, r in ranges.items()}
+
+    @classmethod
+    def load(cls, start_date, end_date, apartment_ids):
+        """Global notes and notes of ``apartment_ids`` overlapping the window."""
+        from django.db.models import Q
+        from mysite.models import CalendarNote
+
+        notes = list(
+            CalendarNote.objects.filter(end_date__gte=start_date, start_date__lte=end_date)
+            .filter(Q(apartment__isnull=True) | Q(apartment_id__in=apartment_ids))
+            .values('id', 'apartment_id', 'apartment__name', 'start_date', 'end_date', 'note')
+        )
+        return cls(notes, start_date, end_date)
+
+    def _covers(self, apartment_id, day):
+        coverage = self._coverage.get(apartment_id)
+        if coverage is None:
+            return False
+        starts, ends = coverage
+        i = bisect_right(starts, day) - 1
+        return i >= 0 and day <= ends[i]
+
+    def has_note(self, apartment_id, day):
+        """True if a global note or a note of ``apartment_id`` covers ``day``."""
+        return self._covers(None, day) or self._covers(apartment_id, day)
+
+    def to_payload(self):
+        apartments = {}
+        rows = []
+        for note in self.notes:
+            if note['apartment_id'] is not None:
+                apartments[str(note['apartment_id'])] = note['apartment__name']
+            rows.append([note['id'], note['apartment_id'], note['start_date'].isoformat(),
+                         note['end_date'].isoformat(), note['note']])
+        return {'apartments': apartments, 'notes': rows}
@@ -0,0 +1,107 @@
+"""
+Change feed for external integrations, read from AuditLog.
+
+Clients keep a mirror of Booking / Payment / ApartmentPrice / Apartment rows
+by polling ``read_changes(cursor)`` instead of downloading full state: each
+change carries the model, object id, action and the new values of the
+fields it changed (foreign keys as plain ids), and the response hands back
+the cursor to send next time.
+
+Cursor ``"<txid>-<id>"``: changes are ordered by the id of the transaction
+that wrote the audit row (AuditLog.txid, set by a database trigger, see
+migration 0072) and then by AuditLog.id. A page only contains transactions
+older than the oldest one still running (txid_snapshot_xmin), so a
+transaction that commits late can never land behind a cursor a client
+already holds; a long-running transaction delays the feed instead of losing
+changes. Rows logged before the trigger existed have txid 0 and come first.
+
+Usage:
+    from mysite.change_feed import head_cursor, read_changes
+
+    cursor = head_cursor()              # before downloading full state
+    page = read_changes(cursor, models=['Booking'])
+    page['changes'], page['cursor'], page['has_more']
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FEED_MODELS = ('Booking', 'Payment', 'ApartmentPrice', 'Apartment')
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+_HORIZON_SQL = "txid_snapshot_xmin(txid_current_snapshot())"
+
+
+def format_cursor(txid, log_id):
+    return f"{txid}-{log_id}"
+
+
+def parse_cursor(value):
+    """(txid, id) from a cursor string; empty means the start of the feed. Raises ValueError."""
+    if not value:
+        return 0, 0
+    txid, sep, log_id = str(value).partition('-')
+    if not sep:
+        raise ValueError(f"Invalid cursor '{value}'")
+    return int(txid), int(log_id)
+
+
+def head_cursor():
+    """Cursor after every change that is already final; changes committed from now on follow it."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {_HORIZON_SQL}")
+        return format_cursor(cursor.fetchone()[0], 0)
+
+
+def _compact(values):
+    """Serialized audit values with {'id', 'repr'} foreign keys reduced to the id."""
+    return {field: value['id'] if isinstance(value, dict) and 'id' in value else value
+            for field, value in (values or {}).items()}
+
+
+def _change(row):
+    if row['action'] == 'delete':
+        fields = None
+    elif row['action'] == 'update':
+        fields = {field: (row['new_values'] or {}).get(field) for field in row['changed_fields'] or []}
+    else:
+        fields = row['new_values']
+    return {
+        'cursor': format_cursor(row['txid'], row['id']),
+        'model': row['model_name'],
+        'id': row['object_id'],
+        'action': row['action'],
+        'at': row['timestamp'].isoformat(),
+        'fields': _compact(fields) if fields is not None else None,
+    }
+
+
+def read_changes(cursor=None, models=None, limit=DEFAULT_LIMIT):
+    """
+    Up to ``limit`` changes of ``models`` (default FEED_MODELS) after
+    ``cursor``, oldest first: {'changes', 'cursor', 'has_more'}. The returned
+    cursor is the last change's, or the given one when nothing is new.
+    Raises ValueError for a bad cursor or a model outside FEED_MODELS.
+    """
+    from mysite.models import AuditLog
+
+    txid, log_id = parse_cursor(cursor)
+    models = list(models or FEED_MODELS)
+    unknown = sorted(set(models) - set(FEED_MODELS))
+    if unknown:
+        raise ValueError(f"Unknown model(s): {', '.join(unknown)}. Available: {', '.join(FEED_MODELS)}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    rows = list(
+        AuditLog.objects.filter(model_name__in=models, txid__gte=txid, txid__lt=RawSQL(_HORIZON_SQL, []))
+        .exclude(txid=txid, id__lte=log_id)
+        .order_by('txid', 'id')
+        .values('id', 'txid', 'model_name', 'object_id', 'action', 'timestamp', 'changed_fields', 'new_values')
+        [:limit + 1]
+    )
+    changes = [_change(row) for row in rows[:limit]]
+    return {
+        'changes': changes,
+        'cursor': changes[-1]['cursor'] if changes else format_cursor(txid, log_id),
+        'has_more': len(rows) > limit,
+    }
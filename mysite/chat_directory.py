@@ -0,0 +1,312 @@
+"""
+Process-level cache of the chat sidebar: every conversation with messages,
+its display info (tenant, apartment, participants), author display map,
+latest message and message count, most recent activity first.
+
+chat_list, chat_detail, load_more_messages and the live stream all read the
+same ``ChatDirectory`` snapshot instead of running get_conversation_display_info
+per conversation. A full load takes six queries. The snapshot is stamped with
+the ``chat_directory`` ReferenceDataVersion row and keeps a message cursor, the
+newest (updated_at, id) it has read, checked at most every STAMP_CHECK_SECONDS:
+
+- messages changed since the cursor are applied incrementally: the touched
+  conversations are re-read (latest message, count, author order), plus a
+  User lookup for phones not seen before. Like the chat stream
+  (mysite/chat_stream.py) the query re-reads CURSOR_OVERLAP before the cursor
+  and skips rows already seen, so a message committed after a newer one is
+  still picked up;
+- anything else that changes the sidebar (conversation links, deleted
+  messages, tenant/booking/apartment edits, see mysite/signals.py) bumps the
+  version and the next access reloads.
+
+Snapshots read inside a transaction are used but not shared, since the rows
+may still be rolled back.
+
+Usage:
+    from mysite.chat_directory import get_chat_directory
+
+    directory = get_chat_directory()
+    directory.rows                      # sidebar, newest activity first
+    directory.display_info(conversation)
+    directory.author_display_map(conversation)
+"""
+import threading
+import time
+from datetime import timedelta
+
+VERSION_NAME = 'chat_directory'
+STAMP_CHECK_SECONDS = 2
+# Messages saved out of updated_at order are re-read within this overlap
+CURSOR_OVERLAP = timedelta(seconds=2)
+# More new messages than this since the last stamp: reload instead of patching
+MAX_INCREMENTAL_MESSAGES = 500
+
+
+def _phones(values):
+    from mysite.views.chat import _is_e164
+
+    return {str(v).strip() for v in values if v and _is_e164(str(v).strip())}
+
+
+def _load_users(phones):
+    """({phone: user}, {phone: first tenant}) for ``phones``; same choice of user as the uncached lookups."""
+    from mysite.models import User
+
+    users_by_phone, tenants_by_phone = {}, {}
+    if phones:
+        for user in User.objects.filter(phone__in=phones).only('id', 'phone', 'full_name', 'role').order_by('id'):
+            phone = (user.phone or '').strip()
+            users_by_phone[phone] = user
+            if user.role == 'Tenant':
+                tenants_by_phone.setdefault(phone, user)
+    return users_by_phone, tenants_by_phone
+
+
+def _message_window(cursor, limit):
+    """(id, conversation_id, updated_at) of messages changed since ``cursor`` minus the overlap, oldest first."""
+    from mysite.models import TwilioMessage
+
+    messages = TwilioMessage.objects.order_by('updated_at', 'id')
+    if cursor is not None:
+        messages = messages.filter(updated_at__gte=cursor[0] - CURSOR_OVERLAP)
+    return list(messages.values_list('id', 'conversation_id', 'updated_at')[:limit])
+
+
+def _load_entries(conversations):
+    """(entries, authors) for ``conversations`` (a TwilioConversation queryset) that have messages."""
+    from django.db.models import Count, Max, OuterRef, Subquery
+
+    from mysite.models import TwilioMessage
+
+    latest_id = (TwilioMessage.objects.filter(conversation=OuterRef('pk'))
+                 .order_by('-message_timestamp', '-id').values('id')[:1])
+    conversations = list(
+        conversations.select_related('booking__tenant', 'apartment')
+        .annotate(last_message_time=Max('messages__message_timestamp'), message_count=Count('messages'),
+                  latest_message_id=Subquery(latest_id))
+        .filter(last_message_time__isnull=False)
+    )
+    latest = TwilioMessage.objects.in_bulk([c.latest_message_id for c in conversations])
+
+    authors = {}
+    author_rows = (TwilioMessage.objects.filter(conversation__in=[c.pk for c in conversations])
+                   .values_list('conversation_id', 'author').annotate(last=Max('message_timestamp'))
+                   .order_by('conversation_id', '-last'))
+    for conversation_id, author, _ in author_rows:
+        authors.setdefault(conversation_id, []).append(author)
+
+    entries = {
+        c.pk: {
+            'conversation': c,
+            'latest_message': latest.get(c.latest_message_id),
+            'message_count': c.message_count,
+            'last_message_time': c.last_message_time,
+        }
+        for c in conversations
+    }
+    return entries, authors
+
+
+class ChatDirectory:
+    """
+    Immutable snapshot at ``stamp`` ((version, updated_at)) and message
+    ``cursor`` ((updated_at, id) or None); ``seen`` maps the ids of messages
+    within CURSOR_OVERLAP of the cursor to the updated_at already applied.
+    ``rows`` are dicts with conversation, display_info, latest_message,
+    message_count and last_message_time, shared between requests: copy a row
+    before adding per-request keys.
+    """
+
+    def __init__(self, stamp, cursor, seen, entries, authors, users_by_phone, tenants_by_phone):
+        from mysite.views.chat import _build_author_display_map, get_conversation_display_info
+
+        self.stamp = stamp
+        self.cursor = cursor
+        self.seen = seen
+        self._entries = entries
+        self._authors = authors
+        self._users_by_phone = users_by_phone
+        self._tenants_by_phone = tenants_by_phone
+        self._display_maps = {}
+        for conversation_id, entry in entries.items():
+            if 'display_info' not in entry:
+                entry['display_info'] = get_conversation_display_info(
+                    entry['conversation'], authors.get(conversation_id, []), users_by_phone, tenants_by_phone,
+                )
+            self._display_maps[conversation_id] = _build_author_display_map(entry['display_info']['participants'])
+        self.rows = sorted(entries.values(), key=lambda e: (e['last_message_time'], e['conversation'].pk), reverse=True)
+
+        self.booking_ids = {e['conversation'].booking_id for e in entries.values()} - {None}
+        self.apartment_ids = {e['conversation'].apartment_id for e in entries.values()} - {None}
+        self.user_ids = {user.pk for user in users_by_phone.values()}
+        self.user_ids |= {e['conversation'].booking.tenant_id for e in entries.values()
+                          if e['conversation'].booking_id and e['conversation'].booking}
+        self.phones = set(users_by_phone) | {phone for names in authors.values() for phone in _phones(names)}
+
+    @classmethod
+    def load(cls, stamp):
+        from mysite.models import TwilioConversation, TwilioMessage
+
+        newest = TwilioMessage.objects.order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+        # Read the cursor first: messages saved during the load are applied again by the next refresh
+        seen = {pk: at for pk, _, at in _message_window(newest, None)} if newest else {}
+        entries, authors = _load_entries(TwilioConversation.objects.all())
+
+        phones = {phone for names in authors.values() for phone in _phones(names)}
+        phones |= _phones(e['conversation'].booking.tenant.phone for e in entries.values()
+                          if e['conversation'].booking and e['conversation'].booking.tenant)
+        phones |= _manager_phones()
+        users_by_phone, tenants_by_phone = _load_users(phones)
+        return cls(stamp, newest, seen, entries, authors, users_by_phone, tenants_by_phone)
+
+    def refreshed(self):
+        """
+        This snapshot when no message changed since its cursor, a copy with the
+        touched conversations re-read, or None when there are too many changes
+        to apply incrementally.
+        """
+        from mysite.models import TwilioConversation
+
+        window = _message_window(self.cursor, MAX_INCREMENTAL_MESSAGES + len(self.seen) + 1)
+        if len(window) > MAX_INCREMENTAL_MESSAGES + len(self.seen):
+            return None
+        changed = [(pk, conversation_id, at) for pk, conversation_id, at in window if self.seen.get(pk) != at]
+        if not changed:
+            return self
+
+        cursor = self.cursor
+        for pk, _, at in changed:
+            if cursor is None or (at, pk) > cursor:
+                cursor = (at, pk)
+        horizon = cursor[0] - CURSOR_OVERLAP
+        seen = {pk: at for pk, _, at in window if at >= horizon}
+
+        touched = {conversation_id for _, conversation_id, _ in changed}
+        fresh_entries, fresh_authors = _load_entries(TwilioConversation.objects.filter(pk__in=touched))
+        entries = {**self._entries, **fresh_entries}
+        authors = {**self._authors, **fresh_authors}
+
+        users_by_phone, tenants_by_phone = self._users_by_phone, self._tenants_by_phone
+        unknown = {phone for names in fresh_authors.values() for phone in _phones(names)} - self.phones
+        if unknown:
+            found_users, found_tenants = _load_users(unknown)
+            users_by_phone = {**users_by_phone, **found_users}
+            tenants_by_phone = {**tenants_by_phone, **{p: u for p, u in found_tenants.items() if p not in tenants_by_phone}}
+        return ChatDirectory(self.stamp, cursor, seen, entries, authors, users_by_phone, tenants_by_phone)
+
+    def entry(self, conversation):
+        return self._entries.get(getattr(conversation, 'pk', conversation))
+
+    def display_info(self, conversation):
+        """Cached display info, computed directly for conversations not in the sidebar (no messages yet)."""
+        entry = self.entry(conversation)
+        if entry is not None:
+            return entry['display_info']
+        from mysite.views.chat import get_conversation_display_info
+
+        return get_conversation_display_info(conversation)
+
+    def author_display_map(self, conversation):
+        display_map = self._display_maps.get(getattr(conversation, 'pk', conversation))
+        if display_map is not None:
+            return display_map
+        from mysite.views.chat import _build_author_display_map
+
+        return _build_author_display_map(self.display_info(conversation).get('participants') or [])
+
+
+def _manager_phones():
+    from mysite.views.chat import MANAGER_PHONE, MANAGER_PHONE_2, MANAGER_PHONE_3
+
+    return {MANAGER_PHONE, MANAGER_PHONE_2, MANAGER_PHONE_3}
+
+
+_directory = None
+_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def current_stamp():
+    from mysite.models import ReferenceDataVersion
+
+    version = ReferenceDataVersion.objects.filter(name=VERSION_NAME).values_list('version', 'updated_at').first()
+    return version or (0, None)
+
+
+def get_chat_directory():
+    """Return the current snapshot, patching in changed messages or reloading when the stamp changed."""
+    global _directory, _checked_at
+    from django.db import connection
+
+    directory = _directory
+    now = time.monotonic()
+    if directory is not None and now - _checked_at < STAMP_CHECK_SECONDS and not connection.in_atomic_block:
+        return directory
+    stamp = current_stamp()
+    updated = directory.refreshed() if directory is not None and directory.stamp == stamp else None
+    if updated is not None and updated is directory:
+        _checked_at = now
+        return directory
+    with _lock:
+        if updated is None:
+            current = _directory
+            if current is not None and current is not directory and current.stamp == stamp:
+                updated = current.refreshed()  # another thread reloaded meanwhile
+            updated = updated or ChatDirectory.load(stamp)
+        # Rows read inside a transaction may still be rolled back, so only share committed data
+        if connection.in_atomic_block:
+            return updated
+        _directory = updated
+        _checked_at = now
+    return updated
+
+
+def shows(booking_id=None, user=None, apartment_id=None):
+    """
+    True if the chat sidebar shows this booking, user (by id or phone) or
+    apartment. Answered from this process's snapshot when its version stamp
+    is current (messages newer than its cursor are checked for the phone); a
+    process without a current snapshot asks the database.
+    """
+    from mysite.models import TwilioConversation, TwilioMessage
+
+    directory = _directory
+    if directory is not None and directory.stamp == current_stamp():
+        if booking_id is not None and booking_id in directory.booking_ids:
+            return True
+        if apartment_id is not None and apartment_id in directory.apartment_ids:
+            return True
+        if user is None:
+            return False
+        phone = (user.phone or '').strip()
+        if user.pk in directory.user_ids or phone in directory.phones:
+            return True
+        recent = TwilioMessage.objects.filter(author=phone)
+        if directory.cursor is not None:
+            recent = recent.filter(updated_at__gte=directory.cursor[0] - CURSOR_OVERLAP)
+        return bool(phone) and recent.exists()
+    if booking_id is not None:
+        return TwilioConversation.objects.filter(booking_id=booking_id).exists()
+    if apartment_id is not None:
+        return TwilioConversation.objects.filter(apartment_id=apartment_id).exists()
+    if user is not None:
+        phone = (user.phone or '').strip()
+        return (TwilioConversation.objects.filter(booking__tenant_id=user.pk).exists()
+                or bool(phone) and TwilioMessage.objects.filter(author=phone).exists())
+    return False
+
+
+def bump_chat_directory_version():
+    """Reload the chat directory in every process."""
+    global _checked_at
+    from django.db.models import F
+    from django.utils import timezone
+
+    from mysite.models import ReferenceDataVersion
+
+    updated = ReferenceDataVersion.objects.filter(name=VERSION_NAME).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        ReferenceDataVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+    _checked_at = 0.0
@@ -0,0 +1,360 @@
+"""
+Live message updates for the chat page: a Server-Sent Events stream under
+ASGI, short polling under WSGI.
+
+``notify_conversation`` is called when a TwilioMessage is saved or its AI
+status changes (save_message_to_db, _update_message_ai_result). After the
+transaction commits it sends one PostgreSQL NOTIFY on CHANNEL with the
+conversation SID as payload. Each process runs a single listener thread on
+its own connection (LISTEN) and fans the notification out to every open
+stream of that conversation through ``broker``; on other databases the
+notification is dispatched in-process only.
+
+A notification only wakes the stream: the rows themselves are read with a
+keyset query on (updated_at, id) past the client's cursor, so a missed or
+coalesced notification never loses a message. The cursor is sent as the SSE
+event id and comes back in ``Last-Event-ID`` when the browser reconnects.
+Delivery is at-least-once: after a reconnect, rows changed within
+CURSOR_OVERLAP before the cursor are sent again and the page replaces the
+message by id.
+
+A stream that waits for notifications would hold a whole sync worker under
+WSGI (gunicorn), so there ``poll_changes`` answers at once with the same
+keyset query as JSON and the page asks again every POLL_SECONDS. Each poll
+starts without stream state, so the cursor it returns (and the page's first
+cursor, ``conversation_cursor``) also lists the rows already delivered
+within CURSOR_OVERLAP before it: ``<cursor>~<id>@<micros>~...``. Those rows
+are only sent again when they change.
+
+Environment:
+    CHAT_STREAM_HEARTBEAT_SECONDS   seconds between keep-alive comments (default 15)
+    CHAT_STREAM_MAX_SECONDS         lifetime of one ASGI stream before the client reconnects (default 300)
+    CHAT_POLL_SECONDS               poll interval of the page under WSGI (default 5)
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+logger = logging.getLogger('mysite.common')
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+CHANNEL = 'chat_messages'
+HEARTBEAT_SECONDS = _env_int('CHAT_STREAM_HEARTBEAT_SECONDS', 15)
+MAX_STREAM_SECONDS = _env_int('CHAT_STREAM_MAX_SECONDS', 300)
+POLL_SECONDS = _env_int('CHAT_POLL_SECONDS', 5)
+RETRY_MS = 3000
+BATCH_SIZE = 100
+# Rows committed slightly out of updated_at order are re-read within this overlap
+CURSOR_OVERLAP = timedelta(seconds=2)
+LISTENER_RECONNECT_SECONDS = 5
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _micros(value):
+    # Integer arithmetic: a float timestamp can be off by a microsecond, and sent rows are matched exactly
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros):
+    return _EPOCH + int(micros) * _MICROSECOND
+
+
+def encode_cursor(updated_at, message_id, sent=None):
+    """Event id of (updated_at, id); ``sent`` ({id: updated_at}) adds the rows delivered in the overlap."""
+    value = f"{_micros(updated_at)}-{message_id}"
+    seen = [f"~{pk}@{_micros(at)}" for pk, at in sorted((sent or {}).items()) if pk != message_id]
+    return value + ''.join(seen)
+
+
+def decode_cursor(value):
+    """(updated_at, id) from an event id, or None when it is missing or malformed."""
+    try:
+        micros, message_id = str(value).split('~', 1)[0].split('-', 1)
+        return _from_micros(micros), int(message_id)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def decode_sent(value):
+    """{id: updated_at} delivered according to a cursor from encode_cursor (the cursor row included)."""
+    cursor = decode_cursor(value)
+    if cursor is None:
+        return {}
+    sent = {cursor[1]: cursor[0]}
+    for item in str(value).split('~')[1:]:
+        try:
+            pk, micros = item.split('@', 1)
+            sent[int(pk)] = _from_micros(micros)
+        except (ValueError, OverflowError, OSError):
+            continue
+    return sent
+
+
+def conversation_cursor(conversation):
+    """
+    Cursor of the most recently changed message in ``conversation`` with the
+    rows in the overlap before it, which the page renders (None if it has none).
+    """
+    latest = (conversation.messages.order_by('-updated_at', '-id')
+              .values_list('updated_at', 'id').first())
+    if latest is None:
+        return None
+    recent = (conversation.messages.filter(updated_at__gte=latest[0] - CURSOR_OVERLAP)
+              .order_by('-updated_at', '-id').values_list('id', 'updated_at')[:BATCH_SIZE])
+    return encode_cursor(*latest, sent=dict(recent))
+
+
+class Subscription:
+    """One open stream; ``notify`` may be called from any thread."""
+
+    def __init__(self, conversation_sid, loop=None):
+        self.conversation_sid = conversation_sid
+        self._loop = loop
+        self._event = asyncio.Event() if loop is not None else threading.Event()
+
+    def notify(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+    def wait(self, timeout):
+        woke = self._event.wait(timeout)
+        self._event.clear()
+        return woke
+
+    async def wait_async(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+
+
+class ChatStreamBroker:
+    """Fans conversation notifications out to the open streams of this process."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, conversation_sid, loop=None):
+        subscription = Subscription(conversation_sid, loop)
+        with self._lock:
+            self._subscriptions.setdefault(conversation_sid, set()).add(subscription)
+        self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.conversation_sid)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.conversation_sid]
+
+    def subscriber_count(self, conversation_sid=None):
+        with self._lock:
+            if conversation_sid is not None:
+                return len(self._subscriptions.get(conversation_sid, ()))
+            return sum(len(s) for s in self._subscriptions.values())
+
+    def dispatch(self, conversation_sid):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(conversation_sid, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.notify()
+            except RuntimeError:
+                # Event loop of a finished stream is already closed
+                self.unsubscribe(subscription)
+        return len(subscriptions)
+
+    def _ensure_listener(self):
+        if connection.vendor != 'postgresql':
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='chat-stream-listen', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """LISTEN on a dedicated connection while any stream is open; reconnect on failure."""
+        from django.db import connections
+
+        while True:
+            with self._lock:
+                if not self._subscriptions:
+                    self._listener = None
+                    return
+            raw = None
+            try:
+                wrapper = connections['default']
+                raw = wrapper.get_new_connection(wrapper.get_connection_params())
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                while self.subscriber_count():
+                    if select.select([raw], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    raw.poll()
+                    sids = {notify.payload for notify in raw.notifies}
+                    raw.notifies.clear()
+                    for sid in sids:
+                        self.dispatch(sid)
+            except Exception as e:
+                logger.warning(f"Chat stream listener failed, reconnecting: {e}")
+                time.sleep(LISTENER_RECONNECT_SECONDS)
+                # Wake every stream so nothing sent while disconnected is missed
+                with self._lock:
+                    sids = list(self._subscriptions)
+                for sid in sids:
+                    self.dispatch(sid)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+
+broker = ChatStreamBroker()
+
+
+def notify_conversation(conversation_sid):
+    """Wake the open streams of ``conversation_sid`` in every process once the current transaction commits."""
+    if not conversation_sid:
+        return
+    transaction.on_commit(lambda: _send_notification(conversation_sid))
+
+
+def _send_notification(conversation_sid):
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, conversation_sid])
+        else:
+            broker.dispatch(conversation_sid)
+    except Exception as e:
+        logger.warning(f"Chat stream notification failed for {conversation_sid}: {e}")
+
+
+def fetch_changes(conversation_id, cursor, sent, limit=BATCH_SIZE):
+    """
+    Messages of the conversation changed since ``cursor`` ((updated_at, id) or
+    None), oldest change first. ``sent`` maps message id -> updated_at already
+    delivered on this stream and drops repeats from the overlap window.
+    """
+    from mysite.models import TwilioMessage
+
+    messages = TwilioMessage.objects.filter(conversation_id=conversation_id).order_by('updated_at', 'id')
+    if cursor is not None:
+        messages = messages.filter(updated_at__gte=cursor[0] - CURSOR_OVERLAP)
+    changes = []
+    for message in messages[:limit + len(sent)]:
+        if sent.get(message.id) == message.updated_at:
+            continue
+        changes.append(message)
+        if len(changes) >= limit:
+            break
+    return changes
+
+
+def format_event(data, event_id=None, event='message'):
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class _StreamState:
+    """Cursor and delivered-row bookkeeping shared by the SSE stream and short polls."""
+
+    def __init__(self, conversation, cursor, serialize, sent=None):
+        self.conversation_id = conversation.pk
+        self.cursor = cursor
+        self.serialize = serialize
+        # The row the cursor points at was delivered, plus the overlap rows the cursor lists
+        self.sent = dict(sent or {})
+        if cursor:
+            self.sent[cursor[1]] = cursor[0]
+
+    def changes(self):
+        """[(payload, cursor after it)] for everything changed since the last call (runs the DB query)."""
+        changed = []
+        while True:
+            messages = fetch_changes(self.conversation_id, self.cursor, self.sent)
+            for message in messages:
+                key = (message.updated_at, message.id)
+                self.sent[message.id] = message.updated_at
+                if self.cursor is None or key > self.cursor:
+                    self.cursor = key
+                changed.append((self.serialize(message), encode_cursor(*self.cursor)))
+            if len(messages) < BATCH_SIZE:
+                break
+        if self.cursor is not None:
+            horizon = self.cursor[0] - CURSOR_OVERLAP
+            self.sent = {pk: at for pk, at in self.sent.items() if at >= horizon}
+        return changed
+
+    def poll(self):
+        """SSE chunks for everything changed since the last poll."""
+        return ''.join(format_event(payload, event_id) for payload, event_id in self.changes())
+
+
+def poll_changes(conversation, cursor, serialize, sent=None):
+    """
+    One short poll (WSGI): ``{'messages': [...], 'cursor': ..., 'poll_ms': ...}``
+    with the messages changed since ``cursor`` and not in ``sent`` (see
+    decode_sent). The returned cursor lists the overlap rows delivered so far;
+    it is None when nothing changed and the page keeps sending its own.
+    """
+    state = _StreamState(conversation, cursor, serialize, sent)
+    changed = state.changes()
+    return {
+        'messages': [payload for payload, _ in changed],
+        'cursor': encode_cursor(*state.cursor, sent=state.sent) if changed else None,
+        'poll_ms': POLL_SECONDS * 1000,
+    }
+
+
+async def astream_events(conversation, cursor, serialize, max_seconds=None, sent=None):
+    """Async SSE generator (ASGI); waiting on the broker holds no thread."""
+    from asgiref.sync import sync_to_async
+
+    max_seconds = MAX_STREAM_SECONDS if max_seconds is None else max_seconds
+    state = _StreamState(conversation, cursor, serialize, sent)
+    subscription = broker.subscribe(conversation.conversation_sid, loop=asyncio.get_running_loop())
+    deadline = time.monotonic() + max_seconds
+    poll = sync_to_async(state.poll)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            chunk = await poll()
+            yield chunk or ': ping\n\n'
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await subscription.wait_async(min(HEARTBEAT_SECONDS, remaining))
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,266 @@
+"""
+Error aggregation window and asynchronous alert delivery for unified_logger.
+
+``log_error`` only appends to the in-process ``ErrorAggregator`` keyed by
+error hash; nothing touches the database or Telegram on the request path.
+A background thread flushes the window every ERROR_FLUSH_SECONDS: each hash
+is upserted into ErrorLog (occurrence counter plus first/last seen, grouped
+into one row per hash per AGGREGATION_WINDOW as before).
+
+High/critical errors are alerted at most once per ERROR_ALERT_THROTTLE_SECONDS
+per hash. The throttle is a lease on ``ErrorLog.telegram_sent_at`` taken with
+a conditional update, so it holds across workers. Occurrences that arrive
+while a hash is throttled are counted and reported in one digest message
+every ERROR_DIGEST_SECONDS. Alerts and digests go through a bounded queue
+served by a separate sender thread, so a slow Telegram API never delays a
+flush.
+
+Environment:
+    ERROR_FLUSH_SECONDS            seconds between flushes (default 5)
+    ERROR_ALERT_THROTTLE_SECONDS   minimum seconds between alerts per hash (default 900)
+    ERROR_DIGEST_SECONDS           seconds between digests of throttled errors (default 900)
+    ERROR_MAX_PENDING              distinct hashes held between flushes (default 500)
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+logger = logging.getLogger('mysite.common')
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+FLUSH_SECONDS = _env_int('ERROR_FLUSH_SECONDS', 5)
+ALERT_THROTTLE_SECONDS = _env_int('ERROR_ALERT_THROTTLE_SECONDS', 900)
+DIGEST_SECONDS = _env_int('ERROR_DIGEST_SECONDS', 900)
+MAX_PENDING = _env_int('ERROR_MAX_PENDING', 500)
+ALERT_QUEUE_SIZE = 100
+DIGEST_MAX_LINES = 20
+AGGREGATION_WINDOW = timedelta(hours=1)
+
+
+class ErrorAggregator:
+    """
+    Bounded per-hash error counters flushed to ErrorLog in the background.
+
+    ``send`` delivers a Telegram message and returns True on success;
+    ``format_alert`` renders an ErrorLog row as an alert message.
+    """
+
+    def __init__(self, send, format_alert, flush_seconds=FLUSH_SECONDS, throttle_seconds=ALERT_THROTTLE_SECONDS,
+                 digest_seconds=DIGEST_SECONDS, max_pending=MAX_PENDING, autostart=True):
+        self.send = send
+        self.format_alert = format_alert
+        self.flush_seconds = flush_seconds
+        self.throttle_seconds = throttle_seconds
+        self.digest_seconds = digest_seconds
+        self.max_pending = max_pending
+        self.autostart = autostart
+        self.dropped = 0
+        self.alerts_dropped = 0
+        self._pending = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._alerts = queue.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self._next_digest = time.monotonic() + digest_seconds
+        self._flush_thread = None
+        self._alert_thread = None
+
+    def add(self, error_hash, fields, alert=False):
+        """Count one occurrence; returns False when the window is full and it was dropped."""
+        now = timezone.now()
+        with self._lock:
+            entry = self._pending.get(error_hash)
+            if entry is None:
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    return False
+                entry = self._pending[error_hash] = {'fields': fields, 'count': 0, 'first_seen': now,
+                                                     'last_seen': now, 'alert': False}
+            entry['count'] += 1
+            entry['last_seen'] = now
+            entry['alert'] = entry['alert'] or alert
+        if self.autostart:
+            self._ensure_started()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return sum(entry['count'] for entry in self._pending.values())
+
+    def _ensure_started(self):
+        if self._flush_thread is not None and self._flush_thread.is_alive():
+            return
+        with self._lock:
+            if self._flush_thread is None or not self._flush_thread.is_alive():
+                self._flush_thread = threading.Thread(target=self._run_flusher, name='error-log-flush', daemon=True)
+                self._flush_thread.start()
+            if self._alert_thread is None or not self._alert_thread.is_alive():
+                self._alert_thread = threading.Thread(target=self._run_sender, name='error-alert-send', daemon=True)
+                self._alert_thread.start()
+
+    def _run_flusher(self):
+        from django.db import connection
+
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                if self.pending() or self._suppressed:
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error log flush failed: {e}", exc_info=True)
+            finally:
+                connection.close()
+
+    def _run_sender(self):
+        from django.db import connection
+
+        while True:
+            item = self._alerts.get()
+            try:
+                self._deliver(item)
+            except Exception as e:
+                logger.error(f"Error alert delivery failed: {e}", exc_info=True)
+            finally:
+                connection.close()
+                self._alerts.task_done()
+
+    def flush(self):
+        """Upsert the pending window into ErrorLog and queue due alerts; returns the number of hashes written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            written = 0
+            try:
+                for error_hash, entry in list(pending.items()):
+                    row_id = self._upsert(error_hash, entry)
+                    del pending[error_hash]
+                    written += 1
+                    if entry['alert']:
+                        self._alert_or_suppress(row_id, error_hash, entry)
+            except Exception:
+                # Put back what was not written so the next flush retries it
+                self._restore(pending)
+                raise
+            if self._suppressed and time.monotonic() >= self._next_digest:
+                self._queue_digest()
+            return written
+
+    def _upsert(self, error_hash, entry):
+        from django.db.models import F
+
+        from mysite.models import ErrorLog
+
+        row_id = (ErrorLog.objects.filter(error_hash=error_hash, last_occurrence__gte=entry['last_seen'] - AGGREGATION_WINDOW)
+                  .order_by('-last_occurrence').values_list('id', flat=True).first())
+        if row_id is not None:
+            ErrorLog.objects.filter(pk=row_id).update(occurrences=F('occurrences') + entry['count'],
+                                                      last_occurrence=entry['last_seen'])
+            return row_id
+        row = ErrorLog.objects.create(error_hash=error_hash, occurrences=entry['count'], **entry['fields'])
+        # timestamp/last_occurrence are auto fields; store when the errors actually happened
+        ErrorLog.objects.filter(pk=row.pk).update(timestamp=entry['first_seen'], last_occurrence=entry['last_seen'])
+        return row.pk
+
+    def _alert_or_suppress(self, row_id, error_hash, entry):
+        from django.db.models import Q
+
+        from mysite.models import ErrorLog
+
+        now = timezone.now()
+        leased = ErrorLog.objects.filter(pk=row_id).filter(
+            Q(telegram_sent_at__isnull=True) | Q(telegram_sent_at__lt=now - timedelta(seconds=self.throttle_seconds))
+        ).update(telegram_sent_at=now)
+        if leased:
+            self._enqueue(('alert', row_id, entry['count']))
+            return
+        fields = entry['fields']
+        suppressed = self._suppressed.setdefault(error_hash, {
+            'count': 0, 'error_type': fields.get('error_type'), 'context': fields.get('context'),
+            'severity': fields.get('severity'),
+        })
+        suppressed['count'] += entry['count']
+
+    def _queue_digest(self):
+        suppressed, self._suppressed = self._suppressed, {}
+        self._next_digest = time.monotonic() + self.digest_seconds
+        ranked = sorted(suppressed.values(), key=lambda s: -s['count'])
+        minutes = max(1, round(self.digest_seconds / 60))
+        msg = f"🔁 <b>ERROR DIGEST</b>\n\nRepeated errors with throttled alerts (last {minutes} min):\n"
+        for item in ranked[:DIGEST_MAX_LINES]:
+            msg += f"• {item['count']}× [{(item['severity'] or '').upper()}] {item['error_type']} — {(item['context'] or '')[:100]}\n"
+        if len(ranked) > DIGEST_MAX_LINES:
+            msg += f"... and {len(ranked) - DIGEST_MAX_LINES} more\n"
+        self._enqueue(('digest', msg, sum(item['count'] for item in ranked)))
+
+    def _enqueue(self, item):
+        try:
+            self._alerts.put_nowait(item)
+        except queue.Full:
+            self.alerts_dropped += 1
+
+    def _deliver(self, item):
+        from mysite.models import ErrorLog
+
+        kind, payload, count = item
+        if kind == 'digest':
+            return self.send(payload)
+        error_log = ErrorLog.objects.filter(pk=payload).first()
+        if error_log is None:
+            return False
+        message = self.format_alert(error_log)
+        if count > 1:
+            message += f"\n\n🔁 <b>Occurrences:</b> {count}"
+        sent = self.send(message)
+        if sent:
+            ErrorLog.objects.filter(pk=payload).update(telegram_sent=True)
+        return sent
+
+    def deliver_pending(self):
+        """Send queued alerts on the calling thread (for commands and tests); returns how many were handled."""
+        handled = 0
+        while True:
+            try:
+                item = self._alerts.get_nowait()
+            except queue.Empty:
+                return handled
+            try:
+                self._deliver(item)
+            finally:
+                self._alerts.task_done()
+            handled += 1
+
+    def drain(self, timeout=10):
+        """Flush now and wait up to ``timeout`` seconds for queued alerts to be sent."""
+        self.flush()
+        deadline = time.monotonic() + timeout
+        sender_alive = self._alert_thread is not None and self._alert_thread.is_alive()
+        if not sender_alive:
+            self.deliver_pending()
+            return
+        while self._alerts.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _restore(self, pending):
+        with self._lock:
+            for error_hash, entry in pending.items():
+                current = self._pending.get(error_hash)
+                if current is None:
+                    self._pending[error_hash] = entry
+                    continue
+                current['count'] += entry['count']
+                current['first_seen'] = min(current['first_seen'], entry['first_seen'])
+                current['alert'] = current['alert'] or entry['alert']
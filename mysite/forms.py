@@ -8,6 +8,7 @@ import uuid
 from datetime import datetime
 from django.utils import timezone
 from django.db.models import Case, When, Value, IntegerField
+from mysite.reference_data import get_reference_data
 
 class CustomUserLoginForm(AuthenticationForm):
     username = forms.EmailField(
@@ -40,20 +41,19 @@ def get_dropdown_options(identifier, isData=False, request=None):
     """
 
     if identifier == 'managers':
-        items = User.objects.filter(role='Manager').order_by('full_name')
         if isData:
             return User.objects.all().order_by('full_name')
-        return [{"value": item.id, "label": item.full_name} for item in items]
+        return [{"value": item.id, "label": item.full_name} for item in get_reference_data().managers]
 
     elif identifier == 'apartments':
-        if request and hasattr(request, 'user') and getattr(request.user, 'role', None) == 'Manager':
-            items = Apartment.objects.filter(
-                managers=request.user).order_by('name')
-        else:
-            items = Apartment.objects.all().order_by('name')
+        is_manager = request and hasattr(request, 'user') and getattr(request.user, 'role', None) == 'Manager'
         if isData:
-            return items
-        return [{"value": item.id, "label": item.name, "manager_ids": [m.id for m in item.managers.all()], "notes": item.notes or ""} for item in items]
+            if is_manager:
+                return Apartment.objects.filter(managers=request.user).order_by('name')
+            return Apartment.objects.all().order_by('name')
+        ref = get_reference_data()
+        items = ref.apartments_for_manager(request.user.id) if is_manager else ref.apartments_by_name_order
+        return [{"value": item.id, "label": item.name, "manager_ids": list(ref.apartment_manager_ids[item.id]), "notes": item.notes or ""} for item in items]
 
     elif identifier == 'cleaners':
         items = User.objects.filter(role='Cleaner').order_by('full_name')
@@ -86,10 +86,9 @@ def get_dropdown_options(identifier, isData=False, request=None):
         return [{"value": item.id, "label": item.full_name} for item in items]
 
     elif identifier == 'payment_methods':
-        items = PaymentMethod.objects.filter(type='Payment Method')
         if isData:
-            return items
-        return [{"value": item.id, "label": item.name} for item in items]
+            return PaymentMethod.objects.filter(type='Payment Method')
+        return [{"value": item.id, "label": item.name} for item in get_reference_data().payment_methods_of_type('Payment Method')]
 
     elif identifier == 'is_rent_car':
         items = [True, False]
@@ -98,10 +97,9 @@ def get_dropdown_options(identifier, isData=False, request=None):
         return [{"value": "true", "label": "Rent"}, {"value": "false", "label": "Own"}]
 
     elif identifier == 'banks':
-        items = PaymentMethod.objects.filter(type='Bank')
         if isData:
-            return items
-        return [{"value": item.id, "label": item.name} for item in items]
+            return PaymentMethod.objects.filter(type='Bank')
+        return [{"value": item.id, "label": item.name} for item in get_reference_data().payment_methods_of_type('Bank')]
 
     elif identifier == 'bookings':
         from datetime import timedelta
@@ -141,17 +139,18 @@ def get_dropdown_options(identifier, isData=False, request=None):
         return [{"value": x[0], "label": x[1]} for x in PaymenType.CATEGORY]
 
     elif identifier == 'payment_type':
-        items = PaymenType.objects.annotate(
-            type_order=Case(
-                When(type='In', then=Value(1)),
-                When(type='Out', then=Value(2)),
-                default=Value(3),
-                output_field=IntegerField(),
-            )
-        ).order_by('type_order', 'name')
-        
         if isData:
-            return items
+            return PaymenType.objects.annotate(
+                type_order=Case(
+                    When(type='In', then=Value(1)),
+                    When(type='Out', then=Value(2)),
+                    default=Value(3),
+                    output_field=IntegerField(),
+                )
+            ).order_by('type_order', 'name')
+        type_order = {'In': 1, 'Out': 2}
+        # Name order comes from the database; the sort is stable
+        items = sorted(get_reference_data().payment_types_by_name_order, key=lambda pt: type_order.get(pt.type, 3))
         return [{"value": item.id, "label": item.full_name2} for item in items]
 
     elif identifier == 'payment_status':
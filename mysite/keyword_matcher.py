@@ -0,0 +1,306 @@
+"""
+Compiled keyword matching for bank statement rows.
+
+``KeywordAutomaton`` is an Aho-Corasick automaton: all patterns are compiled
+into one trie with failure links, and ``find(text)`` reports every pattern that
+occurs in ``text`` in a single pass over its characters.
+
+``PaymentKeywordMatcher`` compiles payment method, payment type and apartment
+names/keywords into one automaton, tagged by category and owner, and gives the
+same answers as ``match_payment_method``, ``match_payment_type``,
+``match_apartment_candidates`` and ``match_apartment`` in
+mysite/views/payment_sync_v2.py (first owner in list order wins, keyword ties
+are broken by hit count, then longest hit). ``BookingContextMatcher`` does the
+same for ``match_booking_context_candidates``.
+
+Usage:
+    from mysite.keyword_matcher import PaymentKeywordMatcher
+
+    matcher = PaymentKeywordMatcher(payment_methods, apartments, payment_types)  # once per upload
+    result = matcher.classify(description, amount_float)                         # once per row
+    result['payment_type'], result['payment_method'], result['apartment_candidates']
+"""
+from collections import deque
+
+PM_NAME = 'payment_method_name'
+PM_KEYWORD = 'payment_method_keyword'
+PT_NAME = 'payment_type_name'
+PT_KEYWORD = 'payment_type_keyword'
+APT_NAME = 'apartment_name'
+APT_KEYWORD = 'apartment_keyword'
+MOBILE_DEPOSIT = 'mobile_deposit'
+TENANT_NAME = 'tenant_name'
+BOOKING_KEYWORD = 'booking_keyword'
+
+
+def _normalize(value):
+    return (str(value or '')).strip().lower()
+
+
+def _split_keywords(value):
+    if not value:
+        return []
+    return [k.strip().lower() for k in str(value).split(',') if k and str(k).strip()]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton answering "which patterns occur in this text"."""
+
+    def __init__(self):
+        self._ids = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        # The empty pattern occurs in every text
+        self._always = set()
+        self._built = True
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, pattern):
+        """Add ``pattern`` and return its id (the same id for a repeated pattern)."""
+        pattern_id = self._ids.get(pattern)
+        if pattern_id is not None:
+            return pattern_id
+        pattern_id = len(self._ids)
+        self._ids[pattern] = pattern_id
+        if not pattern:
+            self._always.add(pattern_id)
+            return pattern_id
+        node = 0
+        for ch in pattern:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[node][ch] = child
+            node = child
+        self._out[node] = self._out[node] + (pattern_id,)
+        self._built = False
+        return pattern_id
+
+    def build(self):
+        """Compute failure links; called automatically by ``find``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[child] = target if target != child else 0
+                out[child] = out[child] + out[fail[child]]
+        self._built = True
+
+    def find(self, text):
+        """Set of ids of the patterns that occur in ``text``."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self._always)
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class _TaggedAutomaton:
+    """KeywordAutomaton whose patterns map to (category, owner index, hit length) tags."""
+
+    def __init__(self):
+        self.automaton = KeywordAutomaton()
+        self._tags = {}
+
+    def add(self, pattern, category, index, length=None):
+        pattern_id = self.automaton.add(pattern)
+        self._tags.setdefault(pattern_id, []).append((category, index, len(pattern) if length is None else length))
+
+    def scan(self, text):
+        """{category: {owner index: [hit lengths]}} for ``text``; repeated keywords count once per repeat."""
+        hits = {}
+        for pattern_id in self.automaton.find(text):
+            for category, index, length in self._tags.get(pattern_id, ()):
+                hits.setdefault(category, {}).setdefault(index, []).append(length)
+        return hits
+
+
+def _best_keyword_index(keyword_hits, indexes):
+    """Owner index with the most keyword hits, then the longest hit; earlier owners win ties."""
+    best = None
+    best_hits = 0
+    best_longest = 0
+    for index in sorted(indexes):
+        lengths = keyword_hits[index]
+        longest = max(lengths)
+        if len(lengths) > best_hits or (len(lengths) == best_hits and longest > best_longest):
+            best = index
+            best_hits = len(lengths)
+            best_longest = longest
+    return best
+
+
+class PaymentKeywordMatcher:
+    """Classify statement descriptions against payment methods, payment types and apartments."""
+
+    def __init__(self, payment_methods, apartments, payment_types):
+        self.payment_methods = list(payment_methods)
+        self.apartments = list(apartments)
+        self.payment_types = list(payment_types)
+        self._tagged = _TaggedAutomaton()
+
+        for index, pm in enumerate(self.payment_methods):
+            if getattr(pm, 'type', None) != 'Payment Method':
+                continue
+            self._tagged.add(pm.name.lower(), PM_NAME, index)
+            if pm.keywords:
+                # Empty entries (e.g. a trailing comma) match every row, as in match_payment_method
+                for keyword in pm.keywords.split(','):
+                    self._tagged.add(keyword.strip().lower(), PM_KEYWORD, index)
+        self._tagged.add('deposit *mobile', MOBILE_DEPOSIT, -1)
+        self.check_payment_method = next((pm for pm in self.payment_methods if pm.name == 'Check'), None)
+
+        banks = [pm for pm in self.payment_methods if pm.type == 'Bank']
+        self.default_bank = next((pm for pm in banks if (pm.name or '').lower() == 'ba'), None) or next(
+            (pm for pm in banks if 'bank of america' in (pm.name or '').lower()), None
+        )
+
+        for index, pt in enumerate(self.payment_types):
+            if pt.name:
+                self._tagged.add(pt.name.strip().lower(), PT_NAME, index)
+            if pt.keywords:
+                for keyword in pt.keywords.split(','):
+                    keyword = keyword.strip()
+                    if keyword:
+                        self._tagged.add(keyword.lower(), PT_KEYWORD, index, len(keyword))
+        self._other_payment_type = {}
+        self._first_payment_type = {}
+        for pt in self.payment_types:
+            self._first_payment_type.setdefault(pt.type, pt)
+            if pt.name == 'Other':
+                self._other_payment_type.setdefault(pt.type, pt)
+
+        for index, apt in enumerate(self.apartments):
+            name = _normalize(getattr(apt, 'name', ''))
+            if name:
+                self._tagged.add(name, APT_NAME, index)
+            for keyword in _split_keywords(getattr(apt, 'keywords', None)):
+                self._tagged.add(keyword, APT_KEYWORD, index)
+
+        # Build now so the matcher can be shared between threads
+        self._tagged.automaton.build()
+
+    def scan(self, description):
+        return self._tagged.scan(_normalize(description))
+
+    def classify(self, description, amount_float):
+        """Payment type, payment method and apartment candidates from one pass over ``description``."""
+        hits = self.scan(description)
+        return {
+            'payment_type': self._payment_type(hits, amount_float),
+            'payment_method': self._payment_method(hits),
+            'apartment_candidates': self._apartment_candidates(hits) if _normalize(description) else [],
+        }
+
+    def payment_method(self, description):
+        return self._payment_method(self.scan(description))
+
+    def payment_type(self, description, amount_float):
+        return self._payment_type(self.scan(description), amount_float)
+
+    def apartment_candidates(self, description):
+        if not _normalize(description):
+            return []
+        return self._apartment_candidates(self.scan(description))
+
+    def apartment(self, description):
+        if not _normalize(description):
+            return None
+        hits = self.scan(description)
+        names = hits.get(APT_NAME)
+        if names:
+            return self.apartments[min(names)]
+        keywords = hits.get(APT_KEYWORD, {})
+        best = _best_keyword_index(keywords, keywords)
+        return self.apartments[best] if best is not None else None
+
+    def _payment_method(self, hits):
+        names = hits.get(PM_NAME)
+        if names:
+            return self.payment_methods[min(names)]
+        if MOBILE_DEPOSIT in hits:
+            return self.check_payment_method
+        keywords = hits.get(PM_KEYWORD)
+        if keywords:
+            return self.payment_methods[min(keywords)]
+        return None
+
+    def _payment_type(self, hits, amount_float):
+        direction = 'In' if amount_float > 0 else 'Out'
+        names = [i for i in hits.get(PT_NAME, ()) if self.payment_types[i].type == direction]
+        if names:
+            return self.payment_types[min(names)]
+        keywords = hits.get(PT_KEYWORD, {})
+        best = _best_keyword_index(keywords, [i for i in keywords if self.payment_types[i].type == direction])
+        if best is not None:
+            return self.payment_types[best]
+        return self._other_payment_type.get(direction) or self._first_payment_type.get(direction)
+
+    def _apartment_candidates(self, hits):
+        names = hits.get(APT_NAME)
+        if names:
+            return [self.apartments[i] for i in sorted(names)]
+        return [self.apartments[i] for i in sorted(hits.get(APT_KEYWORD, ()))]
+
+
+class BookingContextMatcher:
+    """Apartment and tenant names of bookings whose tenant name or keywords occur in a description."""
+
+    def __init__(self, bookings):
+        self.bookings = list(bookings or [])
+        self._tagged = _TaggedAutomaton()
+        for index, booking in enumerate(self.bookings):
+            apartment = getattr(booking, 'apartment', None)
+            if not _normalize(getattr(apartment, 'name', '')):
+                continue
+            tenant_full = _normalize(getattr(getattr(booking, 'tenant', None), 'full_name', ''))
+            if tenant_full:
+                self._tagged.add(tenant_full, TENANT_NAME, index)
+            for keyword in _split_keywords(getattr(booking, 'keywords', None)):
+                self._tagged.add(keyword, BOOKING_KEYWORD, index)
+        self._tagged.automaton.build()
+
+    def candidates(self, description):
+        """(apartment_names, tenant_names) in booking order, like match_booking_context_candidates."""
+        desc = _normalize(description)
+        if not desc:
+            return [], []
+        hits = self._tagged.scan(desc)
+        matched = set(hits.get(TENANT_NAME, ())) | set(hits.get(BOOKING_KEYWORD, ()))
+
+        apartment_names = []
+        seen_apartments = set()
+        tenant_names = []
+        seen_tenants = set()
+        for index in sorted(matched):
+            booking = self.bookings[index]
+            apartment = booking.apartment
+            apartment_key = _normalize(apartment.name)
+            if apartment_key not in seen_apartments:
+                seen_apartments.add(apartment_key)
+                apartment_names.append(apartment.name or apartment_key)
+            tenant_display = (getattr(getattr(booking, 'tenant', None), 'full_name', '') or '').strip()
+            tenant_key = _normalize(tenant_display)
+            if tenant_key and tenant_key not in seen_tenants:
+                seen_tenants.add(tenant_key)
+                tenant_names.append(tenant_display)
+        return apartment_names, tenant_names
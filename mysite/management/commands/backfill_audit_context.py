@@ -0,0 +1,167 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from mysite.models import AuditLog
+from mysite.signals import AUDIT_CONTEXT_FIELDS, complete_audit_contexts, get_audit_contexts
+
+
+def _as_id(value):
+    """Primary key from a serialized audit value: {'id', 'repr'} dict, number or digit string."""
+    if isinstance(value, dict):
+        value = value.get('id')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def _as_repr(value):
+    return value.get('repr') if isinstance(value, dict) else None
+
+
+def _has_context(context):
+    return bool(context['booking_id'] or context['apartment_id'] or context['tenant_id'])
+
+
+class Command(BaseCommand):
+    help = "Fill the booking/apartment/tenant context columns of AuditLog rows written before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many rows would be updated without making changes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows read and updated per batch (default 1000)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only backfill rows from the last N days (default: all rows)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = max(1, options['batch_size'])
+
+        logs = AuditLog.objects.filter(booking_id__isnull=True, apartment_id__isnull=True, tenant_id__isnull=True)
+        if options['days']:
+            logs = logs.filter(timestamp__gte=timezone.now() - timedelta(days=options['days']))
+        logs = logs.only('id', 'model_name', 'object_id', 'object_repr', 'old_values', 'new_values').order_by('id')
+
+        scanned = updated = 0
+        last_id = 0
+        while True:
+            batch = list(logs.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            scanned += len(batch)
+
+            contexts = self._contexts(batch)
+            changed = []
+            for log, context in zip(batch, contexts):
+                if not _has_context(context):
+                    continue
+                for field in AUDIT_CONTEXT_FIELDS:
+                    setattr(log, field, context[field])
+                changed.append(log)
+            if changed and not dry_run:
+                AuditLog.objects.bulk_update(changed, AUDIT_CONTEXT_FIELDS)
+            updated += len(changed)
+            self.stdout.write(f"  scanned {scanned}, {'would update' if dry_run else 'updated'} {updated}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"DRY RUN: Would update {updated} of {scanned} audit log(s)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Successfully updated {updated} of {scanned} audit log(s)"))
+
+    def _contexts(self, batch):
+        """
+        Context columns for ``batch``: from the logged values first, then (for
+        updates that only logged the changed fields) from the object's current
+        row, then from other logs of the same object.
+        """
+        contexts = complete_audit_contexts([self._from_values(log) for log in batch])
+        self._from_current_rows(batch, contexts)
+        self._from_other_logs(batch, contexts)
+        return contexts
+
+    def _from_values(self, log):
+        values = {**(log.old_values or {}), **(log.new_values or {})}
+        context = dict.fromkeys(AUDIT_CONTEXT_FIELDS)
+        object_id = _as_id(log.object_id)
+        if log.model_name == 'Booking':
+            context['booking_id'] = object_id
+        elif log.model_name == 'Apartment':
+            context['apartment_id'] = object_id
+            context['apartment_name'] = values.get('name') or log.object_repr
+        elif log.model_name == 'User':
+            if values.get('role') == 'Tenant':
+                context['tenant_id'] = object_id
+                context['tenant_name'] = values.get('full_name') or log.object_repr
+            return context
+
+        context['booking_id'] = context['booking_id'] or _as_id(values.get('booking'))
+        if not context['apartment_id']:
+            context['apartment_id'] = _as_id(values.get('apartment'))
+            context['apartment_name'] = _as_repr(values.get('apartment'))
+        context['tenant_id'] = _as_id(values.get('tenant'))
+        context['tenant_name'] = _as_repr(values.get('tenant'))
+        return context
+
+    def _unresolved(self, batch, contexts):
+        """{model_name: {object_id: [context, ...]}} of logs still without any context."""
+        unresolved = {}
+        for log, context in zip(batch, contexts):
+            if _has_context(context) or _as_id(log.object_id) is None:
+                continue
+            values = {**(log.old_values or {}), **(log.new_values or {})}
+            if log.model_name == 'User' and 'role' in values:
+                continue  # role was logged and is not Tenant
+            unresolved.setdefault(log.model_name, {}).setdefault(_as_id(log.object_id), []).append(context)
+        return unresolved
+
+    def _from_current_rows(self, batch, contexts):
+        for model_name, by_id in self._unresolved(batch, contexts).items():
+            try:
+                model = apps.get_model('mysite', model_name)
+            except LookupError:
+                continue
+            instances = list(model.objects.filter(pk__in=by_id))
+            for instance, found in zip(instances, get_audit_contexts(instances)):
+                for context in by_id[instance.pk]:
+                    context.update(found)
+
+    def _from_other_logs(self, batch, contexts):
+        unresolved = self._unresolved(batch, contexts)
+        if not unresolved:
+            return
+        # Resolved logs of the same objects in this batch, then in the table
+        known = {}
+        for log, context in zip(batch, contexts):
+            if _has_context(context):
+                known.setdefault((log.model_name, _as_id(log.object_id)), context)
+        for model_name, by_id in unresolved.items():
+            missing = [object_id for object_id in by_id if (model_name, object_id) not in known]
+            if missing:
+                others = (AuditLog.objects.filter(model_name=model_name, object_id__in=[str(i) for i in missing])
+                          .filter(Q(booking_id__isnull=False) | Q(apartment_id__isnull=False) | Q(tenant_id__isnull=False))
+                          .order_by('-id').values('object_id', *AUDIT_CONTEXT_FIELDS))
+                for other in others:
+                    known.setdefault((model_name, _as_id(other.pop('object_id'))), other)
+            for object_id, waiting in by_id.items():
+                found = known.get((model_name, object_id))
+                if found is not None:
+                    for context in waiting:
+                        context.update({field: found[field] for field in AUDIT_CONTEXT_FIELDS})
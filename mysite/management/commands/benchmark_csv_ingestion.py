@@ -0,0 +1,128 @@
+"""
+Benchmark streaming bank statement ingestion against the previous read-everything flow.
+Run: python manage.py benchmark_csv_ingestion --rows 100000
+A synthetic statement is written to a temp file; bookings referenced as N{id}
+(and fallback payment types) are created inside a transaction that is rolled back at the end.
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from mysite.keyword_matcher import PaymentKeywordMatcher
+from mysite.models import Apartment, Booking, PaymenType
+from mysite.reference_data import get_reference_data
+from mysite.views.payment_sync_v2 import (
+    _is_payment_header_line, iter_csv_payment_batches, parse_csv_row, serialize_payment,
+)
+
+HEADER = 'Date,Description,Amount,Running Bal.'
+
+
+class _MessageSink:
+    def add(self, level, message, extra_tags=''):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare peak memory, time and queries of streaming CSV ingestion with the legacy flow"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--bookings', type=int, default=300)
+        parser.add_argument('--booking-share', type=float, default=0.05, help='Share of rows with an N{id} reference.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic(), tempfile.TemporaryDirectory() as directory:
+            booking_ids = self._create_data(options['bookings'])
+            path = os.path.join(directory, 'statement.csv')
+            self._write_statement(path, options['rows'], booking_ids, options['booking_share'], rng)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            self.stdout.write(f"rows={options['rows']} file={size_mb:.1f} MB bookings={len(booking_ids)}")
+
+            ref = get_reference_data()
+            matcher = PaymentKeywordMatcher(ref.payment_methods, ref.apartments, ref.payment_types)
+            legacy = self._measure('legacy', lambda: self._legacy(path, ref, matcher))
+            streamed = self._measure('streaming', lambda: self._streaming(path, ref, matcher))
+            transaction.set_rollback(True)
+
+        if legacy[0] != streamed[0]:
+            for i, (a, b) in enumerate(zip(legacy[0], streamed[0])):
+                if a != b:
+                    raise CommandError(f"Row {i} differs:\n{a}\n{b}")
+            raise CommandError(f"Row counts differ: {len(legacy[0])} vs {len(streamed[0])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Identical {len(streamed[0])} rows; peak memory {legacy[1] / max(streamed[1], 1):.1f}x lower, "
+            f"{legacy[2]} -> {streamed[2]} queries"
+        ))
+
+    def _create_data(self, count):
+        for direction in ('In', 'Out'):
+            PaymenType.objects.get_or_create(name='Other', type=direction)
+        apartment = Apartment.objects.create(name='QA ingestion apartment', bedrooms=1, bathrooms=1)
+        start = date(2024, 1, 1)
+        bookings = Booking.objects.bulk_create([
+            Booking(apartment=apartment, start_date=start + timedelta(days=i), end_date=start + timedelta(days=i + 30))
+            for i in range(count)
+        ])
+        return [booking.id for booking in bookings]
+
+    def _write_statement(self, path, rows, booking_ids, booking_share, rng):
+        day = date(2022, 1, 1)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write('Summary line\nBeginning balance,,"1,000.00"\n\n' + HEADER + '\n')
+            for i in range(rows):
+                day += timedelta(days=1 if rng.random() < 0.03 else 0)
+                description = f'ZELLE PAYMENT FROM TENANT {rng.randint(1, 900)} CONF# {rng.randint(10 ** 6, 10 ** 7)}'
+                if booking_ids and rng.random() < booking_share:
+                    description += f' N{rng.choice(booking_ids)} RENT'
+                amount = rng.choice([1, -1]) * rng.uniform(5, 5000)
+                f.write(f'{day:%m/%d/%Y},"{description}","{amount:,.2f}","{rng.uniform(0, 90000):,.2f}"\n')
+
+    def _measure(self, label, run):
+        reset_queries()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            rows = run()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        queries = len(ctx.captured_queries)
+        self.stdout.write(
+            f"{label:<10} {elapsed:8.2f} s  {len(rows) / elapsed:9.0f} rows/s  "
+            f"peak mem {peak / 1024 / 1024:8.1f} MB  queries {queries}"
+        )
+        return rows, peak, queries
+
+    def _legacy(self, path, ref, matcher):
+        """Previous parse_csv_file: whole file decoded, all lines listed, one booking query per reference."""
+        with open(path, 'rb') as f:
+            lines = [line for line in f.read().decode('utf-8').splitlines() if line.strip()]
+        start_index = next(i + 1 for i, line in enumerate(lines) if _is_payment_header_line(line))
+        payments = []
+        for idx, line in enumerate(lines[start_index:], start=start_index):
+            payment = parse_csv_row(line, idx, ref.payment_methods, ref.apartments, ref.payment_types, matcher=matcher)
+            if payment:
+                payments.append(payment)
+        return [serialize_payment(p) for p in payments]
+
+    def _streaming(self, path, ref, matcher):
+        request = RequestFactory().post('/payments-sync-v2/')
+        request._messages = _MessageSink()
+        rows = []
+        with open(path, 'rb') as f:
+            for batch in iter_csv_payment_batches(request, File(f), ref.payment_methods, ref.apartments,
+                                                  ref.payment_types, matcher=matcher):
+                rows.extend(serialize_payment(p) for p in batch)
+        return rows
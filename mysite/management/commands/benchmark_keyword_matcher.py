@@ -0,0 +1,141 @@
+"""
+Benchmark the compiled keyword matcher against the per-row match_* functions.
+Run: python manage.py benchmark_keyword_matcher --apartments 500 --payment-types 200 --rows 5000
+Objects are unsaved model instances, so no database rows are touched. Every
+row's result is compared with the legacy functions and must be identical.
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mysite.keyword_matcher import BookingContextMatcher, PaymentKeywordMatcher
+from mysite.models import Apartment, Booking, PaymenType, PaymentMethod, User
+from mysite.views.payment_sync_v2 import (
+    match_apartment, match_apartment_candidates, match_booking_context_candidates,
+    match_payment_method, match_payment_type,
+)
+
+WORDS = ['zelle', 'transfer', 'deposit', 'rent', 'payment', 'online', 'ach', 'wire', 'fee', 'pos',
+         'purchase', 'refund', 'utility', 'fpl', 'comcast', 'mobile', 'check', 'cash', 'ref', 'conf']
+STREETS = ['ocean', 'collins', 'bay', 'palm', 'harbor', 'sunset', 'coral', 'lincoln', 'pine', 'lake']
+
+
+class Command(BaseCommand):
+    help = "Compare compiled keyword matching with the per-row match_* functions on synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=500)
+        parser.add_argument('--payment-types', type=int, default=200)
+        parser.add_argument('--payment-methods', type=int, default=30)
+        parser.add_argument('--bookings', type=int, default=400)
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        apartments = self._apartments(options['apartments'], rng)
+        payment_types = self._payment_types(options['payment_types'], rng)
+        payment_methods = self._payment_methods(options['payment_methods'], rng)
+        bookings = self._bookings(options['bookings'], apartments, rng)
+        rows = self._rows(options['rows'], apartments, payment_types, payment_methods, bookings, rng)
+        self.stdout.write(
+            f"apartments={len(apartments)} payment_types={len(payment_types)} payment_methods={len(payment_methods)} "
+            f"bookings={len(bookings)} rows={len(rows)}"
+        )
+
+        t0 = time.perf_counter()
+        legacy = [
+            (
+                match_payment_type(description, amount, payment_types),
+                match_payment_method(description, payment_methods),
+                match_apartment_candidates(description, apartments),
+                match_apartment(description, apartments),
+                match_booking_context_candidates(description, bookings),
+            )
+            for description, amount in rows
+        ]
+        legacy_elapsed = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        matcher = PaymentKeywordMatcher(payment_methods, apartments, payment_types)
+        booking_matcher = BookingContextMatcher(bookings)
+        build_elapsed = time.perf_counter() - t0
+        compiled = []
+        for description, amount in rows:
+            classified = matcher.classify(description, amount)
+            compiled.append((
+                classified['payment_type'],
+                classified['payment_method'],
+                classified['apartment_candidates'],
+                matcher.apartment(description),
+                booking_matcher.candidates(description),
+            ))
+        compiled_elapsed = time.perf_counter() - t0
+
+        labels = ('payment_type', 'payment_method', 'apartment_candidates', 'apartment', 'booking_context')
+        for idx, (expected, actual) in enumerate(zip(legacy, compiled)):
+            for label, a, b in zip(labels, expected, actual):
+                if a != b:
+                    raise CommandError(f"Row {idx} {label} differs: {a!r} vs {b!r} ({rows[idx][0]!r})")
+
+        patterns = len(matcher._tagged.automaton) + len(booking_matcher._tagged.automaton)
+        self.stdout.write(f"legacy match_*      {legacy_elapsed * 1000:9.1f} ms  {len(rows) / legacy_elapsed:10.0f} rows/s")
+        self.stdout.write(
+            f"compiled matcher    {compiled_elapsed * 1000:9.1f} ms  {len(rows) / compiled_elapsed:10.0f} rows/s  "
+            f"(build {build_elapsed * 1000:.1f} ms, {patterns} patterns)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Identical results for {len(rows)} rows, {legacy_elapsed / compiled_elapsed:.1f}x faster"
+        ))
+
+    def _apartments(self, count, rng):
+        apartments = []
+        for i in range(count):
+            street = rng.choice(STREETS)
+            keywords = ', '.join({f'{street}{i}', f'unit {i}', rng.choice(STREETS)} if rng.random() < 0.7 else ())
+            apartments.append(Apartment(id=i + 1, name=f'{street.title()} {100 + i}', keywords=keywords or None))
+        return apartments
+
+    def _payment_types(self, count, rng):
+        payment_types = [PaymenType(id=1, name='Other', type='In'), PaymenType(id=2, name='Other', type='Out')]
+        for i in range(3, count + 1):
+            keywords = ', '.join(rng.sample(WORDS, rng.randint(0, 3)) + [f'pt{i}'])
+            payment_types.append(PaymenType(id=i, name=f'Type {i}', type=rng.choice(['In', 'Out']), keywords=keywords))
+        return payment_types
+
+    def _payment_methods(self, count, rng):
+        payment_methods = [PaymentMethod(id=1, name='Check', type='Payment Method', keywords='check, chk'),
+                           PaymentMethod(id=2, name='BA', type='Bank')]
+        for i in range(3, count + 1):
+            keywords = ', '.join(rng.sample(WORDS, rng.randint(0, 2)) + [f'pm{i}'])
+            payment_methods.append(PaymentMethod(id=i, name=f'Method {i}', type='Payment Method', keywords=keywords))
+        return payment_methods
+
+    def _bookings(self, count, apartments, rng):
+        bookings = []
+        for i in range(count):
+            tenant = User(id=10_000 + i, full_name=f'Tenant {rng.choice(STREETS)} {i}')
+            bookings.append(Booking(id=i + 1, apartment=rng.choice(apartments), tenant=tenant,
+                                    keywords=f'bk{i}' if rng.random() < 0.5 else None))
+        return bookings
+
+    def _rows(self, count, apartments, payment_types, payment_methods, bookings, rng):
+        rows = []
+        for _ in range(count):
+            parts = rng.sample(WORDS, 3) + [str(rng.randint(1000, 99999))]
+            if rng.random() < 0.5:
+                apartment = rng.choice(apartments)
+                parts.append(apartment.name if rng.random() < 0.5 else f'unit {apartment.id - 1}')
+            if rng.random() < 0.4:
+                parts.append(f'pt{rng.randint(3, len(payment_types))}')
+            if rng.random() < 0.3:
+                parts.append(f'pm{rng.randint(3, len(payment_methods))}')
+            if rng.random() < 0.3:
+                booking = rng.choice(bookings)
+                parts.append(booking.tenant.full_name if rng.random() < 0.5 else f'bk{booking.id - 1}')
+            if rng.random() < 0.05:
+                parts.append('DEPOSIT *MOBILE')
+            rng.shuffle(parts)
+            rows.append((' '.join(parts).upper(), rng.choice([1, -1]) * rng.uniform(10, 5000)))
+        return rows
@@ -0,0 +1,82 @@
+"""
+Benchmark the parking occupancy grid against the legacy per-day scan.
+Run: python manage.py benchmark_parking_occupancy --spots 200
+Uses unsaved in-memory objects, so no database rows are touched.
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from mysite.models import Parking, ParkingBooking
+from mysite.parking_occupancy import BOOKED, ParkingOccupancyGrid
+
+
+class Command(BaseCommand):
+    help = "Time occupancy grid build and monthly stats for many parking spots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spots', type=int, default=200, help='Number of parking spots (default: 200).')
+        parser.add_argument('--bookings-per-spot', type=int, default=6, help='Bookings per spot (default: 6).')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start_date = date(2026, 1, 1)
+        end_date = date(2026, 3, 31)
+        statuses = ['Booked', 'Unavailable', 'No Car']
+
+        parkings = [Parking(id=i + 1, number=str(i + 1), building='B') for i in range(options['spots'])]
+        bookings = []
+        for parking in parkings:
+            for _ in range(options['bookings_per_spot']):
+                start = start_date + timedelta(days=rng.randint(-20, 85))
+                bookings.append(ParkingBooking(
+                    id=len(bookings) + 1,
+                    parking_id=parking.id,
+                    status=rng.choice(statuses),
+                    start_date=start,
+                    end_date=start + timedelta(days=rng.randint(0, 30)),
+                ))
+
+        t0 = time.perf_counter()
+        legacy_booked = self._legacy_booked_days(parkings, bookings, start_date, end_date)
+        legacy_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        grid = ParkingOccupancyGrid(parkings, bookings, start_date, end_date)
+        grid_booked = grid.count(BOOKED, start_date, end_date)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        cache = {}
+        for month_start, month_end in grid.months():
+            grid.month_stats(month_start, month_end)
+            for row in range(len(parkings)):
+                grid.day_cells(row, month_start, month_end, cache)
+        render_ms = (time.perf_counter() - t0) * 1000
+
+        self.stdout.write(f"spots={len(parkings)} bookings={len(bookings)} days={grid.num_days}")
+        self.stdout.write(f"legacy scan:        {legacy_ms:8.1f} ms (booked days {legacy_booked})")
+        self.stdout.write(f"grid build + count: {build_ms:8.1f} ms (booked days {grid_booked})")
+        self.stdout.write(f"grid day cells:     {render_ms:8.1f} ms")
+        if legacy_booked != grid_booked:
+            self.stdout.write(self.style.ERROR("Booked day counts differ"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Booked day counts match"))
+
+    @staticmethod
+    def _legacy_booked_days(parkings, bookings, start_date, end_date):
+        booked = 0
+        for parking in parkings:
+            for_parking = [b for b in bookings if b.parking_id == parking.id]
+            day = start_date
+            while day <= end_date:
+                for p_booking in for_parking:
+                    if p_booking.start_date <= day <= p_booking.end_date:
+                        if p_booking.status == 'Booked':
+                            booked += 1
+                        break
+                day += timedelta(days=1)
+        return booked
@@ -0,0 +1,148 @@
+"""
+Benchmark the columnar payment payload against the serializers.serialize flow.
+Run: python manage.py benchmark_payment_payload --payments 6000
+Data is bulk-created inside a transaction that is rolled back at the end.
+Expanded columnar rows must equal the legacy get_json_list rows.
+"""
+import json
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from mysite.models import Apartment, Booking, PaymenType, Payment, PaymentMethod, User
+from mysite.payment_payload import PaymentColumns, expand_payment_payload, reference_payload
+from mysite.reference_data import get_reference_data
+
+
+def legacy_json_list(queryset):
+    """get_json_list before the columnar payload."""
+    data_list = json.loads(serializers.serialize('json', queryset))
+    items_list = [{'id': item['pk'], **item['fields']} for item in data_list]
+    for item, obj in zip(items_list, queryset):
+        if obj.booking:
+            tenant = obj.booking.tenant
+            item['tenant_name'] = (tenant.full_name or '') if tenant else ''
+            item['booking_display'] = (
+                f"{obj.booking.start_date.day} {obj.booking.start_date.strftime('%B')} - "
+                f"{obj.booking.end_date.day} {obj.booking.end_date.strftime('%B')}"
+            )
+        else:
+            item['tenant_name'] = ''
+            item['booking_display'] = None
+        item['apartment_name'] = obj.apartmentName
+        item['bank_name'] = obj.bank.name if obj.bank else None
+        if obj.payment_type:
+            item['payment_type_name'] = f"{obj.payment_type.name} ({obj.payment_type.type})"
+            item['payment_type_obj'] = {'id': obj.payment_type.id, 'name': obj.payment_type.name, 'type': obj.payment_type.type}
+        else:
+            item['payment_type_name'] = None
+            item['payment_type_obj'] = None
+        item['payment_method_name'] = obj.payment_method.name if obj.payment_method else None
+    return items_list
+
+
+def legacy_reference_json(queryset):
+    """get_json before the reference endpoint: every field of every row, embedded in each page."""
+    data_list = json.loads(serializers.serialize('json', queryset))
+    items_list = [{'id': item['pk'], **item['fields']} for item in data_list]
+    for item in items_list:
+        item['tenant_name'] = ''
+        item['bank_name'] = None
+    return json.dumps(items_list)
+
+
+class Command(BaseCommand):
+    help = "Compare payload size, serialization time and queries of columnar vs serializer-based payment JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=6000)
+        parser.add_argument('--apartments', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self._create_data(options['payments'], options['apartments'], rng)
+            queryset = Payment.objects.filter(notes__startswith='QA payload').select_related(
+                'payment_type', 'payment_method', 'apartment', 'booking__tenant', 'bank'
+            )
+
+            legacy, legacy_time, legacy_queries = self._measure(
+                lambda: json.dumps(legacy_json_list(queryset.all())) + ''.join(
+                    legacy_reference_json(model.objects.all()) for model in (PaymentMethod, Apartment, PaymenType)
+                )
+            )
+            columnar, columnar_time, columnar_queries = self._measure(lambda: PaymentColumns(queryset.all()).to_json())
+            reference = json.dumps(reference_payload(get_reference_data()))
+
+            # Neither query is ordered, so compare by id
+            expected = sorted(json.loads(json.dumps(legacy_json_list(queryset.all()))), key=lambda p: p['id'])
+            actual = sorted(expand_payment_payload(json.loads(columnar)), key=lambda p: p['id'])
+            if len(expected) != len(actual):
+                raise CommandError(f"Row counts differ: {len(expected)} vs {len(actual)}")
+            for old, new in zip(expected, actual):
+                if old != new:
+                    diff = {k: (old.get(k), new.get(k)) for k in set(old) | set(new) if old.get(k) != new.get(k)}
+                    raise CommandError(f"Payment {old['id']} differs: {diff}")
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"payments={options['payments']} apartments={options['apartments']}")
+        self.stdout.write(f"legacy page payload   {len(legacy) / 1024:9.1f} KB  {legacy_time * 1000:8.1f} ms  queries {legacy_queries}")
+        self.stdout.write(f"columnar page payload {len(columnar) / 1024:9.1f} KB  {columnar_time * 1000:8.1f} ms  queries {columnar_queries}")
+        self.stdout.write(f"reference endpoint    {len(reference) / 1024:9.1f} KB  (fetched once, then 304 via ETag)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Identical rows; payload {len(legacy) / len(columnar):.1f}x smaller, "
+            f"serialization {legacy_time / columnar_time:.1f}x faster"
+        ))
+
+    def _measure(self, run):
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - t0
+        return result, elapsed, len(ctx.captured_queries)
+
+    def _create_data(self, payments, apartment_count, rng):
+        apartments = Apartment.objects.bulk_create([
+            Apartment(name=f'QA payload {i}', bedrooms=1, bathrooms=1, keywords=f'qa{i}, unit {i}')
+            for i in range(apartment_count)
+        ])
+        tenants = User.objects.bulk_create([
+            User(email=f'qa-payload-{i}@example.com', full_name=f'QA Tenant {i}', role='Tenant')
+            for i in range(apartment_count)
+        ])
+        start = date(2025, 1, 1)
+        bookings = Booking.objects.bulk_create([
+            Booking(apartment=apartments[i], tenant=tenants[i], start_date=start + timedelta(days=i % 90),
+                    end_date=start + timedelta(days=i % 90 + 30))
+            for i in range(apartment_count)
+        ])
+        types = PaymenType.objects.bulk_create([
+            PaymenType(name=f'QA Type {i}', type='In' if i % 2 else 'Out') for i in range(40)
+        ])
+        methods = PaymentMethod.objects.bulk_create(
+            [PaymentMethod(name=f'QA Method {i}', type='Payment Method') for i in range(15)]
+            + [PaymentMethod(name=f'QA Bank {i}', type='Bank') for i in range(3)]
+        )
+        banks = [m for m in methods if m.type == 'Bank']
+        Payment.objects.bulk_create([
+            Payment(
+                payment_date=start + timedelta(days=rng.randint(0, 120)),
+                amount=Decimal(rng.randint(100, 500000)) / 100,
+                payment_type=rng.choice(types),
+                payment_status=rng.choice(['Pending', 'Completed', 'Merged']),
+                payment_method=rng.choice(methods) if rng.random() < 0.9 else None,
+                bank=rng.choice(banks) if rng.random() < 0.8 else None,
+                # A payment is linked to a booking or an apartment, never both
+                **({'booking': rng.choice(bookings)} if rng.random() < 0.6 else {'apartment': rng.choice(apartments)}),
+                notes=f'QA payload ZELLE {rng.randint(1, 10 ** 6)}',
+            )
+            for _ in range(payments)
+        ])
@@ -0,0 +1,266 @@
+"""
+Benchmark the hot views against a deterministic synthetic dataset.
+Run: python manage.py benchmark_suite --scale 1 --repeat 5 [--compare logs/benchmarks/<previous>.json]
+
+The dataset (mysite/benchmark_dataset.py) is generated inside a transaction
+that is rolled back at the end, so nothing is left in the database. Each
+case is requested through the full middleware stack with the Django test
+client; timings, query counts and DB time are written as JSON so runs can
+be compared between versions. twilio_webhook runs in AI test mode with a
+stub AI client: no OpenRouter or Twilio calls are made.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from mysite import perf_telemetry, query_inspector
+from mysite.benchmark_dataset import generate_dataset
+from mysite.models import Payment
+from mysite.query_inspector import QueryRecorder
+from mysite.views import messaging
+
+BENCHMARK_DIR = os.path.join(settings.BASE_DIR, 'logs', 'benchmarks')
+API_TOKEN = 'benchmark-token'
+CASES = (
+    'dashboard.index',
+    'booking_availability',
+    'apartments_analytics',
+    'paymentReport',
+    'match_selection_v2',
+    'ApartmentBookingDates',
+    'chat_list',
+    'twilio_webhook',
+)
+
+
+class StubAIClient:
+    """OpenAI-compatible client that answers instantly with a fixed reply."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Check-out is at 11 AM."))],
+            usage=SimpleNamespace(prompt_tokens=800, completion_tokens=12, total_tokens=812),
+        )
+
+
+@contextlib.contextmanager
+def patched_env(**values):
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def summarize(timings, recorders):
+    ordered = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min_ms': round(ordered[0], 2),
+        'median_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 2),
+        'mean_ms': round(statistics.fmean(ordered), 2),
+        'max_ms': round(ordered[-1], 2),
+        'queries': int(statistics.median(r.count for r in recorders)),
+        'queries_max': max(r.count for r in recorders),
+        'db_ms': round(statistics.median(r.duration * 1000 for r in recorders), 2),
+        'max_repeats': max(r.max_repeats for r in recorders),
+    }
+
+
+class Command(BaseCommand):
+    help = "Time the hot views on a generated dataset and record timings and query counts as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Dataset size multiplier (1 = 40 apartments, ~480 bookings).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--anchor', help='Anchor date YYYY-MM-DD for the dataset (default: today).')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (default: 5).')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per case (default: 1).')
+        parser.add_argument('--cases', help=f"Comma-separated subset of: {', '.join(CASES)}")
+        parser.add_argument('--output', help='Result JSON path (default: logs/benchmarks/benchmark-<time>.json).')
+        parser.add_argument('--compare', help='Previous result JSON to compare against.')
+
+    def handle(self, *args, **options):
+        cases = [c.strip() for c in options['cases'].split(',')] if options['cases'] else list(CASES)
+        unknown = set(cases) - set(CASES)
+        if unknown:
+            raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        anchor = date.fromisoformat(options['anchor']) if options['anchor'] else date.today()
+
+        saved_latency = perf_telemetry.latency_aggregator._stats
+        saved_queries = query_inspector.recent_requests()
+        perf_telemetry.latency_aggregator._stats = {}
+        original_ai_client = messaging._get_ai_client
+        self.ai = StubAIClient()
+        messaging._get_ai_client = lambda: self.ai
+        try:
+            with patched_env(API_AUTH_TOKEN=API_TOKEN, AI_ASSISTANT_ENABLED='false'), transaction.atomic():
+                t0 = time.perf_counter()
+                self.dataset = generate_dataset(scale=options['scale'], seed=options['seed'], anchor=anchor)
+                generate_seconds = time.perf_counter() - t0
+                self.stdout.write(f"dataset scale={options['scale']} seed={options['seed']} anchor={anchor} "
+                                  f"({generate_seconds:.1f}s): {self.dataset.counts}")
+                self.client = Client()
+                self.client.force_login(self.dataset.admin)
+                self._prepare()
+                results = {name: self._run_case(name, options['warmup'], options['repeat']) for name in cases}
+                transaction.set_rollback(True)
+        finally:
+            messaging._get_ai_client = original_ai_client
+            perf_telemetry.latency_aggregator._stats = saved_latency
+            query_inspector.clear()
+            for entry in reversed(saved_queries):
+                query_inspector.record(entry)
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': options['scale'],
+            'seed': options['seed'],
+            'anchor': anchor.isoformat(),
+            'repeat': options['repeat'],
+            'warmup': options['warmup'],
+            'dataset': self.dataset.counts,
+            'generate_seconds': round(generate_seconds, 2),
+            'stub_ai_calls': self.ai.calls,
+            'results': results,
+        }
+        previous = self._load(options['compare']) if options['compare'] else None
+        self._print(results, previous)
+
+        output = options['output'] or os.path.join(BENCHMARK_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def _prepare(self):
+        anchor = self.dataset.anchor
+        payment = (Payment.objects.filter(booking_id__in=self.dataset.booking_ids, payment_date__gte=anchor - timedelta(days=45))
+                   .order_by('payment_date', 'id').first())
+        if payment is None:
+            raise CommandError("Dataset has no recent booking payment to match")
+        self.match_body = json.dumps({
+            'selected_file_ids': ['bench-file-1'],
+            'selected_file_payments': [{
+                'id': 'bench-file-1', 'amount': float(payment.amount), 'payment_date': payment.payment_date.isoformat(),
+                'notes': 'Zelle payment',
+            }],
+        })
+        if not self.dataset.conversations:
+            raise CommandError("Dataset has no Twilio conversations")
+        self.apartment_ids = ','.join(str(pk) for pk in self.dataset.apartment_ids[:20])
+        self.webhook_runs = 0
+
+    def _request(self, name):
+        client = self.client
+        if name == 'dashboard.index':
+            return client.get(reverse('index'))
+        if name == 'booking_availability':
+            return client.get(reverse('booking_availability'))
+        if name == 'apartments_analytics':
+            return client.get(reverse('apartments_analytics'))
+        if name == 'paymentReport':
+            return client.get(reverse('paymentReport'))
+        if name == 'match_selection_v2':
+            return client.post(reverse('match_selection_v2'), data=self.match_body, content_type='application/json')
+        if name == 'ApartmentBookingDates':
+            return client.get(reverse('apartment_booking_dates'), {'auth_token': API_TOKEN, 'apartment_ids': self.apartment_ids})
+        if name == 'chat_list':
+            return client.get(reverse('chat_list'))
+        if name == 'twilio_webhook':
+            conversation_sid, tenant_phone = self.dataset.conversations[self.webhook_runs % len(self.dataset.conversations)]
+            self.webhook_runs += 1
+            return client.post(reverse('twilio_webhook'), {
+                'EventType': 'onMessageAdded',
+                'ConversationSid': conversation_sid,
+                'MessageSid': f'IMbench-run-{self.webhook_runs:05d}',
+                'WebhookSid': 'WHbench',
+                'Author': tenant_phone,
+                'Body': 'What time is check-out on the last day?',
+            })
+        raise CommandError(f"Unknown case {name}")
+
+    def _run_case(self, name, warmup, repeat):
+        timings, recorders = [], []
+        status = None
+        sink = io.StringIO()  # several views print debug output
+        for run in range(warmup + repeat):
+            recorder = QueryRecorder()
+            with transaction.atomic():
+                t0 = time.perf_counter()
+                with connection.execute_wrapper(recorder), contextlib.redirect_stdout(sink):
+                    response = self._request(name)
+                elapsed = (time.perf_counter() - t0) * 1000
+            status = response.status_code
+            if status >= 400:
+                raise CommandError(f"{name} returned {status}: {response.content[:300]!r}")
+            if run >= warmup:
+                timings.append(elapsed)
+                recorders.append(recorder)
+        return {'status': status, **summarize(timings, recorders)}
+
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read comparison file {path}: {e}")
+
+    def _print(self, results, previous):
+        before = (previous or {}).get('results', {})
+        if previous:
+            self.stdout.write(f"compared with {previous.get('git_revision') or '?'} ({previous.get('created_at')}, "
+                              f"scale {previous.get('scale')})")
+        self.stdout.write(f"{'case':<24}{'median ms':>11}{'p95 ms':>10}{'queries':>9}{'db ms':>9}{'repeats':>9}"
+                          + (f"{'Δ median':>11}{'Δ queries':>11}" if previous else ''))
+        for name, result in results.items():
+            line = (f"{name:<24}{result['median_ms']:>11.1f}{result['p95_ms']:>10.1f}{result['queries']:>9}"
+                    f"{result['db_ms']:>9.1f}{result['max_repeats']:>9}")
+            old = before.get(name)
+            if old:
+                change = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+                line += f"{change:>+10.0f}%{result['queries'] - old['queries']:>+11}"
+            elif previous:
+                line += f"{'new':>11}"
+            self.stdout.write(line)
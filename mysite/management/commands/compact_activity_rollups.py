@@ -0,0 +1,27 @@
+"""
+Roll up closed hours of AuditLog, ErrorLog and SystemLog into ActivityRollup (cron).
+Run: python manage.py compact_activity_rollups [--rebuild]
+The first run rolls up the whole history, later runs only the hours closed since.
+"""
+from django.core.management.base import BaseCommand
+
+from mysite import activity_rollup
+from mysite.models import ActivityRollup, ActivityRollupCursor
+
+
+class Command(BaseCommand):
+    help = "Roll up closed hours of the audit, error and system logs for the activity report and dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop all rollups and roll up the whole history again.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            ActivityRollupCursor.objects.all().delete()
+            ActivityRollup.objects.all().delete()
+        written = activity_rollup.compact()
+        cursors = ', '.join(
+            f"{source} until {closed:%Y-%m-%d %H:%M %Z}" if closed else f"{source} empty"
+            for source, closed in ActivityRollupCursor.objects.order_by('source').values_list('source', 'closed_until')
+        )
+        self.stdout.write(self.style.SUCCESS(f"{written} rollup rows written; {cursors}"))
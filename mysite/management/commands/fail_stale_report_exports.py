@@ -0,0 +1,18 @@
+"""
+Mark report export jobs lost with their worker (restart, deploy) as failed (cron).
+Run: python manage.py fail_stale_report_exports
+A job is lost when its progress heartbeat is older than STALE_JOB_SECONDS.
+"""
+from django.core.management.base import BaseCommand
+
+from mysite.report_export import STALE_JOB_SECONDS, fail_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Mark report export jobs without a heartbeat for STALE_JOB_SECONDS as failed"
+
+    def handle(self, *args, **options):
+        failed = fail_stale_jobs()
+        self.stdout.write(self.style.SUCCESS(
+            f"{failed} stale report export job(s) marked failed (no heartbeat for {STALE_JOB_SECONDS // 60} min)"
+        ))
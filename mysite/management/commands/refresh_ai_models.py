@@ -0,0 +1,27 @@
+"""
+Refresh the cached AI model catalog now (deploys, cron).
+Run: python manage.py refresh_ai_models [--force]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from mysite.model_catalog import openrouter_catalog
+from mysite.models import AIModelCatalogSnapshot
+
+
+class Command(BaseCommand):
+    help = "Fetch the OpenRouter model list into the AI model catalog snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Fetch even if the stored list is still fresh.')
+
+    def handle(self, *args, **options):
+        refreshed = openrouter_catalog.refresh(force=options['force'])
+        snapshot = AIModelCatalogSnapshot.objects.get(name=openrouter_catalog.name)
+        if not refreshed:
+            raise CommandError(
+                f"Refresh failed: {snapshot.last_error or 'another worker is refreshing'}; "
+                f"keeping {len(snapshot.items or [])} models from {snapshot.fetched_at or 'never'}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(snapshot.items)} models, fetched at {snapshot.fetched_at:%Y-%m-%d %H:%M:%S %Z}"
+        ))
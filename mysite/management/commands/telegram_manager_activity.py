@@ -1,9 +1,15 @@
 """
 Daily Manager Activity Report - Telegram Notification
 Sends a daily summary of all database changes (create/update/delete) for core models to Telegram group.
+Counts come from the hourly activity rollups (mysite/activity_rollup.py); only the
+latest MAX_DETAILS_PER_MODEL changes per user and model are read and listed.
 """
 from datetime import timedelta, date
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
+from mysite import activity_rollup
+from mysite.activity_rollup import IGNORED_FIELDS, format_value, has_real_changes
 from mysite.models import AuditLog
 from mysite.management.commands.base_command import BaseCommandWithErrorHandling
 from mysite.unified_logger import log_info, log_error
@@ -14,15 +20,12 @@ import requests
 # Core models to track
 TRACKED_MODELS = ['Payment', 'Booking', 'Cleaning', 'Apartment', 'User', 'ParkingBooking', 'HandyManBooking']
 
-# Fields to ignore (auto-updated timestamps and tracking fields, not real changes)
-IGNORED_FIELDS = [
-    'updated_at', 'created_at', 'modified_at', 'last_modified', 'timestamp',
-    'last_updated_by', 'last_updated_at', 'modified_by', 'created_by'
-]
-
 # Telegram message limit
 MAX_MESSAGE_LENGTH = 4000  # Leave some buffer from 4096
 
+# Changes listed per user and model; the rest is summarized as "+N more"
+MAX_DETAILS_PER_MODEL = 30
+
 
 def send_telegram_message(chat_id, token, message):
     """Send a message to Telegram"""
@@ -80,16 +83,6 @@ def split_message(message, max_length=MAX_MESSAGE_LENGTH):
     return messages
 
 
-def format_value(value):
-    """Format a value for display (no shortening; only trim whitespace)."""
-    if value is None:
-        return "None"
-    # Keep full value; just trim edges and avoid multiline breaking formatting.
-    value_str = str(value).strip()
-    value_str = " ".join(value_str.splitlines()).strip()
-    return value_str
-
-
 def extract_apartment_name(log):
     """Extract apartment name from log data"""
     values = log.new_values if log.action in ['create', 'update'] else log.old_values
@@ -216,27 +209,6 @@ def format_change_detail(log):
     return detail
 
 
-def has_real_changes(log):
-    """
-    Check if a log entry has real changes (not just auto-updated timestamps).
-    Returns True if there are meaningful field changes.
-    Also filters out false positives where old and new values display the same (e.g. 3300.0 → 3300.0).
-    """
-    if log.action != 'update':
-        return True  # Creates and deletes are always real changes
-    
-    if not log.changed_fields:
-        return False
-    
-    real_fields = [f for f in log.changed_fields if f not in IGNORED_FIELDS]
-    for field in real_fields:
-        old_val = log.old_values.get(field) if log.old_values else None
-        new_val = log.new_values.get(field) if log.new_values else None
-        if format_value(old_val) != format_value(new_val):
-            return True
-    return False
-
-
 def get_real_changed_fields(log):
     """Get list of changed fields excluding ignored auto-update fields"""
     if not log.changed_fields:
@@ -244,43 +216,63 @@ def get_real_changed_fields(log):
     return [f for f in log.changed_fields if f not in IGNORED_FIELDS]
 
 
+def get_recent_changes(since, limit=None):
+    """
+    {(user, model): [log, ...]} with the latest ``limit`` real changes per user
+    and model since ``since``. Reads at most 2 * ``limit`` rows per group
+    (auto-timestamp updates are filtered out in Python).
+    """
+    limit = limit or MAX_DETAILS_PER_MODEL
+    ranked = AuditLog.objects.filter(
+        timestamp__gte=since,
+        model_name__in=TRACKED_MODELS
+    ).annotate(
+        rank=Window(RowNumber(), partition_by=[F('changed_by'), F('model_name')], order_by=F('timestamp').desc())
+    ).filter(rank__lte=2 * limit).order_by('-timestamp')
+    
+    changes = {}
+    for log in ranked:
+        if not has_real_changes(log):
+            continue
+        group = changes.setdefault((log.changed_by or 'Unknown', log.model_name), [])
+        if len(group) < limit:
+            group.append(log)
+    return changes
+
+
 def generate_daily_report():
     """
-    Generate the daily activity report from AuditLog.
+    Generate the daily activity report from the activity rollups.
     Returns a list of messages (split if needed).
     """
     # Get logs from the last 24 hours
     yesterday = timezone.now() - timedelta(hours=24)
     
-    logs = AuditLog.objects.filter(
-        timestamp__gte=yesterday,
-        model_name__in=TRACKED_MODELS
-    ).order_by('model_name', '-timestamp')
+    rows = activity_rollup.counts(
+        'audit', yesterday,
+        group_by=('user', 'kind', 'action'),
+        filters={'kind__in': TRACKED_MODELS},
+    )
     
-    if not logs.exists():
+    if not rows:
         return ["📊 <b>Daily Manager Activity Report</b>\n\nNo changes recorded in the last 24 hours for tracked models."]
     
-    # Group logs by user first, then by model
-    logs_by_user = {}
+    # Count real changes by user first, then by model
+    counts_by_user = {}
     summary = {'create': 0, 'update': 0, 'delete': 0}
     skipped_count = 0
     
-    for log in logs:
-        # Skip updates that only changed auto-timestamp fields
-        if not has_real_changes(log):
-            skipped_count += 1
+    for row in rows:
+        # Updates that only changed auto-timestamp fields are counted as noise
+        skipped_count += row['noise']
+        real = row['count'] - row['noise']
+        if not real or row['action'] not in summary:
             continue
         
-        user = log.changed_by or 'Unknown'
-        model = log.model_name
-        
-        if user not in logs_by_user:
-            logs_by_user[user] = {}
-        if model not in logs_by_user[user]:
-            logs_by_user[user][model] = []
-        
-        logs_by_user[user][model].append(log)
-        summary[log.action] += 1
+        user = row['user'] or 'Unknown'
+        model_counts = counts_by_user.setdefault(user, {})
+        model_counts[row['kind']] = model_counts.get(row['kind'], 0) + real
+        summary[row['action']] += real
     
     # Check if any real changes exist
     total_changes = sum(summary.values())
@@ -291,6 +283,8 @@ def generate_daily_report():
             msg += f"<i>({skipped_count} auto-timestamp updates filtered out)</i>"
         return [msg]
     
+    recent_changes = get_recent_changes(yesterday)
+    
     # Build the report
     today = date.today().strftime("%Y-%m-%d")
     
@@ -309,9 +303,9 @@ def generate_daily_report():
     details = ""
     
     # Sort users alphabetically
-    for user in sorted(logs_by_user.keys()):
-        user_models = logs_by_user[user]
-        user_total = sum(len(logs) for logs in user_models.values())
+    for user in sorted(counts_by_user.keys()):
+        user_models = counts_by_user[user]
+        user_total = sum(user_models.values())
         
         details += f"\n👤 <b>{user}</b> ({user_total} changes)\n"
         
@@ -320,13 +314,15 @@ def generate_daily_report():
             if model not in user_models:
                 continue
             
-            model_logs = user_models[model]
-            model_logs.sort(key=lambda x: x.timestamp, reverse=True)
+            model_total = user_models[model]
+            model_logs = recent_changes.get((user, model), [])
             
-            details += f"\n   📁 <b>{model}</b> ({len(model_logs)} changes)\n"
+            details += f"\n   📁 <b>{model}</b> ({model_total} changes)\n"
             
             for log in model_logs:
                 details += format_change_detail(log) + "\n\n"
+            if model_total > len(model_logs):
+                details += f"      <i>... +{model_total - len(model_logs)} earlier changes</i>\n\n"
         
         details += "─" * 30 + "\n"
     
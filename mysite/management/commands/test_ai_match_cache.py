@@ -0,0 +1,178 @@
+"""
+Verify the AI match cache and batch matching without calling OpenRouter.
+Run: python manage.py test_ai_match_cache
+A fake chat client replaces the OpenRouter client for the duration of the
+command; all data is created inside a transaction that is rolled back at the end.
+"""
+import json
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+
+from mysite import ai_match_cache
+from mysite.models import AIMatchCacheEntry, Apartment, PaymenType, Payment, User
+from mysite.views import payment_sync_v2
+
+START = date(2031, 3, 1)
+
+
+class FakeChatClient:
+    """Answers with the cheapest candidate; records concurrency and timeouts."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.timeouts = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature, timeout=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.timeouts.append(timeout)
+        try:
+            time.sleep(self.delay)
+            user_msg = messages[1]['content']
+            candidates = json.loads(user_msg[user_msg.index('DB candidates (choose best matches):\n') + 37:])
+            best = min(candidates, key=lambda c: c['amount'])
+            content = json.dumps([{'db_id': best['db_id'], 'score': 90, 'match_type': 'fake', 'criteria': 'cheapest'}])
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=50),
+            )
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class Command(BaseCommand):
+    help = "Check AI match caching, invalidation, batch concurrency and stats with a fake client"
+
+    def handle(self, *args, **options):
+        original_client = payment_sync_v2._openrouter_client
+        self.client = FakeChatClient()
+        payment_sync_v2._openrouter_client = lambda: (self.client, None)
+        try:
+            with transaction.atomic():
+                self._create_data()
+                self._check_single()
+                self._check_invalidation()
+                self._check_batch()
+                transaction.set_rollback(True)
+        finally:
+            payment_sync_v2._openrouter_client = original_client
+        self.stdout.write(self.style.SUCCESS("OK: AI match cache, invalidation and batch matching"))
+
+    def _create_data(self):
+        self.admin = User.objects.create(email='qa-ai-cache@example.com', full_name='QA AI Cache', role='Admin')
+        payment_type = PaymenType.objects.create(name='QA AI Rent', type='In')
+        apartment = Apartment.objects.create(name='QA AI Apartment', bedrooms=1, bathrooms=1)
+        self.payments = Payment.objects.bulk_create([
+            Payment(payment_date=START + timedelta(days=i), amount=Decimal(1000 + i * 10), payment_type=payment_type,
+                    payment_status='Pending', apartment=apartment, notes=f'QA AI {i}')
+            for i in range(40)
+        ])
+
+    def _selection(self, offset, amount=1500):
+        day = START + timedelta(days=offset)
+        return {
+            'selected_file_ids': [f'file-{offset}'],
+            'selected_file_payments': [{'id': f'file-{offset}', 'amount': amount, 'payment_date': day.isoformat()}],
+        }
+
+    def _post(self, view, body):
+        request = RequestFactory().post('/payments-sync-v2/', data=json.dumps(body), content_type='application/json')
+        request.user = self.admin
+        response = view(request)
+        if response.status_code != 200:
+            raise CommandError(f"{view.__name__} returned {response.status_code}: {response.content[:300]}")
+        return json.loads(response.content)
+
+    def _match(self, offset):
+        return self._post(payment_sync_v2.match_selection_v2, {'mode': 'ai', **self._selection(offset)})
+
+    def _check_single(self):
+        first = self._match(5)
+        second = self._match(5)
+        if self.client.calls != 1:
+            raise CommandError(f"Repeated selection called the model {self.client.calls} times")
+        if first['matched_payments'] != second['matched_payments'] or not first['matched_payments']:
+            raise CommandError("Cached answer differs from the original")
+        if first['ai_stats']['cache_hits'] != 0 or second['ai_stats']['cache_hits'] != 1:
+            raise CommandError(f"Unexpected stats: {first['ai_stats']} / {second['ai_stats']}")
+        if second['ai_stats']['tokens_saved'] != 1050 or first['ai_stats']['prompt_tokens'] != 1000:
+            raise CommandError(f"Token usage not reported: {first['ai_stats']} / {second['ai_stats']}")
+        if self.client.timeouts[-1] != payment_sync_v2.AI_MATCH_TIMEOUT_SECONDS:
+            raise CommandError("Per-call timeout not passed to the client")
+
+    def _check_invalidation(self):
+        entry = AIMatchCacheEntry.objects.get()
+        candidate = Payment.objects.get(id=entry.payment_ids[0])
+        candidate.notes = 'QA AI changed'
+        candidate.save()
+        if not AIMatchCacheEntry.objects.filter(pk=entry.pk).exists():
+            raise CommandError("Saving a payment should not delete cache entries (updated_at is in the key)")
+        self._match(5)
+        if self.client.calls != 2:
+            raise CommandError("Changed candidate was answered from the cache")
+
+        # QuerySet.update() skips signals, but the changed fields change the key
+        Payment.objects.filter(id=candidate.id).update(amount=Decimal('1.00'))
+        result = self._match(5)
+        if self.client.calls != 3 or result['ai_stats']['cache_hits'] != 0:
+            raise CommandError("Bulk-updated candidate was answered from the cache")
+        if result['matched_payments'][0]['db_payment']['id'] != candidate.id:
+            raise CommandError("Fresh answer does not reflect the updated candidate")
+
+        # Deleting a candidate drops the entries that listed it
+        listed = AIMatchCacheEntry.objects.filter(payment_ids__contains=[candidate.id]).count()
+        if not listed:
+            raise CommandError("No cache entry lists the candidate")
+        Payment.objects.filter(id=candidate.id).first().delete()
+        if AIMatchCacheEntry.objects.filter(payment_ids__contains=[candidate.id]).exists():
+            raise CommandError("Deleting a candidate did not invalidate its cache entries")
+
+    def _check_batch(self):
+        AIMatchCacheEntry.objects.all().delete()
+        self._match(20)  # cached before the batch
+        calls_before = self.client.calls
+        selections = [self._selection(offset) for offset in (20, 30, 35, 45, 50, 55)] + [
+            self._selection(30),  # duplicate of a pending one
+            {'selected_file_ids': ['bad'], 'selected_file_payments': [{'amount': 10}]},
+        ]
+        t0 = time.perf_counter()
+        body = self._post(payment_sync_v2.match_selections_batch_v2, {'selections': selections, 'max_workers': 3, 'timeout': 5})
+        elapsed = time.perf_counter() - t0
+
+        results = body['results']
+        stats = body['ai_stats']
+        new_calls = self.client.calls - calls_before
+        if new_calls != 5:
+            raise CommandError(f"Expected 5 model calls (1 cached, 1 duplicate), got {new_calls}")
+        if self.client.max_active > 3:
+            raise CommandError(f"max_workers=3 but {self.client.max_active} calls ran at once")
+        if elapsed > 5 * self.client.delay * 0.9:
+            raise CommandError(f"Batch took {elapsed:.2f}s; calls did not overlap")
+        if not results[0]['cached'] or results[1]['matched_payments'] != results[6]['matched_payments']:
+            raise CommandError("Cached/duplicate selections were not answered correctly")
+        if results[7]['error'] is None or any(r['error'] for r in results[:7]):
+            raise CommandError(f"Unexpected errors: {[r['error'] for r in results]}")
+        if stats['cache_hits'] != 1 or stats['requests'] != 6 or stats['prompt_tokens'] != 5000:
+            raise CommandError(f"Unexpected batch stats: {stats}")
+        if self.client.timeouts[-1] != 5:
+            raise CommandError("Batch timeout not passed to the client")
+        totals = ai_match_cache.cache_stats()
+        if totals['entries'] != 6 or totals['hits'] != 1:
+            raise CommandError(f"Unexpected cache totals: {totals}")
+        self.stdout.write(f"batch of {len(selections)}: {elapsed:.2f}s, {new_calls} calls, "
+                          f"max concurrency {self.client.max_active}, stats {stats}")
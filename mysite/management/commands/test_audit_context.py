@@ -0,0 +1,136 @@
+"""
+Verify the booking/apartment/tenant context columns of AuditLog: captured by
+the audit signals and audit_queryset_update, used by database_activity
+without per-row lookups, and filled for old rows by backfill_audit_context.
+Run: python manage.py test_audit_context
+All data is created inside a transaction that is rolled back at the end.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mysite.audit_bulk import audit_queryset_update
+from mysite.models import Apartment, AuditLog, Booking, PaymenType, Payment, User
+
+SMALL, LARGE = 3, 30
+
+
+class Command(BaseCommand):
+    help = "Check AuditLog context capture, the database_activity page and the context backfill"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_data()
+            self._check_capture()
+            self._check_page()
+            self._check_backfill()
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("OK: audit context capture, filtering and backfill"))
+
+    def _create_data(self):
+        self.admin = User.objects.create(email='qa-audit-ctx@example.com', full_name='QA Audit Admin', role='Admin')
+        self.apartment = Apartment.objects.create(name='QA Audit Ctx Apt', bedrooms=1, bathrooms=1)
+        self.tenant = User.objects.create(email='qa-audit-ctx-tenant@example.com', full_name='QA Audit Tenant', role='Tenant')
+        self.booking = Booking.objects.create(apartment=self.apartment, tenant=self.tenant, status='Confirmed',
+                                              start_date=date.today(), end_date=date.today() + timedelta(days=5))
+        self.payment_type = PaymenType.objects.create(name='QA Audit Rent', type='In')
+
+    def _payment(self, amount):
+        # Fresh instance with nothing related loaded, as in a form save
+        return Payment.objects.create(payment_date=date.today(), amount=Decimal(amount),
+                                      payment_type=self.payment_type, booking_id=self.booking.pk)
+
+    def _check_capture(self):
+        expected = {'booking_id': self.booking.pk, 'apartment_id': self.apartment.pk, 'apartment_name': self.apartment.name,
+                    'tenant_id': self.tenant.pk, 'tenant_name': self.tenant.full_name}
+        payment = self._payment(100)
+        audit_queryset_update(Payment.objects.filter(pk=payment.pk), changed_by='QA', amount=Decimal(150))
+        logs = {
+            'booking create': AuditLog.objects.get(model_name='Booking', object_id=str(self.booking.pk), action='create'),
+            'payment create': AuditLog.objects.get(model_name='Payment', object_id=str(payment.pk), action='create'),
+            'bulk update': AuditLog.objects.get(model_name='Payment', object_id=str(payment.pk), action='update'),
+        }
+        payment_id = payment.pk
+        payment.delete()
+        logs['payment delete'] = AuditLog.objects.get(model_name='Payment', object_id=str(payment_id), action='delete')
+        for label, log in logs.items():
+            captured = {field: getattr(log, field) for field in expected}
+            if captured != expected:
+                raise CommandError(f"{label}: context {captured} != {expected}")
+
+        apartment_log = AuditLog.objects.get(model_name='Apartment', object_id=str(self.apartment.pk), action='create')
+        tenant_log = AuditLog.objects.get(model_name='User', object_id=str(self.tenant.pk), action='create')
+        if apartment_log.apartment_id != self.apartment.pk or tenant_log.tenant_id != self.tenant.pk:
+            raise CommandError("Apartment/tenant rows do not reference themselves")
+        if AuditLog.objects.get(model_name='User', object_id=str(self.admin.pk), action='create').tenant_id:
+            raise CommandError("A non-tenant user was recorded as tenant")
+        self.stdout.write(f"captured context on {len(logs)} booking-related logs")
+
+    def _page_queries(self, client):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('database_activity'), {'apartment': 'QA Audit Ctx', 'days': 1})
+        if response.status_code != 200:
+            raise CommandError(f"database_activity returned {response.status_code}")
+        return len(ctx.captured_queries), response.content.decode()
+
+    def _check_page(self):
+        client = Client()
+        client.force_login(self.admin)
+        self._page_queries(client)  # warm the process caches (rollup cursors, reference data)
+        for i in range(SMALL):
+            self._payment(10 + i)
+        small, _ = self._page_queries(client)
+        for i in range(LARGE - SMALL):
+            self._payment(100 + i)
+        large, html = self._page_queries(client)
+        if large != small:
+            raise CommandError(f"database_activity queries grow with audit rows: {small} -> {large}")
+        if f"Tenant: {self.tenant.full_name}" not in html or f"Booking ({self.booking.pk})" not in html:
+            raise CommandError("Context links are missing from the page")
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(reverse('database_activity'), {'apartment': 'QA Audit Ctx', 'days': 1})
+        audit_sql = [q['sql'] for q in ctx.captured_queries if 'mysite_auditlog' in q['sql'] and 'COUNT(' in q['sql']]
+        if len(audit_sql) != 1 or '::text' in audit_sql[0] or 'new_values' in audit_sql[0].split('WHERE', 1)[-1]:
+            raise CommandError(f"Expected one summary query filtered on apartment_id: {audit_sql}")
+
+        # Rows of deleted apartments and parking rows only carry the captured apartment name
+        AuditLog.objects.create(model_name='Booking', object_id='999999996', object_repr='QA Audit Ctx deleted-apt booking',
+                                action='delete', apartment_id=999999997, apartment_name='QA Audit Ctx Old Apt')
+        AuditLog.objects.create(model_name='Parking', object_id='999999995', object_repr='QA Audit Ctx parking spot',
+                                action='update', apartment_name='QA Audit Ctx Apt')
+        _, html = self._page_queries(client)
+        if 'QA Audit Ctx deleted-apt booking' not in html or 'QA Audit Ctx parking spot' not in html:
+            raise CommandError("Apartment filter dropped rows that only match by the captured apartment name")
+        self.stdout.write(f"database_activity: {small} queries for {SMALL} and {LARGE} payments")
+
+    def _check_backfill(self):
+        log = AuditLog.objects.get(model_name='Booking', object_id=str(self.booking.pk), action='create')
+        AuditLog.objects.filter(model_name__in=['Booking', 'Payment']).filter(timestamp__gte=log.timestamp).update(
+            booking_id=None, apartment_id=None, apartment_name=None, tenant_id=None, tenant_name=None)
+        # Deleted booking: ids and names come from the logged values
+        AuditLog.objects.create(model_name='Payment', object_id='999999999', action='delete',
+                                old_values={'booking': {'id': 999999998, 'repr': 'Gone'},
+                                            'apartment': {'id': 999999997, 'repr': 'QA Gone Apt'}})
+
+        call_command('backfill_audit_context', days=1, dry_run=True, stdout=StringIO())
+        if AuditLog.objects.filter(object_id=str(self.booking.pk), model_name='Booking', booking_id__isnull=False).exists():
+            raise CommandError("Dry run wrote changes")
+        call_command('backfill_audit_context', days=1, batch_size=7, stdout=StringIO())
+        missing = AuditLog.objects.filter(model_name__in=['Booking', 'Payment'], timestamp__gte=log.timestamp,
+                                          tenant_id__isnull=True).exclude(object_id='999999999').count()
+        if missing:
+            raise CommandError(f"{missing} logs were not backfilled")
+        gone = AuditLog.objects.get(object_id='999999999')
+        if (gone.booking_id, gone.apartment_id, gone.apartment_name) != (999999998, 999999997, 'QA Gone Apt'):
+            raise CommandError("Deleted rows were not backfilled from the logged values")
+        log.refresh_from_db()
+        if log.tenant_name != self.tenant.full_name:
+            raise CommandError("Backfill did not resolve names")
+        self.stdout.write("backfill filled booking/payment logs")
@@ -0,0 +1,175 @@
+"""
+Verify the Rental Guru batch import (POST /api/bookings/batch/): the same
+number of queries for 5 and 50 bookings with payments, notifications and
+bulk audit rows for created rows, overlaps caught in memory (against the
+database and inside the batch), idempotent re-imports, plain vs date
+changes on existing bookings and payments, and the parking / cleaner
+options applied after the bulk write.
+Run: python manage.py test_booking_import
+All data is created inside a transaction that is rolled back at the end.
+"""
+import json
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mysite.models import (Apartment, AuditLog, Booking, Cleaning, Notification, Parking, ParkingBooking, PaymenType,
+                           Payment, User)
+
+SMALL, LARGE = 5, 50
+START = date(2031, 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Check the batch booking/payment import API: query count, overlaps, audit rows, updates"
+
+    def handle(self, *args, **options):
+        saved_token = os.environ.get('API_AUTH_TOKEN')
+        os.environ['API_AUTH_TOKEN'] = self.token = 'qa-booking-import-token'
+        try:
+            with transaction.atomic():
+                self.client = Client()
+                self.apartments = [Apartment.objects.create(name=f'QA Import Apt {i}', bedrooms=1, bathrooms=1)
+                                   for i in range(2)]
+                self.rent = PaymenType.objects.create(name='QA Import Rent', type='In')
+                self._check_queries()
+                self._check_overlaps()
+                self._check_reimport()
+                self._check_updates()
+                self._check_options()
+                self._check_malformed()
+                transaction.set_rollback(True)
+        finally:
+            if saved_token is None:
+                os.environ.pop('API_AUTH_TOKEN', None)
+            else:
+                os.environ['API_AUTH_TOKEN'] = saved_token
+        self.stdout.write(self.style.SUCCESS("OK: batch booking import"))
+
+    def _post(self, bookings, expected_status=200):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('api_rental_guru_batch_import_bookings'),
+                                        json.dumps({'auth_token': self.token, 'bookings': bookings}),
+                                        content_type='application/json')
+        if response.status_code != expected_status:
+            raise CommandError(f"Batch import returned {response.status_code}: {response.content[:300]}")
+        return response.json(), len(ctx.captured_queries)
+
+    def _booking(self, n, prefix, apartment=0, nights=3, **extra):
+        start = START + timedelta(days=n * (nights + 1))
+        return {
+            'source_id': f'{prefix}-{n}', 'apartment': self.apartments[apartment].id, 'status': 'Confirmed',
+            'start_date': start.isoformat(), 'end_date': (start + timedelta(days=nights)).isoformat(),
+            'tenant_email': f'qa-import-{prefix}-{n}@example.com', 'tenant_full_name': f'QA Import {n}',
+            'payments': [{'source_id': f'{prefix}-{n}-rent', 'payment_date': start.isoformat(), 'amount': 300 + n,
+                          'payment_type': self.rent.id}],
+            **extra,
+        }
+
+    def _check_queries(self):
+        self._post([self._booking(500, 'qw')])  # the first import creates the chat directory version row
+        audit_before = AuditLog.objects.filter(model_name='Booking', action='create').count()
+        small_data, small = self._post([self._booking(n, 'qs', apartment=0) for n in range(SMALL)])
+        large_data, large = self._post([self._booking(n, 'ql', apartment=1) for n in range(LARGE)])
+        if small_data['created_count'] != SMALL or large_data['created_count'] != LARGE:
+            raise CommandError(f"Created {small_data['created_count']} / {large_data['created_count']} bookings")
+        if large != small:
+            raise CommandError(f"Batch import queries grow with the batch: {small} -> {large}")
+
+        booking_ids = [result['booking_id'] for result in large_data['results']]
+        if AuditLog.objects.filter(model_name='Booking', action='create').count() - audit_before != SMALL + LARGE:
+            raise CommandError("Created bookings are missing audit rows")
+        notifications = Notification.objects.filter(booking_id__in=booking_ids).count()
+        payment_notifications = Notification.objects.filter(payment__booking_id__in=booking_ids).count()
+        if notifications != 2 * LARGE or payment_notifications != LARGE:
+            raise CommandError(f"{notifications} booking / {payment_notifications} payment notifications for {LARGE}")
+        payment = Payment.objects.get(source_id='ql-3-rent')
+        if (payment.booking_id, payment.amount, payment.source) != (booking_ids[3], Decimal('303'), 'Rental Guru'):
+            raise CommandError("Payment was not linked to its booking")
+        booking = Booking.objects.select_related('tenant').get(pk=booking_ids[3])
+        if booking.tenant.email != 'qa-import-ql-3@example.com' or booking.created_by != 'Rental Guru':
+            raise CommandError("Tenant or tracking fields were not set")
+        self.stdout.write(f"batch import: {small} queries for {SMALL} and {LARGE} bookings")
+
+    def _check_overlaps(self):
+        existing = self._booking(0, 'qs')  # already imported in apartment 0
+        clash_db = self._booking(0, 'ov-db', start_date=existing['start_date'], end_date=existing['end_date'])
+        first = self._booking(200, 'ov-batch')
+        clash_batch = {**self._booking(201, 'ov-batch'), 'start_date': first['start_date'], 'end_date': first['end_date']}
+        data, _ = self._post([clash_db, first, clash_batch])
+        actions = [result['action'] for result in data['results']]
+        if actions != ['error', 'created', 'error']:
+            raise CommandError(f"Overlap actions {actions}")
+        if 'already booked' not in data['results'][2]['errors']['__all__'][0]:
+            raise CommandError(f"Unexpected overlap error {data['results'][2]['errors']}")
+        if Booking.objects.filter(source_id__in=['ov-db-0', 'ov-batch-201']).exists():
+            raise CommandError("Invalid items were written")
+
+    def _check_reimport(self):
+        audit_before = AuditLog.objects.count()
+        data, _ = self._post([self._booking(n, 'qs', apartment=0) for n in range(SMALL)])
+        if data['unchanged_count'] != SMALL or any(p['action'] != 'unchanged'
+                                                   for r in data['results'] for p in r['payments']):
+            raise CommandError(f"Re-import changed rows: {data['results'][:2]}")
+        if AuditLog.objects.count() != audit_before:
+            raise CommandError("Re-import wrote audit rows")
+
+    def _check_updates(self):
+        items = [self._booking(n, 'qs', apartment=0) for n in range(SMALL)]
+        items[0]['notes'] = 'QA plain change'
+        items[1]['end_date'] = (date.fromisoformat(items[1]['end_date']) - timedelta(days=1)).isoformat()
+        moved = (date.fromisoformat(items[2]['payments'][0]['payment_date']) + timedelta(days=1)).isoformat()
+        items[2]['payments'][0].update(amount=999, payment_date=moved)
+        data, _ = self._post(items)
+        actions = [result['action'] for result in data['results']]
+        if actions[:3] != ['updated', 'updated', 'unchanged'] or data['results'][2]['payments'][0]['action'] != 'updated':
+            raise CommandError(f"Update actions {actions} / {data['results'][2]['payments']}")
+
+        plain = AuditLog.objects.filter(model_name='Booking', object_id=str(data['results'][0]['booking_id']),
+                                        action='update').latest('id')
+        if 'notes' not in plain.changed_fields or 'end_date' in plain.changed_fields:
+            raise CommandError(f"Plain update audit fields {plain.changed_fields}")
+        end_notification = Notification.objects.get(booking_id=data['results'][1]['booking_id'], message='End Booking')
+        if end_notification.date.isoformat() != items[1]['end_date']:
+            raise CommandError("End date change did not go through Booking.save()")
+        payment = Payment.objects.get(source_id='qs-2-rent')
+        notification = Notification.objects.get(payment=payment)
+        if payment.amount != Decimal('999') or notification.date.isoformat() != moved:
+            raise CommandError("Payment update or its notification date is wrong")
+        self.stdout.write("updates: plain changes in bulk, date changes through Booking.save()")
+
+    def _check_options(self):
+        parking = Parking.objects.create(number='QA-P1', building='QA')
+        cleaner = User.objects.create(email='qa-import-cleaner@example.com', full_name='QA Cleaner', role='Cleaner')
+        first = self._booking(600, 'opt', apartment=0, parking_number=parking.id, assigned_cleaner=cleaner.id)
+        clash = self._booking(600, 'opt-clash', apartment=1, parking_number=parking.id)
+        data, _ = self._post([first, clash])
+        actions = [result['action'] for result in data['results']]
+        if actions != ['created', 'error'] or 'parking_number' not in data['results'][1]['errors']:
+            raise CommandError(f"Parking option actions {actions} / {data['results'][1].get('errors')}")
+        booking_id = data['results'][0]['booking_id']
+        if not ParkingBooking.objects.filter(booking_id=booking_id, parking=parking).exists():
+            raise CommandError("parking_number did not create the parking booking")
+        cleaning = Cleaning.objects.filter(booking_id=booking_id).first()
+        if cleaning is None or cleaning.cleaner_id != cleaner.id or cleaning.date.isoformat() != first['end_date']:
+            raise CommandError("assigned_cleaner did not schedule the cleaning")
+
+        data, _ = self._post([{**first, 'notes': 'QA option on update'}])
+        if data['error_count'] != 1 or 'parking_number' not in data['results'][0]['errors']:
+            raise CommandError("parking_number was accepted for an existing booking")
+        self.stdout.write("options: parking and cleaner applied after the bulk write")
+
+    def _check_malformed(self):
+        self._post([], expected_status=400)
+        data, _ = self._post([{'source_id': 'qa-missing'}, {'apartment': self.apartments[0].id},
+                              self._booking(300, 'bad', payments=[{'source_id': 'bad-p', 'amount': 0,
+                                                                   'payment_date': '2031-01-01',
+                                                                   'payment_type': self.rent.id}])])
+        if data['error_count'] != 3:
+            raise CommandError(f"Malformed items were accepted: {data['results']}")
@@ -0,0 +1,137 @@
+"""
+Verify the set-based apartment price upsert: POST /api/apartment-prices/bulk/
+runs the same number of queries for 2 and 200 prices, writes one AuditLog per
+created/changed price, skips unchanged rows, invalidates price timelines and
+writes nothing when a selector is unknown. The single and by-rooms endpoints
+use the same upsert.
+Run: python manage.py test_bulk_price_upsert
+All data is created inside a transaction that is rolled back at the end.
+"""
+import json
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mysite.models import Apartment, ApartmentPrice, AuditLog
+
+ROOMS = 97  # bedroom count no real apartment has
+APARTMENTS = 5
+
+
+class Command(BaseCommand):
+    help = "Check the bulk apartment price upsert API: query count, audit rows, cache invalidation"
+
+    def handle(self, *args, **options):
+        saved_token = os.environ.get('API_AUTH_TOKEN')
+        os.environ['API_AUTH_TOKEN'] = self.token = 'qa-bulk-price-token'
+        try:
+            with transaction.atomic():
+                self.client = Client()
+                self.apartments = [Apartment.objects.create(name=f'QA Bulk Price {i}', bedrooms=ROOMS, bathrooms=1)
+                                   for i in range(APARTMENTS)]
+                self.start = date.today() + timedelta(days=400)
+                self._check_queries()
+                self._check_audit_and_cache()
+                self._check_errors()
+                self._check_legacy_endpoints()
+                transaction.set_rollback(True)
+        finally:
+            if saved_token is None:
+                os.environ.pop('API_AUTH_TOKEN', None)
+            else:
+                os.environ['API_AUTH_TOKEN'] = saved_token
+        self.stdout.write(self.style.SUCCESS("OK: bulk price upsert"))
+
+    def _post(self, url_name, payload):
+        return self.client.post(reverse(url_name), json.dumps({'auth_token': self.token, **payload}),
+                                content_type='application/json')
+
+    def _bulk(self, prices, expected_status=200):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post('bulk_update_apartment_prices', {'prices': prices, 'notes': 'QA bulk'})
+        if response.status_code != expected_status:
+            raise CommandError(f"Bulk price API returned {response.status_code}: {response.content[:300]}")
+        return response.json(), len(ctx.captured_queries)
+
+    def _entries(self, days, offset=0, price=100):
+        return [{'apartment_id': apartment.id, 'effective_date': (self.start + timedelta(days=offset + d)).isoformat(),
+                 'price': price + d} for apartment in self.apartments for d in range(days)]
+
+    def _check_queries(self):
+        small_data, small = self._bulk(self._entries(1)[:2])
+        large_data, large = self._bulk(self._entries(40, offset=10))
+        if large_data['created_count'] != 200 or small_data['created_count'] != 2:
+            raise CommandError(f"Created {small_data['created_count']} / {large_data['created_count']} rows")
+        if large != small:
+            raise CommandError(f"Bulk price queries grow with the batch: {small} -> {large}")
+        self.stdout.write(f"bulk upsert: {small} queries for 2 and 200 prices")
+
+    def _check_audit_and_cache(self):
+        apartment = self.apartments[0]
+        day = self.start + timedelta(days=100)
+        if apartment.price_timeline.price_on(day) != Decimal('139'):
+            raise CommandError("Timeline does not show the created prices")
+
+        audit_before = AuditLog.objects.filter(model_name='ApartmentPrice').count()
+        prices = self._entries(40, offset=10)  # same prices again: nothing to write
+        prices[0]['price'] = 555  # one changed price
+        prices.append({'number_of_rooms': ROOMS, 'effective_date': day.isoformat(), 'price': '777.50',
+                       'notes': 'QA rooms'})  # later entry wins for every apartment on that day
+        data, _ = self._bulk(prices)
+        counts = (data['created_count'], data['updated_count'], data['unchanged_count'])
+        if counts != (APARTMENTS, 1, 199):
+            raise CommandError(f"(created, updated, unchanged) = {counts}")
+
+        logs = AuditLog.objects.filter(model_name='ApartmentPrice').order_by('id')[audit_before:]
+        actions = sorted(log.action for log in logs)
+        if actions != ['create'] * APARTMENTS + ['update']:
+            raise CommandError(f"Audit actions {actions}")
+        update = next(log for log in logs if log.action == 'update')
+        if update.old_values.get('price') != 100.0 or update.new_values.get('price') != 555.0:
+            raise CommandError(f"Update audit values {update.old_values} -> {update.new_values}")
+        if update.apartment_id != apartment.id or update.apartment_name != apartment.name or not update.changed_by:
+            raise CommandError("Audit rows are missing their context")
+
+        if apartment.price_timeline.price_on(day) != Decimal('777.50'):
+            raise CommandError("Price timeline was not invalidated")
+        if ApartmentPrice.objects.get(apartment=apartment, effective_date=day).created_by != 'Rental Guru':
+            raise CommandError("Tracking fields were not set")
+        self.stdout.write(f"audit: {len(actions)} logs for {APARTMENTS} created and 1 changed price")
+
+    def _check_errors(self):
+        total = ApartmentPrice.objects.filter(apartment__in=self.apartments).count()
+        day = (self.start + timedelta(days=300)).isoformat()
+        self._bulk([{'apartment_id': self.apartments[0].id, 'effective_date': day, 'price': 1},
+                    {'apartment_id': 0, 'effective_date': day, 'price': 1}], expected_status=404)
+        self._bulk([{'apartment_id': self.apartments[0].id, 'effective_date': '2026-13-01', 'price': 1}],
+                   expected_status=400)
+        self._bulk([{'apartment_id': self.apartments[0].id, 'number_of_rooms': ROOMS, 'effective_date': day,
+                     'price': 1}], expected_status=400)
+        if ApartmentPrice.objects.filter(apartment__in=self.apartments).count() != total:
+            raise CommandError("A rejected batch wrote prices")
+
+    def _check_legacy_endpoints(self):
+        day = (self.start + timedelta(days=200)).isoformat()
+        response = self._post('update_apartment_price_by_rooms',
+                              {'number_of_rooms': ROOMS, 'new_price': 321, 'effective_date': day})
+        if response.status_code != 200 or response.json()['updated_count'] != APARTMENTS:
+            raise CommandError(f"By-rooms endpoint returned {response.status_code}: {response.content[:300]}")
+        apartment = self.apartments[1]
+        response = self._post('update_single_apartment_price',
+                              {'apartment_id': apartment.id, 'new_price': 322, 'effective_date': day})
+        data = response.json()
+        if response.status_code != 200 or data['new_price_record']['action'] != 'updated':
+            raise CommandError(f"Single endpoint returned {response.status_code}: {response.content[:300]}")
+        if data['pricing_history'][0]['price'] != 322.0:
+            raise CommandError(f"Single endpoint history is stale: {data['pricing_history'][:1]}")
+        response = self._post('update_apartment_price_by_rooms',
+                              {'number_of_rooms': ROOMS + 1, 'new_price': 1, 'effective_date': day})
+        if response.status_code != 404:
+            raise CommandError(f"Unknown room count returned {response.status_code}")
+        self.stdout.write("single and by-rooms endpoints share the upsert")
@@ -0,0 +1,114 @@
+"""
+Verify the interval form of booking availability calendar notes against the
+old day-by-day expansion.
+Run: python manage.py test_calendar_note_intervals
+All data is created inside a transaction that is rolled back at the end.
+"""
+import json
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.calendar_note_intervals import CalendarNoteIntervals
+from mysite.models import Apartment, CalendarNote, User
+
+WINDOW_START = date(2026, 3, 1)
+WINDOW_END = date(2026, 5, 31)
+
+
+def _expand(notes, start_date, end_date):
+    """{(apartment_id, day): [note ids]} the way booking_availability used to build it."""
+    by_day = {}
+    for note in notes:
+        day = max(note['start_date'], start_date)
+        while day <= min(note['end_date'], end_date):
+            by_day.setdefault((note['apartment_id'], day), []).append(note['id'])
+            day += timedelta(days=1)
+    return by_day
+
+
+def _notes_for_day(payload, apartment_id, day):
+    """Python twin of notesForDay in templates/booking_availability.html."""
+    iso = day.isoformat()
+    covering = [row for row in payload['notes'] if row[2] <= iso <= row[3]]
+    return ([row[0] for row in covering if row[1] is None]
+            + [row[0] for row in covering if row[1] is not None and row[1] == apartment_id])
+
+
+class Command(BaseCommand):
+    help = "Check calendar note intervals against per-day expansion"
+
+    def handle(self, *args, **options):
+        self._check_random_notes()
+        with transaction.atomic():
+            self._check_load_and_page()
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("OK: calendar note intervals match the per-day expansion"))
+
+    def _check_random_notes(self):
+        rng = random.Random(49)
+        apartment_ids = [1, 2, 3]
+        notes = []
+        for note_id in range(1, 200):
+            start = WINDOW_START + timedelta(days=rng.randint(-120, 100))
+            notes.append({
+                'id': note_id,
+                'apartment_id': rng.choice(apartment_ids + [None]),
+                'apartment__name': None,
+                'start_date': start,
+                'end_date': start + timedelta(days=rng.choice([0, 0, 1, 3, 10, 60, 400])),
+                'note': f'note {note_id}',
+            })
+        intervals = CalendarNoteIntervals(notes, WINDOW_START, WINDOW_END)
+        payload = json.loads(json.dumps(intervals.to_payload()))
+        expanded = _expand(notes, WINDOW_START, WINDOW_END)
+
+        day = WINDOW_START - timedelta(days=3)
+        while day <= WINDOW_END + timedelta(days=3):
+            for apartment_id in apartment_ids + [99]:
+                in_window = WINDOW_START <= day <= WINDOW_END
+                expected = (expanded.get((None, day), []) + expanded.get((apartment_id, day), [])) if in_window else []
+                if intervals.has_note(apartment_id, day) != bool(expected):
+                    raise CommandError(f"has_note({apartment_id}, {day}) disagrees with the expansion")
+                if in_window and _notes_for_day(payload, apartment_id, day) != expected:
+                    raise CommandError(f"notes for ({apartment_id}, {day}) differ from the expansion")
+            day += timedelta(days=1)
+        self.stdout.write(f"random notes: {len(notes)} notes, payload {len(json.dumps(payload))} bytes")
+
+    def _check_load_and_page(self):
+        admin = User.objects.create(email='qa-notes-admin@example.com', full_name='QA Notes Admin', role='Admin')
+        apartment = Apartment.objects.create(name='QA Notes Apt', bedrooms=1, bathrooms=1, status='Available')
+        other = Apartment.objects.create(name='QA Notes Other', bedrooms=1, bathrooms=1, status='Available')
+        today = timezone.now().date()
+        inside = CalendarNote.objects.create(apartment=apartment, start_date=today - timedelta(days=400),
+                                             end_date=today + timedelta(days=400), note='QA long note')
+        global_note = CalendarNote.objects.create(apartment=None, start_date=today, end_date=today, note='QA global')
+        CalendarNote.objects.create(apartment=other, start_date=today, end_date=today, note='QA other apartment')
+        CalendarNote.objects.create(apartment=apartment, start_date=today - timedelta(days=900),
+                                    end_date=today - timedelta(days=800), note='QA finished note')
+
+        start, end = today.replace(day=1), today + timedelta(days=60)
+        intervals = CalendarNoteIntervals.load(start, end, [apartment.id])
+        ids = [note['id'] for note in intervals.notes]
+        if inside.id not in ids or global_note.id not in ids or len(ids) != len(set(ids)):
+            raise CommandError(f"load() missed overlapping notes: {ids}")
+        if any(note['note'] in ('QA other apartment', 'QA finished note') for note in intervals.notes):
+            raise CommandError("load() returned notes outside the window or apartment list")
+        payload = intervals.to_payload()
+        if payload['apartments'].get(str(apartment.id)) != 'QA Notes Apt':
+            raise CommandError("payload misses the apartment name")
+
+        client = Client()
+        client.force_login(admin)
+        response = client.get(reverse('booking_availability'))
+        html = response.content.decode()
+        if response.status_code != 200 or 'id="calendar-notes-data"' not in html or 'QA long note' not in html:
+            raise CommandError("booking_availability does not embed the calendar notes payload")
+        if 'calendar-notes-b64' in html:
+            raise CommandError("booking_availability still renders per-day note blobs")
+        self.stdout.write(f"booking availability: {len(payload['notes'])} notes embedded once")
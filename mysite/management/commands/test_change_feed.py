@@ -0,0 +1,146 @@
+"""
+Verify the change feed (GET /api/changes/): changes come back in commit-safe
+order with compact payloads, paging with small limits gives the same
+sequence, and a transaction that is still open holds back later changes
+instead of being skipped by the cursor.
+Run: python manage.py test_change_feed
+The feed only shows committed transactions, so this test commits its rows
+and deletes them (and their audit rows) at the end.
+"""
+import os
+import threading
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from mysite.models import Apartment, ApartmentPrice, AuditLog
+
+WAIT_SECONDS = 30
+
+
+class Command(BaseCommand):
+    help = "Check the AuditLog change feed: order, payloads, paging and concurrent transactions"
+
+    def handle(self, *args, **options):
+        saved_token = os.environ.get('API_AUTH_TOKEN')
+        os.environ['API_AUTH_TOKEN'] = self.token = 'qa-change-feed-token'
+        self.client = Client()
+        self.apartment_ids, self.price_ids = [], []
+        try:
+            self._check_sequence()
+            self._check_concurrent_transaction()
+            self._check_errors()
+        finally:
+            self._cleanup()
+            if saved_token is None:
+                os.environ.pop('API_AUTH_TOKEN', None)
+            else:
+                os.environ['API_AUTH_TOKEN'] = saved_token
+        self.stdout.write(self.style.SUCCESS("OK: change feed"))
+
+    def _get(self, expected_status=200, **params):
+        response = self.client.get(reverse('api_change_feed'), {'auth_token': self.token, **params})
+        if response.status_code != expected_status:
+            raise CommandError(f"Change feed returned {response.status_code}: {response.content[:300]}")
+        return response.json()
+
+    def _mine(self, changes):
+        mine = ({('Apartment', str(pk)) for pk in self.apartment_ids}
+                | {('ApartmentPrice', str(pk)) for pk in self.price_ids})
+        return [(c['model'], c['action'], c['id']) for c in changes if (c['model'], c['id']) in mine]
+
+    def _read_all(self, cursor, limit):
+        changes = []
+        while True:
+            page = self._get(cursor=cursor, models='Apartment,ApartmentPrice', limit=limit)
+            changes += page['changes']
+            cursor = page['cursor']
+            if not page['has_more']:
+                return changes, cursor
+
+    def _apartment(self, name):
+        apartment = Apartment.objects.create(name=name, bedrooms=1, bathrooms=1)
+        self.apartment_ids.append(apartment.pk)
+        return apartment
+
+    def _price(self, effective_date):
+        price = ApartmentPrice.objects.create(apartment=self.apartment, price=Decimal('120.00'),
+                                              effective_date=effective_date)
+        self.price_ids.append(price.pk)
+        return price
+
+    def _check_sequence(self):
+        head = self._get(cursor='latest')['cursor']
+        apartment = self.apartment = self._apartment('QA Feed Apt')
+        price = self._price(date(2031, 5, 1))
+        price_id = str(price.pk)
+        apartment.name = 'QA Feed Apt Renamed'
+        apartment.save()
+        price.delete()
+
+        expected = [('Apartment', 'create', str(apartment.pk)), ('ApartmentPrice', 'create', price_id),
+                    ('Apartment', 'update', str(apartment.pk)), ('ApartmentPrice', 'delete', price_id)]
+        changes, _ = self._read_all(head, limit=500)
+        if self._mine(changes) != expected:
+            raise CommandError(f"Feed sequence {self._mine(changes)} != {expected}")
+        paged, _ = self._read_all(head, limit=1)
+        if self._mine(paged) != expected:
+            raise CommandError(f"Paged feed sequence {self._mine(paged)} != {expected}")
+
+        by_key = {(c['model'], c['action']): c for c in changes if c['id'] in {str(apartment.pk), price_id}}
+        if by_key[('ApartmentPrice', 'create')]['fields'].get('apartment') != apartment.pk:
+            raise CommandError("Foreign keys are not reduced to ids")
+        if by_key[('Apartment', 'update')]['fields'].get('name') != 'QA Feed Apt Renamed':
+            raise CommandError(f"Update payload {by_key[('Apartment', 'update')]['fields']}")
+        if by_key[('ApartmentPrice', 'delete')]['fields'] is not None:
+            raise CommandError("Deletes carry a payload")
+        self.stdout.write(f"sequence: {len(expected)} changes in order, also with limit=1")
+
+    def _check_concurrent_transaction(self):
+        # Prices, not apartments: apartment saves bump a shared version row and would wait on each other
+        cursor = self._get(cursor='latest')['cursor']
+        written, release, created = threading.Event(), threading.Event(), []
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    created.append(self._price(date(2031, 6, 1)))
+                    written.set()
+                    release.wait(WAIT_SECONDS)
+            finally:
+                written.set()
+                connection.close()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        try:
+            if not written.wait(WAIT_SECONDS) or not created:
+                raise CommandError("Concurrent writer did not start")
+            fast = self._price(date(2031, 6, 2))  # committed while the slow transaction is open
+            held, held_cursor = self._read_all(cursor, limit=500)
+            if self._mine(held):
+                raise CommandError(f"Changes after an open transaction were served: {self._mine(held)}")
+        finally:
+            release.set()
+            thread.join(WAIT_SECONDS)
+
+        changes, _ = self._read_all(held_cursor, limit=500)
+        expected = [('ApartmentPrice', 'create', str(created[0].pk)), ('ApartmentPrice', 'create', str(fast.pk))]
+        if self._mine(changes) != expected:
+            raise CommandError(f"After commit {self._mine(changes)} != {expected}")
+        self.stdout.write("concurrency: an open transaction holds back the feed and is not skipped")
+
+    def _check_errors(self):
+        self._get(expected_status=400, cursor='not-a-cursor')
+        self._get(expected_status=400, models='AuditLog')
+        self._get(expected_status=401, auth_token='wrong')
+
+    def _cleanup(self):
+        price_ids = [str(pk) for pk in self.price_ids]
+        Apartment.objects.filter(pk__in=self.apartment_ids).delete()
+        AuditLog.objects.filter(model_name='Apartment', object_id__in=[str(i) for i in self.apartment_ids]).delete()
+        AuditLog.objects.filter(model_name='ApartmentPrice', object_id__in=price_ids).delete()
@@ -0,0 +1,166 @@
+"""
+Verify the cached chat directory (sidebar + display maps) and keyset
+pagination of chat_detail / load_more_messages.
+Run: python manage.py test_chat_directory
+All data is created inside a transaction that is rolled back at the end.
+"""
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite import chat_directory
+from mysite.chat_directory import ChatDirectory
+from mysite.models import Apartment, Booking, ReferenceDataVersion, TwilioConversation, TwilioMessage, User
+from mysite.views.chat import MESSAGES_PAGE_SIZE, get_conversation_display_info
+from mysite.views.messaging import save_message_to_db
+
+CONVERSATIONS = 12
+LONG_CHAT = 2 * MESSAGES_PAGE_SIZE + 20
+
+
+class Command(BaseCommand):
+    help = "Check the cached chat sidebar/display maps and keyset message pagination"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_data()
+            self._check_load()
+            self._check_incremental()
+            self._check_pagination()
+            self._check_invalidation()
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("OK: chat directory and keyset pagination"))
+
+    def _create_data(self):
+        self.manager = User.objects.create(email='qa-chatdir@example.com', full_name='QA Chat Manager', role='Manager')
+        apartment = Apartment.objects.create(name='QA Chat Apt', bedrooms=1, bathrooms=1)
+        self.conversations = []
+        now = timezone.now()
+        for i in range(CONVERSATIONS):
+            phone = f'+1555010{i:04d}'
+            tenant = User.objects.create(email=f'qa-chatdir-{i}@example.com', full_name=f'QA Tenant {i}',
+                                         role='Tenant', phone=phone)
+            booking = None
+            if i % 2 == 0:
+                booking = Booking.objects.create(tenant=tenant, apartment=apartment,
+                                                 start_date=now.date() + timedelta(days=i), end_date=now.date() + timedelta(days=i + 3))
+            conversation = TwilioConversation.objects.create(
+                conversation_sid=f'CHqa-dir-{i:04d}', friendly_name=f'QA dir {i}',
+                booking=booking, apartment=apartment if booking else None,
+            )
+            messages = TwilioMessage.objects.bulk_create([
+                TwilioMessage(message_sid=f'IMqa-dir-{i}-{n}', conversation=conversation, conversation_sid=conversation.conversation_sid,
+                              author=author, body=f'message {n}', direction='inbound' if author == phone else 'outbound')
+                for n, author in enumerate([phone, 'ASSISTANT', '+15612205252', phone])
+            ])
+            for n, message in enumerate(messages):
+                TwilioMessage.objects.filter(pk=message.pk).update(message_timestamp=now - timedelta(hours=CONVERSATIONS - i, minutes=10 - n))
+            self.conversations.append(conversation)
+
+    def _check_load(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.directory = ChatDirectory.load(chat_directory.current_stamp())
+        queries = len(ctx.captured_queries)
+        if queries > 6:
+            raise CommandError(f"Loading {CONVERSATIONS} conversations took {queries} queries")
+        rows = [row for row in self.directory.rows if row['conversation'].conversation_sid.startswith('CHqa-dir-')]
+        if [row['conversation'].pk for row in rows] != [c.pk for c in reversed(self.conversations)]:
+            raise CommandError("Sidebar is not ordered by last activity")
+        for row in rows:
+            conversation = TwilioConversation.objects.get(pk=row['conversation'].pk)
+            expected = get_conversation_display_info(conversation)
+            cached = row['display_info']
+            if (cached['name'], cached['phone'], cached['participants_text']) != (expected['name'], expected['phone'], expected['participants_text']):
+                raise CommandError(f"Cached display info differs for {conversation.conversation_sid}: {cached['name']} / {expected['name']}")
+            if row['message_count'] != 4 or row['latest_message'].body != 'message 3':
+                raise CommandError("Wrong message count or latest message")
+        self.stdout.write(f"full load: {queries} queries for {len(self.directory.rows)} conversations")
+
+    def _check_incremental(self):
+        conversation = self.conversations[0]
+        newcomer = User.objects.create(email='qa-chatdir-new@example.com', full_name='QA Newcomer', role='Tenant', phone='+15550109999')
+        save_message_to_db('IMqa-dir-new', conversation.conversation_sid, newcomer.phone, 'Hello from a new number')
+        with CaptureQueriesContext(connection) as ctx:
+            updated = self.directory.refreshed()
+        if updated is None or updated is self.directory or len(ctx.captured_queries) > 5:
+            raise CommandError(f"New message was not applied incrementally ({len(ctx.captured_queries)} queries)")
+        row = updated.rows[0]
+        if row['conversation'].pk != conversation.pk or row['message_count'] != 5 or row['latest_message'].message_sid != 'IMqa-dir-new':
+            raise CommandError("Incremental update did not move the conversation to the top")
+        if updated.author_display_map(conversation).get(newcomer.phone) != f"{newcomer.phone} (QA Newcomer)":
+            raise CommandError("New author is missing from the display map")
+        if self.directory.entry(conversation)['message_count'] != 4:
+            raise CommandError("Incremental update modified the previous snapshot")
+        if updated.refreshed() is not updated:
+            raise CommandError("A snapshot without changes since its cursor was rebuilt")
+
+        # A message with an earlier updated_at that commits after the cursor moved past it
+        late_conversation = self.conversations[1]
+        late = save_message_to_db('IMqa-dir-late', late_conversation.conversation_sid, 'ASSISTANT', 'Late commit')
+        TwilioMessage.objects.filter(pk=late.pk).update(updated_at=updated.cursor[0] - chat_directory.CURSOR_OVERLAP / 2)
+        patched = updated.refreshed()
+        if patched is None or patched.entry(late_conversation)['message_count'] != 5:
+            raise CommandError("A message committed behind the cursor was skipped")
+        if patched.entry(conversation)['message_count'] != 5 or patched.refreshed() is not patched:
+            raise CommandError("Messages inside the overlap window were applied twice")
+        self.directory = patched
+        self.stdout.write(f"incremental: {len(ctx.captured_queries)} queries for one new message")
+
+    def _check_pagination(self):
+        conversation = self.conversations[-1]
+        same_time = timezone.now()
+        created = TwilioMessage.objects.bulk_create([
+            TwilioMessage(message_sid=f'IMqa-page-{n}', conversation=conversation, conversation_sid=conversation.conversation_sid,
+                          author='ASSISTANT', body=f'page {n}', direction='outbound')
+            for n in range(LONG_CHAT)
+        ])
+        # Identical timestamps: order must fall back to id
+        TwilioMessage.objects.filter(pk__in=[m.pk for m in created]).update(message_timestamp=same_time)
+
+        client = Client()
+        client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('chat_detail', args=[conversation.conversation_sid]))
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries if 'mysite_twiliomessage' in q['sql']).upper()
+        if response.status_code != 200 or 'OFFSET' in sql or 'COUNT(' in sql.replace('COUNT("MYSITE_TWILIOMESSAGE"."ID")', ''):
+            raise CommandError("chat_detail should page messages without COUNT/OFFSET")
+        html = response.content.decode()
+        bodies = dict(TwilioMessage.objects.filter(conversation=conversation).values_list('id', 'body'))
+        page = [bodies[int(pk)] for pk in re.findall(r'message-row" data-message-id="(\d+)"', html)]
+        if page != [f'page {n}' for n in range(LONG_CHAT - MESSAGES_PAGE_SIZE, LONG_CHAT)]:
+            raise CommandError(f"chat_detail did not open at the newest messages: {page[:2]}...")
+
+        seen = list(page)
+        before = re.search(r"let beforeCursor = '([^']*)'", html).group(1).replace('\\u002D', '-')
+        while before:
+            data = client.get(reverse('load_more_messages', args=[conversation.conversation_sid]), {'before': before}).json()
+            seen = [m['body'] for m in data['messages']] + seen
+            before = data['before'] if data['has_previous'] else None
+        expected = [f'message {n}' for n in range(4)] + [f'page {n}' for n in range(LONG_CHAT)]
+        if seen != expected:
+            raise CommandError(f"Keyset pages skipped or repeated messages ({len(seen)} of {len(expected)})")
+        self.stdout.write(f"keyset pages: {len(seen)} messages, newest page opened first")
+
+    def _check_invalidation(self):
+        def version():
+            return ReferenceDataVersion.objects.filter(name=chat_directory.VERSION_NAME).values_list('version', flat=True).first() or 0
+
+        start = version()
+        tenant = User.objects.get(email='qa-chatdir-0@example.com')
+        tenant.full_name = 'QA Renamed Tenant'
+        tenant.save()
+        if version() != start + 1:
+            raise CommandError("Renaming a tenant shown in the sidebar did not bump the directory version")
+        User.objects.create(email='qa-chatdir-other@example.com', full_name='QA Unrelated', role='Tenant', phone='+15550208888')
+        if version() != start + 1:
+            raise CommandError("An unrelated user bumped the directory version")
+        directory = chat_directory.get_chat_directory()
+        info = directory.display_info(self.conversations[0])
+        if info['name'] != 'QA Renamed Tenant':
+            raise CommandError(f"Reloaded directory shows {info['name']}")
@@ -0,0 +1,151 @@
+"""
+Verify the live chat updates: cursor resume and AI status updates through the
+WSGI short poll, no repeats of rows in the cursor overlap across polls,
+broker fan-out and PostgreSQL LISTEN/NOTIFY delivery.
+Run: python manage.py test_chat_stream
+Messages are created inside a transaction that is rolled back at the end.
+"""
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from mysite import chat_stream
+from mysite.models import TwilioConversation, TwilioMessage, User
+from mysite.views.messaging import _update_message_ai_result, save_message_to_db
+
+SID = 'CHqa-stream-0001'
+OVERLAP_SID = 'CHqa-stream-0002'
+TENANT = '+15550001111'
+
+
+class Command(BaseCommand):
+    help = "Check the chat message stream cursor, AI updates, fan-out and LISTEN/NOTIFY"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._check_stream()
+            self._check_overlap_polls()
+            self._check_fan_out()
+            transaction.set_rollback(True)
+        if connection.vendor == 'postgresql':
+            self._check_notify()
+        self.stdout.write(self.style.SUCCESS("OK: chat stream cursor, AI updates and fan-out"))
+
+    def _poll(self, client, sid=SID, **params):
+        """(cursor, messages) of one short poll; the test client is WSGI, so it never streams."""
+        headers = {}
+        if 'last_event_id' in params:
+            headers['HTTP_LAST_EVENT_ID'] = params.pop('last_event_id')
+        started = time.monotonic()
+        response = client.get(reverse('chat_message_stream', args=[sid]), params, **headers)
+        if response.status_code != 200 or response['Content-Type'] != 'application/json':
+            raise CommandError(f"Poll returned {response.status_code} {response['Content-Type']}")
+        if time.monotonic() - started > 2:
+            raise CommandError("Poll waited instead of answering at once")
+        data = json.loads(response.content)
+        return data['cursor'], data['messages']
+
+    def _check_stream(self):
+        manager = User.objects.create(email='qa-stream@example.com', full_name='QA Stream', role='Manager')
+        TwilioConversation.objects.create(conversation_sid=SID, friendly_name='QA stream')
+        first = save_message_to_db('IMqa-stream-1', SID, TENANT, 'Is parking included?')
+        client = Client()
+        client.force_login(manager)
+
+        # Older than the overlap window, so only real changes come back after the page's cursor
+        first.__class__.objects.filter(pk=first.pk).update(updated_at=first.updated_at - 5 * chat_stream.CURSOR_OVERLAP)
+        page_cursor = chat_stream.conversation_cursor(first.conversation)
+
+        cursor, messages = self._poll(client, cursor=page_cursor)
+        if messages or cursor is not None:
+            raise CommandError("Nothing changed after the page cursor, but messages were sent")
+
+        second = save_message_to_db('IMqa-stream-2', SID, 'ASSISTANT', 'Yes, one spot.', direction='outbound')
+        _update_message_ai_result('IMqa-stream-1', ai_response='Parking is included.', ai_sent_to_chat=False)
+        # Last-Event-ID (browser reconnect) wins over the page's cursor
+        cursor, messages = self._poll(client, cursor='garbage', last_event_id=page_cursor)
+        ids = [data['id'] for data in messages]
+        if ids != [second.id, first.id] or messages[-1]['ai_response'] != 'Parking is included.':
+            raise CommandError(f"Expected the new message and the AI update after the cursor, got {ids}")
+        if chat_stream.decode_cursor(cursor)[1] != first.id:
+            raise CommandError("Returned cursor is not the resume cursor")
+
+        # Resuming re-reads at most the overlap window (clients upsert by message id)
+        again = [data['id'] for data in self._poll(client, cursor=cursor)[1]]
+        if not set(again) <= {first.id, second.id}:
+            raise CommandError(f"Resume replayed messages before the cursor: {again}")
+        self.stdout.write(f"resume: {len(messages)} messages after cursor")
+
+    def _check_overlap_polls(self):
+        """Rows changed within CURSOR_OVERLAP of each other come once, and again only when they change."""
+        manager = User.objects.get(email='qa-stream@example.com')
+        conversation = TwilioConversation.objects.create(conversation_sid=OVERLAP_SID, friendly_name='QA overlap')
+        old = save_message_to_db('IMqa-overlap-0', OVERLAP_SID, TENANT, 'Hello')
+        base = old.updated_at - timedelta(minutes=1)
+        TwilioMessage.objects.filter(pk=old.pk).update(updated_at=base - 5 * chat_stream.CURSOR_OVERLAP)
+        client = Client()
+        client.force_login(manager)
+        page_cursor = chat_stream.conversation_cursor(conversation)
+
+        # An AI status update and the AI reply usually land within a second of each other
+        status = save_message_to_db('IMqa-overlap-1', OVERLAP_SID, TENANT, 'When is check-in?')
+        reply = save_message_to_db('IMqa-overlap-2', OVERLAP_SID, 'ASSISTANT', 'At 3 PM.', direction='outbound')
+        TwilioMessage.objects.filter(pk=status.pk).update(updated_at=base)
+        TwilioMessage.objects.filter(pk=reply.pk).update(updated_at=base + timedelta(seconds=1))
+
+        cursor, messages = self._poll(client, sid=OVERLAP_SID, cursor=page_cursor)
+        if [data['id'] for data in messages] != [status.id, reply.id]:
+            raise CommandError(f"Expected both overlap messages once, got {[data['id'] for data in messages]}")
+        for _ in range(2):
+            again, messages = self._poll(client, sid=OVERLAP_SID, cursor=cursor)
+            if messages or again is not None:
+                raise CommandError(f"Next poll re-sent overlap messages {[data['id'] for data in messages]}")
+
+        # A row inside the overlap before the cursor is sent again once it changes
+        TwilioMessage.objects.filter(pk=status.pk).update(updated_at=base + timedelta(milliseconds=500))
+        cursor, messages = self._poll(client, sid=OVERLAP_SID, cursor=cursor)
+        if [data['id'] for data in messages] != [status.id]:
+            raise CommandError(f"Changed overlap row was not re-sent once: {[data['id'] for data in messages]}")
+        if self._poll(client, sid=OVERLAP_SID, cursor=cursor)[1]:
+            raise CommandError("Changed overlap row was re-sent on the following poll")
+
+        # The page's first cursor already lists the rows it rendered in the overlap
+        _, messages = self._poll(client, sid=OVERLAP_SID, cursor=chat_stream.conversation_cursor(conversation))
+        if messages:
+            raise CommandError(f"First poll re-sent rendered messages {[data['id'] for data in messages]}")
+        self.stdout.write("overlap: messages 1 s apart are not re-sent by later polls")
+
+    def _check_fan_out(self):
+        broker = chat_stream.ChatStreamBroker()
+        subscriptions = [broker.subscribe(SID) for _ in range(20)]
+        other = broker.subscribe('CHqa-other')
+        if broker.dispatch(SID) != 20 or not all(s.wait(0) for s in subscriptions) or other.wait(0):
+            raise CommandError("Notification was not fanned out to exactly the conversation's streams")
+        for subscription in subscriptions + [other]:
+            broker.unsubscribe(subscription)
+        if broker.subscriber_count():
+            raise CommandError("Streams were not unsubscribed")
+
+    def _check_notify(self):
+        subscription = chat_stream.broker.subscribe(SID)
+        try:
+            deadline = time.monotonic() + 5
+            # Give the listener thread time to LISTEN before notifying
+            while time.monotonic() < deadline:
+                chat_stream._send_notification(SID)
+                if subscription.wait(0.5):
+                    break
+            else:
+                raise CommandError("NOTIFY did not reach the subscribed stream")
+        finally:
+            chat_stream.broker.unsubscribe(subscription)
+        listener = chat_stream.broker._listener
+        if listener is not None and not isinstance(listener, threading.Thread):
+            raise CommandError("Unexpected listener")
+        self.stdout.write("LISTEN/NOTIFY delivered")
@@ -0,0 +1,98 @@
+"""
+Verify that log_error only appends in memory and that the background flush
+aggregates occurrences per hash, throttles alerts and sends digests.
+Run: python manage.py test_error_aggregator
+Flushes run on this thread inside a transaction that is rolled back at the
+end; Telegram delivery is replaced by a stub.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from mysite import unified_logger
+from mysite.error_aggregator import ErrorAggregator
+from mysite.models import ErrorLog
+from mysite.query_inspector import QueryRecorder
+
+BURST = 50
+
+
+class Command(BaseCommand):
+    help = "Check error aggregation, alert throttling and digests of unified_logger.log_error"
+
+    def handle(self, *args, **options):
+        self.sent = []
+        saved_aggregator = unified_logger.error_aggregator
+        self.aggregator = ErrorAggregator(send=self._send, format_alert=unified_logger._format_telegram_error,
+                                          throttle_seconds=3600, digest_seconds=0, max_pending=3, autostart=False)
+        unified_logger.error_aggregator = self.aggregator
+        try:
+            with transaction.atomic():
+                self._check_request_path()
+                self._check_burst()
+                self._check_throttle_and_digest()
+                self._check_bounded_window()
+                transaction.set_rollback(True)
+        finally:
+            unified_logger.error_aggregator = saved_aggregator
+        self.stdout.write(self.style.SUCCESS("OK: error aggregation, alert throttling and digests"))
+
+    def _send(self, message):
+        self.sent.append(message)
+        return True
+
+    def _raise_and_log(self, message, severity='high'):
+        try:
+            raise ValueError(message)
+        except ValueError as e:
+            return unified_logger.log_error(e, 'QA Error Aggregator', severity=severity, source='command')
+
+    def _check_request_path(self):
+        recorder = QueryRecorder()
+        t0 = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            for _ in range(BURST):
+                error_hash = self._raise_and_log('qa burst')
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if recorder.count or self.sent:
+            raise CommandError(f"log_error ran {recorder.count} queries / sent {len(self.sent)} alerts on the caller")
+        if self.aggregator.pending() != BURST or not error_hash:
+            raise CommandError(f"Expected {BURST} pending occurrences, got {self.aggregator.pending()}")
+        self.error_hash = error_hash
+        self.stdout.write(f"{BURST} log_error calls: {elapsed_ms:.1f} ms, 0 queries")
+
+    def _check_burst(self):
+        if self.aggregator.flush() != 1:
+            raise CommandError("Burst was not written as one row")
+        row = ErrorLog.objects.get(error_hash=self.error_hash)
+        if row.occurrences != BURST or row.timestamp > row.last_occurrence or 'ValueError' not in (row.traceback or ''):
+            raise CommandError(f"Unexpected row: occurrences={row.occurrences}")
+        self.aggregator.deliver_pending()
+        if len(self.sent) != 1 or f"Occurrences:</b> {BURST}" not in self.sent[0]:
+            raise CommandError(f"Expected one alert for the burst, got {len(self.sent)}")
+        row.refresh_from_db()
+        if not (row.telegram_sent and row.telegram_sent_at):
+            raise CommandError("Alert was not recorded on the row")
+
+    def _check_throttle_and_digest(self):
+        for _ in range(7):
+            self._raise_and_log('qa burst')
+        self._raise_and_log('qa low', severity='low')
+        self.aggregator.flush()
+        self.aggregator.deliver_pending()
+        if ErrorLog.objects.get(error_hash=self.error_hash).occurrences != BURST + 7:
+            raise CommandError("Second window was not added to the existing row")
+        if len(self.sent) != 2 or 'ERROR DIGEST' not in self.sent[1] or '7×' not in self.sent[1]:
+            raise CommandError(f"Expected a digest instead of a second alert: {self.sent[1:]}")
+        if 'QA Error Aggregator' not in self.sent[1] or self.aggregator._suppressed:
+            raise CommandError("Digest content or reset is wrong")
+
+    def _check_bounded_window(self):
+        for i in range(5):
+            self._raise_and_log(f'qa distinct {i}', severity='low')
+        if self.aggregator.dropped != 2 or self.aggregator.pending() != 3:
+            raise CommandError(f"Window not bounded: dropped={self.aggregator.dropped}")
+        self.aggregator.flush()
+        if ErrorLog.objects.filter(context='QA Error Aggregator').count() != 5:
+            raise CommandError("Distinct errors were not stored as separate rows")
@@ -0,0 +1,122 @@
+"""
+Verify the AI model catalog cache: no network on reads, stale-while-revalidate,
+last good list on failures and the cross-worker refresh lease.
+Run: python manage.py test_model_catalog
+Uses a fake provider; the snapshot rows and warnings it creates are deleted at the end.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mysite.model_catalog import ModelCatalog, parse_openrouter_models
+from mysite.models import AIModelCatalogSnapshot, SystemLog
+
+FALLBACK = [{'value': 'fallback/model', 'label': 'Fallback'}]
+
+
+class FakeProvider:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.fail = None
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(self.fail)
+        return [{'value': f'model/{self.calls}', 'label': f'Model {self.calls}'}]
+
+
+class Command(BaseCommand):
+    help = "Check AI model catalog caching, background refresh and failure fallback"
+
+    def handle(self, *args, **options):
+        names = ['qa-catalog-swr', 'qa-catalog-lease']
+        try:
+            self._check_parse()
+            self._check_stale_while_revalidate(names[0])
+            self._check_lease(names[1])
+        finally:
+            AIModelCatalogSnapshot.objects.filter(name__in=names).delete()
+            for name in names:
+                SystemLog.objects.filter(message__startswith=f"Model catalog '{name}'").delete()
+        self.stdout.write(self.style.SUCCESS("OK: model catalog serves cached lists without blocking"))
+
+    def _check_parse(self):
+        models = parse_openrouter_models({'data': [
+            {'id': 'b/model', 'name': 'B', 'pricing': {'prompt': '0.000001', 'completion': '0.000002'}, 'context_length': 128000},
+            {'id': 'a/model', 'name': 'A', 'context_length': 1000000},
+            {'id': 'x/unnamed', 'name': None},
+        ]})
+        if [m['value'] for m in models] != ['x/unnamed', 'a/model', 'b/model']:
+            raise CommandError(f"Unexpected sort order: {models}")
+        if models[2]['prompt_price'] != '1.00' or models[2]['context_length_display'] != '128k':
+            raise CommandError(f"Unexpected pricing/context: {models[2]}")
+        if models[1]['context_length_display'] != '1M':
+            raise CommandError(f"Unexpected context display: {models[1]}")
+
+    def _check_stale_while_revalidate(self, name):
+        provider = FakeProvider(delay=0.5)
+        catalog = ModelCatalog(name, provider, ttl=3600, retry_seconds=0)
+
+        # Cold start: fallback right away, provider called in the background
+        t0 = time.perf_counter()
+        first = catalog.get(fallback=FALLBACK)
+        if time.perf_counter() - t0 > 0.2 or first != FALLBACK:
+            raise CommandError("Cold get() blocked or did not return the fallback")
+        catalog.wait(5)
+        if catalog.get(fallback=FALLBACK)[0]['value'] != 'model/1' or provider.calls != 1:
+            raise CommandError("Background refresh did not load the provider list")
+
+        # A new process starts from the DB snapshot without calling the provider
+        other = ModelCatalog(name, provider, ttl=3600, retry_seconds=0)
+        if other.get(fallback=FALLBACK)[0]['value'] != 'model/1' or other._thread is not None:
+            raise CommandError("Fresh DB snapshot was not reused by a new process")
+
+        # Stale: old list served immediately while the slow provider is refreshed
+        AIModelCatalogSnapshot.objects.filter(name=name).update(fetched_at=timezone.now() - timedelta(hours=2))
+        catalog._fetched_at = timezone.now() - timedelta(hours=2)
+        provider.release.clear()
+        t0 = time.perf_counter()
+        stale = catalog.get(fallback=FALLBACK)
+        if time.perf_counter() - t0 > 0.2 or stale[0]['value'] != 'model/1':
+            raise CommandError("Stale get() blocked or lost the previous list")
+        # Concurrent readers don't start more refreshes
+        for _ in range(20):
+            catalog.get(fallback=FALLBACK)
+        provider.release.set()
+        catalog.wait(5)
+        if provider.calls != 2 or catalog.get()[0]['value'] != 'model/2':
+            raise CommandError(f"Expected one background refresh, provider called {provider.calls} times")
+
+        # Failure keeps the last good list and records the error
+        provider.fail = 'upstream timeout'
+        if catalog.refresh(force=True):
+            raise CommandError("Failed refresh reported success")
+        snapshot = AIModelCatalogSnapshot.objects.get(name=name)
+        if catalog.get()[0]['value'] != 'model/2' or snapshot.items[0]['value'] != 'model/2':
+            raise CommandError("Failed refresh replaced the last good list")
+        if snapshot.last_error != 'upstream timeout':
+            raise CommandError(f"Error not recorded: {snapshot.last_error!r}")
+
+    def _check_lease(self, name):
+        provider = FakeProvider()
+        first = ModelCatalog(name, provider, ttl=3600, retry_seconds=60)
+        second = ModelCatalog(name, provider, ttl=3600, retry_seconds=60)
+        AIModelCatalogSnapshot.objects.create(name=name, last_attempt_at=timezone.now())
+        # Another worker holds the lease: no provider call
+        if first.refresh() or provider.calls:
+            raise CommandError("Refresh ignored the other worker's lease")
+        AIModelCatalogSnapshot.objects.filter(name=name).update(last_attempt_at=timezone.now() - timedelta(minutes=5))
+        if not first.refresh() or provider.calls != 1:
+            raise CommandError("Expired lease was not taken over")
+        # The second worker adopts the stored list instead of fetching again
+        if not second.refresh() or provider.calls != 1 or second.get()[0]['value'] != 'model/1':
+            raise CommandError("Second worker fetched instead of adopting the fresh list")
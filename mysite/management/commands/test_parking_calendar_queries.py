@@ -0,0 +1,79 @@
+"""
+Verify parking_calendar runs a constant number of queries and that the
+occupancy grid matches the legacy per-day booking scan.
+Run: python manage.py test_parking_calendar_queries
+All data is created inside a transaction that is rolled back at the end.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mysite.models import Parking, ParkingBooking
+from mysite.parking_occupancy import ParkingOccupancyGrid
+from mysite.views.parking_calendar import parking_calendar
+
+
+class Command(BaseCommand):
+    help = "Check parking_calendar query count does not grow with the number of parking spots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=5, help='Spots in the first run (default: 5).')
+        parser.add_argument('--large', type=int, default=40, help='Spots in the second run (default: 40).')
+
+    def handle(self, *args, **options):
+        counts = {}
+        for spots in (options['small'], options['large']):
+            with transaction.atomic():
+                self._create_spots(spots)
+                counts[spots] = self._count_view_queries()
+                self._compare_with_legacy_scan()
+                transaction.set_rollback(True)
+            self.stdout.write(f"{spots} spots -> {counts[spots]} queries")
+
+        small, large = counts[options['small']], counts[options['large']]
+        if small != large:
+            raise CommandError(f"Query count grows with spots: {small} vs {large}")
+        self.stdout.write(self.style.SUCCESS(f"OK: parking_calendar runs {large} queries regardless of spot count"))
+
+    def _create_spots(self, spots):
+        today = timezone.now().date()
+        statuses = ['Booked', 'Unavailable', 'No Car']
+        for i in range(spots):
+            parking = Parking.objects.create(number=str(i + 1), building='QA', notes='query test')
+            for j in range(3):
+                start = today + timedelta(days=(i + j * 20) % 80 - 10)
+                ParkingBooking.objects.create(
+                    parking=parking,
+                    status=statuses[(i + j) % 3],
+                    start_date=start,
+                    end_date=start + timedelta(days=5 + j * 4),
+                    notes=f'qa {i}-{j}',
+                )
+
+    def _count_view_queries(self):
+        request = RequestFactory().get('/parking_calendar/')
+        request.user = AnonymousUser()
+        with CaptureQueriesContext(connection) as ctx:
+            response = parking_calendar(request)
+        if response.status_code != 200:
+            raise CommandError(f"parking_calendar returned {response.status_code}")
+        return len(ctx.captured_queries)
+
+    def _compare_with_legacy_scan(self):
+        today = timezone.now().date()
+        start_date = today.replace(day=1)
+        grid = ParkingOccupancyGrid.load(start_date, start_date + timedelta(days=89))
+        for row, parking in enumerate(grid.parkings):
+            bookings = [b for b in grid.bookings if b.parking_id == parking.id]
+            for offset in range(grid.num_days):
+                day = start_date + timedelta(days=offset)
+                expected = next((b for b in bookings if b.start_date <= day <= b.end_date), None)
+                owner = grid.owner[row][offset]
+                actual = grid.bookings[owner] if owner >= 0 else None
+                if expected is not actual:
+                    raise CommandError(f"Grid mismatch for parking {parking.id} on {day}")
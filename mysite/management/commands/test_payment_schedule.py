@@ -0,0 +1,147 @@
+"""
+Verify the bulk payment schedule behind Booking.create_payments and
+Payment.save(number_of_months=N): monthly dates, Damage Deposit returns,
+notifications and AuditLog rows, and a query count that does not grow with
+the number of months.
+Run: python manage.py test_payment_schedule
+All data is created inside a transaction that is rolled back at the end.
+"""
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from mysite.models import Apartment, AuditLog, Booking, Notification, PaymenType, Payment, User
+
+START = date(2031, 1, 31)
+
+
+def _payments_data(rows):
+    """payments_data as BookingForm builds it from (date, amount, type id, notes, months, payment id, status) rows."""
+    keys = ('payment_dates', 'amounts', 'payment_types', 'payment_notes', 'number_of_months', 'payment_id', 'payment_status')
+    return {key: [row[i] for row in rows] for i, key in enumerate(keys)}
+
+
+class Command(BaseCommand):
+    help = "Check the bulk recurring payment schedule: dates, notifications, audit rows and query count"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_data()
+            self._check_schedule()
+            self._check_query_count()
+            self._check_payment_form_path()
+            self._check_edits()
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("OK: bulk payment schedule"))
+
+    def _payment_type(self, name, type):
+        return (PaymenType.objects.filter(name=name, type=type).order_by('id').first()
+                or PaymenType.objects.create(name=name, type=type))
+
+    def _create_data(self):
+        tenant = User.objects.create(email='qa-schedule@example.com', full_name='QA Schedule Tenant', role='Tenant')
+        apartment = Apartment.objects.create(name='QA Schedule Apt', bedrooms=1, bathrooms=1)
+        self.booking = Booking.objects.create(tenant=tenant, apartment=apartment, status='Confirmed',
+                                              start_date=START, end_date=START + relativedelta(years=1))
+        self.rent = self._payment_type('QA Schedule Rent', 'In')
+        self.mortage = self._payment_type('QA Schedule Mortage', 'Out')
+        self.deposit = self._payment_type('Damage Deposit', 'In')
+        self.deposit_return = PaymenType.objects.filter(name='Damage Deposit', type='Out').order_by('id').first()
+        if self.deposit_return is None:
+            self.deposit_return = PaymenType.objects.create(name='Damage Deposit', type='Out')
+
+    def _check_schedule(self):
+        self.booking.create_payments(_payments_data([
+            (START.isoformat(), '1000', str(self.rent.id), 'QA rent', 12, '', 'Pending'),
+            (START.isoformat(), '500', str(self.deposit.id), 'QA deposit', 1, '', 'Pending'),
+            (START.isoformat(), '300', str(self.mortage.id), 'QA mortage', 2, '', 'Pending'),
+        ]))
+        payments = list(Payment.objects.filter(booking=self.booking).order_by('id'))
+        rent = [p for p in payments if p.payment_type_id == self.rent.id]
+        expected_dates = [START + relativedelta(months=i) for i in range(12)]
+        if [p.payment_date for p in rent] != expected_dates:
+            raise CommandError(f"Rent dates differ: {[p.payment_date for p in rent]}")
+        if any(p.amount != Decimal('1000') or p.notes != 'QA rent' or p.apartment_id for p in rent):
+            raise CommandError("Rent payments lost amount/notes or kept an apartment link")
+        returns = [p for p in payments if p.payment_type_id == self.deposit_return.id]
+        if len(returns) != 1 or returns[0].payment_date != self.booking.end_date or returns[0].notes != 'Damage Deposit Return':
+            raise CommandError("Damage Deposit return missing or on the wrong date")
+        if len(payments) != 12 + 1 + 1 + 2:
+            raise CommandError(f"Expected 16 payments, got {len(payments)}")
+
+        notifications = Notification.objects.filter(payment__booking=self.booking)
+        if notifications.filter(payment__payment_type=self.mortage).exists():
+            raise CommandError("Mortage payments got notifications")
+        for payment in payments:
+            if payment.payment_type_id == self.mortage.id:
+                continue
+            dates = sorted(notifications.filter(payment=payment).values_list('date', flat=True))
+            expected = [payment.payment_date]
+            if payment.payment_type_id == self.deposit_return.id:
+                expected = sorted([payment.payment_date, START])  # plus the reminder on the deposit date
+            if dates != expected:
+                raise CommandError(f"Payment {payment.pk} notifications {dates}, expected {expected}")
+
+        audited = set(AuditLog.objects.filter(model_name='Payment', action='create',
+                                              object_id__in=[str(p.pk) for p in payments])
+                      .values_list('object_id', flat=True))
+        if audited != {str(p.pk) for p in payments}:
+            raise CommandError("Not every created payment has a create AuditLog row")
+        if AuditLog.objects.filter(model_name='Notification', action='create',
+                                   object_id__in=[str(n) for n in notifications.values_list('id', flat=True)]).count() != notifications.count():
+            raise CommandError("Not every notification has a create AuditLog row")
+        self.stdout.write(f"schedule: {len(payments)} payments, {notifications.count()} notifications")
+
+    def _count_queries(self, months):
+        with CaptureQueriesContext(connection) as ctx:
+            self.booking.create_payments(_payments_data([
+                ((START + relativedelta(years=2)).isoformat(), '10', str(self.rent.id), f'QA {months}', months, '', 'Pending'),
+            ]))
+        return len(ctx.captured_queries)
+
+    def _check_query_count(self):
+        self._count_queries(1)  # warm the reference data snapshot
+        short, long = self._count_queries(2), self._count_queries(24)
+        # One extra query is the reference data stamp check, when its interval runs out in between
+        if long > short + 1:
+            raise CommandError(f"Queries grow with the number of months: {short} -> {long}")
+        self.stdout.write(f"query count: {short} queries for 2 and 24 months")
+
+    def _check_payment_form_path(self):
+        template = Payment(payment_type=self.rent, amount=Decimal('75'), booking=self.booking,
+                           payment_date=START + relativedelta(years=3), notes='QA form', payment_status='Completed')
+        template.save(number_of_months=3)
+        if template.pk is not None:
+            raise CommandError("The template payment itself should not be saved")
+        created = list(Payment.objects.filter(booking=self.booking, notes='QA form').order_by('payment_date'))
+        if [p.payment_date for p in created] != [START + relativedelta(years=3, months=i) for i in range(3)]:
+            raise CommandError("Payment.save(number_of_months=3) wrote the wrong dates")
+        if any(p.payment_status != 'Completed' for p in created):
+            raise CommandError("Monthly copies lost the payment status")
+        if Notification.objects.filter(payment__in=created).count() != 3:
+            raise CommandError("Monthly copies should have one notification each")
+        try:
+            Payment(payment_type=self.rent, amount=0, booking=self.booking, payment_date=START).save(number_of_months=2)
+        except ValidationError:
+            pass
+        else:
+            raise CommandError("Zero amount schedules must be rejected")
+        self.stdout.write("Payment.save(number_of_months=3): ok")
+
+    def _check_edits(self):
+        rent = list(Payment.objects.filter(booking=self.booking, notes='QA rent').order_by('payment_date')[:2])
+        self.booking.create_payments(_payments_data([
+            (rent[0].payment_date.isoformat(), '1100', str(self.rent.id), 'QA rent edited', None, str(rent[0].pk), 'Completed'),
+            (rent[1].payment_date.isoformat(), '1000', str(self.rent.id), 'QA rent', None, f'{rent[1].pk}_deleted', 'Pending'),
+        ]))
+        edited = Payment.objects.get(pk=rent[0].pk)
+        if edited.amount != Decimal('1100') or edited.payment_status != 'Completed':
+            raise CommandError("Edited payment was not updated")
+        if Payment.objects.filter(pk=rent[1].pk).exists():
+            raise CommandError("Deleted payment still exists")
+        self.stdout.write("edits and deletes: ok")
@@ -0,0 +1,132 @@
+"""
+Verify latency histograms, their flush to EndpointLatency, regression
+detection and on-demand request profiling.
+Run: python manage.py test_perf_telemetry
+All data is created inside a transaction that is rolled back at the end;
+profile dumps go to a temporary directory.
+"""
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite import perf_telemetry
+from mysite.models import EndpointLatency, RequestProfile, User
+from mysite.perf_telemetry import LatencyAggregator, empty_buckets, bucket_index, percentile
+
+
+class Command(BaseCommand):
+    help = "Check latency percentiles, histogram flushes, regressions and request profiling"
+
+    def handle(self, *args, **options):
+        saved_stats = perf_telemetry.latency_aggregator._stats
+        saved_dir = perf_telemetry.PROFILE_DIR
+        perf_telemetry.latency_aggregator._stats = {}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                perf_telemetry.PROFILE_DIR = directory
+                with transaction.atomic():
+                    self._check_percentiles()
+                    self._check_flush()
+                    self._check_regressions()
+                    self._check_profiling(directory)
+                    transaction.set_rollback(True)
+        finally:
+            perf_telemetry.latency_aggregator._stats = saved_stats
+            perf_telemetry.PROFILE_DIR = saved_dir
+        self.stdout.write(self.style.SUCCESS("OK: latency histograms, regressions and request profiling"))
+
+    def _check_percentiles(self):
+        buckets = empty_buckets()
+        for ms in range(1, 1001):
+            buckets[bucket_index(ms)] += 1
+        p50, p95, p99 = (percentile(buckets, q, 1000) for q in (0.5, 0.95, 0.99))
+        if not (450 <= p50 <= 550 and 900 <= p95 <= 1000 and 950 <= p99 <= 1000):
+            raise CommandError(f"Percentiles off for uniform 1..1000 ms: p50={p50} p95={p95} p99={p99}")
+        overflow = empty_buckets()
+        overflow[-1] = 10
+        if not 30000 < percentile(overflow, 0.99, 45000) <= 45000 or percentile(overflow, 1.0, 45000) != 45000:
+            raise CommandError("Overflow bucket is not capped at the observed maximum")
+        if percentile(empty_buckets(), 0.5) is not None:
+            raise CommandError("Empty histogram should have no percentile")
+
+    def _check_flush(self):
+        aggregator = LatencyAggregator(flush_seconds=3600)
+        now = timezone.now()
+        for ms in range(1, 101):
+            aggregator.record('qa:perf', 'GET', ms, now=now)
+        aggregator.record('qa:perf', 'GET', 2500, error=True, now=now)
+        if aggregator.flush() != 1 or aggregator.pending():
+            raise CommandError("First flush did not write one row")
+        for ms in range(1, 101):
+            aggregator.record('qa:perf', 'GET', ms, now=now)
+        aggregator.flush()
+
+        row = EndpointLatency.objects.get(view_name='qa:perf', method='GET')
+        if row.count != 201 or sum(row.buckets) != 201 or row.error_count != 1 or row.max_ms != 2500:
+            raise CommandError(f"Flushes were not merged: count={row.count} buckets={sum(row.buckets)} errors={row.error_count}")
+        summary = next(s for s in perf_telemetry.endpoint_summary(now - timedelta(hours=1)) if s['view_name'] == 'qa:perf')
+        if not (40 <= summary['p50'] <= 60 and summary['p99'] <= 2500 and summary['avg_ms'] > 50):
+            raise CommandError(f"Unexpected endpoint summary: {summary}")
+
+    def _check_regressions(self):
+        now = timezone.now()
+        for hours_ago, ms in ((3 * 24, 40), (2, 400)):
+            buckets = empty_buckets()
+            buckets[bucket_index(ms)] = 50
+            EndpointLatency.objects.create(
+                view_name='qa:slower', method='GET', period_start=perf_telemetry.period_start(now - timedelta(hours=hours_ago)),
+                count=50, total_ms=50 * ms, max_ms=ms, buckets=buckets,
+            )
+        found = [r for r in perf_telemetry.regressions(now=now) if r['view_name'] == 'qa:slower']
+        if not found or found[0]['change'] < 5:
+            raise CommandError(f"Regression not detected: {found}")
+        trend = perf_telemetry.daily_p95('qa:slower', 'GET', now=now)
+        if len(trend) != 2 or trend[0][1] >= trend[1][1]:
+            raise CommandError(f"Unexpected daily p95 trend: {trend}")
+
+    def _check_profiling(self, directory):
+        admin = User.objects.create(email='qa-perf-admin@example.com', full_name='QA Perf Admin', role='Admin')
+        manager = User.objects.create(email='qa-perf-manager@example.com', full_name='QA Perf Manager', role='Manager')
+        client = Client()
+        client.force_login(admin)
+        url = reverse('performance_dashboard')
+
+        response = client.get(url, {'_profile': '1', 'view': 'qa:slower'})
+        header_response = client.get(url, HTTP_X_PROFILE='1')
+        plain = client.get(url)
+        if response.status_code != 200 or b'qa:slower' not in response.content:
+            raise CommandError(f"Dashboard returned {response.status_code}")
+        profiles = list(RequestProfile.objects.order_by('id'))
+        if [p.trigger for p in profiles] != ['query', 'header'] or 'X-Profile-Id' in plain:
+            raise CommandError(f"Unexpected profiles: {[p.trigger for p in profiles]}")
+        profile = profiles[0]
+        if response['X-Profile-Id'] != str(profile.pk) or 'performance_dashboard' not in profile.summary:
+            raise CommandError("Profile id header or summary missing")
+        if not profile.file_path.startswith(directory) or not os.path.exists(profile.file_path):
+            raise CommandError("Profile dump was not written")
+
+        download = client.get(reverse('performance_profile_download', args=[profile.pk]))
+        with open(profile.file_path, 'rb') as f:
+            if download.status_code != 200 or b''.join(download.streaming_content) != f.read():
+                raise CommandError("Profile download does not match the dump")
+
+        pending = perf_telemetry.latency_aggregator.pending()
+        if pending < 3:
+            raise CommandError(f"Requests were not timed ({pending} pending)")
+
+        client.force_login(manager)
+        client.get(reverse('paymentReport'), {'_profile': '1'}, HTTP_X_PROFILE='1')
+        if RequestProfile.objects.count() != 2:
+            raise CommandError("Non-admin request was profiled")
+
+        removed = perf_telemetry.prune_profiles(keep=1)
+        if removed != 1 or os.path.exists(profile.file_path) or RequestProfile.objects.count() != 1:
+            raise CommandError("Old profiles were not pruned with their files")
+        self.stdout.write(f"profiled {header_response['X-Profile-Id']}: {profiles[1].duration_ms:.0f} ms, "
+                          f"{pending} requests pending flush")
@@ -0,0 +1,104 @@
+"""
+Verify cached apartment price timelines against direct ApartmentPrice queries.
+Run: python manage.py test_price_timeline
+All data is created inside a transaction that is rolled back at the end.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from mysite.models import Apartment, ApartmentPrice
+from mysite.price_timeline import get_price_timeline, invalidate_price_timelines, preload_price_timelines
+
+
+class Command(BaseCommand):
+    help = "Check price timeline lookups, invalidation and query counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            apartments = self._create_apartments(options['apartments'], rng)
+            invalidate_price_timelines()
+            self._check_lookups(apartments, rng)
+            self._check_query_count(apartments)
+            self._check_invalidation(apartments[0])
+            transaction.set_rollback(True)
+        invalidate_price_timelines()
+        self.stdout.write(self.style.SUCCESS("OK: price timelines match direct queries"))
+
+    def _create_apartments(self, count, rng):
+        apartments = []
+        for i in range(count):
+            apartment = Apartment.objects.create(
+                name=f'QA timeline {i}', bedrooms=1, bathrooms=1,
+                default_price=Decimal('1000.00'), raiting=Decimal(rng.choice(['0', '5', '7.5', '10'])),
+            )
+            day = date(2025, 1, 1) + timedelta(days=rng.randint(0, 60))
+            for _ in range(rng.randint(0, 6)):
+                ApartmentPrice.objects.create(apartment=apartment, price=Decimal(rng.randint(900, 4000)), effective_date=day)
+                day += timedelta(days=rng.randint(1, 120))
+            apartments.append(apartment)
+        return apartments
+
+    def _check_lookups(self, apartments, rng):
+        today = date.today()
+        for apartment in apartments:
+            timeline = get_price_timeline(apartment.id)
+            for _ in range(30):
+                day = date(2024, 12, 1) + timedelta(days=rng.randint(0, 900))
+                record = apartment.prices.filter(effective_date__lte=day).order_by('-effective_date').first()
+                expected = record.price if record else None
+                if timeline.price_on(day) != expected:
+                    raise CommandError(f"price_on mismatch for {apartment.name} on {day}")
+
+                surcharge = Decimal(str(apartment.get_rating_surcharge_per_day() * 30))
+                with_rating = apartment.get_price_on_date(day, include_rating=True)
+                if expected is not None and with_rating != expected + surcharge:
+                    raise CommandError(f"rating surcharge mismatch for {apartment.name} on {day}")
+
+                end = day + timedelta(days=rng.randint(1, 90))
+                legacy = 0.0
+                cursor = day
+                while cursor < end:
+                    record = apartment.prices.filter(effective_date__lte=cursor).order_by('-effective_date').first()
+                    legacy += float(record.price if record else apartment.default_price) / 30.0
+                    cursor += timedelta(days=1)
+                if abs(timeline.daily_price_sum(day, end, apartment.default_price) - legacy) > 0.01:
+                    raise CommandError(f"daily_price_sum mismatch for {apartment.name} {day}..{end}")
+
+            future = [(p.effective_date, p.price) for p in apartment.get_future_prices()]
+            expected_future = list(
+                apartment.prices.filter(effective_date__gt=today).order_by('effective_date').values_list('effective_date', 'price')
+            )
+            if future != expected_future:
+                raise CommandError(f"get_future_prices mismatch for {apartment.name}")
+
+    def _check_query_count(self, apartments):
+        ids = [apartment.id for apartment in apartments]
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            timelines = preload_price_timelines(ids)
+            for apartment in apartments:
+                timelines[apartment.id].price_on(date.today())
+        # Inside a transaction timelines are not shared, so expect: stamp check (maybe) + one load
+        if len(ctx.captured_queries) > 2:
+            raise CommandError(f"preload for {len(ids)} apartments ran {len(ctx.captured_queries)} queries")
+        self.stdout.write(f"{len(ids)} apartments -> {len(ctx.captured_queries)} queries")
+
+    def _check_invalidation(self, apartment):
+        day = date(2030, 1, 1)
+        before = apartment.get_price_on_date(day)
+        price = ApartmentPrice.objects.create(apartment=apartment, price=Decimal('12345.00'), effective_date=day)
+        if apartment.get_price_on_date(day) != Decimal('12345.00'):
+            raise CommandError("Timeline not refreshed after ApartmentPrice save")
+        price.delete()
+        if apartment.get_price_on_date(day) != before:
+            raise CommandError("Timeline not refreshed after ApartmentPrice delete")
@@ -0,0 +1,171 @@
+"""
+Verify the query inspector and assert per-view SQL query budgets.
+Run: python manage.py test_query_budget [--small 3] [--large 15]
+Each view is requested through the full middleware stack at two data sizes;
+its query count must stay within budget and must not grow with the data.
+All data is created inside a transaction that is rolled back at the end.
+"""
+from collections import deque
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from mysite import perf_telemetry, query_inspector
+from mysite.models import Apartment, Booking, PaymenType, Payment, User
+from mysite.query_inspector import QueryBudgetExceeded, assert_query_budget, fingerprint
+from mysite.query_inspector_middleware import QueryInspectorMiddleware
+
+# url name -> (max queries, max repeats of one query shape)
+VIEW_BUDGETS = {
+    'paymentReport': (5, 3),
+    'parking_calendar': (6, 3),
+    'chat_list': (4, 3),
+    'database_activity': (33, 3),
+    'apartment_prices': (3, 3),
+    'database_query_activity': (1, 1),
+}
+# Known N+1 pages: reported and expected to be flagged, not failed
+KNOWN_N_PLUS_ONE = ('apartments', 'bookings', 'booking_availability')
+
+
+class Command(BaseCommand):
+    help = "Check query inspector fingerprints, N+1 detection, the ring buffer and per-view query budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=3, help='Bookings in the first run (default: 3).')
+        parser.add_argument('--large', type=int, default=15, help='Bookings in the second run (default: 15).')
+
+    def handle(self, *args, **options):
+        saved = query_inspector.recent_requests()
+        # Keep the test requests out of the latency telemetry flushed at exit
+        saved_latency = perf_telemetry.latency_aggregator._stats
+        perf_telemetry.latency_aggregator._stats = {}
+        try:
+            self._check_fingerprint()
+            self._check_budget_helper()
+            self._check_ring_buffer()
+            counts = {}
+            for size in (options['small'], options['large']):
+                with transaction.atomic():
+                    client = self._create_data(size)
+                    counts[size] = self._measure_views(client)
+                    transaction.set_rollback(True)
+        finally:
+            perf_telemetry.latency_aggregator._stats = saved_latency
+            query_inspector.clear()
+            for entry in reversed(saved):
+                query_inspector.record(entry)
+
+        small, large = counts[options['small']], counts[options['large']]
+        for name, (max_queries, max_repeats) in VIEW_BUDGETS.items():
+            for size, measured in counts.items():
+                entry = measured[name]
+                if entry['queries'] > max_queries or entry['max_repeats'] > max_repeats:
+                    raise CommandError(
+                        f"{name} with {size} bookings: {entry['queries']} queries, max repeats {entry['max_repeats']} "
+                        f"(budget {max_queries} / {max_repeats}); repeated: {entry['repeated'][:2]}"
+                    )
+            if large[name]['queries'] > small[name]['queries']:
+                raise CommandError(f"{name} query count grows with data: {small[name]['queries']} -> {large[name]['queries']}")
+            self.stdout.write(f"{name}: {large[name]['queries']} queries (budget {max_queries})")
+
+        for name in KNOWN_N_PLUS_ONE:
+            entry = large[name]
+            if not entry['n_plus_one'] and entry['max_repeats'] > query_inspector.N_PLUS_ONE_THRESHOLD:
+                raise CommandError(f"{name} repeats a query {entry['max_repeats']} times but was not flagged")
+            self.stdout.write(f"{name}: {small[name]['queries']} -> {entry['queries']} queries, "
+                              f"max repeats {entry['max_repeats']}{' (N+1)' if entry['n_plus_one'] else ''}")
+        self.stdout.write(self.style.SUCCESS("OK: query inspector and per-view query budgets"))
+
+    def _check_fingerprint(self):
+        a = fingerprint('SELECT * FROM "mysite_payment" WHERE "mysite_payment"."id" = 5 AND note = \'x\'')
+        b = fingerprint('SELECT *  FROM "mysite_payment"\nWHERE "mysite_payment"."id" = 77 AND note = \'it\'\'s\'')
+        if a != b or '5' in a:
+            raise CommandError(f"Literals not normalized: {a!r} / {b!r}")
+        c = fingerprint('SELECT 1 FROM t1 WHERE id IN (%s, %s, %s)')
+        d = fingerprint('SELECT 1 FROM t1 WHERE id IN (%s)')
+        if c != d or 't1' not in c:
+            raise CommandError(f"IN lists or identifiers not normalized: {c!r} / {d!r}")
+
+    def _check_budget_helper(self):
+        with assert_query_budget(max_queries=3, max_repeats=3) as recorder:
+            for _ in range(3):
+                User.objects.filter(pk=-1).exists()
+        if recorder.count != 3 or len(recorder.shapes) != 1:
+            raise CommandError(f"Recorder counted {recorder.count} queries, {len(recorder.shapes)} shapes")
+        try:
+            with assert_query_budget(max_repeats=2):
+                for pk in range(-3, 0):
+                    User.objects.filter(pk=pk).exists()
+        except QueryBudgetExceeded as e:
+            if 'ran 3 times' not in str(e):
+                raise CommandError(f"Unexpected budget message: {e}")
+        else:
+            raise CommandError("Repeated query shape did not exceed the budget")
+
+    def _check_ring_buffer(self):
+        def n_plus_one_view(request):
+            for pk in range(-(query_inspector.N_PLUS_ONE_THRESHOLD + 1), 0):
+                User.objects.filter(pk=pk).first()
+            return None
+
+        query_inspector.clear()
+        middleware = QueryInspectorMiddleware(n_plus_one_view)
+        middleware(RequestFactory().get('/qa-n-plus-one/'))
+        entry = query_inspector.recent_requests()[0]
+        if not entry['n_plus_one'] or entry['queries'] != query_inspector.N_PLUS_ONE_THRESHOLD + 1:
+            raise CommandError(f"N+1 request not flagged: {entry}")
+
+        original = query_inspector._recent
+        query_inspector._recent = deque(maxlen=3)
+        try:
+            for i in range(5):
+                middleware(RequestFactory().get(f'/qa-ring/{i}/'))
+            paths = [e['path'] for e in query_inspector.recent_requests()]
+        finally:
+            query_inspector._recent = original
+        if paths != ['/qa-ring/4/', '/qa-ring/3/', '/qa-ring/2/']:
+            raise CommandError(f"Ring buffer is not bounded newest-first: {paths}")
+
+    def _create_data(self, size):
+        admin = User.objects.create(email=f'qa-query-budget-{size}@example.com', full_name='QA Query Budget', role='Admin')
+        tenants = User.objects.bulk_create([
+            User(email=f'qa-query-budget-{size}-{i}@example.com', full_name=f'QA Tenant {i}', role='Tenant')
+            for i in range(size)
+        ])
+        apartments = Apartment.objects.bulk_create([
+            Apartment(name=f'QA Budget Apartment {size}-{i}', bedrooms=1, bathrooms=1) for i in range(size)
+        ])
+        today = date.today()
+        bookings = Booking.objects.bulk_create([
+            Booking(apartment=apartments[i], tenant=tenants[i], status='Confirmed',
+                    start_date=today - timedelta(days=3), end_date=today + timedelta(days=10))
+            for i in range(size)
+        ])
+        payment_type = PaymenType.objects.create(name='QA Budget Rent', type='In')
+        Payment.objects.bulk_create([
+            Payment(payment_date=today, amount=Decimal(100 + i), payment_type=payment_type,
+                    payment_status='Pending', booking=bookings[i])
+            for i in range(size)
+        ])
+        client = Client()
+        client.force_login(admin)
+        return client
+
+    def _measure_views(self, client):
+        measured = {}
+        for name in list(VIEW_BUDGETS) + list(KNOWN_N_PLUS_ONE):
+            client.get(reverse(name))  # warm per-process caches (reference data, first-access logs)
+            query_inspector.clear()
+            response = client.get(reverse(name))
+            if response.status_code != 200:
+                raise CommandError(f"{name} returned {response.status_code}")
+            entries = [e for e in query_inspector.recent_requests() if e['view'] == name]
+            if len(entries) != 1:
+                raise CommandError(f"Middleware did not record {name}: {query_inspector.recent_requests()}")
+            measured[name] = entries[0]
+        return measured
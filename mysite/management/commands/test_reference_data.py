@@ -0,0 +1,111 @@
+"""
+Verify the process-level reference data cache against direct queries.
+Run: python manage.py test_reference_data
+All data is created inside a transaction that is rolled back at the end.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mysite.forms import get_dropdown_options
+from mysite.models import Apartment, PaymenType, PaymentMethod, User
+from mysite.reference_data import bump_reference_data_version, current_stamp, current_version, get_reference_data
+from mysite.views.payment_sync_v2 import match_payment_method, match_payment_type
+
+
+class Command(BaseCommand):
+    help = "Check reference data lookups, version bumps and dropdown query counts"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_data()
+            self._check_lookups()
+            self._check_matchers()
+            self._check_query_count()
+            self._check_version_bumps()
+            transaction.set_rollback(True)
+        # The rolled back stamp can never match again, but reload right away anyway
+        bump_reference_data_version()
+        if any(a.name.startswith('QA Ref') for a in get_reference_data().apartments):
+            raise CommandError("Snapshot still holds rolled back rows")
+        self.stdout.write(self.style.SUCCESS("OK: reference data matches direct queries"))
+
+    def _create_data(self):
+        self.manager = User.objects.create(email='qa-refdata@example.com', full_name='QA Ref Manager', role='Manager')
+        self.apartment = Apartment.objects.create(name='QA Ref Apartment', bedrooms=1, bathrooms=1, keywords='qaref, ocean')
+        self.apartment.managers.add(self.manager)
+        self.payment_type = PaymenType.objects.create(name='QA Ref Rent', type='In', keywords='qa-rent-kw')
+        self.payment_method = PaymentMethod.objects.create(name='QA Ref Zelle', type='Payment Method', keywords='qa-zelle-kw')
+
+    def _check_lookups(self):
+        ref = get_reference_data()
+        if [pt.id for pt in ref.payment_types] != list(PaymenType.objects.order_by('id').values_list('id', flat=True)):
+            raise CommandError("payment_types differ from database")
+        if [pm.id for pm in ref.payment_methods] != list(PaymentMethod.objects.order_by('id').values_list('id', flat=True)):
+            raise CommandError("payment_methods differ from database")
+        if [a.id for a in ref.apartments_by_name_order] != list(Apartment.objects.order_by('name', 'id').values_list('id', flat=True)):
+            raise CommandError("apartments_by_name_order differs from database")
+        if ref.payment_type(self.payment_type.id) != self.payment_type:
+            raise CommandError("payment_type lookup by id failed")
+        if ref.payment_method_by_name('qa ref zelle', type='Payment Method') != self.payment_method:
+            raise CommandError("payment_method lookup by name failed")
+        if ref.apartment_by_name('QA Ref Apartment') != self.apartment:
+            raise CommandError("apartment lookup by name failed")
+        if self.apartment not in ref.apartments_with_keyword('Ocean'):
+            raise CommandError("apartment lookup by keyword failed")
+        if self.apartment not in ref.apartments_for_manager(self.manager.id):
+            raise CommandError("apartments_for_manager lost the manager link")
+
+        options = get_dropdown_options('payment_type')
+        expected = [pt.id for pt in get_dropdown_options('payment_type', isData=True)]
+        if [o['value'] for o in options] != expected:
+            raise CommandError("payment_type dropdown order differs from database order")
+
+    def _check_matchers(self):
+        ref = get_reference_data()
+        if match_payment_type('payment qa-rent-kw', 100.0, ref.payment_types) != self.payment_type:
+            raise CommandError("match_payment_type missed the keyword")
+        if match_payment_method('transfer QA-ZELLE-KW', ref.payment_methods) != self.payment_method:
+            raise CommandError("match_payment_method missed the keyword")
+        # Lists and querysets must give the same answer
+        for description, amount in (('qa-rent-kw', 50.0), ('random text', -20.0), ('deposit *mobile', 10.0)):
+            if match_payment_type(description, amount, ref.payment_types) != match_payment_type(description, amount, PaymenType.objects.all()):
+                raise CommandError(f"match_payment_type differs for {description!r}")
+            if match_payment_method(description, ref.payment_methods) != match_payment_method(description, PaymentMethod.objects.all()):
+                raise CommandError(f"match_payment_method differs for {description!r}")
+
+    def _check_query_count(self):
+        get_reference_data()
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            for identifier in ('managers', 'apartments', 'payment_methods', 'banks', 'payment_type'):
+                get_dropdown_options(identifier)
+        # At most one version check when the throttle window expires
+        if len(ctx.captured_queries) > 1:
+            raise CommandError(f"Dropdown options ran {len(ctx.captured_queries)} queries")
+        self.stdout.write(f"5 dropdowns -> {len(ctx.captured_queries)} queries")
+
+    def _check_version_bumps(self):
+        for label, change in (
+            ('PaymenType save', lambda: PaymenType.objects.create(name='QA Ref Extra', type='Out')),
+            ('PaymentMethod save', lambda: PaymentMethod.objects.create(name='QA Ref Bank', type='Bank')),
+            ('Apartment save', lambda: Apartment.objects.create(name='QA Ref Apartment 2', bedrooms=1, bathrooms=1)),
+            ('Apartment managers change', lambda: self.apartment.managers.remove(self.manager)),
+            ('Manager save', lambda: User.objects.filter(pk=self.manager.pk).first().save()),
+        ):
+            before = current_version()
+            change()
+            if current_version() <= before:
+                raise CommandError(f"{label} did not bump the reference data version")
+            if get_reference_data().stamp != current_stamp():
+                raise CommandError(f"Snapshot not reloaded after {label}")
+        if self.apartment in get_reference_data().apartments_for_manager(self.manager.id):
+            raise CommandError("Removed manager still linked in snapshot")
+
+        # Logins only touch last_login, which is not cached
+        before = current_version()
+        self.manager.last_login = timezone.now()
+        self.manager.save(update_fields=['last_login'])
+        if current_version() != before:
+            raise CommandError("Manager login bumped the reference data version")
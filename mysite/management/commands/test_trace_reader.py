@@ -0,0 +1,137 @@
+"""
+Verify indexed trace queries: tail, filters, legacy files, rotated segments and follow.
+Run: python manage.py test_trace_reader
+Everything is written to a temporary directory.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mysite.trace_reader import follow, parse_time, query, tail, trace_segments
+from mysite.trace_writer import TraceWriter, index_path
+
+
+def numbers(events):
+    return [event['data']['n'] for event in events]
+
+
+class Command(BaseCommand):
+    help = "Check trace tail/query/follow against rotated, compressed and legacy trace files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=20000, help='Events in the memory check trace.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            self._check_rotated(os.path.join(directory, 'rotated', 'trace.jsonl'))
+            self._check_legacy(os.path.join(directory, 'legacy', 'trace.jsonl'))
+            self._check_follow(os.path.join(directory, 'follow', 'trace.jsonl'))
+            self._check_memory(os.path.join(directory, 'memory', 'trace.jsonl'), options['events'])
+        self.stdout.write(self.style.SUCCESS("OK: indexed trace tail, query and follow"))
+
+    def _write(self, writer, start, count, ts=None):
+        for n in range(start, start + count):
+            writer.submit({'rid': f'r{n % 5}', 'step': f'step.{n % 3}', 'ts': ts or time.time(),
+                           'data': {'n': n, 'pad': 'x' * 80}})
+        if not writer.flush(10):
+            raise CommandError("Writer did not drain the queue")
+
+    def _check_rotated(self, path):
+        writer = TraceWriter(path, max_bytes=8000, backup_count=100)
+        old_ts = time.time() - 3 * 3600
+        self._write(writer, 0, 200, ts=old_ts)
+        self._write(writer, 200, 200)
+        if len(trace_segments(path)) < 5:
+            raise CommandError("Expected several rotated segments")
+
+        if numbers(query(path)) != list(range(400)):
+            raise CommandError("query() lost or reordered events across segments")
+        if numbers(tail(path, 150)) != list(range(250, 400)):
+            raise CommandError("tail() did not return the last events in order")
+        expected = [n for n in range(400) if n % 5 == 2 and n % 3 == 1]
+        if numbers(query(path, rid='r2', step='step.1')) != expected:
+            raise CommandError("rid/step filter returned wrong events")
+        if numbers(tail(path, 3, rid='r2', step='step.[01]')) != [n for n in range(400) if n % 5 == 2 and n % 3 < 2][-3:]:
+            raise CommandError("Filtered tail returned wrong events")
+        if numbers(query(path, since=parse_time('1h'))) != list(range(200, 400)):
+            raise CommandError("since filter returned wrong events")
+        if numbers(query(path, until=parse_time('2h'))) != list(range(200)):
+            raise CommandError("until filter returned wrong events")
+
+    def _check_legacy(self, path):
+        # Trace written by the old FileHandler era: no index, some pretty-printed events
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('not json\n')
+            for n in range(10):
+                event = {'rid': f'r{n % 2}', 'step': 'legacy', 'data': {'n': n}}
+                f.write((json.dumps(event, indent=2) if n % 3 == 0 else json.dumps(event)) + '\n')
+        if numbers(query(path, rid='r1')) != [1, 3, 5, 7, 9]:
+            raise CommandError("Legacy file was not indexed correctly")
+        if not os.path.exists(index_path(path)):
+            raise CommandError("Legacy index was not persisted")
+
+        # The writer appends to the same file; the index is extended, not rebuilt
+        index_inode = os.stat(index_path(path)).st_ino
+        writer = TraceWriter(path)
+        self._write(writer, 10, 5)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'rid': 'r0', 'step': 'manual', 'data': {'n': 15}}) + '\n')
+        if numbers(tail(path, 7)) != list(range(9, 16)):
+            raise CommandError("Incremental index extension lost events")
+        if os.stat(index_path(path)).st_ino != index_inode:
+            raise CommandError("Index was rebuilt instead of extended")
+        self._write(writer, 16, 1)
+        if numbers(tail(path, 2)) != [15, 16]:
+            raise CommandError("Writer did not continue the extended index")
+
+    def _check_follow(self, path):
+        writer = TraceWriter(path, max_bytes=3000, backup_count=100)
+        self._write(writer, 0, 20)
+        seen = []
+        stop = threading.Event()
+
+        def consume():
+            for event in follow(path, step='step.0', poll_seconds=0.02, stop=stop.is_set):
+                seen.append(event['data']['n'])
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        time.sleep(0.2)
+        # Several rotations happen between polls
+        self._write(writer, 20, 300)
+        deadline = time.monotonic() + 5
+        expected = [n for n in range(20, 320) if n % 3 == 0]
+        while seen != expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stop.set()
+        thread.join(5)
+        if seen != expected:
+            raise CommandError(f"follow() saw {len(seen)} of {len(expected)} events across rotations")
+
+    def _check_memory(self, path, count):
+        writer = TraceWriter(path, max_bytes=0, queue_size=count + 1)
+        self._write(writer, 0, count)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        tail(path, 1)  # build the index up front; it is normally written by the writer
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        last = tail(path, 20, step='step.2')
+        found = sum(1 for _ in query(path, rid='r4', step='step.0'))
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if numbers(last) != [n for n in range(count) if n % 3 == 2][-20:]:
+            raise CommandError("tail() on the large trace returned wrong events")
+        if found != len([n for n in range(count) if n % 5 == 4 and n % 3 == 0]):
+            raise CommandError("query() on the large trace returned wrong events")
+        if peak > 2 * 1024 * 1024:
+            raise CommandError(f"Peak memory {peak / 1024:.0f} KB for a {size_mb:.1f} MB trace")
+        self.stdout.write(f"{count} events ({size_mb:.1f} MB): tail + rid query {elapsed * 1000:.0f} ms, "
+                          f"peak memory {peak / 1024:.0f} KB")
@@ -0,0 +1,165 @@
+"""
+Verify the background trace writer: index offsets, rotation, compression, sampling, drops
+and payload snapshots taken before queueing.
+Run: python manage.py test_trace_writer
+Everything is written to a temporary directory.
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from mysite.trace_writer import TraceWriter, archived_trace_files, index_path, parse_sample_rates, snapshot
+from mysite.views import payment_sync_v2
+
+
+def read_index(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n').split('\t') for line in f]
+
+
+class Command(BaseCommand):
+    help = "Check trace writer index offsets, rotation, sampling and non-blocking submits"
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            self._check_index_and_rotation(os.path.join(directory, 'rotate', 'trace.jsonl'))
+            self._check_sampling()
+            self._check_drops(os.path.join(directory, 'drops', 'trace.jsonl'))
+            self._check_event_cap(os.path.join(directory, 'cap', 'trace.jsonl'))
+            self._check_snapshot()
+            self._check_view_trace(os.path.join(directory, 'view', 'trace.jsonl'))
+        self.stdout.write(self.style.SUCCESS("OK: trace writer index, rotation, sampling and drops"))
+
+    def _check_index_and_rotation(self, path):
+        writer = TraceWriter(path, max_bytes=20_000, backup_count=3, queue_size=10_000)
+        submitted = []
+
+        def produce(worker):
+            for i in range(200):
+                event = {'rid': f'r{worker}-{i % 7}', 'step': f'step.{i % 3}', 'data': {'n': i, 'pad': 'x' * 200}}
+                writer.submit(event)
+                submitted.append(event)
+
+        threads = [threading.Thread(target=produce, args=(w,)) for w in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if not writer.flush(10):
+            raise CommandError("Writer did not drain the queue")
+        if writer.written != len(submitted) or writer.dropped:
+            raise CommandError(f"written={writer.written} dropped={writer.dropped} submitted={len(submitted)}")
+
+        archives = archived_trace_files(path)
+        if not archives:
+            raise CommandError("Expected size-based rotation")
+        if len(archives) > 3:
+            raise CommandError(f"backup_count=3 but {len(archives)} archives kept")
+
+        # Every index entry of the live file and each archive points at its own event
+        segments = [(path, index_path(path), open)] + [(data, idx, gzip.open) for data, idx in archives]
+        for data_path, idx_path, opener in segments:
+            with opener(data_path, 'rb') as f:
+                content = f.read()
+            entries = read_index(idx_path)
+            if sum(int(e[2]) for e in entries) != len(content):
+                raise CommandError(f"Index of {data_path} does not cover the file")
+            for rid, offset, length, step, ts in entries:
+                event = json.loads(content[int(offset):int(offset) + int(length)])
+                if event['rid'] != rid or event['step'] != step or not float(ts):
+                    raise CommandError(f"Index entry {rid}@{offset} points at {event['rid']}")
+
+    def _check_sampling(self):
+        if parse_sample_rates('a=0.5, b=0,bad,c=x') != {'a': 0.5, 'b': 0.0}:
+            raise CommandError("parse_sample_rates failed")
+        writer = TraceWriter('unused.jsonl', sample_rate=0.25, step_sample_rates={'always': 1, 'never': 0})
+        rids = [f'rid{i}' for i in range(4000)]
+        kept = [rid for rid in rids if writer.should_sample(rid, 'other')]
+        if not 0.2 < len(kept) / len(rids) < 0.3:
+            raise CommandError(f"Sample rate 0.25 kept {len(kept) / len(rids):.2f}")
+        if kept != [rid for rid in rids if writer.should_sample(rid, 'other')]:
+            raise CommandError("Sampling is not stable per rid")
+        if not all(writer.should_sample(rid, 'always') for rid in rids[:100]):
+            raise CommandError("Per-step rate 1 dropped events")
+        if any(writer.should_sample(rid, 'never') for rid in rids[:100]):
+            raise CommandError("Per-step rate 0 kept events")
+
+    def _check_drops(self, path):
+        writer = TraceWriter(path, queue_size=5)
+        original_write = writer._write
+        release = threading.Event()
+
+        def slow_write(line, event):
+            release.wait(5)
+            original_write(line, event)
+
+        writer._write = slow_write
+        t0 = time.perf_counter()
+        accepted = sum(writer.submit({'rid': 'burst', 'step': 's', 'data': i}) for i in range(100))
+        elapsed = time.perf_counter() - t0
+        release.set()
+        writer.flush(5)
+        if elapsed > 1:
+            raise CommandError(f"submit blocked for {elapsed:.2f}s with a stalled writer")
+        if writer.dropped != 100 - accepted or writer.dropped < 90:
+            raise CommandError(f"Expected drops with a full queue: accepted={accepted} dropped={writer.dropped}")
+        if writer.written != accepted:
+            raise CommandError(f"Accepted {accepted} events but wrote {writer.written}")
+
+    def _check_event_cap(self, path):
+        writer = TraceWriter(path, max_event_bytes=5000)
+        writer.submit({'rid': 'big', 'step': 's', 'data': {'blob': 'y' * 50_000}})
+        writer.flush(5)
+        with open(path, 'rb') as f:
+            line = f.readline()
+        event = json.loads(line)
+        if len(line) > 5000 or not event['data'].get('_truncated') or event['rid'] != 'big':
+            raise CommandError("Oversized event was not truncated to a preview")
+
+    def _check_snapshot(self):
+        payload = {'columns': {'amount': [1, 2]}, 'rows': [{'id': 1}], 'pair': (1, [2])}
+        copied = snapshot(payload)
+        payload['columns']['amount'].append(3)
+        payload['columns']['new'] = []
+        payload['rows'][0]['id'] = 9
+        payload['pair'][1].append(3)
+        if copied != {'columns': {'amount': [1, 2]}, 'rows': [{'id': 1}], 'pair': [1, [2]]}:
+            raise CommandError(f"snapshot shares containers with the payload: {copied}")
+
+    def _check_view_trace(self, path):
+        os.environ['PAYMENT_SYNC_V2_TRACE_PATH'] = path
+        previous = payment_sync_v2._trace_writer_instance
+        payment_sync_v2._trace_writer_instance = None
+        try:
+            request = RequestFactory().post('/payments-sync-v2/')
+            payload = [{'id': i} for i in range(50)]
+            payment_sync_v2._trace_event(request, 'qa.step', payload)
+            writer = payment_sync_v2._trace_writer()
+            writer.flush(5)
+            entries = read_index(index_path(path))
+            if len(entries) != 1 or entries[0][0] != request._payment_sync_v2_rid:
+                raise CommandError(f"_trace_event wrote unexpected index entries: {entries}")
+            with open(path, 'r', encoding='utf-8') as f:
+                event = json.loads(f.readline())
+            if event['data'].get('len') != 50 or event['step'] != 'qa.step':
+                raise CommandError(f"_trace_event wrote unexpected event: {event}")
+
+            # Callers keep changing traced payloads (PaymentColumns.set_column after to_payload)
+            columns = {'id': [1, 2], 'is_matched': [False, False]}
+            payment_sync_v2._trace_event(request, 'qa.columns', {'format': 'columns', 'columns': columns})
+            columns['is_matched'] = [True, True]
+            columns['matched_criteria'] = ['ai', 'ai']
+            writer.flush(5)
+            with open(path, 'r', encoding='utf-8') as f:
+                event = json.loads(f.readlines()[-1])
+            if event['data'].get('columns') != {'id': [1, 2], 'is_matched': [False, False]}:
+                raise CommandError(f"_trace_event did not snapshot the payload: {event['data']}")
+        finally:
+            payment_sync_v2._trace_writer_instance = previous
+            os.environ.pop('PAYMENT_SYNC_V2_TRACE_PATH', None)
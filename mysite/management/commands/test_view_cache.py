@@ -0,0 +1,169 @@
+"""
+Verify conditional GET on the calendar and API views: ETag / 304 responses,
+cached bodies and invalidation after saves, bulk writes and manager changes,
+with the version bumps of a transaction applied once, after it commits.
+Run: python manage.py test_view_cache
+All data is created inside a transaction that is rolled back at the end;
+writes run under captureOnCommitCallbacks to apply their bumps.
+"""
+import os
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.audit_bulk import audit_bulk_create, audit_queryset_update
+from mysite.models import Apartment, Booking, CalendarNote, HandymanCalendar, ParkingBooking, Parking, User
+from mysite.view_cache import _bump_pending, model_versions
+
+
+class Command(BaseCommand):
+    help = "Check ETag / 304 handling and invalidation of the cached calendar and API views"
+
+    def handle(self, *args, **options):
+        cache.clear()
+        with transaction.atomic():
+            self._create_data()
+            self._check_not_modified()
+            self._check_invalidation()
+            self._check_scopes()
+            self._check_api()
+            transaction.set_rollback(True)
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS("OK: conditional GET and view cache invalidation"))
+
+    def _create_data(self):
+        today = timezone.now().date()
+        self.admin = User.objects.create(email='qa-viewcache-admin@example.com', full_name='QA VC Admin', role='Admin')
+        self.manager = User.objects.create(email='qa-viewcache-mgr@example.com', full_name='QA VC Manager', role='Manager')
+        self.tenant = User.objects.create(email='qa-viewcache-tenant@example.com', full_name='QA VC Tenant', role='Tenant')
+        self.apartment = Apartment.objects.create(name='QA VC Apt', bedrooms=1, bathrooms=1, status='Available')
+        self.booking = Booking.objects.create(tenant=self.tenant, apartment=self.apartment, status='Confirmed',
+                                              start_date=today, end_date=today + timedelta(days=10))
+        self.parking = Parking.objects.create(number='QA-VC-1', building='QA')
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        self.manager_client = Client()
+        self.manager_client.force_login(self.manager)
+
+    def _get(self, client, url, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return client.get(url, params, **headers)
+
+    def _expect(self, response, status, label):
+        if response.status_code != status:
+            raise CommandError(f"{label}: expected {status}, got {response.status_code}")
+        return response
+
+    def _check_not_modified(self):
+        for name in ('booking_availability', 'index', 'parking_calendar', 'handyman_calendar'):
+            url = reverse(name)
+            first = self._expect(self._get(self.admin_client, url), 200, f"{name} first GET")
+            etag = first.get('ETag')
+            if not etag or not first.get('Last-Modified'):
+                raise CommandError(f"{name}: missing ETag/Last-Modified")
+            again = self._expect(self._get(self.admin_client, url, etag), 304, f"{name} If-None-Match")
+            if again.content:
+                raise CommandError(f"{name}: 304 response has a body")
+            cached = self._expect(self._get(self.admin_client, url), 200, f"{name} cached GET")
+            if cached.content != first.content or cached.get('ETag') != etag:
+                raise CommandError(f"{name}: cached body differs from the rendered page")
+            other_page = self._get(self.admin_client, url, page=1)
+            if other_page.get('ETag') == etag:
+                raise CommandError(f"{name}: ETag ignores the query string")
+        self.stdout.write("304 and cached bodies: ok")
+
+    def _check_invalidation(self):
+        url = reverse('booking_availability')
+        writes = [
+            ('Booking save', lambda: Booking.objects.filter(pk=self.booking.pk).first().save()),
+            ('CalendarNote create', lambda: CalendarNote.objects.create(
+                apartment=self.apartment, start_date=self.booking.start_date,
+                end_date=self.booking.end_date, note='QA VC note')),
+            ('bulk_create', lambda: audit_bulk_create(Booking, [Booking(
+                tenant=self.tenant, apartment=self.apartment, status='Pending',
+                start_date=self.booking.end_date + timedelta(days=5),
+                end_date=self.booking.end_date + timedelta(days=8))])),
+            ('queryset update', lambda: audit_queryset_update(
+                Apartment.objects.filter(pk=self.apartment.pk), notes='QA VC updated')),
+            ('manager link', lambda: self.apartment.managers.add(self.manager)),
+        ]
+        for label, write in writes:
+            etag = self._get(self.admin_client, url)['ETag']
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                write()
+            response = self._get(self.admin_client, url, etag)
+            if response.status_code != 200 or response['ETag'] == etag:
+                raise CommandError(f"{label} did not invalidate booking_availability")
+
+        # Writes to models the view does not read keep the ETag
+        etag = self._get(self.admin_client, url)['ETag']
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            ParkingBooking.objects.create(parking=self.parking, start_date=self.booking.start_date,
+                                          end_date=self.booking.end_date, status='Booked')
+            HandymanCalendar.objects.create(tenant_name='QA VC', tenant_phone='+15550100000',
+                                            apartment_name='QA VC Apt', date=self.booking.start_date,
+                                            start_time='09:00', end_time='09:30', notes='')
+        self._expect(self._get(self.admin_client, url, etag), 304, "unrelated writes")
+
+        # last_login updates do not count as user changes
+        versions = model_versions(['User'])
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            self.admin.last_login = timezone.now()
+            self.admin.save(update_fields=['last_login'])
+        if model_versions(['User']) != versions:
+            raise CommandError("last_login update bumped the User version")
+
+        # Bumps wait for the commit and are applied once per transaction
+        versions = model_versions(['Apartment', 'Booking'])
+        with TestCase.captureOnCommitCallbacks() as callbacks:
+            Booking.objects.filter(pk=self.booking.pk).first().save()
+            audit_queryset_update(Apartment.objects.filter(pk=self.apartment.pk), notes='QA VC again')
+            Booking.objects.filter(pk=self.booking.pk).first().save()
+        if model_versions(['Apartment', 'Booking']) != versions:
+            raise CommandError("versions were bumped before the transaction committed")
+        if callbacks.count(_bump_pending) != 1:
+            raise CommandError(f"{callbacks.count(_bump_pending)} version bump callbacks for one transaction")
+        _bump_pending()
+        bumped = model_versions(['Apartment', 'Booking'])
+        if any(bumped[name][0] != versions[name][0] + 1 for name in versions):
+            raise CommandError(f"expected one bump per model after commit: {versions} -> {bumped}")
+        self.stdout.write("invalidation after saves, bulk writes and m2m changes: ok")
+
+    def _check_scopes(self):
+        url = reverse('booking_availability')
+        admin_response = self._get(self.admin_client, url)
+        manager_response = self._get(self.manager_client, url)
+        if admin_response['ETag'] == manager_response['ETag']:
+            raise CommandError("admin and manager share an ETag")
+        self._expect(self._get(self.manager_client, url, admin_response['ETag']), 200, "manager with admin ETag")
+        if b'QA VC Apt' not in manager_response.content:
+            raise CommandError("manager page misses the managed apartment")
+
+        # POST is never answered from the cache
+        etag = self._get(self.admin_client, reverse('index'))['ETag']
+        response = self.admin_client.post(reverse('index'), {}, HTTP_IF_NONE_MATCH=etag)
+        if response.status_code == 304:
+            raise CommandError("POST was answered with 304")
+        self.stdout.write("per-user scopes: ok")
+
+    def _check_api(self):
+        url = reverse('apartment_booking_dates')
+        token = os.environ.get('API_AUTH_TOKEN')
+        if not token:
+            self.stdout.write("API_AUTH_TOKEN not set, skipping the API check")
+            return
+        params = {'auth_token': token, 'apartment_ids': str(self.apartment.pk)}
+        client = Client()
+        first = self._expect(client.get(url, params), 200, "api first GET")
+        etag = first['ETag']
+        self._expect(client.get(url, params, HTTP_IF_NONE_MATCH=etag), 304, "api If-None-Match")
+        self._expect(client.get(url, {**params, 'auth_token': 'wrong'}, HTTP_IF_NONE_MATCH=etag), 401, "api bad token")
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(pk=self.booking.pk).first().save()
+        self._expect(client.get(url, params, HTTP_IF_NONE_MATCH=etag), 200, "api after booking save")
+        self.stdout.write("apartment booking dates API: ok")
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:20
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0065_ai_model_catalog_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIMatchCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=200)),
+                ('response', models.JSONField(blank=True, default=list)),
+                ('payment_ids', models.JSONField(blank=True, default=list)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['payment_ids'], name='aimatchcache_payment_ids_gin')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0066_ai_match_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointLatency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('period_start', models.DateTimeField(db_index=True)),
+                ('count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('buckets', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(db_index=True, max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.TextField()),
+                ('status_code', models.IntegerField(blank=True, null=True)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('trigger', models.CharField(choices=[('header', 'Header'), ('query', 'Query flag'), ('sample', 'Sampled')], max_length=10)),
+                ('file_path', models.TextField(blank=True, null=True)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('requested_by', models.CharField(blank=True, editable=False, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='endpointlatency',
+            constraint=models.UniqueConstraint(fields=('view_name', 'method', 'period_start'), name='endpoint_latency_period_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0067_perf_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='twiliomessage',
+            index=models.Index(fields=['conversation', 'updated_at', 'id'], name='mysite_twil_convers_4e6140_idx'),
+        ),
+    ]
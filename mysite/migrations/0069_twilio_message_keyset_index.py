@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0068_twilio_message_stream_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='twiliomessage',
+            index=models.Index(fields=['conversation', 'message_timestamp', 'id'], name='mysite_twil_convers_5e1503_idx'),
+        ),
+    ]
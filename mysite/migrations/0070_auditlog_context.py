@@ -0,0 +1,50 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0069_twilio_message_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='apartment_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='apartment_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='booking_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='tenant_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='tenant_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['booking_id', '-timestamp'], name='mysite_audi_booking_40576d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['apartment_id', '-timestamp'], name='mysite_audi_apartme_1b9bff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['tenant_id', '-timestamp'], name='mysite_audi_tenant__0f2924_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0070_auditlog_context'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('audit', 'Audit'), ('error', 'Error'), ('system', 'System')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('user', models.CharField(blank=True, default='', max_length=255)),
+                ('kind', models.CharField(blank=True, default='', max_length=100)),
+                ('action', models.CharField(blank=True, default='', max_length=20)),
+                ('apartment_id', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('noise', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityRollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=10, unique=True)),
+                ('closed_until', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(fields=('source', 'period_start', 'user', 'kind', 'action', 'apartment_id'), name='activity_rollup_uniq'),
+        ),
+    ]
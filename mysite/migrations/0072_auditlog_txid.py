@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+# Rows written before this migration keep txid 0 and are read in id order
+SET_TXID = """
+CREATE OR REPLACE FUNCTION mysite_auditlog_set_txid() RETURNS trigger AS $$
+BEGIN
+    NEW.txid := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER mysite_auditlog_set_txid
+    BEFORE INSERT ON mysite_auditlog
+    FOR EACH ROW EXECUTE FUNCTION mysite_auditlog_set_txid();
+"""
+
+DROP_TXID = """
+DROP TRIGGER IF EXISTS mysite_auditlog_set_txid ON mysite_auditlog;
+DROP FUNCTION IF EXISTS mysite_auditlog_set_txid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0071_activity_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['txid', 'id'], name='mysite_audi_txid_ad05aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'txid', 'id'], name='mysite_audi_model_n_802b07_idx'),
+        ),
+        migrations.RunSQL(SET_TXID, DROP_TXID),
+    ]
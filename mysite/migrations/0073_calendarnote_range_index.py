@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0072_auditlog_txid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarnote',
+            index=models.Index(fields=['end_date', 'start_date'], name='calnote_end_start_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.4 on 2026-10-19 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mysite', '0073_calendarnote_range_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportexportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportexportjob',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_export_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mysite', '0074_reportexportjob_owner_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='twiliomessage',
+            index=models.Index(fields=['updated_at', 'id'], name='mysite_twil_updated_7700ee_idx'),
+        ),
+    ]
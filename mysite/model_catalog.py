@@ -0,0 +1,215 @@
+"""
+Cached AI model catalog for the model pickers (payment sync v2, AI management).
+
+Views call ``openrouter_catalog.get(fallback)`` which never touches the
+network: it returns the in-process list, loading it once from the
+AIModelCatalogSnapshot row when the process starts. When the list is older
+than CATALOG_TTL_SECONDS, the stale list is still returned and a background
+thread refreshes it (stale-while-revalidate):
+
+- if another worker already stored a fresh list, it is adopted from the DB;
+- otherwise the worker that wins the ``last_attempt_at`` lease fetches the
+  provider with a timeout and stores the result;
+- on failure the last good list is kept and the error is recorded on the row.
+
+Until a first list has been fetched, ``get`` returns the caller's fallback.
+``python manage.py refresh_ai_models`` refreshes synchronously (deploys, cron).
+
+Usage:
+    from mysite.model_catalog import openrouter_catalog
+
+    ai_models = openrouter_catalog.get(fallback=DEFAULT_AI_MODELS)
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+CATALOG_TTL_SECONDS = 6 * 3600
+# Minimum time between provider calls after a failure, and the cross-worker lease length
+RETRY_SECONDS = 60
+FETCH_TIMEOUT = (3, 10)
+OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models"
+
+
+def format_context_length(n):
+    """Format context length for display, e.g. 128000 -> '128k', 1000000 -> '1M'."""
+    if n is None:
+        return None
+    try:
+        n = int(n)
+        if n >= 1_000_000:
+            return f"{n // 1_000_000}M"
+        if n >= 1000:
+            return f"{n // 1000}k"
+        return str(n)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_openrouter_models(data):
+    """OpenRouter /models response -> [{value, label, prompt_price, completion_price, context_length, context_length_display}]."""
+    models = []
+    for m in data.get('data', []):
+        pricing = m.get('pricing', {})
+        prompt_price = float(pricing.get('prompt', 0)) * 1000000
+        completion_price = float(pricing.get('completion', 0)) * 1000000
+        ctx = m.get('context_length')
+        models.append({
+            'value': m.get('id'),
+            'label': m.get('name'),
+            'prompt_price': f"{prompt_price:.2f}",
+            'completion_price': f"{completion_price:.2f}",
+            'context_length': ctx,
+            'context_length_display': format_context_length(ctx),
+        })
+    models.sort(key=lambda x: x['label'] or '')
+    return models
+
+
+def fetch_openrouter_models():
+    import requests
+
+    api_key = os.environ.get('OPENROUTER_API_KEY')
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY is not set")
+    response = requests.get(
+        OPENROUTER_MODELS_URL,
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=FETCH_TIMEOUT,
+    )
+    response.raise_for_status()
+    return parse_openrouter_models(response.json())
+
+
+class ModelCatalog:
+    """Process cache of one provider's model list backed by an AIModelCatalogSnapshot row."""
+
+    def __init__(self, name, fetch, ttl=CATALOG_TTL_SECONDS, retry_seconds=RETRY_SECONDS):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self._items = None
+        self._fetched_at = None
+        self._loaded = False
+        self._next_attempt = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get(self, fallback=None):
+        """Model list for views; never does network I/O (one DB read per process at most)."""
+        if not self._loaded:
+            self._load_snapshot()
+        if self.is_stale():
+            self.refresh_in_background()
+        items = self._items
+        return list(items) if items else list(fallback or [])
+
+    @property
+    def fetched_at(self):
+        return self._fetched_at
+
+    def is_stale(self):
+        from django.utils import timezone
+
+        return self._fetched_at is None or timezone.now() - self._fetched_at > timedelta(seconds=self.ttl)
+
+    def refresh_in_background(self):
+        """Start a refresh thread unless one is running or the last attempt was too recent."""
+        if time.monotonic() < self._next_attempt:
+            return None
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+            if time.monotonic() < self._next_attempt:
+                return None
+            self._next_attempt = time.monotonic() + self.retry_seconds
+            self._thread = threading.Thread(target=self._background_refresh, name=f'model-catalog-{self.name}', daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def wait(self, timeout=None):
+        """Join a running background refresh (commands and tests)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _background_refresh(self):
+        from django.db import connection
+
+        try:
+            self.refresh()
+        except Exception as e:
+            from mysite.unified_logger import log_warning
+
+            log_warning(f"Model catalog '{self.name}' refresh failed: {e}", category='sync')
+        finally:
+            connection.close()
+
+    def refresh(self, force=False):
+        """
+        Bring the list up to date; returns True when a fresh list is loaded.
+        Adopts a fresh list stored by another worker, otherwise fetches the
+        provider if this worker wins the lease (or ``force`` is set).
+        """
+        from django.db.models import Q
+        from django.utils import timezone
+
+        from mysite.models import AIModelCatalogSnapshot
+
+        now = timezone.now()
+        snapshot, _ = AIModelCatalogSnapshot.objects.get_or_create(name=self.name)
+        if not force and snapshot.fetched_at and now - snapshot.fetched_at <= timedelta(seconds=self.ttl):
+            self._adopt(snapshot)
+            return True
+
+        rows = AIModelCatalogSnapshot.objects.filter(pk=snapshot.pk)
+        lease_cutoff = now - timedelta(seconds=self.retry_seconds)
+        won = rows.filter(Q(last_attempt_at__isnull=True) | Q(last_attempt_at__lt=lease_cutoff)).update(last_attempt_at=now)
+        if not won and not force:
+            self._adopt(snapshot)
+            return False
+
+        try:
+            items = self.fetch()
+            if not items:
+                raise ValueError("provider returned no models")
+        except Exception as e:
+            error = str(e)[:2000]
+            rows.update(last_error=error)
+            self._adopt(snapshot)
+            if error != snapshot.last_error:
+                # Log once per distinct error, not on every retry
+                from mysite.unified_logger import log_warning
+
+                log_warning(f"Model catalog '{self.name}' fetch failed, keeping last good list: {e}", category='sync')
+            return False
+
+        rows.update(items=items, fetched_at=now, last_error='')
+        with self._lock:
+            self._items = items
+            self._fetched_at = now
+            self._loaded = True
+        return True
+
+    def _adopt(self, snapshot):
+        with self._lock:
+            if snapshot.items and (self._fetched_at is None or (snapshot.fetched_at and snapshot.fetched_at > self._fetched_at)):
+                self._items = snapshot.items
+                self._fetched_at = snapshot.fetched_at
+            self._loaded = True
+
+    def _load_snapshot(self):
+        from mysite.models import AIModelCatalogSnapshot
+
+        try:
+            snapshot = AIModelCatalogSnapshot.objects.filter(name=self.name).first()
+        except Exception:
+            snapshot = None
+        if snapshot is not None:
+            self._adopt(snapshot)
+        self._loaded = True
+
+
+openrouter_catalog = ModelCatalog('openrouter', fetch_openrouter_models)
@@ -1,7 +1,8 @@
 # mysite/models.py
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password
 from dateutil.relativedelta import relativedelta
 from datetime import datetime
@@ -392,24 +393,27 @@ class Apartment(models.Model):
         
         return 0
 
+    @property
+    def price_timeline(self):
+        """Cached price history (see mysite/price_timeline.py)"""
+        from mysite.price_timeline import get_price_timeline
+        return get_price_timeline(self.id)
+
     @property
     def current_price(self):
         """Get the price that is effective on the current date"""
         from datetime import date
-        today = date.today()
-        current_price_record = self.prices.filter(effective_date__lte=today).order_by('-effective_date').first()
-        return current_price_record.price if current_price_record else None
+        return self.price_timeline.price_on(date.today())
 
-    def get_price_on_date(self, target_date):
-        """Get the price that was effective on a specific date"""
-        price_record = self.prices.filter(effective_date__lte=target_date).order_by('-effective_date').first()
-        return price_record.price if price_record else None
+    def get_price_on_date(self, target_date, include_rating=False):
+        """Get the price that was effective on a specific date (optionally with the monthly rating surcharge)"""
+        surcharge = self.get_rating_surcharge_per_day() * 30 if include_rating else 0
+        return self.price_timeline.price_on(target_date, surcharge=surcharge)
 
     def get_future_prices(self):
-        """Get all price changes scheduled for the future"""
+        """Get all price changes scheduled for the future as PricePoint(effective_date, price, notes)"""
         from datetime import date
-        today = date.today()
-        return self.prices.filter(effective_date__gt=today).order_by('effective_date')
+        return self.price_timeline.after(date.today())
 
     def payment_revenue(self, start_date, end_date):
         if start_date and end_date:
@@ -430,8 +434,8 @@ class Apartment(models.Model):
         
         # Pricing information
         current_price = self.current_price
-        price_count = self.prices.count()
-        future_count = self.get_future_prices().count()
+        price_count = len(self.price_timeline)
+        future_count = len(self.get_future_prices())
         
         if current_price:
             price_status = f"Current: ${current_price}"
@@ -505,6 +509,10 @@ class CalendarNote(models.Model):
                 name='calendar_note_start_date_lte_end_date',
             )
         ]
+        indexes = [
+            # Window overlap: end_date >= window start skips finished notes first
+            models.Index(fields=['end_date', 'start_date'], name='calnote_end_start_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         from mysite.request_context import apply_user_tracking
@@ -673,6 +681,8 @@ class Booking(models.Model):
         form_data = kwargs.pop('form_data', None)
         payments_data = kwargs.pop('payments_data', None)
         updated_by = kwargs.pop('updated_by', None)
+        # Batch imports run external calls (contract updates) only once their transaction commits
+        self._defer_external = kwargs.pop('defer_external', False)
         
         # Apply user tracking
         apply_user_tracking(self, updated_by)
@@ -743,7 +753,7 @@ class Booking(models.Model):
         
         # Update contract if exists
         if self.contract_id and self.status != 'Cancelled':
-            update_contract(self)
+            self._run_external(update_contract, "Update Contract")
         
         # Handle contract sending and messaging
         if self.status != 'Cancelled':
@@ -753,6 +763,19 @@ class Booking(models.Model):
         if self.tenant and self.tenant.phone and self.status != 'Cancelled':
             self.update_conversation_links()
 
+    def _run_external(self, func, label):
+        """Call an external service now, or after commit when saved with defer_external=True (errors are logged)"""
+        if not getattr(self, '_defer_external', False):
+            return func(self)
+
+        def run():
+            try:
+                func(self)
+            except Exception as e:
+                log_error(e, f"Booking {self.id} - {label}", source='model')
+
+        transaction.on_commit(run)
+
     def _reassign_parking_on_apartment_change(self):
         """
         When a booking moves apartments, try to move linked parking to the
@@ -1073,6 +1096,13 @@ class Booking(models.Model):
                 self.tenant = user
 
     def create_payments(self, payments_data):
+        """
+        Apply the payment lines of the booking form: edit or delete rows that
+        carry a payment_id, and write all new rows (monthly repeats and
+        Damage Deposit returns included) with one PaymentSchedule.
+        """
+        from mysite.payment_schedule import PaymentSchedule
+
         if payments_data:
             payment_dates = payments_data.get('payment_dates', [])
             amounts = payments_data.get('amounts', [])
@@ -1086,10 +1116,17 @@ class Booking(models.Model):
             payment_dates = [convert_date_format(
                 date) for date in payment_dates]
 
-            for date, amount, p_type, p_notes, n_months, payment_id, payment_status in zip_longest(
-                payment_dates, amounts, payment_types, payment_notes, number_of_months, payment_ids, payment_statuses, fillvalue=None
-            ):
-                self.create_payment(p_type, amount, date, p_notes, n_months, payment_id, payment_status)
+            existing_ids = [str(payment_id).replace("_deleted", "") for payment_id in payment_ids if payment_id]
+            existing = {str(pk): payment for pk, payment in Payment.objects.in_bulk(existing_ids).items()}
+            schedule = PaymentSchedule(booking=self)
+
+            with transaction.atomic():
+                for date, amount, p_type, p_notes, n_months, payment_id, payment_status in zip_longest(
+                    payment_dates, amounts, payment_types, payment_notes, number_of_months, payment_ids, payment_statuses, fillvalue=None
+                ):
+                    self.create_payment(p_type, amount, date, p_notes, n_months, payment_id, payment_status,
+                                        schedule=schedule, existing=existing)
+                schedule.write()
 
     def schedule_cleaning(self, form_data):
         # Schedule a cleaning for the day after the booking ends
@@ -1114,51 +1151,37 @@ class Booking(models.Model):
                                     booking=self, cleaner=assigned_cleaner)
                 cleaning.save()
 
-    def create_payment(self, payment_type_id, amount, payment_date, payment_notes, number_of_months, payment_id, payment_status):
-        payment_type_instance = PaymenType.objects.get(pk=payment_type_id)
+    def create_payment(self, payment_type_id, amount, payment_date, payment_notes, number_of_months, payment_id, payment_status,
+                       schedule=None, existing=None):
+        """
+        Apply one payment line. New payments are added to ``schedule`` (written
+        right away when none is given); ``existing`` maps payment ids to rows
+        already loaded by create_payments.
+        """
+        from mysite.payment_schedule import PaymentSchedule, payment_type_by_id
+
+        payment_type_instance = payment_type_by_id(payment_type_id)
+        existing = existing or {}
 
         if payment_id:
             if payment_id.endswith("_deleted"):
                 payment_id = payment_id[:-8]
-                payment = Payment.objects.get(pk=payment_id)
+                payment = existing.get(str(payment_id)) or Payment.objects.get(pk=payment_id)
                 payment.delete()
             else:
-                payment = Payment.objects.get(pk=payment_id)
+                payment = existing.get(str(payment_id)) or Payment.objects.get(pk=payment_id)
                 payment.payment_type = payment_type_instance
                 payment.amount = amount
                 payment.notes = payment_notes
                 payment.payment_date = payment_date
                 payment.payment_status = payment_status
                 payment.save()
+        elif schedule is not None:
+            schedule.add(payment_type_instance, amount, payment_date, payment_notes, number_of_months)
         else:
-            payment = Payment(
-                payment_type=payment_type_instance,
-                amount=amount,
-                booking=self,
-                notes=payment_notes,
-                payment_date=payment_date
-            )
-            payment.save(number_of_months=number_of_months)
-
-            if payment_type_instance.name == "Damage Deposit":
-                damage_deposit_return_type = PaymenType.objects.get(
-                    name="Damage Deposit", type="Out")
-                if damage_deposit_return_type:
-                    deposit_payment = Payment(
-                        payment_type=damage_deposit_return_type, amount=amount, booking=self, notes="Damage Deposit Return",
-                    payment_date=self.end_date)
-                    deposit_payment.save()
-                else:
-                    error_message = "Damage Deposit Return type not found"
-                    raise Exception(error_message)
-                    
-
-                notification = Notification(
-                    date=payment_date,
-                    message="Payment",
-                    payment=deposit_payment,
-                )
-                notification.save()
+            schedule = PaymentSchedule(booking=self)
+            schedule.add(payment_type_instance, amount, payment_date, payment_notes, number_of_months)
+            schedule.write()
 
     @property
     def assigned_cleaner(self):
@@ -1538,11 +1561,11 @@ class Payment(models.Model):
                         date=payment_date_str,
                     )
 
-            # Save the payment first
+            # Save the payment first; a monthly schedule writes its own notifications
             if number_of_months and number_of_months > 0:
                 self.create_payments(number_of_months)
-            else:
-                super().save(*args, **kwargs)
+                return
+            super().save(*args, **kwargs)
 
             # Auto-create notification for new payments (excluding mortage payments)
             if is_creating:
@@ -1572,24 +1595,12 @@ class Payment(models.Model):
         
 
     def create_payments(self, number_of_months):
-        for i in range(number_of_months):
-            payment_date = convert_date_format(
-                self.payment_date) + relativedelta(months=i)
-
-            payment = Payment(
-                payment_type=self.payment_type,
-                amount=self.amount,
-                booking=self.booking,
-                apartment=self.apartment,
-                payment_status=self.payment_status,
-                notes=self.notes,
-                bank=self.bank,
-                payment_method=self.payment_method,
-                payment_date=payment_date
-            )
-            payment.save()
+        """Save ``number_of_months`` monthly copies of this payment (not the payment itself) in bulk."""
+        from mysite.payment_schedule import PaymentSchedule
 
-            
+        schedule = PaymentSchedule(booking=self.booking)
+        schedule.add_recurring(self, number_of_months)
+        schedule.write()
 
     def delete(self, *args, **kwargs):
         from django.core.exceptions import PermissionDenied
@@ -1721,9 +1732,13 @@ class Cleaning(models.Model):
             
             # Create payment for new cleaning
             try:
-                payment_type = PaymenType.objects.get(pk=26)
-                payment_method = PaymentMethod.objects.get(pk=1)
-                bank = PaymentMethod.objects.get(pk=6)
+                from mysite.reference_data import get_reference_data
+                ref = get_reference_data()
+                payment_type = ref.payment_type(26)
+                payment_method = ref.payment_method(1)
+                bank = ref.payment_method(6)
+                if payment_type is None or payment_method is None or bank is None:
+                    raise ValueError("Cleaning payment type 26, payment method 1 or bank 6 is missing")
                 
                 payment = Payment(
                     payment_date=self.date,
@@ -2227,6 +2242,11 @@ class TwilioMessage(models.Model):
     
     class Meta:
         ordering = ['-message_timestamp']
+        indexes = [
+            models.Index(fields=['conversation', 'updated_at', 'id']),
+            models.Index(fields=['conversation', 'message_timestamp', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def save(self, *args, **kwargs):
         from mysite.request_context import apply_user_tracking
@@ -2295,12 +2315,27 @@ class AuditLog(models.Model):
     old_values = models.JSONField(blank=True, null=True)  # Old values (for updates and deletes)
     new_values = models.JSONField(blank=True, null=True)  # New values (for creates and updates)
     
+    # Related booking/apartment/tenant captured at write time (plain ids, they outlive deletes)
+    booking_id = models.IntegerField(blank=True, null=True)
+    apartment_id = models.IntegerField(blank=True, null=True)
+    apartment_name = models.CharField(max_length=255, blank=True, null=True)
+    tenant_id = models.IntegerField(blank=True, null=True)
+    tenant_name = models.CharField(max_length=255, blank=True, null=True)
+    
+    # Writing transaction id, set by a database trigger (see mysite/change_feed.py)
+    txid = models.BigIntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['-timestamp']
         indexes = [
+            models.Index(fields=['txid', 'id']),
+            models.Index(fields=['model_name', 'txid', 'id']),
             models.Index(fields=['-timestamp', 'model_name']),
             models.Index(fields=['model_name', '-timestamp']),
             models.Index(fields=['changed_by', '-timestamp']),
+            models.Index(fields=['booking_id', '-timestamp']),
+            models.Index(fields=['apartment_id', '-timestamp']),
+            models.Index(fields=['tenant_id', '-timestamp']),
         ]
     
     def __str__(self):
@@ -2486,6 +2521,210 @@ class AIManagement(models.Model):
         return []
 
 
+class ReportExportJob(models.Model):
+    """
+    Background spreadsheet export (payments / booking / apartment reports).
+    Progress is updated per written chunk so the status page can poll it.
+    """
+    FORMAT_CHOICES = [
+        ('sheets', 'Google Sheets'),
+        ('xlsx', 'Excel (XLSX)'),
+        ('csv', 'CSV'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    report = models.CharField(max_length=50, db_index=True)
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='sheets')
+    params = models.JSONField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    rows_written = models.IntegerField(default=0)
+    total_rows = models.IntegerField(blank=True, null=True)
+    result_url = models.TextField(blank=True, null=True)
+    file_path = models.TextField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    # Set on every progress update; a job whose heartbeat stops was lost with its worker
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                                     related_name='report_export_jobs')
+    created_by = models.CharField(max_length=255, blank=True, null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.report} ({self.export_format}) - {self.status}"
+
+    @property
+    def progress_percent(self):
+        # rows_written and total_rows both count data rows (see run_export)
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.rows_written * 100 / self.total_rows))
+
+
+class ReferenceDataVersion(models.Model):
+    """
+    Cluster-wide version counters for process caches (see mysite/reference_data.py).
+    Bumped whenever the cached tables change so every worker reloads its copy.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class AIModelCatalogSnapshot(models.Model):
+    """
+    Last good AI model list fetched from a provider (see mysite/model_catalog.py).
+    Survives restarts and is shared by all workers; last_attempt_at doubles as
+    a refresh lease so only one worker calls the provider at a time.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    items = models.JSONField(default=list, blank=True)
+    fetched_at = models.DateTimeField(blank=True, null=True)
+    last_attempt_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.name} ({len(self.items or [])} models)"
+
+
+class AIMatchCacheEntry(models.Model):
+    """
+    Cached AI match result for one (model, prompts, composite, candidates) request
+    (see mysite/ai_match_cache.py). Rows mentioning a payment are deleted when
+    that payment changes.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=200)
+    response = models.JSONField(default=list, blank=True)
+    payment_ids = models.JSONField(default=list, blank=True)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['payment_ids'], name='aimatchcache_payment_ids_gin'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]} ({self.hit_count} hits)"
+
+
+class EndpointLatency(models.Model):
+    """
+    Latency histogram of one endpoint (URL name + method) for one hour
+    (see mysite/perf_telemetry.py). Each worker aggregates in process and
+    merges its counts into the row on flush.
+    """
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    period_start = models.DateTimeField(db_index=True)
+    count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    # Request counts per perf_telemetry.LATENCY_BUCKETS_MS upper bound, plus one overflow bucket
+    buckets = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['view_name', 'method', 'period_start'],
+                name='endpoint_latency_period_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.view_name} @ {self.period_start:%Y-%m-%d %H:00} ({self.count})"
+
+
+class ActivityRollup(models.Model):
+    """
+    Number of AuditLog / ErrorLog / SystemLog rows logged in one hour for one
+    combination of user, kind, action and apartment (see mysite/activity_rollup.py).
+    Audit: kind = model name, action = create/update/delete.
+    Error: kind = error source, action = severity. System: kind = category, action = level.
+    """
+    SOURCE_CHOICES = [
+        ('audit', 'Audit'),
+        ('error', 'Error'),
+        ('system', 'System'),
+    ]
+
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    period_start = models.DateTimeField()
+    user = models.CharField(max_length=255, blank=True, default='')
+    kind = models.CharField(max_length=100, blank=True, default='')
+    action = models.CharField(max_length=20, blank=True, default='')
+    apartment_id = models.IntegerField(default=0)  # 0: no apartment
+    count = models.IntegerField(default=0)
+    # Audit updates that only touched auto-updated fields
+    noise = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'period_start', 'user', 'kind', 'action', 'apartment_id'],
+                name='activity_rollup_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.kind} {self.action} @ {self.period_start:%Y-%m-%d %H:00} ({self.count})"
+
+
+class ActivityRollupCursor(models.Model):
+    """Every hour of ``source`` before ``closed_until`` is fully counted in ActivityRollup."""
+    source = models.CharField(max_length=10, unique=True)
+    closed_until = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.source} rolled up until {self.closed_until}"
+
+
+class RequestProfile(models.Model):
+    """cProfile dump of one request, captured on demand by an admin or by sampling."""
+    TRIGGER_CHOICES = [
+        ('header', 'Header'),
+        ('query', 'Query flag'),
+        ('sample', 'Sampled'),
+    ]
+
+    view_name = models.CharField(max_length=200, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    status_code = models.IntegerField(blank=True, null=True)
+    duration_ms = models.FloatField(default=0)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    file_path = models.TextField(blank=True, null=True)
+    summary = models.TextField(blank=True, default='')
+    requested_by = models.CharField(max_length=255, blank=True, null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
 def send_telegram_message(chat_id, token, message):
     if chat_id and token:
         url = f"https://api.telegram.org/bot{token}/sendMessage"
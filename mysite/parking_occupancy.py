@@ -0,0 +1,181 @@
+"""
+Parking occupancy grid used by the parking calendar.
+
+All ParkingBookings that overlap the visible window are loaded with a single
+query and painted into a spot x day matrix. Every parking spot owns three
+rows covering the whole window:
+
+- status: one byte per day (AVAILABLE / BOOKED / UNAVAILABLE / NO_CAR / OTHER)
+- edges: START / END bit flags for the booking that owns the day
+- owner: index into ``bookings`` of the booking that owns the day (-1 = free)
+
+Bookings are painted with slice assignment, so building the grid costs one
+operation per booking instead of one per day, and monthly occupancy is a
+``bytearray.count`` over the month's slice of each row.
+"""
+from array import array
+from calendar import monthrange
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+
+AVAILABLE = 0
+BOOKED = 1
+UNAVAILABLE = 2
+NO_CAR = 3
+OTHER = 4
+
+START = 1
+END = 2
+
+STATUS_CODES = {
+    'Booked': BOOKED,
+    'Unavailable': UNAVAILABLE,
+    'No Car': NO_CAR,
+}
+
+
+class ParkingOccupancyGrid:
+    """Spot x day occupancy matrix for ``parkings`` between two dates (inclusive)."""
+
+    def __init__(self, parkings, parking_bookings, start_date, end_date):
+        self.parkings = list(parkings)
+        self.bookings = list(parking_bookings)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.num_days = (end_date - start_date).days + 1
+        self.row_by_parking_id = {parking.id: i for i, parking in enumerate(self.parkings)}
+
+        self.status = [bytearray(self.num_days) for _ in self.parkings]
+        self.edges = [bytearray(self.num_days) for _ in self.parkings]
+        self.owner = [array('l', [-1]) * self.num_days for _ in self.parkings]
+        self._paint()
+
+    @classmethod
+    def load(cls, start_date, end_date, status=None):
+        """Load parkings and every overlapping ParkingBooking with two queries."""
+        from mysite.models import Parking, ParkingBooking
+
+        parkings = Parking.objects.all().order_by('building', 'number')
+        parking_bookings = ParkingBooking.objects.filter(
+            parking__isnull=False,
+            start_date__lte=end_date,
+            end_date__gte=start_date,
+        )
+        if status:
+            parking_bookings = parking_bookings.filter(status=status)
+        parking_bookings = parking_bookings.select_related('apartment', 'booking__tenant').order_by('id')
+        return cls(parkings, parking_bookings, start_date, end_date)
+
+    def _paint(self):
+        # The legacy calendar showed the first matching booking for a day, so
+        # paint in reverse: earlier bookings overwrite later overlapping ones.
+        for index in range(len(self.bookings) - 1, -1, -1):
+            p_booking = self.bookings[index]
+            row = self.row_by_parking_id.get(p_booking.parking_id)
+            if row is None or not p_booking.start_date or not p_booking.end_date:
+                continue
+            first = max((p_booking.start_date - self.start_date).days, 0)
+            last = min((p_booking.end_date - self.start_date).days, self.num_days - 1)
+            if first > last:
+                continue
+            length = last - first + 1
+            code = STATUS_CODES.get(p_booking.status, OTHER)
+
+            self.status[row][first:last + 1] = bytes((code,)) * length
+            self.owner[row][first:last + 1] = array('l', [index]) * length
+            self.edges[row][first:last + 1] = bytes(length)
+            if p_booking.start_date >= self.start_date:
+                self.edges[row][first] |= START
+            if p_booking.end_date <= self.end_date:
+                self.edges[row][last] |= END
+
+    def offset(self, day):
+        return (day - self.start_date).days
+
+    def count(self, code, first_day, last_day):
+        """Number of spot-days with ``code`` between two dates (inclusive)."""
+        first = max(self.offset(first_day), 0)
+        stop = min(self.offset(last_day), self.num_days - 1) + 1
+        if first >= stop:
+            return 0
+        return sum(row.count(code, first, stop) for row in self.status)
+
+    def months(self):
+        """Yield (month_start, month_end) pairs covering the grid window."""
+        current_month = self.start_date.replace(day=1)
+        while current_month <= self.end_date:
+            days_in_month = monthrange(current_month.year, current_month.month)[1]
+            yield current_month, current_month.replace(day=days_in_month)
+            current_month += relativedelta(months=1)
+
+    def month_stats(self, month_start, month_end):
+        days_in_month = (month_end - month_start).days + 1
+        total_spots = len(self.parkings) * days_in_month
+        booked_days = self.count(BOOKED, month_start, month_end)
+        return {
+            'total_spots': total_spots,
+            'total_bookings': booked_days,
+            'month_occupancy': round((booked_days / total_spots) * 100) if total_spots > 0 else 0,
+        }
+
+    def _booking_payload(self, index, cache):
+        payload = cache.get(index)
+        if payload is None:
+            p_booking = self.bookings[index]
+            booking = p_booking.booking
+            apartment = p_booking.apartment
+            payload = {
+                'status': p_booking.status,
+                'tenant_name': booking.tenant.full_name if booking and booking.tenant else "",
+                'notes': p_booking.notes or "",
+                'id': p_booking.id,
+                'apartment_id': apartment.id if apartment else "",
+                'booking_id': booking.id if booking else "",
+                'apartment_name': apartment.name if apartment else "",
+                'start_date': p_booking.start_date.strftime('%Y-%m-%d'),
+                'end_date': p_booking.end_date.strftime('%Y-%m-%d'),
+            }
+            cache[index] = payload
+        return payload
+
+    def day_cells(self, row, month_start, month_end, payload_cache=None):
+        """Template cells for one spot and month, keyed by day of month."""
+        if payload_cache is None:
+            payload_cache = {}
+        owner = self.owner[row]
+        edges = self.edges[row]
+        base = self.offset(month_start)
+        days = {}
+        for day in range(1, month_end.day + 1):
+            i = base + day - 1
+            cell = {
+                'status': 'Available',
+                'is_start': False,
+                'is_end': False,
+                'tenant_name': "",
+                'day': (month_start + timedelta(days=day - 1)).strftime('%Y-%m-%d'),
+                'notes': "",
+            }
+            if 0 <= i < self.num_days and owner[i] >= 0:
+                cell.update(self._booking_payload(owner[i], payload_cache))
+                cell['is_start'] = bool(edges[i] & START)
+                cell['is_end'] = bool(edges[i] & END)
+            days[day] = cell
+        return days
+
+
+def current_parking_rooms(parking_ids, today):
+    """Apartment number of the first active 'Booked' booking per parking, in one query."""
+    from mysite.models import ParkingBooking
+
+    rooms = {}
+    active = ParkingBooking.objects.filter(
+        parking_id__in=parking_ids,
+        end_date__gt=today,
+        status='Booked',
+    ).select_related('apartment').order_by('id')
+    for p_booking in active:
+        if p_booking.parking_id not in rooms:
+            rooms[p_booking.parking_id] = p_booking.apartment.apartment_n if p_booking.apartment else None
+    return rooms
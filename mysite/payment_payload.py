@@ -0,0 +1,174 @@
+"""
+Compact columnar JSON payload for payment lists (payment sync v2).
+
+Payments are read with a single ``.values()`` query that pre-joins the names
+the page shows (payment type, method, bank, apartment, booking tenant and
+dates), instead of ``serializers.serialize`` plus a second walk over model
+instances. The payload stores one array per field and puts repeated names in
+lookup dictionaries keyed by id:
+
+    {
+        "format": "columns",
+        "count": 2,
+        "columns": {"id": [1, 2], "amount": ["10.00", "5.00"], "payment_type": [3, 3], ...},
+        "lookups": {
+            "payment_types": {"3": ["Rent", "In"]},
+            "payment_methods": {"4": "Zelle"},     # payment methods and banks
+            "apartments": {"7": "Ocean 1"},
+            "bookings": {"9": ["Tenant Name", "3 March - 10 March", 7]}
+        }
+    }
+
+``expandDbPayments`` in templates/payment_sync/sync_v2.html and
+``PaymentColumns.rows()`` turn it back into the row dicts ``get_json_list``
+used to produce (same keys and value formats).
+
+Usage:
+    from mysite.payment_payload import PaymentColumns
+
+    columns = PaymentColumns(window_qs, merged_qs)     # rows de-duplicated by id
+    JsonResponse({'db_payments': columns.to_payload()})
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+PAYMENT_FIELDS = (
+    'id', 'invoice_url', 'payment_date', 'amount', 'payment_type', 'payment_status', 'payment_method',
+    'bank', 'notes', 'tenant_notes', 'keywords', 'merged_payment_key', 'booking', 'apartment',
+    'source', 'source_id', 'created_by', 'last_updated_by', 'created_at', 'updated_at',
+)
+
+JOINED_FIELDS = (
+    'payment_type__name', 'payment_type__type', 'payment_method__name', 'bank__name', 'apartment__name',
+    'booking__tenant__full_name', 'booking__start_date', 'booking__end_date',
+    'booking__apartment_id', 'booking__apartment__name',
+)
+
+
+def _booking_display(start_date, end_date):
+    """Same text as payment_sync_v2._format_booking_display: '3 March - 10 March'."""
+    if not start_date or not end_date:
+        return None
+    return f"{start_date.day} {start_date.strftime('%B')} - {end_date.day} {end_date.strftime('%B')}"
+
+
+class PaymentColumns:
+    """Columnar view of one or more Payment querysets (first occurrence of an id wins)."""
+
+    def __init__(self, *querysets):
+        self.columns = {name: [] for name in PAYMENT_FIELDS}
+        self.payment_types = {}
+        self.payment_methods = {}
+        self.apartments = {}
+        self.bookings = {}
+        seen = set()
+        for queryset in querysets:
+            for row in queryset.values(*PAYMENT_FIELDS, *JOINED_FIELDS):
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                self._add_row(row)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def _add_row(self, row):
+        for name in PAYMENT_FIELDS:
+            self.columns[name].append(row[name])
+        if row['payment_type'] is not None:
+            self.payment_types[row['payment_type']] = [row['payment_type__name'], row['payment_type__type']]
+        if row['payment_method'] is not None:
+            self.payment_methods[row['payment_method']] = row['payment_method__name']
+        if row['bank'] is not None:
+            self.payment_methods[row['bank']] = row['bank__name']
+        if row['apartment'] is not None:
+            self.apartments[row['apartment']] = row['apartment__name']
+        if row['booking'] is not None:
+            booking_apartment_id = row['booking__apartment_id']
+            if booking_apartment_id is not None:
+                self.apartments[booking_apartment_id] = row['booking__apartment__name']
+            self.bookings[row['booking']] = [
+                row['booking__tenant__full_name'] or '',
+                _booking_display(row['booking__start_date'], row['booking__end_date']),
+                booking_apartment_id,
+            ]
+
+    def column(self, name):
+        return self.columns[name]
+
+    def set_column(self, name, values):
+        values = list(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column {name!r} has {len(values)} values for {len(self)} payments")
+        self.columns[name] = values
+
+    def to_payload(self):
+        return {
+            'format': 'columns',
+            'count': len(self),
+            'columns': self.columns,
+            'lookups': {
+                'payment_types': self.payment_types,
+                'payment_methods': self.payment_methods,
+                'apartments': self.apartments,
+                'bookings': self.bookings,
+            },
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_payload(), cls=DjangoJSONEncoder)
+
+    def rows(self):
+        """Row dicts in the ``get_json_list`` format (JSON-ready values)."""
+        payload = json.loads(self.to_json())
+        return expand_payment_payload(payload)
+
+
+def expand_payment_payload(payload):
+    """Python twin of ``expandDbPayments`` in sync_v2.html (payload must be JSON-decoded)."""
+    columns = payload['columns']
+    lookups = payload['lookups']
+    payment_types = lookups['payment_types']
+    payment_methods = lookups['payment_methods']
+    apartments = lookups['apartments']
+    bookings = lookups['bookings']
+    names = list(columns)
+    rows = []
+    for i in range(payload['count']):
+        row = {name: columns[name][i] for name in names}
+        payment_type = payment_types.get(str(row['payment_type'])) if row['payment_type'] is not None else None
+        booking = bookings.get(str(row['booking'])) if row['booking'] is not None else None
+        row['tenant_name'] = booking[0] if booking else ''
+        row['booking_display'] = booking[1] if booking else None
+        if row['apartment'] is not None:
+            row['apartment_name'] = apartments.get(str(row['apartment']))
+        elif booking and booking[2] is not None:
+            row['apartment_name'] = apartments.get(str(booking[2]))
+        else:
+            row['apartment_name'] = ''
+        row['bank_name'] = payment_methods.get(str(row['bank'])) if row['bank'] is not None else None
+        row['payment_type_name'] = f"{payment_type[0]} ({payment_type[1]})" if payment_type else None
+        row['payment_type_obj'] = (
+            {'id': row['payment_type'], 'name': payment_type[0], 'type': payment_type[1]} if payment_type else None
+        )
+        row['payment_method_name'] = (
+            payment_methods.get(str(row['payment_method'])) if row['payment_method'] is not None else None
+        )
+        rows.append(row)
+    return rows
+
+
+def reference_payload(ref):
+    """Payment methods, apartments and payment types the sync page needs, from a ReferenceData snapshot."""
+    return {
+        'version': ref.version,
+        'payment_methods': [{'id': pm.id, 'name': pm.name, 'type': pm.type} for pm in ref.payment_methods],
+        'apartments': [{'id': apt.id, 'name': apt.name} for apt in ref.apartments],
+        'payment_types': [{'id': pt.id, 'name': pt.name, 'type': pt.type} for pt in ref.payment_types],
+    }
+
+
+def reference_etag(ref):
+    version, updated_at = ref.stamp
+    return f"reference-{version}-{updated_at.timestamp() if updated_at else 0}"
@@ -0,0 +1,134 @@
+"""
+Recurring payment schedules for Booking.create_payments and
+Payment.save(number_of_months=N).
+
+A ``PaymentSchedule`` collects every payment a booking form (or the payment
+form) asks for in memory: N monthly payments per line, plus the Damage
+Deposit return on the booking's end date. ``write()`` then inserts, in one
+transaction,
+
+- all payments with one bulk insert,
+- their Payment notifications (none for mortage payments, as in
+  Payment.save) and the deposit return reminders with a second one,
+- the matching 'create' AuditLog rows in bulk (see mysite/audit_bulk.py),
+
+instead of a Payment.save() per month with its own notification lookup,
+notification insert and audit rows. Payment types come from the reference
+data cache (mysite/reference_data.py).
+
+Usage:
+    from mysite.payment_schedule import PaymentSchedule
+
+    schedule = PaymentSchedule(booking=booking)
+    schedule.add(payment_type, amount, '2026-03-01', notes='Rent', number_of_months=12)
+    payments = schedule.write()
+"""
+from dateutil.relativedelta import relativedelta
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+BATCH_SIZE = 500
+
+# Fields copied from a template payment to every month (as Payment.create_payments always did)
+RECURRING_FIELDS = ('payment_type', 'amount', 'booking', 'apartment', 'payment_status', 'notes', 'bank', 'payment_method')
+
+
+def payment_type_by_id(payment_type_id):
+    """PaymenType from the reference data cache; raises PaymenType.DoesNotExist like objects.get(pk=...)."""
+    from mysite.models import PaymenType
+    from mysite.reference_data import get_reference_data
+
+    try:
+        payment_type = get_reference_data().payment_type(int(payment_type_id))
+    except (TypeError, ValueError):
+        payment_type = None
+    if payment_type is None:
+        raise PaymenType.DoesNotExist(f"PaymenType matching id {payment_type_id!r} does not exist.")
+    return payment_type
+
+
+def _deposit_return_type():
+    from mysite.reference_data import get_reference_data
+
+    payment_type = get_reference_data().payment_type_by_name("Damage Deposit", type="Out")
+    if payment_type is None:
+        raise Exception("Damage Deposit Return type not found")
+    return payment_type
+
+
+class PaymentSchedule:
+    """Payments and notifications to create for one booking (or none), written together by ``write()``."""
+
+    def __init__(self, booking=None):
+        self.booking = booking
+        self.payments = []
+        self.reminders = []
+
+    def add_recurring(self, template, number_of_months):
+        """One copy of ``template`` per month starting at its payment_date (at least one)."""
+        from mysite.models import Payment, convert_date_format
+
+        if template.amount == 0:
+            raise ValidationError("Payment amount cannot be 0. Please enter a valid payment amount.")
+        first_date = convert_date_format(template.payment_date)
+        months = []
+        for i in range(max(number_of_months or 0, 1)):
+            payment = Payment(**{name: getattr(template, name) for name in RECURRING_FIELDS})
+            payment.payment_date = first_date + relativedelta(months=i)
+            if payment.booking_id is not None:
+                payment.apartment = None
+            self.payments.append(payment)
+            months.append(payment)
+        return months
+
+    def add(self, payment_type, amount, payment_date, notes=None, number_of_months=None):
+        """
+        A booking form payment line: ``number_of_months`` monthly payments,
+        and for a Damage Deposit its return on the booking's end date plus a
+        reminder on the deposit date.
+        """
+        from mysite.models import Notification, Payment
+
+        template = Payment(payment_type=payment_type, amount=amount, booking=self.booking,
+                           notes=notes, payment_date=payment_date)
+        months = self.add_recurring(template, number_of_months)
+
+        if payment_type.name == "Damage Deposit":
+            deposit_return = Payment(payment_type=_deposit_return_type(), amount=amount, booking=self.booking,
+                                     notes="Damage Deposit Return", payment_date=self.booking.end_date)
+            self.add_recurring(deposit_return, 1)
+            self.reminders.append(Notification(date=months[0].payment_date, message="Payment",
+                                               payment=self.payments[-1]))
+        return months
+
+    def _notifications(self):
+        from mysite.models import Notification
+
+        notifications = []
+        for payment in self.payments:
+            if 'mortage' in payment.payment_type.name.lower():
+                continue
+            notifications.append(Notification(date=payment.payment_date, message='Payment', payment=payment,
+                                              send_in_telegram=True))
+        return notifications + self.reminders
+
+    def write(self):
+        """Insert the payments, their notifications and audit rows; returns the saved payments."""
+        from mysite.audit_bulk import audit_bulk_create
+        from mysite.models import Notification, Payment
+        from mysite.request_context import apply_user_tracking
+
+        if not self.payments:
+            return []
+        with transaction.atomic():
+            for payment in self.payments:
+                apply_user_tracking(payment)
+            audit_bulk_create(Payment, self.payments, batch_size=BATCH_SIZE)
+
+            notifications = self._notifications()
+            for notification in notifications:
+                # Notification.save takes the apartment from the payment (None for booking payments)
+                notification.apartment = notification.payment.apartment
+                apply_user_tracking(notification)
+            audit_bulk_create(Notification, notifications, batch_size=BATCH_SIZE)
+        return self.payments
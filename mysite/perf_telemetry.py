@@ -0,0 +1,375 @@
+"""
+Endpoint latency histograms and on-demand request profiling.
+
+PerformanceMiddleware (mysite/performance_middleware.py) times every request
+and adds it to the in-process ``latency_aggregator`` keyed by (URL name,
+method, hour). Latencies are counted in fixed LATENCY_BUCKETS_MS buckets, so
+histograms from several workers and several flushes add up exactly and
+p50/p95/p99 can be read from any merged set of rows. The aggregator is
+flushed to EndpointLatency rows every FLUSH_SECONDS from a background thread
+(and at process exit).
+
+Admins can profile a single request with cProfile by sending the
+``X-Profile: 1`` header or adding ``?_profile=1``; PERF_PROFILE_SAMPLE
+profiles a random fraction of all requests. The pstats dump is written to
+PROFILE_DIR and listed with its top functions on /performance/.
+
+Environment:
+    PERF_TELEMETRY_ENABLED   "0" disables timing and profiling (default on)
+    PERF_FLUSH_SECONDS       seconds between flushes (default 60)
+    PERF_PROFILE_SAMPLE      fraction of requests profiled automatically (default 0)
+    PERF_PROFILE_KEEP        profiles kept before the oldest are deleted (default 100)
+"""
+import atexit
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+ENABLED = (os.getenv('PERF_TELEMETRY_ENABLED') or '1').lower() not in ('0', 'false', 'no', 'off')
+FLUSH_SECONDS = _env_int('PERF_FLUSH_SECONDS', 60)
+PROFILE_SAMPLE_RATE = _env_float('PERF_PROFILE_SAMPLE', 0.0)
+PROFILE_KEEP = _env_int('PERF_PROFILE_KEEP', 100)
+PROFILE_DIR = os.path.join(settings.BASE_DIR, 'logs', 'profiles')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_SUMMARY_LINES = 40
+
+# Bucket upper bounds in milliseconds; one extra overflow bucket follows the last bound
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+def bucket_index(ms):
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, ms)
+
+
+def empty_buckets():
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def merge_buckets(target, source):
+    """Add ``source`` counts into ``target`` in place (lengths may differ if the bounds ever grow)."""
+    if len(target) < len(source):
+        target.extend([0] * (len(source) - len(target)))
+    for i, n in enumerate(source):
+        target[i] += n
+    return target
+
+
+def percentile(buckets, q, max_ms=None):
+    """
+    Estimated latency at quantile ``q`` (0..1), interpolated inside the
+    bucket that holds it. The overflow bucket is capped at ``max_ms``.
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(buckets):
+        if n and seen + n >= rank:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            if i < len(LATENCY_BUCKETS_MS):
+                upper = LATENCY_BUCKETS_MS[i]
+            else:
+                upper = max(max_ms or lower, lower)
+            value = lower + (upper - lower) * (rank - seen) / n
+            return round(min(value, max_ms) if max_ms else value, 1)
+        seen += n
+    return float(max_ms or LATENCY_BUCKETS_MS[-1])
+
+
+def period_start(now=None):
+    from django.utils import timezone
+
+    now = now or timezone.now()
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+class LatencyAggregator:
+    """Thread-safe in-process histograms keyed by (view_name, method, hour)."""
+
+    def __init__(self, flush_seconds=FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_seconds
+        self._thread = None
+
+    def record(self, view_name, method, ms, error=False, now=None):
+        key = (view_name, method, period_start(now))
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = {'count': 0, 'error_count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                           'buckets': empty_buckets()}
+            stat['count'] += 1
+            stat['error_count'] += int(error)
+            stat['total_ms'] += ms
+            stat['max_ms'] = max(stat['max_ms'], ms)
+            stat['buckets'][bucket_index(ms)] += 1
+
+    def pending(self):
+        with self._lock:
+            return sum(stat['count'] for stat in self._stats.values())
+
+    def flush_if_due(self):
+        """Start a background flush when FLUSH_SECONDS have passed since the last one."""
+        if time.monotonic() < self._next_flush:
+            return None
+        with self._lock:
+            if time.monotonic() < self._next_flush or (self._thread is not None and self._thread.is_alive()):
+                return None
+            self._next_flush = time.monotonic() + self.flush_seconds
+            self._thread = threading.Thread(target=self._background_flush, name='perf-telemetry-flush', daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def _background_flush(self):
+        from django.db import connection
+
+        try:
+            self.flush()
+        except Exception as e:
+            from mysite.unified_logger import log_warning
+
+            log_warning(f"Latency telemetry flush failed: {e}", category='system')
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Merge pending histograms into EndpointLatency rows; returns the number of rows written."""
+        from django.db import IntegrityError, transaction
+
+        from mysite.models import EndpointLatency
+
+        with self._flush_lock:
+            with self._lock:
+                stats, self._stats = self._stats, {}
+            written = 0
+            try:
+                for (view_name, method, start), stat in list(stats.items()):
+                    for attempt in range(2):
+                        try:
+                            with transaction.atomic():
+                                row = (EndpointLatency.objects.select_for_update()
+                                       .filter(view_name=view_name, method=method, period_start=start).first())
+                                if row is None:
+                                    row = EndpointLatency(view_name=view_name, method=method, period_start=start,
+                                                          buckets=empty_buckets())
+                                row.count += stat['count']
+                                row.error_count += stat['error_count']
+                                row.total_ms += stat['total_ms']
+                                row.max_ms = max(row.max_ms, stat['max_ms'])
+                                row.buckets = merge_buckets(list(row.buckets or []), stat['buckets'])
+                                row.save()
+                            break
+                        except IntegrityError:
+                            # Another worker created the row first; merge into it
+                            if attempt:
+                                raise
+                    del stats[(view_name, method, start)]
+                    written += 1
+            except Exception:
+                # Put back what was not written so the next flush retries it
+                self._restore(stats)
+                raise
+            return written
+
+    def _restore(self, stats):
+        with self._lock:
+            for key, stat in stats.items():
+                current = self._stats.get(key)
+                if current is None:
+                    self._stats[key] = stat
+                    continue
+                for field in ('count', 'error_count', 'total_ms'):
+                    current[field] += stat[field]
+                current['max_ms'] = max(current['max_ms'], stat['max_ms'])
+                merge_buckets(current['buckets'], stat['buckets'])
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+latency_aggregator = LatencyAggregator()
+
+
+@atexit.register
+def _flush_at_exit():
+    if latency_aggregator.pending():
+        try:
+            latency_aggregator.flush()
+        except Exception:
+            pass
+
+
+def profile_trigger(request):
+    """'header' / 'query' for an admin's explicit request, 'sample' when sampled, else None."""
+    user = getattr(request, 'user', None)
+    is_admin = bool(user and getattr(user, 'is_authenticated', False) and getattr(user, 'role', None) == 'Admin')
+    if is_admin and request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return 'header'
+    if is_admin and request.GET.get(PROFILE_QUERY_FLAG) in ('1', 'true', 'yes'):
+        return 'query'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+class RequestProfiler:
+    """cProfile around one call; ``save`` writes the pstats dump and a RequestProfile row."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def run(self, func, *args):
+        return self.profiler.runcall(func, *args)
+
+    def summary(self, lines=PROFILE_SUMMARY_LINES):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(lines)
+        return out.getvalue()
+
+    def save(self, request, response, view_name, duration_ms, trigger, directory=None):
+        from django.utils import timezone
+
+        from mysite.models import RequestProfile
+
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in view_name)[:80]
+        file_path = os.path.join(directory, f"{timezone.now():%Y%m%d-%H%M%S-%f}-{safe_name}.prof")
+        self.profiler.dump_stats(file_path)
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            view_name=view_name,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            status_code=getattr(response, 'status_code', None),
+            duration_ms=round(duration_ms, 2),
+            trigger=trigger,
+            file_path=file_path,
+            summary=self.summary(),
+            requested_by=getattr(user, 'email', None) if user and user.is_authenticated else None,
+        )
+        prune_profiles()
+        return profile
+
+
+def prune_profiles(keep=None):
+    """Delete the oldest profiles (rows and dump files) beyond ``keep``."""
+    from mysite.models import RequestProfile
+
+    keep = PROFILE_KEEP if keep is None else keep
+    old = list(RequestProfile.objects.order_by('-created_at', '-id').values_list('id', 'file_path')[keep:])
+    for _, file_path in old:
+        if file_path and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+    if old:
+        RequestProfile.objects.filter(id__in=[pk for pk, _ in old]).delete()
+    return len(old)
+
+
+def endpoint_summary(since, until=None):
+    """
+    Per-endpoint totals from EndpointLatency rows in [since, until):
+    [{view_name, method, count, error_count, avg_ms, max_ms, p50, p95, p99}], slowest p95 first.
+    """
+    from mysite.models import EndpointLatency
+
+    rows = EndpointLatency.objects.filter(period_start__gte=since)
+    if until is not None:
+        rows = rows.filter(period_start__lt=until)
+    merged = {}
+    for row in rows.only('view_name', 'method', 'count', 'error_count', 'total_ms', 'max_ms', 'buckets'):
+        stat = merged.setdefault((row.view_name, row.method), {
+            'view_name': row.view_name, 'method': row.method, 'count': 0, 'error_count': 0,
+            'total_ms': 0.0, 'max_ms': 0.0, 'buckets': empty_buckets(),
+        })
+        stat['count'] += row.count
+        stat['error_count'] += row.error_count
+        stat['total_ms'] += row.total_ms
+        stat['max_ms'] = max(stat['max_ms'], row.max_ms)
+        merge_buckets(stat['buckets'], row.buckets or [])
+    result = []
+    for stat in merged.values():
+        buckets = stat.pop('buckets')
+        total_ms = stat.pop('total_ms')
+        stat['avg_ms'] = round(total_ms / stat['count'], 1) if stat['count'] else None
+        stat['max_ms'] = round(stat['max_ms'], 1)
+        for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            stat[name] = percentile(buckets, q, stat['max_ms'])
+        result.append(stat)
+    result.sort(key=lambda s: -(s['p95'] or 0))
+    return result
+
+
+def regressions(now=None, window=timedelta(hours=24), baseline=timedelta(days=7), min_count=20, ratio=1.5):
+    """Endpoints whose p95 over the last ``window`` is at least ``ratio`` x their p95 over the preceding ``baseline``."""
+    from django.utils import timezone
+
+    now = now or timezone.now()
+    recent_start = period_start(now - window)
+    current = {(s['view_name'], s['method']): s for s in endpoint_summary(recent_start)}
+    previous = {(s['view_name'], s['method']): s for s in endpoint_summary(recent_start - baseline, recent_start)}
+    found = []
+    for key, stat in current.items():
+        before = previous.get(key)
+        if not before or stat['count'] < min_count or before['count'] < min_count or not before['p95']:
+            continue
+        change = stat['p95'] / before['p95']
+        if change >= ratio:
+            found.append({**stat, 'baseline_p95': before['p95'], 'baseline_count': before['count'],
+                          'change': round(change, 2)})
+    found.sort(key=lambda s: -s['change'])
+    return found
+
+
+def daily_p95(view_name, method, days=14, now=None):
+    """[(date, p95, count)] for one endpoint over the last ``days`` days."""
+    from django.utils import timezone
+
+    from mysite.models import EndpointLatency
+
+    now = now or timezone.now()
+    start = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    per_day = {}
+    for row in EndpointLatency.objects.filter(view_name=view_name, method=method, period_start__gte=start):
+        day = timezone.localtime(row.period_start).date()
+        stat = per_day.setdefault(day, {'buckets': empty_buckets(), 'count': 0, 'max_ms': 0.0})
+        merge_buckets(stat['buckets'], row.buckets or [])
+        stat['count'] += row.count
+        stat['max_ms'] = max(stat['max_ms'], row.max_ms)
+    return [(day, percentile(stat['buckets'], 0.95, stat['max_ms']), stat['count'])
+            for day, stat in sorted(per_day.items())]
@@ -0,0 +1,53 @@
+"""
+Middleware that records per-endpoint latency and profiles requests on demand.
+
+See mysite/perf_telemetry.py for the histograms, the flush cycle, the
+profiling triggers and the PERF_* environment settings.
+"""
+import time
+
+from django.conf import settings
+
+from mysite import perf_telemetry
+
+
+class PerformanceMiddleware:
+    """
+    Times each request into the latency aggregator under its URL name.
+    When an admin asks for it (X-Profile header / ?_profile=1) or the request
+    is sampled, the request runs under cProfile and the dump is stored.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    def __call__(self, request):
+        if not perf_telemetry.ENABLED or request.path.startswith(self.static_prefix):
+            return self.get_response(request)
+
+        trigger = perf_telemetry.profile_trigger(request)
+        profiler = perf_telemetry.RequestProfiler() if trigger else None
+        start = time.perf_counter()
+        if profiler:
+            response = profiler.run(self.get_response, request)
+        else:
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else perf_telemetry.UNRESOLVED_VIEW
+        status = getattr(response, 'status_code', 500)
+        perf_telemetry.latency_aggregator.record(view_name, request.method, duration_ms, error=status >= 500)
+
+        if profiler:
+            try:
+                profile = profiler.save(request, response, view_name, duration_ms, trigger)
+                response['X-Profile-Id'] = str(profile.pk)
+            except Exception as e:
+                from mysite.unified_logger import log_warning
+
+                log_warning(f"Saving request profile for {view_name} failed: {e}", category='system')
+
+        perf_telemetry.latency_aggregator.flush_if_due()
+        return response
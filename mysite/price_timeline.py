@@ -0,0 +1,176 @@
+"""
+Apartment price timelines.
+
+Every apartment's ApartmentPrice history is kept in a process cache as sorted
+``effective_date`` / ``price`` / ``notes`` arrays, so "price on a date",
+"future prices" and "price summed over a date range" are answered with
+``bisect`` instead of one ApartmentPrice query per call.
+
+Invalidation:
+- ApartmentPrice post_save / post_delete signals drop the apartment's timeline
+  (see mysite/signals.py); call ``invalidate_price_timelines()`` after
+  QuerySet.update()/bulk_create() on ApartmentPrice, which bypass signals.
+- Other worker processes notice changes through a cheap stamp query
+  (row count + latest updated_at) that runs at most every
+  STAMP_CHECK_SECONDS.
+
+Usage:
+    from mysite.price_timeline import get_price_timeline, preload_price_timelines
+
+    preload_price_timelines(apartment_ids)          # one query for a page of apartments
+    timeline = get_price_timeline(apartment.id)
+    timeline.price_on(date.today())
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from decimal import Decimal
+
+STAMP_CHECK_SECONDS = 5
+
+PricePoint = namedtuple('PricePoint', ['effective_date', 'price', 'notes'])
+
+
+class PriceTimeline:
+    """Sorted price history of one apartment (ascending effective_date)."""
+
+    __slots__ = ('apartment_id', 'dates', 'prices', 'notes')
+
+    def __init__(self, apartment_id, points=()):
+        points = sorted(points, key=lambda p: p.effective_date)
+        self.apartment_id = apartment_id
+        self.dates = [p.effective_date for p in points]
+        self.prices = [p.price for p in points]
+        self.notes = [p.notes for p in points]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _point(self, index):
+        return PricePoint(self.dates[index], self.prices[index], self.notes[index])
+
+    def index_on(self, day):
+        """Index of the price effective on ``day`` or -1."""
+        return bisect_right(self.dates, day) - 1
+
+    def entry_on(self, day):
+        index = self.index_on(day)
+        return self._point(index) if index >= 0 else None
+
+    def price_on(self, day, surcharge=0):
+        """Monthly price effective on ``day`` (+ monthly ``surcharge``), None if no price yet."""
+        index = self.index_on(day)
+        if index < 0:
+            return None
+        price = self.prices[index]
+        return price + Decimal(str(surcharge)) if surcharge else price
+
+    def after(self, day):
+        """Price changes with effective_date > day, oldest first."""
+        return [self._point(i) for i in range(bisect_right(self.dates, day), len(self.dates))]
+
+    def since(self, day):
+        """Price changes with effective_date >= day, oldest first."""
+        return [self._point(i) for i in range(bisect_left(self.dates, day), len(self.dates))]
+
+    def segments(self, start_date, end_date, default_price=None):
+        """
+        Yield (segment_start, segment_end, monthly_price) covering
+        [start_date, end_date). Days before the first price use ``default_price``.
+        """
+        if start_date >= end_date:
+            return
+        index = self.index_on(start_date)
+        current = start_date
+        while current < end_date:
+            next_index = index + 1
+            next_change = self.dates[next_index] if next_index < len(self.dates) else end_date
+            segment_end = min(next_change, end_date)
+            price = self.prices[index] if index >= 0 else default_price
+            yield current, segment_end, price
+            current = segment_end
+            index = next_index
+
+    def daily_price_sum(self, start_date, end_date, default_price=0, surcharge_per_day=0):
+        """Sum of daily prices (monthly price / 30 + surcharge) over [start_date, end_date)."""
+        total = 0.0
+        for segment_start, segment_end, price in self.segments(start_date, end_date, default_price):
+            daily = float(price or 0) / 30.0 + float(surcharge_per_day or 0)
+            total += daily * (segment_end - segment_start).days
+        return total
+
+
+_timelines = {}
+_lock = threading.Lock()
+_stamp = None
+_stamp_checked_at = 0.0
+
+
+def _current_stamp():
+    from django.db.models import Count, Max
+    from mysite.models import ApartmentPrice
+
+    row = ApartmentPrice.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return row['count'], row['updated']
+
+
+def _check_stamp():
+    """Drop every timeline if another process changed ApartmentPrice rows."""
+    global _stamp, _stamp_checked_at
+    now = time.monotonic()
+    if now - _stamp_checked_at < STAMP_CHECK_SECONDS:
+        return
+    stamp = _current_stamp()
+    with _lock:
+        if stamp != _stamp:
+            _timelines.clear()
+            _stamp = stamp
+        _stamp_checked_at = now
+
+
+def preload_price_timelines(apartment_ids):
+    """
+    Load timelines for ``apartment_ids`` that are not cached yet with a single
+    query. Returns {apartment_id: PriceTimeline} for every requested id.
+    """
+    from django.db import connection
+    from mysite.models import ApartmentPrice
+
+    _check_stamp()
+    wanted = {apartment_id for apartment_id in apartment_ids if apartment_id is not None}
+    timelines = {apartment_id: _timelines[apartment_id] for apartment_id in wanted if apartment_id in _timelines}
+    missing = wanted - timelines.keys()
+    if not missing:
+        return timelines
+    points = {apartment_id: [] for apartment_id in missing}
+    rows = ApartmentPrice.objects.filter(apartment_id__in=missing).values_list(
+        'apartment_id', 'effective_date', 'price', 'notes'
+    )
+    for apartment_id, effective_date, price, notes in rows:
+        points[apartment_id].append(PricePoint(effective_date, price, notes))
+    loaded = {apartment_id: PriceTimeline(apartment_id, apartment_points) for apartment_id, apartment_points in points.items()}
+    # Rows read inside a transaction may still be rolled back, so only share committed data
+    if not connection.in_atomic_block:
+        with _lock:
+            _timelines.update(loaded)
+    timelines.update(loaded)
+    return timelines
+
+
+def get_price_timeline(apartment_id):
+    _check_stamp()
+    timeline = _timelines.get(apartment_id)
+    if timeline is None:
+        timeline = preload_price_timelines([apartment_id]).get(apartment_id) or PriceTimeline(apartment_id)
+    return timeline
+
+
+def invalidate_price_timelines(apartment_ids=None):
+    """Forget cached timelines for ``apartment_ids`` (all when None)."""
+    with _lock:
+        if apartment_ids is None:
+            _timelines.clear()
+        else:
+            for apartment_id in apartment_ids:
+                _timelines.pop(apartment_id, None)
@@ -0,0 +1,192 @@
+"""
+Set-based ApartmentPrice upserts for the pricing APIs.
+
+A batch of (apartment selector, effective_date, price) entries is applied in
+one transaction with a fixed number of queries, whatever the batch size: one
+query resolves the selectors, one locks the existing prices of those
+apartments and dates, then one bulk insert and one bulk update write the
+prices and their AuditLog rows (see mysite/audit_bulk.py). Price timelines
+are invalidated once per batch instead of once per saved row.
+
+The row locks only cover prices that already exist. When a concurrent batch
+inserts the same new (apartment, effective_date) first, the insert hits the
+unique constraint; the batch is then rolled back to its savepoint and applied
+again, this time updating the row the other batch created.
+
+Selectors:
+    {"apartment_id": 12, ...}         one apartment
+    {"number_of_rooms": 2, ...}       every apartment with that many bedrooms
+
+When several entries target the same apartment and date, the later one wins.
+
+Usage:
+    from mysite.price_upsert import parse_price_entries, upsert_apartment_prices
+
+    changes = upsert_apartment_prices(parse_price_entries(request.data.get('prices')))
+    for change in changes:
+        change.apartment, change.record, change.action   # 'created' / 'updated' / 'unchanged'
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Entries accepted per request and rows per bulk INSERT / UPDATE statement
+MAX_ENTRIES = 5000
+BATCH_SIZE = 500
+# Attempts when a concurrent batch creates one of our new prices first
+UPSERT_ATTEMPTS = 3
+
+UPDATE_FIELDS = ['price', 'notes', 'last_updated_by', 'updated_at']
+
+PriceChange = namedtuple('PriceChange', ['apartment', 'record', 'action'])
+
+
+def _as_price(value):
+    price = Decimal(str(value)).quantize(Decimal('0.01'))
+    if not price.is_finite():
+        raise ValueError(value)
+    return price
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_price_entries(raw_entries, default_notes=''):
+    """
+    Validate the ``prices`` list of a bulk pricing request. Each entry needs
+    exactly one of ``apartment_id`` / ``number_of_rooms`` plus ``effective_date``
+    (YYYY-MM-DD) and ``price``; ``notes`` defaults to ``default_notes``.
+    Raises ValueError with a message naming the first bad entry.
+    """
+    if not isinstance(raw_entries, list) or not raw_entries:
+        raise ValueError("prices must be a non-empty list")
+    if len(raw_entries) > MAX_ENTRIES:
+        raise ValueError(f"prices accepts at most {MAX_ENTRIES} entries per request")
+
+    entries = []
+    for index, raw in enumerate(raw_entries):
+        if not isinstance(raw, dict):
+            raise ValueError(f"prices[{index}] must be an object")
+        has_id, has_rooms = raw.get('apartment_id') is not None, raw.get('number_of_rooms') is not None
+        if has_id == has_rooms:
+            raise ValueError(f"prices[{index}] needs exactly one of apartment_id or number_of_rooms")
+        if raw.get('price') is None or raw.get('effective_date') is None:
+            raise ValueError(f"prices[{index}] needs price and effective_date")
+        try:
+            entry = {
+                'apartment_id': int(raw['apartment_id']) if has_id else None,
+                'number_of_rooms': int(raw['number_of_rooms']) if has_rooms else None,
+                'effective_date': _as_date(raw['effective_date']),
+                'price': _as_price(raw['price']),
+            }
+        except (ValueError, TypeError, InvalidOperation):
+            raise ValueError(
+                f"prices[{index}]: apartment_id/number_of_rooms must be integers, price must be a number, "
+                f"and effective_date must be in YYYY-MM-DD format"
+            )
+        notes = raw.get('notes')
+        entry['notes'] = default_notes if notes is None else str(notes)
+        entries.append(entry)
+    return entries
+
+
+def _resolve_apartments(entries):
+    """({id: apartment}, {rooms: [apartments]}) for the selectors of ``entries`` in one query."""
+    from mysite.models import Apartment
+
+    ids = {e['apartment_id'] for e in entries if e.get('apartment_id') is not None}
+    rooms = {e['number_of_rooms'] for e in entries if e.get('number_of_rooms') is not None}
+    apartments = Apartment.objects.filter(Q(id__in=ids) | Q(bedrooms__in=rooms)).order_by('id')
+    by_id, by_rooms = {}, defaultdict(list)
+    for apartment in apartments:
+        by_id[apartment.id] = apartment
+        if apartment.bedrooms in rooms:
+            by_rooms[apartment.bedrooms].append(apartment)
+
+    missing_ids, missing_rooms = sorted(ids - set(by_id)), sorted(rooms - set(by_rooms))
+    if missing_ids:
+        raise Apartment.DoesNotExist(f"Apartment with id {missing_ids[0]} not found")
+    if missing_rooms:
+        raise Apartment.DoesNotExist(f"No apartments found with {missing_rooms[0]} rooms")
+    return by_id, by_rooms
+
+
+def upsert_apartment_prices(entries):
+    """
+    Create or update the ApartmentPrice of every (apartment, effective_date)
+    selected by ``entries`` (see parse_price_entries) in one transaction.
+    Returns a PriceChange per target in entry order; rows whose price and
+    notes are already stored are left untouched ('unchanged').
+    Raises Apartment.DoesNotExist when a selector matches no apartment;
+    nothing is written then.
+    """
+    for attempt in range(UPSERT_ATTEMPTS):
+        try:
+            return _upsert(entries)
+        except IntegrityError:
+            # A concurrent batch inserted one of the new prices; its row is visible now
+            if attempt == UPSERT_ATTEMPTS - 1:
+                raise
+
+
+def _upsert(entries):
+    from mysite.audit_bulk import audit_bulk_create, audit_bulk_update, audit_snapshot
+    from mysite.models import ApartmentPrice
+    from mysite.price_timeline import invalidate_price_timelines
+    from mysite.request_context import apply_user_tracking
+
+    with transaction.atomic():
+        by_id, by_rooms = _resolve_apartments(entries)
+
+        targets = {}
+        for entry in entries:
+            selected = ([by_id[entry['apartment_id']]] if entry.get('apartment_id') is not None
+                        else by_rooms[entry['number_of_rooms']])
+            for apartment in selected:
+                targets.pop((apartment.id, entry['effective_date']), None)  # keep the later entry's position
+                targets[(apartment.id, entry['effective_date'])] = entry
+
+        existing = ApartmentPrice.objects.select_for_update().filter(
+            apartment_id__in={apartment_id for apartment_id, _ in targets},
+            effective_date__in={day for _, day in targets},
+        )
+        existing = {(record.apartment_id, record.effective_date): record for record in existing}
+
+        now = timezone.now()
+        created, updated, before, changes = [], [], {}, []
+        for (apartment_id, day), entry in targets.items():
+            apartment = by_id[apartment_id]
+            price, notes = _as_price(entry['price']), entry.get('notes') or ''
+            record = existing.get((apartment_id, day))
+            if record is None:
+                record = ApartmentPrice(apartment=apartment, price=price, effective_date=day, notes=notes)
+                apply_user_tracking(record)
+                created.append(record)
+                action = 'created'
+            elif record.price == price and (record.notes or '') == notes:
+                record.apartment = apartment
+                action = 'unchanged'
+            else:
+                record.apartment = apartment
+                before[record.pk] = audit_snapshot(record, UPDATE_FIELDS)
+                record.price, record.notes, record.updated_at = price, notes, now
+                apply_user_tracking(record)
+                updated.append(record)
+                action = 'updated'
+            changes.append(PriceChange(apartment, record, action))
+
+        audit_bulk_create(ApartmentPrice, created, batch_size=BATCH_SIZE)
+        audit_bulk_update(updated, UPDATE_FIELDS, before, batch_size=BATCH_SIZE)
+
+        apartment_ids = sorted({record.apartment_id for record in created + updated})
+        if apartment_ids:
+            invalidate_price_timelines(apartment_ids)
+            transaction.on_commit(lambda: invalidate_price_timelines(apartment_ids))
+    return changes
@@ -0,0 +1,193 @@
+"""
+Per-request SQL instrumentation: query count, DB time and N+1 detection.
+
+QueryInspectorMiddleware (mysite/query_inspector_middleware.py) wraps the
+DB cursor of every request with a QueryRecorder via
+``connection.execute_wrapper``. Each SQL statement is reduced to a
+fingerprint (literals, numbers and IN-lists replaced by ``?``) so that the
+same query shape with different parameters is counted together. A shape
+executed more than N_PLUS_ONE_THRESHOLD times in one request is flagged as a
+likely N+1 pattern. Per-request summaries are kept in a bounded in-process
+ring buffer shown on /database-activity/queries/.
+
+Environment:
+    QUERY_INSPECTOR_ENABLED      "0" disables the middleware (default on)
+    QUERY_INSPECTOR_N_PLUS_ONE   repeats of one shape before it is flagged (default 10)
+    QUERY_INSPECTOR_BUFFER       requests kept in the ring buffer (default 200)
+
+Test helper:
+    with assert_query_budget(max_queries=12, max_repeats=3):
+        client.get('/chat/')
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+ENABLED = (os.getenv('QUERY_INSPECTOR_ENABLED') or '1').lower() not in ('0', 'false', 'no', 'off')
+N_PLUS_ONE_THRESHOLD = _env_int('QUERY_INSPECTOR_N_PLUS_ONE', 10)
+BUFFER_SIZE = _env_int('QUERY_INSPECTOR_BUFFER', 200)
+# Repeated shapes kept per request in the buffer, and their SQL length
+MAX_SHAPES_PER_REQUEST = 5
+MAX_SQL_CHARS = 500
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """SQL shape without parameters: "... WHERE id = 5" and "... WHERE id = 7" give the same string."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` callable counting queries, DB time and query shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}  # fingerprint -> [count, seconds]
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            stat = self.shapes.setdefault(fingerprint(sql), [0, 0.0])
+            stat[0] += 1
+            stat[1] += elapsed
+
+    @property
+    def db_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def repeated(self, min_count=2):
+        """[{sql, count, db_ms}] for shapes executed at least ``min_count`` times, most repeated first."""
+        rows = [
+            {'sql': sql, 'count': count, 'db_ms': round(seconds * 1000, 2)}
+            for sql, (count, seconds) in self.shapes.items()
+            if count >= min_count
+        ]
+        rows.sort(key=lambda row: (-row['count'], -row['db_ms']))
+        return rows
+
+    def n_plus_one(self, threshold=None):
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return self.repeated(min_count=threshold + 1)
+
+    @property
+    def max_repeats(self):
+        return max((count for count, _ in self.shapes.values()), default=0)
+
+
+_recent = deque(maxlen=BUFFER_SIZE)
+_recent_lock = threading.Lock()
+
+
+def record(entry):
+    with _recent_lock:
+        _recent.append(entry)
+
+
+def recent_requests():
+    """Buffered request summaries, newest first."""
+    with _recent_lock:
+        return list(reversed(_recent))
+
+
+def clear():
+    with _recent_lock:
+        _recent.clear()
+
+
+def summarize_request(request, response, recorder, total_seconds, view_name=None):
+    """Ring buffer entry for one request."""
+    from django.utils import timezone
+
+    suspects = recorder.n_plus_one()
+    repeated = suspects or recorder.repeated()
+    return {
+        'at': timezone.now(),
+        'method': request.method,
+        'path': request.path,
+        'view': view_name or '',
+        'status': getattr(response, 'status_code', None),
+        'queries': recorder.count,
+        'db_ms': recorder.db_ms,
+        'total_ms': round(total_seconds * 1000, 2),
+        'distinct': len(recorder.shapes),
+        'max_repeats': recorder.max_repeats,
+        'n_plus_one': bool(suspects),
+        'repeated': [
+            {**row, 'sql': row['sql'][:MAX_SQL_CHARS]} for row in repeated[:MAX_SHAPES_PER_REQUEST]
+        ],
+    }
+
+
+def view_summary(entries):
+    """Per-view totals over buffered entries, worst N+1 offenders and query counts first."""
+    views = {}
+    for entry in entries:
+        name = entry['view'] or entry['path']
+        row = views.setdefault(name, {
+            'view': name, 'requests': 0, 'queries': 0, 'max_queries': 0,
+            'db_ms': 0.0, 'max_repeats': 0, 'n_plus_one': 0,
+        })
+        row['requests'] += 1
+        row['queries'] += entry['queries']
+        row['max_queries'] = max(row['max_queries'], entry['queries'])
+        row['db_ms'] += entry['db_ms']
+        row['max_repeats'] = max(row['max_repeats'], entry['max_repeats'])
+        row['n_plus_one'] += int(entry['n_plus_one'])
+    rows = list(views.values())
+    for row in rows:
+        row['avg_queries'] = round(row['queries'] / row['requests'], 1)
+        row['avg_db_ms'] = round(row['db_ms'] / row['requests'], 2)
+    rows.sort(key=lambda row: (-row['n_plus_one'], -row['max_queries']))
+    return rows
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_query_budget(max_queries=None, max_repeats=None, using='default'):
+    """
+    Fail when the block runs more than ``max_queries`` statements, or any
+    query shape more than ``max_repeats`` times. Yields the QueryRecorder.
+    """
+    from django.db import connections
+
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+    problems = []
+    if max_queries is not None and recorder.count > max_queries:
+        problems.append(f"{recorder.count} queries (budget {max_queries})")
+    if max_repeats is not None and recorder.max_repeats > max_repeats:
+        problems.append(f"a query shape ran {recorder.max_repeats} times (budget {max_repeats})")
+    if problems:
+        details = '\n'.join(f"  {row['count']}x {row['sql'][:200]}" for row in recorder.repeated()[:MAX_SHAPES_PER_REQUEST])
+        raise QueryBudgetExceeded('; '.join(problems) + (f"\nRepeated queries:\n{details}" if details else ''))
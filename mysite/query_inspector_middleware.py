@@ -0,0 +1,41 @@
+"""
+Middleware that records SQL query count, DB time and likely N+1 patterns per request.
+
+See mysite/query_inspector.py for the recorder, the ring buffer and the
+QUERY_INSPECTOR_* environment settings.
+"""
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from mysite import query_inspector
+
+
+class QueryInspectorMiddleware:
+    """
+    Wraps the DB cursor for the duration of each request and stores a
+    summary in the query inspector ring buffer. Static files are skipped.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    def __call__(self, request):
+        if not query_inspector.ENABLED or request.path.startswith(self.static_prefix):
+            return self.get_response(request)
+
+        recorder = query_inspector.QueryRecorder()
+        response = None
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+            return response
+        finally:
+            match = getattr(request, 'resolver_match', None)
+            query_inspector.record(query_inspector.summarize_request(
+                request, response, recorder, time.perf_counter() - start,
+                view_name=match.view_name if match else None,
+            ))
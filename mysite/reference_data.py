@@ -0,0 +1,217 @@
+"""
+Process-level cache of small reference tables: PaymenType, PaymentMethod,
+Apartment (with manager ids) and manager users.
+
+The tables are loaded once per process into an immutable ``ReferenceData``
+snapshot with lookups by id, name and keyword. Saves and deletes of these
+models bump the ``reference_data`` row in ReferenceDataVersion (see
+mysite/signals.py), and every process compares its snapshot stamp with
+the database at most every VERSION_CHECK_SECONDS, so changes propagate to
+all workers without per-request queries.
+
+Call ``bump_reference_data_version()`` after QuerySet.update()/bulk_create()
+on these models, which bypass signals.
+
+Usage:
+    from mysite.reference_data import get_reference_data
+
+    ref = get_reference_data()
+    ref.payment_type(26)
+    ref.payment_method_by_name('Zelle', type='Payment Method')
+    ref.apartments_with_keyword('ocean')
+"""
+import threading
+import time
+
+VERSION_NAME = 'reference_data'
+VERSION_CHECK_SECONDS = 2
+
+
+def _split_keywords(value):
+    return [k.strip().lower() for k in (value or '').split(',') if k.strip()]
+
+
+class ReferenceData:
+    """
+    Immutable snapshot of the reference tables at ``version``.
+
+    ``payment_types``, ``payment_methods`` and ``apartments`` are in primary key
+    order, like the unordered querysets they replace, so "first match" logic
+    keeps its tie-breaking. ``payment_types_by_name_order`` and
+    ``apartments_by_name_order`` keep the database collation order for dropdowns.
+    """
+
+    def __init__(self, stamp, payment_types, payment_methods, apartments, managers):
+        self.stamp = stamp
+        self.version = stamp[0]
+        self.payment_types_by_name_order = payment_types
+        self.apartments_by_name_order = apartments
+        self.payment_types = sorted(payment_types, key=lambda pt: pt.id)
+        self.payment_methods = sorted(payment_methods, key=lambda pm: pm.id)
+        self.apartments = sorted(apartments, key=lambda apt: apt.id)
+        self.managers = managers
+
+        self.payment_types_by_id = {pt.id: pt for pt in self.payment_types}
+        self.payment_methods_by_id = {pm.id: pm for pm in self.payment_methods}
+        self.apartments_by_id = {apt.id: apt for apt in self.apartments}
+        self.managers_by_id = {user.id: user for user in self.managers}
+
+        self._payment_types_by_name = self._index_by_name(self.payment_types)
+        self._payment_methods_by_name = self._index_by_name(self.payment_methods)
+        self._apartments_by_name = self._index_by_name(self.apartments)
+        self._payment_types_by_keyword = self._index_by_keyword(self.payment_types)
+        self._payment_methods_by_keyword = self._index_by_keyword(self.payment_methods)
+        self._apartments_by_keyword = self._index_by_keyword(self.apartments)
+
+        self.apartment_manager_ids = {
+            apt.id: [manager.id for manager in apt.managers.all()] for apt in self.apartments
+        }
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, stamp):
+        from mysite.models import Apartment, PaymenType, PaymentMethod, User
+
+        return cls(
+            stamp,
+            payment_types=list(PaymenType.objects.order_by('name', 'id')),
+            payment_methods=list(PaymentMethod.objects.order_by('id')),
+            apartments=list(Apartment.objects.prefetch_related('managers').order_by('name', 'id')),
+            managers=list(User.objects.filter(role='Manager').order_by('full_name')),
+        )
+
+    @staticmethod
+    def _index_by_name(objects):
+        index = {}
+        for obj in objects:
+            index.setdefault((obj.name or '').strip().lower(), []).append(obj)
+        return index
+
+    @staticmethod
+    def _index_by_keyword(objects):
+        index = {}
+        for obj in objects:
+            for keyword in _split_keywords(getattr(obj, 'keywords', None)):
+                index.setdefault(keyword, []).append(obj)
+        return index
+
+    # Lookups by id
+
+    def payment_type(self, payment_type_id):
+        return self.payment_types_by_id.get(payment_type_id)
+
+    def payment_method(self, payment_method_id):
+        return self.payment_methods_by_id.get(payment_method_id)
+
+    def apartment(self, apartment_id):
+        return self.apartments_by_id.get(apartment_id)
+
+    # Lookups by name (case-insensitive, first match by primary key)
+
+    def payment_type_by_name(self, name, type=None):
+        for pt in self._payment_types_by_name.get((name or '').strip().lower(), []):
+            if type is None or pt.type == type:
+                return pt
+        return None
+
+    def payment_method_by_name(self, name, type=None):
+        for pm in self._payment_methods_by_name.get((name or '').strip().lower(), []):
+            if type is None or pm.type == type:
+                return pm
+        return None
+
+    def apartment_by_name(self, name):
+        matches = self._apartments_by_name.get((name or '').strip().lower())
+        return matches[0] if matches else None
+
+    # Lookups by keyword (entries of the comma separated ``keywords`` field)
+
+    def payment_types_with_keyword(self, keyword):
+        return list(self._payment_types_by_keyword.get((keyword or '').strip().lower(), []))
+
+    def payment_methods_with_keyword(self, keyword):
+        return list(self._payment_methods_by_keyword.get((keyword or '').strip().lower(), []))
+
+    def apartments_with_keyword(self, keyword):
+        return list(self._apartments_by_keyword.get((keyword or '').strip().lower(), []))
+
+    # Filtered views
+
+    def payment_methods_of_type(self, type):
+        return [pm for pm in self.payment_methods if pm.type == type]
+
+    def apartments_for_manager(self, user_id):
+        """Apartments managed by ``user_id`` in name order."""
+        return [apt for apt in self.apartments_by_name_order if user_id in self.apartment_manager_ids[apt.id]]
+
+    def memo(self, key, factory):
+        """Compute a derived value (e.g. serialized JSON) once per snapshot."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = factory()
+            return self._memo[key]
+
+
+_snapshot = None
+_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def current_stamp():
+    """
+    (version, updated_at) of the reference data row. updated_at is part of the
+    stamp so a snapshot loaded inside a rolled back transaction never matches a
+    later commit that reaches the same version number.
+    """
+    from mysite.models import ReferenceDataVersion
+
+    row = ReferenceDataVersion.objects.filter(name=VERSION_NAME).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def current_version():
+    return current_stamp()[0]
+
+
+def get_reference_data():
+    """Return the current snapshot, reloading it when the database version changed."""
+    global _snapshot, _checked_at
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None and now - _checked_at < VERSION_CHECK_SECONDS:
+        return snapshot
+    stamp = current_stamp()
+    if snapshot is None or snapshot.stamp != stamp:
+        with _lock:
+            if _snapshot is None or _snapshot.stamp != stamp:
+                _snapshot = ReferenceData.load(stamp)
+            snapshot = _snapshot
+    _checked_at = now
+    return snapshot
+
+
+def is_cached_manager(user_id):
+    """True if ``user_id`` is a manager in this process's snapshot (no query)."""
+    snapshot = _snapshot
+    return snapshot is not None and user_id in snapshot.managers_by_id
+
+
+def bump_reference_data_version():
+    """Invalidate every process's reference data snapshot."""
+    global _checked_at
+    from django.db.models import F
+    from django.utils import timezone
+    from mysite.models import ReferenceDataVersion
+
+    updated = ReferenceDataVersion.objects.filter(name=VERSION_NAME).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        ReferenceDataVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+    # Re-check on the next access in this process
+    _checked_at = 0.0
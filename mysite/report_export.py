@@ -0,0 +1,642 @@
+"""
+Streaming spreadsheet export engine for the report views.
+
+A report is a sequence of ``ExportSheet`` objects whose ``rows`` are lazy
+iterators (usually fed by ``QuerySet.iterator(chunk_size=...)``, which uses
+server-side cursors on PostgreSQL). The engine pulls rows in chunks and hands
+each chunk to a sink:
+
+- ``CsvExportSink`` / ``XlsxExportSink`` write a local file with constant memory
+- ``SheetsExportSink`` writes each chunk with one ``values.batchUpdate`` call and
+  sends all row formatting as coalesced ranges in batched ``batchUpdate`` calls
+
+Exports run in a background thread tracked by ``ReportExportJob`` so the
+request only creates the job and the status page polls its progress. Every
+progress update is also a heartbeat: a job whose heartbeat is older than
+STALE_JOB_SECONDS died with its worker (restart, deploy) and is marked failed
+by ``fail_stale_jobs()`` (status page and the fail_stale_report_exports cron).
+
+Progress counts data rows only: the rows after a sheet's STYLE_HEADER row, the
+same rows a source counts in ``ExportReport.total_rows``. Title, summary and
+header rows are written but not counted.
+
+Report sources are registered in ``REPORT_SOURCES`` and live next to the view
+that renders the same report on screen.
+
+Usage:
+    from mysite.report_export import start_export_job
+
+    job = start_export_job('payments', 'xlsx', params, user=request.user)
+"""
+import csv
+import os
+import re
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from mysite.unified_logger import log_error, logger
+
+CHUNK_SIZE = 500
+STALE_JOB_SECONDS = 15 * 60
+SHEETS_MAX_REQUESTS_PER_BATCH = 500
+EXPORT_DIR = os.path.join(settings.BASE_DIR, 'reports', 'exports')
+
+STYLE_HEADER = 'header'
+STYLE_HIGHLIGHT = 'highlight'
+
+REPORT_SOURCES = {
+    'payments': 'mysite.views.payments_report.export_payment_report',
+    'booking': 'mysite.views.booking_report.export_booking_report',
+    'apartment': 'mysite.views.apartments_report.export_apartment_report',
+}
+
+FORMATS = ('sheets', 'xlsx', 'csv')
+
+
+class StyledRow(list):
+    """A row of cell values carrying a style name (STYLE_HEADER / STYLE_HIGHLIGHT)."""
+
+    def __init__(self, values, style):
+        super().__init__(values)
+        self.style = style
+
+
+class ExportSheet:
+    def __init__(self, title, rows, columns=0):
+        self.title = title
+        self.rows = rows
+        self.columns = columns
+
+
+class ExportReport:
+    def __init__(self, title, sheets, total_rows=None):
+        self.title = title
+        self.sheets = sheets
+        self.total_rows = total_rows
+
+
+def cell_value(value):
+    """Normalize a cell value to str/int/float for every sink."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+class ExportSink:
+    """Base sink: start_sheet() is called before the rows of each sheet."""
+
+    def open(self, title):
+        pass
+
+    def start_sheet(self, sheet):
+        raise NotImplementedError
+
+    def write_chunk(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the export and return (result_url, file_path)."""
+        raise NotImplementedError
+
+
+def _safe_filename(title):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', title).strip('_')[:120] or 'report'
+
+
+class CsvExportSink(ExportSink):
+    """One CSV file; every sheet starts with a ``[Sheet title]`` marker row."""
+
+    def __init__(self, directory=EXPORT_DIR):
+        self.directory = directory
+        self.path = None
+        self._file = None
+        self._writer = None
+        self._sheets = 0
+
+    def open(self, title):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{_safe_filename(title)}_{time.time_ns()}.csv")
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+
+    def start_sheet(self, sheet):
+        if self._sheets:
+            self._writer.writerow([])
+        self._writer.writerow([f"[{sheet.title}]"])
+        self._sheets += 1
+
+    def write_chunk(self, rows):
+        self._writer.writerows([cell_value(v) for v in row] for row in rows)
+
+    def close(self):
+        self._file.close()
+        return None, self.path
+
+
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class XlsxExportSink(ExportSink):
+    """
+    Minimal XLSX writer on top of zipfile. Each worksheet is streamed into its
+    zip entry row by row (inline strings, no shared string table), so memory
+    does not grow with the number of rows.
+    """
+
+    STYLE_IDS = {None: 0, STYLE_HEADER: 1, STYLE_HIGHLIGHT: 2}
+
+    def __init__(self, directory=EXPORT_DIR):
+        self.directory = directory
+        self.path = None
+        self._zip = None
+        self._stream = None
+        self._sheet_names = []
+
+    def open(self, title):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{_safe_filename(title)}_{time.time_ns()}.xlsx")
+        self._zip = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _sheet_name(self, title):
+        name = re.sub(r'[\[\]:*?/\\]', ' ', title).strip()[:31] or 'Sheet'
+        base, n = name, 2
+        while name in self._sheet_names:
+            suffix = f" ({n})"
+            name = base[:31 - len(suffix)] + suffix
+            n += 1
+        return name
+
+    def _end_sheet(self):
+        if self._stream is not None:
+            self._stream.write(b'</sheetData></worksheet>')
+            self._stream.close()
+            self._stream = None
+
+    def start_sheet(self, sheet):
+        self._end_sheet()
+        self._sheet_names.append(self._sheet_name(sheet.title))
+        index = len(self._sheet_names)
+        self._stream = self._zip.open(f'xl/worksheets/sheet{index}.xml', 'w', force_zip64=True)
+        self._stream.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+
+    def _cell(self, value, style_id):
+        value = cell_value(value)
+        style = f' s="{style_id}"' if style_id else ''
+        if isinstance(value, (int, float)):
+            return f'<c{style}><v>{value}</v></c>'
+        if value == '' and not style_id:
+            return '<c/>'
+        text = escape(_XML_ILLEGAL.sub('', value))
+        return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def write_chunk(self, rows):
+        parts = []
+        for row in rows:
+            style_id = self.STYLE_IDS.get(getattr(row, 'style', None), 0)
+            parts.append('<row>')
+            parts.extend(self._cell(v, style_id) for v in row)
+            parts.append('</row>')
+        self._stream.write(''.join(parts).encode('utf-8'))
+
+    def close(self):
+        if not self._sheet_names:
+            self.start_sheet(ExportSheet('Report', []))
+        self._end_sheet()
+        sheets = ''.join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, name in enumerate(self._sheet_names, start=1)
+        )
+        rels = ''.join(
+            f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(self._sheet_names) + 1)
+        )
+        styles_rel_id = len(self._sheet_names) + 1
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(self._sheet_names) + 1)
+        )
+        self._zip.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{overrides}</Types>'
+        ))
+        self._zip.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        self._zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{sheets}</sheets></workbook>'
+        ))
+        self._zip.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{rels}<Relationship Id="rId{styles_rel_id}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        self._zip.writestr('xl/styles.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+            '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="4"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill>'
+            '<fill><patternFill patternType="solid"><fgColor rgb="FFD9D9D9"/><bgColor indexed="64"/></patternFill></fill>'
+            '<fill><patternFill patternType="solid"><fgColor rgb="FFFFCCCC"/><bgColor indexed="64"/></patternFill></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1"/>'
+            '<xf numFmtId="0" fontId="0" fillId="3" borderId="0" xfId="0" applyFill="1"/></cellXfs>'
+            '</styleSheet>'
+        ))
+        self._zip.close()
+        return None, self.path
+
+
+class SheetsExportSink(ExportSink):
+    """
+    Google Sheets sink. Values go out one ``values.batchUpdate`` per chunk;
+    header/highlight formatting is collected as row runs and sent at the end
+    as coalesced ``repeatCell`` ranges in batches of SHEETS_MAX_REQUESTS_PER_BATCH.
+    """
+
+    FORMATS = {
+        STYLE_HEADER: (
+            {'textFormat': {'bold': True}, 'backgroundColor': {'red': 0.85, 'green': 0.85, 'blue': 0.85}},
+            'userEnteredFormat(textFormat,backgroundColor)',
+        ),
+        STYLE_HIGHLIGHT: (
+            {'backgroundColor': {'red': 1.0, 'green': 0.8, 'blue': 0.8}},
+            'userEnteredFormat.backgroundColor',
+        ),
+    }
+
+    def __init__(self, sheets_service, drive_service=None, share=True):
+        self.sheets_service = sheets_service
+        self.drive_service = drive_service
+        self.share = share
+        self.spreadsheet_id = None
+        self._title = None
+        self._sheet = None
+        self._sheet_id = None
+        self._next_row = 1
+        self._format_runs = []
+        self._resize = []
+        self._sheet_titles = []
+
+    def open(self, title):
+        self._title = title
+
+    def start_sheet(self, sheet):
+        title = sheet.title
+        if title in self._sheet_titles:
+            title = f"{title} ({len(self._sheet_titles) + 1})"
+        self._sheet_titles.append(title)
+        if self.spreadsheet_id is None:
+            spreadsheet = self.sheets_service.create(body={
+                'properties': {'title': self._title},
+                'sheets': [{'properties': {'title': title}}],
+            }).execute()
+            self.spreadsheet_id = spreadsheet.get('spreadsheetId')
+            self._sheet_id = spreadsheet['sheets'][0]['properties']['sheetId']
+            logger.info(f"Spreadsheet created {self.spreadsheet_id}")
+        else:
+            reply = self.sheets_service.batchUpdate(spreadsheetId=self.spreadsheet_id, body={
+                'requests': [{'addSheet': {'properties': {'title': title}}}]
+            }).execute()
+            self._sheet_id = reply['replies'][0]['addSheet']['properties']['sheetId']
+        self._sheet = sheet
+        self._sheet_range_title = title.replace("'", "''")
+        self._next_row = 1
+        if sheet.columns:
+            self._resize.append((self._sheet_id, sheet.columns))
+
+    def _add_format_run(self, style, row_index, columns):
+        # Extend the previous run when rows with the same style are contiguous
+        if self._format_runs:
+            sheet_id, last_style, start, end, cols = self._format_runs[-1]
+            if sheet_id == self._sheet_id and last_style == style and end == row_index:
+                self._format_runs[-1] = (sheet_id, style, start, row_index + 1, max(cols, columns))
+                return
+        self._format_runs.append((self._sheet_id, style, row_index, row_index + 1, columns))
+
+    def write_chunk(self, rows):
+        values = []
+        for offset, row in enumerate(rows):
+            values.append([cell_value(v) for v in row])
+            style = getattr(row, 'style', None)
+            if style in self.FORMATS:
+                self._add_format_run(style, self._next_row - 1 + offset, self._sheet.columns or len(row))
+        self.sheets_service.values().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': f"'{self._sheet_range_title}'!A{self._next_row}", 'values': values}],
+            },
+        ).execute()
+        self._next_row += len(values)
+
+    def _formatting_requests(self):
+        for sheet_id, style, start, end, columns in self._format_runs:
+            fmt, fields = self.FORMATS[style]
+            yield {
+                'repeatCell': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': start,
+                        'endRowIndex': end,
+                        'startColumnIndex': 0,
+                        'endColumnIndex': columns,
+                    },
+                    'cell': {'userEnteredFormat': fmt},
+                    'fields': fields,
+                }
+            }
+        for sheet_id, columns in self._resize:
+            yield {
+                'autoResizeDimensions': {
+                    'dimensions': {'sheetId': sheet_id, 'dimension': 'COLUMNS', 'startIndex': 0, 'endIndex': columns}
+                }
+            }
+
+    def close(self):
+        if self.spreadsheet_id is None:
+            self.start_sheet(ExportSheet(self._title or 'Report', []))
+        for batch in chunked(self._formatting_requests(), SHEETS_MAX_REQUESTS_PER_BATCH):
+            self.sheets_service.batchUpdate(spreadsheetId=self.spreadsheet_id, body={'requests': batch}).execute()
+        if self.share and self.drive_service is not None:
+            from mysite.views.booking_report import share_document_with_user
+            share_document_with_user(self.drive_service, self.spreadsheet_id)
+        return f'https://docs.google.com/spreadsheets/d/{self.spreadsheet_id}/edit', None
+
+
+# ---------------------------------------------------------------------------
+# Offline Sheets service (throughput tests, benchmarks)
+# ---------------------------------------------------------------------------
+
+class _FakeRequest:
+    def __init__(self, service, method, result):
+        self._service = service
+        self._method = method
+        self._result = result
+
+    def execute(self):
+        self._service.calls[self._method] = self._service.calls.get(self._method, 0) + 1
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        return self._result
+
+
+class _FakeValues:
+    def __init__(self, service):
+        self._service = service
+
+    def _record(self, data):
+        for item in data:
+            rows = item.get('values', [])
+            self._service.rows_written += len(rows)
+            self._service.cells_written += sum(len(r) for r in rows)
+            if self._service.keep_values:
+                self._service.stored_values.setdefault(item['range'], []).extend(rows)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        self._record([{'range': range, 'values': body.get('values', [])}])
+        return _FakeRequest(self._service, 'values.update', {'updatedRange': range})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self._record(body.get('data', []))
+        return _FakeRequest(self._service, 'values.batchUpdate', {'spreadsheetId': spreadsheetId})
+
+
+class _FakeDrive:
+    def __init__(self, service):
+        self._service = service
+
+    def permissions(self):
+        return self
+
+    def create(self, fileId, body, fields=None):
+        return _FakeRequest(self._service, 'drive.permissions.create', {'id': 'fake-permission'})
+
+
+class FakeSheetsService:
+    """
+    In-memory stand-in for ``build('sheets', 'v4').spreadsheets()`` and the Drive
+    service used for sharing. Counts API calls and written cells and can add a
+    fixed per-call latency to model network round trips.
+    """
+
+    def __init__(self, latency=0.0, keep_values=False):
+        self.latency = latency
+        self.keep_values = keep_values
+        self.calls = {}
+        self.rows_written = 0
+        self.cells_written = 0
+        self.format_requests = 0
+        self.stored_values = {}
+        self._next_sheet_id = 0
+
+    def _new_sheet_id(self):
+        self._next_sheet_id += 1
+        return self._next_sheet_id
+
+    def create(self, body):
+        result = {
+            'spreadsheetId': 'fake-spreadsheet',
+            'sheets': [{'properties': {'sheetId': self._new_sheet_id()}} for _ in body.get('sheets', [{}])],
+        }
+        return _FakeRequest(self, 'create', result)
+
+    def batchUpdate(self, spreadsheetId, body):
+        replies = []
+        for request in body.get('requests', []):
+            if 'addSheet' in request:
+                replies.append({'addSheet': {'properties': {'sheetId': self._new_sheet_id()}}})
+            else:
+                self.format_requests += 1
+                replies.append({})
+        return _FakeRequest(self, 'batchUpdate', {'replies': replies})
+
+    def values(self):
+        return _FakeValues(self)
+
+    @property
+    def drive(self):
+        return _FakeDrive(self)
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+
+# ---------------------------------------------------------------------------
+# Engine and background jobs
+# ---------------------------------------------------------------------------
+
+def make_sink(export_format, sheets_service=None, drive_service=None):
+    if export_format == 'csv':
+        return CsvExportSink()
+    if export_format == 'xlsx':
+        return XlsxExportSink()
+    if sheets_service is None:
+        from mysite.views.booking_report import get_google_sheets_service
+        sheets_service, drive_service = get_google_sheets_service()
+    return SheetsExportSink(sheets_service, drive_service)
+
+
+def run_export(report, sink, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Stream every sheet of ``report`` into ``sink``.
+    ``progress(rows_written)`` is called after each chunk.
+    Returns (result_url, file_path, rows_written) where rows_written counts
+    data rows (rows after the sheet's header row).
+    """
+    rows_written = 0
+    sink.open(report.title)
+    for sheet in report.sheets:
+        sink.start_sheet(sheet)
+        in_data = False
+        for chunk in chunked(sheet.rows, chunk_size):
+            sink.write_chunk(chunk)
+            for row in chunk:
+                if in_data:
+                    rows_written += 1
+                elif getattr(row, 'style', None) == STYLE_HEADER:
+                    in_data = True
+            if progress:
+                progress(rows_written)
+    result_url, file_path = sink.close()
+    return result_url, file_path, rows_written
+
+
+def build_report(report_name, params):
+    if report_name not in REPORT_SOURCES:
+        raise ValueError(f"Unknown report: {report_name}")
+    return import_string(REPORT_SOURCES[report_name])(params or {})
+
+
+def _run_job(job_id, sheets_service=None, drive_service=None, in_thread=True):
+    from mysite.models import ReportExportJob
+
+    if in_thread:
+        close_old_connections()
+    try:
+        job = ReportExportJob.objects.get(pk=job_id)
+        ReportExportJob.objects.filter(pk=job_id).update(status='running', heartbeat_at=timezone.now())
+        report = build_report(job.report, job.params)
+        if report.total_rows is not None:
+            ReportExportJob.objects.filter(pk=job_id).update(total_rows=report.total_rows, heartbeat_at=timezone.now())
+
+        def progress(rows_written):
+            ReportExportJob.objects.filter(pk=job_id).update(rows_written=rows_written, heartbeat_at=timezone.now())
+
+        sink = make_sink(job.export_format, sheets_service, drive_service)
+        result_url, file_path, rows_written = run_export(report, sink, progress=progress)
+        ReportExportJob.objects.filter(pk=job_id).update(
+            status='done',
+            rows_written=rows_written,
+            result_url=result_url,
+            file_path=file_path,
+            finished_at=timezone.now(),
+        )
+        logger.info(f"Report export #{job_id} ({job.report}/{job.export_format}) finished: {rows_written} rows")
+    except Exception as e:
+        log_error(e, f"Report export job #{job_id}", source='task', severity='medium')
+        ReportExportJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(e)[:2000], finished_at=timezone.now()
+        )
+    finally:
+        if in_thread:
+            connections.close_all()
+
+
+def start_export_job(report_name, export_format, params, user=None, run_async=True,
+                     sheets_service=None, drive_service=None):
+    """Create a ReportExportJob and run it in a background thread (or inline)."""
+    from mysite.models import ReportExportJob
+
+    if export_format not in FORMATS:
+        export_format = 'sheets'
+    job = ReportExportJob.objects.create(
+        report=report_name,
+        export_format=export_format,
+        params=params,
+        requested_by=user if getattr(user, 'is_authenticated', False) else None,
+        created_by=getattr(user, 'full_name', None) or (str(user) if user else 'System'),
+    )
+    if run_async:
+        threading.Thread(
+            target=_run_job,
+            args=(job.pk, sheets_service, drive_service),
+            daemon=True,
+            name=f"report-export-{job.pk}",
+        ).start()
+    else:
+        _run_job(job.pk, sheets_service, drive_service, in_thread=False)
+        job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs(jobs=None):
+    """
+    Mark pending/running jobs whose worker is gone as failed: no heartbeat
+    (or, before the first one, no start) for STALE_JOB_SECONDS. Returns the
+    number of jobs marked.
+    """
+    from django.db.models import Q
+    from mysite.models import ReportExportJob
+
+    cutoff = timezone.now() - timedelta(seconds=STALE_JOB_SECONDS)
+    jobs = ReportExportJob.objects.all() if jobs is None else jobs
+    stale = jobs.filter(status__in=('pending', 'running')).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff)
+    )
+    return stale.update(
+        status='failed',
+        error='Export was interrupted (the server restarted while it was running). Please start it again.',
+        finished_at=timezone.now(),
+    )
@@ -75,12 +75,6 @@ LOGGING = {
             'filename': 'logs/debug.log',
             'formatter': 'verbose',
         },
-        'payment_sync_v2_trace': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': str(BASE_DIR / 'logs' / 'payment_sync_v2_trace.jsonl'),
-            'formatter': 'jsonl',
-        },
         'group_chat_log': {
             'level': 'DEBUG',
             'class': 'logging.FileHandler',
@@ -99,11 +93,6 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
-        'mysite.payment_sync_v2_trace': {
-            'handlers': ['payment_sync_v2_trace'],
-            'level': 'DEBUG',
-            'propagate': False,
-        },
         'mysite.group_chat_log': {
             'handlers': ['group_chat_log'],
             'level': 'DEBUG',
@@ -141,6 +130,8 @@ MIDDLEWARE = [
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'mysite.request_context_middleware.RequestContextMiddleware',  # Track current user
+    'mysite.query_inspector_middleware.QueryInspectorMiddleware',  # Query counts / N+1 detection
+    'mysite.performance_middleware.PerformanceMiddleware',  # Latency histograms / on-demand profiling
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
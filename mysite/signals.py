@@ -2,7 +2,8 @@
 Django signals to automatically track database changes for audit logging.
 This captures creates, updates, and deletes for all models.
 """
-from django.db.models.signals import post_save, pre_delete, pre_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.apps import apps
 from django.core.serializers.json import DjangoJSONEncoder
@@ -13,7 +14,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Models to exclude from audit logging
-EXCLUDED_MODELS = ['auditlog', 'session', 'contenttype', 'permission', 'logentry']
+EXCLUDED_MODELS = ['auditlog', 'session', 'contenttype', 'permission', 'logentry', 'referencedataversion', 'aimodelcatalogsnapshot', 'aimatchcacheentry', 'endpointlatency', 'requestprofile', 'activityrollup', 'activityrollupcursor']
 
 def _values_equal(old_val, new_val):
     """
@@ -109,6 +110,107 @@ def get_model_fields(instance):
     return fields_data
 
 
+AUDIT_CONTEXT_FIELDS = ('booking_id', 'apartment_id', 'apartment_name', 'tenant_id', 'tenant_name')
+
+
+def _cached_related(instance, name):
+    """Related object already loaded on ``instance`` (no query), or None."""
+    try:
+        field = instance._meta.get_field(name)
+        return field.get_cached_value(instance, default=None) if field.is_relation and field.many_to_one else None
+    except Exception:
+        return None
+
+
+def _instance_audit_context(instance):
+    """Booking / apartment / tenant ids and names known from ``instance`` and its loaded relations."""
+    model_name = instance.__class__.__name__
+    context = dict.fromkeys(AUDIT_CONTEXT_FIELDS)
+    if model_name == 'Booking':
+        context['booking_id'] = instance.pk
+    elif model_name == 'Apartment':
+        context['apartment_id'], context['apartment_name'] = instance.pk, instance.name
+    elif model_name == 'User':
+        if getattr(instance, 'role', None) == 'Tenant':
+            context['tenant_id'], context['tenant_name'] = instance.pk, instance.full_name
+        return context
+    context['booking_id'] = context['booking_id'] or getattr(instance, 'booking_id', None)
+    context['apartment_id'] = context['apartment_id'] or getattr(instance, 'apartment_id', None)
+    context['tenant_id'] = getattr(instance, 'tenant_id', None)
+
+    booking = _cached_related(instance, 'booking')
+    if booking is not None:
+        context['apartment_id'] = context['apartment_id'] or booking.apartment_id
+        context['tenant_id'] = context['tenant_id'] or booking.tenant_id
+    for holder in (instance, booking):
+        if holder is None:
+            continue
+        apartment = _cached_related(holder, 'apartment')
+        if apartment is not None and apartment.pk == context['apartment_id']:
+            context['apartment_name'] = apartment.name
+        tenant = _cached_related(holder, 'tenant')
+        if tenant is not None and tenant.pk == context['tenant_id']:
+            context['tenant_name'] = tenant.full_name
+    return context
+
+
+def complete_audit_contexts(contexts):
+    """
+    Fill in missing apartment/tenant ids (from the booking) and display names
+    of ``contexts`` in place, with at most one query per related model for the
+    whole batch. Rows that no longer exist keep the ids they already have.
+    """
+    from mysite.models import Apartment, Booking, User
+
+    booking_ids = {c['booking_id'] for c in contexts
+                   if c['booking_id'] and not (c['apartment_id'] and c['tenant_id'])}
+    if booking_ids:
+        bookings = {b['id']: b for b in Booking.objects.filter(pk__in=booking_ids).values(
+            'id', 'apartment_id', 'apartment__name', 'tenant_id', 'tenant__full_name')}
+        for context in contexts:
+            booking = bookings.get(context['booking_id'])
+            if booking is None:
+                continue
+            if not context['apartment_id'] and booking['apartment_id']:
+                context['apartment_id'], context['apartment_name'] = booking['apartment_id'], booking['apartment__name']
+            if not context['tenant_id'] and booking['tenant_id']:
+                context['tenant_id'], context['tenant_name'] = booking['tenant_id'], booking['tenant__full_name']
+
+    apartment_ids = {c['apartment_id'] for c in contexts if c['apartment_id'] and not c['apartment_name']}
+    if apartment_ids:
+        names = dict(Apartment.objects.filter(pk__in=apartment_ids).values_list('id', 'name'))
+        for context in contexts:
+            if context['apartment_id'] and not context['apartment_name']:
+                context['apartment_name'] = names.get(context['apartment_id'])
+
+    tenant_ids = {c['tenant_id'] for c in contexts if c['tenant_id'] and not c['tenant_name']}
+    if tenant_ids:
+        names = dict(User.objects.filter(pk__in=tenant_ids).values_list('id', 'full_name'))
+        for context in contexts:
+            if context['tenant_id'] and not context['tenant_name']:
+                context['tenant_name'] = names.get(context['tenant_id'])
+
+    for context in contexts:
+        for key in ('apartment_name', 'tenant_name'):
+            if context[key]:
+                context[key] = str(context[key])[:255]
+    return contexts
+
+
+def get_audit_contexts(instances):
+    """
+    AuditLog context columns (booking_id, apartment_id/name, tenant_id/name)
+    for ``instances``, in the same order. Captured at write time so the
+    database activity page can filter on indexed columns and render without
+    looking up each row's booking.
+    """
+    try:
+        return complete_audit_contexts([_instance_audit_context(instance) for instance in instances])
+    except Exception as e:
+        logger.error(f"Error resolving audit context: {e}")
+        return [dict.fromkeys(AUDIT_CONTEXT_FIELDS) for _ in instances]
+
+
 def should_track_model(instance):
     """Determine if we should track changes for this model"""
     model_name = instance.__class__.__name__.lower()
@@ -162,7 +264,8 @@ def log_create_update(sender, instance, created, **kwargs):
                 action='create',
                 changed_by=changed_by,
                 new_values=new_values,
-                changed_fields=list(new_values.keys())
+                changed_fields=list(new_values.keys()),
+                **get_audit_contexts([instance])[0]
             )
         else:
             # Object was updated
@@ -188,7 +291,8 @@ def log_create_update(sender, instance, created, **kwargs):
                     changed_by=changed_by,
                     old_values={k: old_values.get(k) for k in changed_fields},
                     new_values={k: new_values.get(k) for k in changed_fields},
-                    changed_fields=changed_fields
+                    changed_fields=changed_fields,
+                    **get_audit_contexts([instance])[0]
                 )
             
             # Clean up the stored state
@@ -220,9 +324,98 @@ def log_delete(sender, instance, **kwargs):
             action='delete',
             changed_by=changed_by,
             old_values=old_values,
-            changed_fields=list(old_values.keys())
+            changed_fields=list(old_values.keys()),
+            **get_audit_contexts([instance])[0]
         )
     
     except Exception as e:
         logger.error(f"Error logging {sender.__name__} delete: {e}")
 
+
+@receiver([post_save, post_delete], sender='mysite.ApartmentPrice')
+def invalidate_apartment_price_timeline(sender, instance, **kwargs):
+    """Drop the cached price timeline now and again once the transaction commits"""
+    from mysite.price_timeline import invalidate_price_timelines
+
+    apartment_ids = [instance.apartment_id]
+    invalidate_price_timelines(apartment_ids)
+    transaction.on_commit(lambda: invalidate_price_timelines(apartment_ids))
+
+
+@receiver(post_delete, sender='mysite.Payment')
+def invalidate_ai_match_cache(sender, instance, **kwargs):
+    """
+    Drop cached AI matches that listed a deleted payment. Saves need nothing:
+    updated_at is part of the cache key, so an edited candidate misses anyway.
+    """
+    from mysite.ai_match_cache import invalidate_payments
+    invalidate_payments([instance.pk])
+
+
+@receiver([post_save, post_delete], sender='mysite.PaymenType')
+@receiver([post_save, post_delete], sender='mysite.PaymentMethod')
+@receiver([post_save, post_delete], sender='mysite.Apartment')
+def bump_reference_data_on_change(sender, instance, **kwargs):
+    """Reload cached reference data in every process (see mysite/reference_data.py)"""
+    from mysite.reference_data import bump_reference_data_version
+    bump_reference_data_version()
+
+
+@receiver([post_save, post_delete], sender='mysite.User')
+def bump_reference_data_on_manager_change(sender, instance, **kwargs):
+    """Only managers are cached; also catch users that stop being managers"""
+    from mysite.reference_data import bump_reference_data_version, is_cached_manager
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if instance.role == 'Manager' or is_cached_manager(instance.pk):
+        bump_reference_data_version()
+
+
+@receiver(m2m_changed)
+def bump_reference_data_on_apartment_managers(sender, action, **kwargs):
+    """Apartment.managers is cached too (m2m_changed has no lazy sender, so filter here)"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if sender is apps.get_model('mysite', 'Apartment').managers.through:
+        from mysite.reference_data import bump_reference_data_version
+        from mysite.view_cache import bump_model_versions
+        bump_reference_data_version()
+        # Managers only see the calendars of their apartments
+        bump_model_versions('Apartment')
+
+
+@receiver([post_save, post_delete], sender='mysite.TwilioConversation')
+@receiver(post_delete, sender='mysite.TwilioMessage')
+def bump_chat_directory_on_change(sender, instance, **kwargs):
+    """Conversation links and deleted messages change the chat sidebar (see mysite/chat_directory.py)"""
+    from mysite.chat_directory import bump_chat_directory_version
+    bump_chat_directory_version()
+
+
+@receiver([post_save, post_delete], sender='mysite.Booking')
+@receiver([post_save, post_delete], sender='mysite.User')
+@receiver([post_save, post_delete], sender='mysite.Apartment')
+def bump_chat_directory_on_display_change(sender, instance, **kwargs):
+    """Tenant names, booking dates and apartment names are shown in the chat sidebar"""
+    from mysite.chat_directory import bump_chat_directory_version, shows
+    model_name = sender.__name__
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if ((model_name == 'Booking' and shows(booking_id=instance.pk))
+            or (model_name == 'User' and shows(user=instance))
+            or (model_name == 'Apartment' and shows(apartment_id=instance.pk))):
+        bump_chat_directory_version()
+
+
+@receiver([post_save, post_delete])
+def bump_view_cache_versions(sender, instance, **kwargs):
+    """ETags of the calendar and API views depend on these models (see mysite/view_cache.py)"""
+    from mysite.view_cache import TRACKED_MODELS, bump_model_versions
+    if sender.__name__ not in TRACKED_MODELS or sender._meta.app_label != 'mysite':
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_model_versions(sender.__name__)
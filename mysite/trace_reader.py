@@ -0,0 +1,423 @@
+"""
+Constant-memory queries over JSONL traces written by mysite/trace_writer.py.
+
+A trace is a list of segments: rotated archives (oldest first, gzip or not)
+followed by the live file. Each segment has a sidecar index (``<file>.idx``,
+one ``rid\\toffset\\tlength\\tstep\\tts`` line per event). The writer appends it
+as it goes; ``Segment.ensure_index()`` extends it incrementally for anything
+the writer did not index (files written before the writer existed, or lines
+appended by other tools), holding the same ``flock`` the writer uses.
+
+Queries only walk index lines and seek to the matching events:
+- ``tail(path, n, rid=..., step=..., since=..., until=...)`` reads index lines
+  backwards from the end in blocks and stops after n matches.
+- ``query(path, ...)`` yields matching events in file order and skips segments
+  whose time range is outside since/until.
+- ``follow(path, ...)`` yields events appended after it started and keeps
+  going across rotations.
+
+Usage:
+    from mysite.trace_reader import tail, query
+    for event in tail('logs/payment_sync_v2_trace.jsonl', 50, step='fetch_db_*'):
+        ...
+"""
+import fnmatch
+import glob
+import gzip
+import json
+import os
+import re
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from .trace_writer import archive_sort_key, index_path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+# Index entry covering bytes before the first parseable event, so coverage starts at 0
+SKIPPED_STEP = '_skipped'
+BLOCK_SIZE = 64 * 1024
+MAX_OBJECT_BYTES = 64 * 1024 * 1024
+
+IndexEntry = namedtuple('IndexEntry', 'rid offset length step ts')
+
+
+def parse_index_line(line):
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='replace')
+    parts = line.rstrip('\n').split('\t')
+    if len(parts) < 4:
+        return None
+    try:
+        ts = float(parts[4]) if len(parts) > 4 and parts[4] else None
+        return IndexEntry(parts[0], int(parts[1]), int(parts[2]), parts[3], ts)
+    except ValueError:
+        return None
+
+
+def format_index_line(rid, offset, length, step, ts):
+    rid = str(rid or '-').replace('\t', ' ').replace('\n', ' ')
+    step = str(step or '-').replace('\t', ' ').replace('\n', ' ')
+    ts = f'{float(ts):.3f}' if isinstance(ts, (int, float)) else ''
+    return f'{rid}\t{offset}\t{length}\t{step}\t{ts}\n'
+
+
+def iter_lines_reverse(f, end=None, block_size=BLOCK_SIZE):
+    """Lines of a seekable binary file from ``end`` (default EOF) backwards, without newlines."""
+    if end is None:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+    position = end
+    remainder = b''
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        chunk = f.read(size) + remainder
+        lines = chunk.split(b'\n')
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line
+    if remainder:
+        yield remainder
+
+
+def scan_objects(f, start=0):
+    """
+    (offset, length, obj) for each top-level JSON object from ``start``.
+    Handles JSONL and older traces with pretty-printed objects spanning lines;
+    anything that does not parse is skipped.
+    """
+    f.seek(start)
+    offset = start
+    pending_start = None
+    pending = []
+    pending_size = 0
+    for line in iter(f.readline, b''):
+        line_offset = offset
+        offset += len(line)
+        opens_object = line.lstrip().startswith(b'{')
+        if pending_start is not None:
+            pending.append(line)
+            pending_size += len(line)
+            if line.startswith(b'}'):
+                try:
+                    obj = json.loads(b''.join(pending))
+                except ValueError:
+                    obj = None
+                if obj is not None:
+                    yield pending_start, pending_size, obj
+                    pending_start, pending, pending_size = None, [], 0
+                    continue
+            if pending_size <= MAX_OBJECT_BYTES and not line.startswith(b'{'):
+                continue
+            # Unbalanced fragment: drop it, and retry this line on its own if it opens an object
+            pending_start, pending, pending_size = None, [], 0
+        if not opens_object:
+            continue
+        try:
+            yield line_offset, len(line), json.loads(line)
+        except ValueError:
+            pending_start, pending, pending_size = line_offset, [line], len(line)
+
+
+class Segment:
+    """One trace file (live or rotated) and its sidecar index."""
+
+    def __init__(self, data_path, index_file=None):
+        self.data_path = data_path
+        self.compressed = data_path.endswith('.gz')
+        self.index_path = index_file or index_path(data_path[:-3] if self.compressed else data_path)
+
+    def __repr__(self):
+        return f'Segment({self.data_path!r})'
+
+    def open(self):
+        return gzip.open(self.data_path, 'rb') if self.compressed else open(self.data_path, 'rb')
+
+    def read(self, f, entry):
+        f.seek(entry.offset)
+        try:
+            return json.loads(f.read(entry.length))
+        except ValueError:
+            return None
+
+    def _covered_end(self):
+        """(first offset, end of last indexed event) or None when there is no usable index."""
+        try:
+            with open(self.index_path, 'rb') as idx:
+                first = parse_index_line(idx.readline())
+                last = next((e for e in map(parse_index_line, iter_lines_reverse(idx)) if e), None)
+        except OSError:
+            return None
+        if first is None or last is None:
+            return None
+        return first.offset, last.offset + last.length
+
+    def ensure_index(self):
+        """Index events the writer did not; returns False if the index could not be written."""
+        try:
+            with self.open() as f:
+                if fcntl and not self.compressed:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    return self._extend_index(f)
+                finally:
+                    if fcntl and not self.compressed:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            return False
+
+    def _extend_index(self, f):
+        if self.compressed:
+            if os.path.exists(self.index_path):
+                return True
+            size = None
+        else:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+        covered = self._covered_end()
+        if covered is not None and covered[0] == 0:
+            if size is None or covered[1] >= size:
+                return True
+            with open(self.index_path, 'ab') as idx:
+                for offset, length, obj in scan_objects(f, covered[1]):
+                    idx.write(self._entry_line(offset, length, obj))
+            return True
+        if size == 0:
+            return True
+        # No index, or un-indexed events before the first indexed one: rebuild
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as idx:
+            first = True
+            for offset, length, obj in scan_objects(f, 0):
+                if first and offset > 0:
+                    idx.write(format_index_line('-', 0, offset, SKIPPED_STEP, None).encode('utf-8'))
+                first = False
+                idx.write(self._entry_line(offset, length, obj))
+            if first and size:
+                idx.write(format_index_line('-', 0, size, SKIPPED_STEP, None).encode('utf-8'))
+        os.replace(tmp_path, self.index_path)
+        return True
+
+    @staticmethod
+    def _entry_line(offset, length, obj):
+        if not isinstance(obj, dict):
+            obj = {}
+        return format_index_line(obj.get('rid'), offset, length, obj.get('step'), obj.get('ts')).encode('utf-8')
+
+    def entries(self):
+        try:
+            with open(self.index_path, 'rb') as idx:
+                for line in idx:
+                    entry = parse_index_line(line)
+                    if entry and entry.step != SKIPPED_STEP:
+                        yield entry
+        except OSError:
+            return
+
+    def entries_reverse(self):
+        try:
+            with open(self.index_path, 'rb') as idx:
+                for line in iter_lines_reverse(idx):
+                    entry = parse_index_line(line)
+                    if entry and entry.step != SKIPPED_STEP:
+                        yield entry
+        except OSError:
+            return
+
+    def time_bounds(self):
+        """(first ts, last ts) from the first and last index entries; None parts when unknown."""
+        first = next(self.entries(), None)
+        last = next(self.entries_reverse(), None)
+        return (first.ts if first else None), (last.ts if last else None)
+
+    def scan(self):
+        """Events without an index (read-only trace directories)."""
+        with self.open() as f:
+            for offset, length, obj in scan_objects(f):
+                if isinstance(obj, dict):
+                    yield IndexEntry(obj.get('rid'), offset, length, obj.get('step'), obj.get('ts')), obj
+
+
+def trace_segments(path):
+    """Segments of a trace, oldest first: rotated archives then the live file."""
+    base, suffix = os.path.splitext(path)
+    archives = {}
+    for archive in glob.glob(f'{glob.escape(base)}.*{suffix}') + glob.glob(f'{glob.escape(base)}.*{suffix}.gz'):
+        # Prefer the uncompressed copy while compression is still running
+        key = archive[:-3] if archive.endswith('.gz') else archive
+        if key not in archives or not archive.endswith('.gz'):
+            archives[key] = archive
+    segments = [Segment(archives[key]) for key in sorted(archives, key=archive_sort_key)]
+    if os.path.exists(path):
+        segments.append(Segment(path))
+    return segments
+
+
+def parse_time(value, now=None):
+    """'2026-10-19', '2026-10-19T14:30', '15m', '2h', '1d' (ago) -> unix timestamp; None passes through."""
+    if value is None or value == '':
+        return None
+    now = now or datetime.now()
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhd])', str(value).strip())
+    if match:
+        seconds = float(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        return (now - timedelta(seconds=seconds)).timestamp()
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"Unrecognized time {value!r}; use ISO date/time or an age like 15m, 2h, 1d")
+
+
+class TraceFilter:
+    """rid (exact), step (fnmatch pattern) and since/until (unix timestamps)."""
+
+    def __init__(self, rid=None, step=None, since=None, until=None):
+        self.rid = rid
+        self.step = step
+        self.since = since
+        self.until = until
+
+    def matches(self, rid, step, ts):
+        if self.rid is not None and str(rid) != self.rid:
+            return False
+        if self.step is not None and not fnmatch.fnmatchcase(str(step), self.step):
+            return False
+        if self.since is not None or self.until is not None:
+            if ts is None:
+                return False
+            if self.since is not None and ts < self.since:
+                return False
+            if self.until is not None and ts > self.until:
+                return False
+        return True
+
+    def overlaps(self, segment):
+        if self.since is None and self.until is None:
+            return True
+        first, last = segment.time_bounds()
+        if self.until is not None and first is not None and first > self.until:
+            return False
+        if self.since is not None and last is not None and last < self.since:
+            return False
+        return True
+
+
+def query(path, rid=None, step=None, since=None, until=None):
+    """Matching events, oldest first."""
+    flt = TraceFilter(rid, step, since, until)
+    for segment in trace_segments(path):
+        if not segment.ensure_index():
+            for entry, obj in segment.scan():
+                if flt.matches(entry.rid, entry.step, entry.ts):
+                    yield obj
+            continue
+        if not flt.overlaps(segment):
+            continue
+        with segment.open() as f:
+            for entry in segment.entries():
+                if flt.matches(entry.rid, entry.step, entry.ts):
+                    event = segment.read(f, entry)
+                    if event is not None:
+                        yield event
+
+
+def tail(path, n, rid=None, step=None, since=None, until=None):
+    """Last ``n`` matching events, oldest first."""
+    flt = TraceFilter(rid, step, since, until)
+    found = []
+    for segment in reversed(trace_segments(path)):
+        if len(found) >= n:
+            break
+        if not segment.ensure_index():
+            window = deque(maxlen=n - len(found))
+            for entry, obj in segment.scan():
+                if flt.matches(entry.rid, entry.step, entry.ts):
+                    window.append(obj)
+            found.extend(reversed(window))
+            continue
+        if not flt.overlaps(segment):
+            continue
+        with segment.open() as f:
+            for entry in segment.entries_reverse():
+                if flt.matches(entry.rid, entry.step, entry.ts):
+                    event = segment.read(f, entry)
+                    if event is not None:
+                        found.append(event)
+                        if len(found) >= n:
+                            break
+    found.reverse()
+    return found
+
+
+def follow(path, rid=None, step=None, since=None, until=None, poll_seconds=0.5, stop=None):
+    """
+    Events appended to the live file after the call, forever (or until ``stop()`` is true).
+    On rotation the rest of the renamed file is drained, then archives rotated in
+    between (several rotations within one poll) are replayed before the new live file.
+    """
+    flt = TraceFilter(rid, step, since, until)
+
+    known_archives = {_segment_key(s) for s in trace_segments(path) if s.data_path != path}
+    start_at_end = os.path.exists(path)
+    f = None
+    inode = None
+    position = 0
+    buffer = b''
+    try:
+        while not (stop and stop()):
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    start_at_end = False
+                    time.sleep(poll_seconds)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                position = f.seek(0, os.SEEK_END) if start_at_end else 0
+                start_at_end = False
+            f.seek(position)
+            chunk = f.read(BLOCK_SIZE)
+            position += len(chunk)
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                try:
+                    event = json.loads(line) if line.strip() else None
+                except ValueError:
+                    event = None
+                if isinstance(event, dict) and flt.matches(event.get('rid'), event.get('step'), event.get('ts')):
+                    yield event
+            if chunk:
+                continue
+            try:
+                rotated = os.stat(path).st_ino != inode
+            except FileNotFoundError:
+                rotated = True
+            if not rotated:
+                time.sleep(poll_seconds)
+                continue
+            # Everything up to EOF of the renamed file has been read; the oldest new
+            # archive is that file, any newer ones were rotated before we noticed
+            f.close()
+            f, position, buffer = None, 0, b''
+            new_segments = [s for s in trace_segments(path) if s.data_path != path and _segment_key(s) not in known_archives]
+            known_archives.update(_segment_key(s) for s in new_segments)
+            for segment in new_segments[1:]:
+                with segment.open() as archive:
+                    for _, _, event in scan_objects(archive):
+                        if isinstance(event, dict) and flt.matches(event.get('rid'), event.get('step'), event.get('ts')):
+                            yield event
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _segment_key(segment):
+    return segment.data_path[:-3] if segment.compressed else segment.data_path
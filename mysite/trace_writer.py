@@ -0,0 +1,301 @@
+"""
+Background JSONL trace writer with sampling, rotation and a request-id index.
+
+``TraceWriter.submit(event)`` only puts the event on a bounded queue; a daemon
+thread serializes it, appends it to the JSONL file and appends one line to a
+sidecar index (``<file>.idx``)::
+
+    <rid>\\t<byte offset>\\t<byte length>\\t<step>\\t<unix ts>
+
+so readers can seek straight to a request's events instead of scanning the file.
+When the queue is full the event is dropped and counted instead of blocking
+the request. Payloads are serialized on the writer thread, so callers must not
+mutate a payload after submitting it; pass ``snapshot(payload)`` when the
+caller keeps working on the same dicts and lists.
+
+Rotation: when the file passes ``max_bytes`` or the day changes, the file and
+its index are renamed to ``<name>.<YYYYmmdd-HHMMSS-ffffff><suffix>``, the data file is
+gzip-compressed and only ``backup_count`` archives are kept. Writes and
+rotation happen under an exclusive ``flock`` and every writer reopens the file
+when its inode changes, so several worker processes can share one trace file.
+
+Usage:
+    writer = TraceWriter('logs/trace.jsonl', max_bytes=50 * 1024 * 1024)
+    writer.submit({'rid': 'abc123', 'step': 'view.enter', 'data': {...}})
+"""
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import zlib
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+INDEX_SUFFIX = '.idx'
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def parse_sample_rates(value):
+    """'step.a=0.1,step.b=0' -> {'step.a': 0.1, 'step.b': 0.0}; bad entries are ignored."""
+    rates = {}
+    for item in (value or '').split(','):
+        step, sep, rate = item.partition('=')
+        if not sep:
+            continue
+        try:
+            rates[step.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def snapshot(value):
+    """Copy of the dicts, lists and tuples in ``value`` (leaf values are shared) to submit safely."""
+    if isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [snapshot(item) for item in value]
+    return value
+
+
+class TraceWriter:
+    """Non-blocking JSONL writer; see module docstring."""
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=20, rotate_daily=True,
+                 queue_size=1000, sample_rate=1.0, step_sample_rates=None, max_event_bytes=1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_daily = rotate_daily
+        self.sample_rate = sample_rate
+        self.step_sample_rates = dict(step_sample_rates or {})
+        self.max_event_bytes = max_event_bytes
+        self.dropped = 0
+        self.written = 0
+        self.sampled_out = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._index = None
+        self._day_cache = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # Request thread side
+
+    def should_sample(self, rid, step):
+        """Per-step sampling, stable per request id so a request keeps all events of a sampled step."""
+        rate = self.step_sample_rates.get(step, self.sample_rate)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        return zlib.crc32(str(rid).encode('utf-8')) / 0xFFFFFFFF < rate
+
+    def submit(self, event):
+        """Queue ``event`` (a dict with 'rid' and 'step'); never blocks. Returns False if not queued."""
+        if not self.should_sample(event.get('rid'), event.get('step')):
+            self.sampled_out += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Wait until queued events are written (for commands and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, 2.0)
+
+    # Writer thread side
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            try:
+                self._write(self._encode(event), event)
+            except Exception:
+                # Tracing must never take the process down
+                pass
+            finally:
+                self._queue.task_done()
+
+    def _encode(self, event):
+        try:
+            line = json.dumps(event, default=str, ensure_ascii=False)
+        except Exception as e:
+            line = json.dumps({**{k: event.get(k) for k in ('rid', 'step', 'user', 'path', 'method')},
+                               'data': {'_error': f'unserializable payload: {e}'}}, default=str)
+        if self.max_event_bytes and len(line) > self.max_event_bytes:
+            data = json.dumps(event.get('data'), default=str, ensure_ascii=False)
+            preview_chars = max(self.max_event_bytes // 4, 1000)
+            truncated = {k: v for k, v in event.items() if k != 'data'}
+            truncated['data'] = {'_truncated': True, 'bytes': len(data), 'preview': data[:preview_chars]}
+            line = json.dumps(truncated, default=str, ensure_ascii=False)
+        return (line + '\n').encode('utf-8')
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._close()
+        self._file = open(self.path, 'ab')
+        self._index = open(index_path(self.path), 'ab')
+
+    def _close(self):
+        for f in (self._file, self._index):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._file = None
+        self._index = None
+
+    def _is_current(self):
+        """False when another process rotated the file or replaced the index (trace_reader rebuilds it)."""
+        try:
+            return (os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+                    and os.stat(index_path(self.path)).st_ino == os.fstat(self._index.fileno()).st_ino)
+        except OSError:
+            return False
+
+    def _file_day(self):
+        """Day of the first event in the current file (from the index), cached per inode."""
+        inode = os.fstat(self._file.fileno()).st_ino
+        if self._day_cache and self._day_cache[0] == inode:
+            return self._day_cache[1]
+        day = None
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                first = f.readline().decode('utf-8').rstrip('\n').split('\t')
+            if len(first) >= 5:
+                day = datetime.fromtimestamp(float(first[4])).date()
+        except (OSError, ValueError):
+            pass
+        if day is not None:
+            self._day_cache = (inode, day)
+        return day
+
+    def _needs_rotation(self, incoming):
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return False
+        if self.max_bytes and size + incoming > self.max_bytes:
+            return True
+        if self.rotate_daily:
+            day = self._file_day()
+            return day is not None and day != datetime.now().date()
+        return False
+
+    def _lock(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _write(self, line, event):
+        if self._file is None or not self._is_current():
+            self._open()
+        self._lock()
+        rotated = None
+        try:
+            # Another process may have rotated the file while we waited for the lock
+            while not self._is_current():
+                self._unlock()
+                self._open()
+                self._lock()
+            if self._needs_rotation(len(line)):
+                rotated = self._rotate()
+                self._unlock()
+                self._open()
+                self._lock()
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            rid = str(event.get('rid') or '-').replace('\t', ' ')
+            step = str(event.get('step') or '-').replace('\t', ' ')
+            ts = event.get('ts') or time.time()
+            self._index.write(f'{rid}\t{offset}\t{len(line)}\t{step}\t{ts:.3f}\n'.encode('utf-8'))
+            self._index.flush()
+            self.written += 1
+        finally:
+            self._unlock()
+        if rotated:
+            self._compress(rotated)
+            self._prune()
+
+    def _rotate(self):
+        """Rename the current file and index (lock held); returns the archived data file path."""
+        base, suffix = os.path.splitext(self.path)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        archived = f'{base}.{stamp}{suffix}'
+        counter = 1
+        while os.path.exists(archived) or os.path.exists(archived + '.gz'):
+            archived = f'{base}.{stamp}-{counter}{suffix}'
+            counter += 1
+        os.rename(self.path, archived)
+        if os.path.exists(index_path(self.path)):
+            os.rename(index_path(self.path), index_path(archived))
+        return archived
+
+    def _compress(self, archived):
+        try:
+            with open(archived, 'rb') as src, gzip.open(archived + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(archived)
+        except OSError:
+            pass
+
+    def _prune(self):
+        archives = archived_trace_files(self.path)
+        for old, old_index in archives[self.backup_count:] if self.backup_count else []:
+            for victim in (old, old_index):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+
+
+def archive_sort_key(path):
+    """Chronological sort key of a rotated archive name (stamp, collision counter)."""
+    match = re.search(r'\.(\d{8}-\d{6}(?:-\d{6})?)(?:-(\d+))?\.[^.]+(?:\.gz)?$', os.path.basename(path))
+    if not match:
+        return ('', 0)
+    return match.group(1), int(match.group(2) or 0)
+
+
+def archived_trace_files(path):
+    """Rotated, compressed archives of ``path`` (newest first), each as (data_path, index_path)."""
+    base, suffix = os.path.splitext(path)
+    archives = sorted(glob.glob(f'{glob.escape(base)}.*{suffix}.gz'), key=archive_sort_key, reverse=True)
+    return [(archive, index_path(archive[:-len('.gz')])) for archive in archives]
@@ -12,6 +12,7 @@ Features:
 - Logs errors AND general events
 - Stores in database (ErrorLog and SystemLog models)
 - Sends Telegram notifications for errors
+- Aggregates repeated errors in memory; DB writes and alerts run in the background
 - Automatic context capture (user, request, etc.)
 - Proper severity levels
 - Clean, simple API
@@ -29,6 +30,7 @@ Usage:
     log_info("Payment processed", category='payment', details={'amount': 100})
     log_warning("Low balance", category='system')
 """
+import atexit
 import logging
 import traceback
 import hashlib
@@ -37,6 +39,8 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 from django.utils import timezone
 
+from mysite.error_aggregator import ErrorAggregator
+
 # Standard Python logger
 logger = logging.getLogger('mysite.common')
 
@@ -135,6 +139,19 @@ def _format_telegram_error(error_log) -> str:
     return msg
 
 
+MAX_TRACEBACK_CHARS = 20000
+
+error_aggregator = ErrorAggregator(send=_send_telegram, format_alert=_format_telegram_error)
+
+
+@atexit.register
+def _flush_errors_at_exit():
+    try:
+        error_aggregator.drain(timeout=5)
+    except Exception:
+        pass
+
+
 def log_error(
     error: Exception,
     context: str,
@@ -143,10 +160,15 @@ def log_error(
     additional_info: Optional[Dict[str, Any]] = None,
     send_telegram: bool = True,
     re_raise: bool = False
-) -> Optional[int]:
+) -> Optional[str]:
     """
     Log an error to database, Telegram, and standard logger
     
+    Only an in-memory append happens here: the error is counted in
+    ``error_aggregator`` under its hash and written to ErrorLog by a
+    background flush; Telegram alerts are throttled per hash and sent
+    from a queue (see mysite/error_aggregator.py).
+    
     Args:
         error: The exception that occurred
         context: Description of where/what happened (e.g., "Payment Processing - Charge Card")
@@ -157,85 +179,53 @@ def log_error(
         re_raise: Whether to re-raise the exception after logging
     
     Returns:
-        ErrorLog ID if saved, None otherwise
+        Error hash the occurrence was counted under, None if it could not be recorded
     """
+    error_hash = None
     try:
-        # Avoid circular import
-        from mysite.models import ErrorLog
-        
         error_type = type(error).__name__
         error_message = str(error)
         tb = traceback.format_exc()
         
-        # Get context
-        user_ctx = _get_user_context()
-        request_ctx = _get_request_context()
-        
         # Generate error hash for grouping
         error_hash = _generate_error_hash(error_type, context, error_message)
         
-        # Check if similar error exists recently (last hour)
-        from django.utils import timezone as tz
-        from datetime import timedelta
-        recent_time = tz.now() - timedelta(hours=1)
-        
-        existing_error = ErrorLog.objects.filter(
-            error_hash=error_hash,
-            last_occurrence__gte=recent_time
-        ).first()
-        
-        if existing_error:
-            # Update existing error
-            existing_error.occurrences += 1
-            existing_error.last_occurrence = tz.now()
-            existing_error.save(update_fields=['occurrences', 'last_occurrence'])
-            error_log_id = existing_error.id
-            # Don't send telegram for duplicates
-            telegram_sent = False
-        else:
-            # Create new error log
-            error_log = ErrorLog.objects.create(
-                error_type=error_type,
-                error_message=error_message,
-                context=context,
-                source=source,
-                severity=severity,
-                traceback=tb if tb != "NoneType: None\n" else None,
-                additional_info=additional_info,
-                error_hash=error_hash,
-                **user_ctx,
-                **request_ctx
-            )
-            error_log_id = error_log.id
-            
-            # Send Telegram notification
-            telegram_sent = False
-            if send_telegram and severity in ['high', 'critical']:
-                telegram_message = _format_telegram_error(error_log)
-                telegram_sent = _send_telegram(telegram_message)
-                
-                if telegram_sent:
-                    error_log.telegram_sent = True
-                    error_log.telegram_sent_at = tz.now()
-                    error_log.save(update_fields=['telegram_sent', 'telegram_sent_at'])
+        fields = {
+            'error_type': error_type[:255],
+            'error_message': error_message,
+            'context': context[:500],
+            'source': source,
+            'severity': severity,
+            'traceback': tb[-MAX_TRACEBACK_CHARS:] if tb != "NoneType: None\n" else None,
+            'additional_info': additional_info,
+            **_get_user_context(),
+            **_get_request_context(),
+        }
+        if not error_aggregator.add(error_hash, fields, alert=send_telegram and severity in ['high', 'critical']):
+            logger.warning(f"Error window full, occurrence not stored: {error_hash}")
         
         # Also log to standard logger
         logger.error(
             f"[{severity.upper()}] {context}: {error_message}",
             exc_info=True,
-            extra={'error_log_id': error_log_id}
+            extra={'error_hash': error_hash}
         )
         
-        if re_raise:
-            raise
-        
-        return error_log_id
-        
     except Exception as log_err:
-        # Fallback - log to standard logger if database fails
-        logger.error(f"Failed to log error to database: {log_err}", exc_info=True)
+        # Fallback - log to standard logger if aggregation fails
+        logger.error(f"Failed to record error: {log_err}", exc_info=True)
         logger.error(f"Original error: {context}: {error}", exc_info=True)
-        return None
+        error_hash = None
+    
+    if re_raise:
+        raise error
+    
+    return error_hash
+
+
+def flush_errors(timeout: float = 10) -> None:
+    """Write pending errors to ErrorLog now and wait for queued alerts (commands, tests, shutdown)."""
+    error_aggregator.drain(timeout)
 
 
 def log_info(
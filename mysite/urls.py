@@ -27,11 +27,15 @@ urlpatterns = [
     path('generate-invoice/', views.generate_invoice, name='generateInvoice'),
     path('booking-report/', views.booking_report, name='booking_report'),
     path('apartment-report/', views.apartment_report, name='apartment_report'),
+    path('report-export/<int:job_id>/', views.report_export_status, name='report_export_status'),
+    path('report-export/<int:job_id>/download/', views.report_export_download, name='report_export_download'),
     path('payments-sync/', views.sync_payments, name='sync_payments'),
     path('payments-sync-v2/', views.sync_payments_v2, name='sync_payments_v2'),
     path('payments-sync-v2/fetch-db-payments/', views.fetch_db_payments_for_matching, name='fetch_db_payments_for_matching'),
     path('payments-sync-v2/match-selection/', views.match_selection_v2, name='match_selection_v2'),
+    path('payments-sync-v2/match-selections-batch/', views.match_selections_batch_v2, name='match_selections_batch_v2'),
     path('payments-sync-v2/fetch-merged-db-payments/', views.fetch_merged_db_payments_for_file, name='fetch_merged_db_payments_for_file'),
+    path('payments-sync-v2/reference-data/', views.payment_sync_reference_data, name='payment_sync_reference_data'),
     path('booking-availability/', views.booking_availability, name='booking_availability'),
     path('create-booking/', views.create_booking_by_link, name='create_booking_by_link'),
     path('handyman_calendar/', views.handyman_calendar, name='handyman_calendar'),
@@ -43,11 +47,14 @@ urlpatterns = [
     path('api/calendar-notes/<int:note_id>/delete/', views.delete_calendar_note, name='delete_calendar_note'),
     path('api/update-apartment-price-by-rooms/', views.UpdateApartmentPriceByRooms.as_view(), name='update_apartment_price_by_rooms'),
     path('api/update-single-apartment-price/', views.UpdateSingleApartmentPrice.as_view(), name='update_single_apartment_price'),
+    path('api/apartment-prices/bulk/', views.BulkUpdateApartmentPrices.as_view(), name='bulk_update_apartment_prices'),
     path('api/bookings/', views.RentalGuruCreateBookingAPI.as_view(), name='api_rental_guru_create_booking'),
+    path('api/bookings/batch/', views.RentalGuruBatchImportBookingsAPI.as_view(), name='api_rental_guru_batch_import_bookings'),
     path('api/bookings/<int:pk>/', views.RentalGuruUpdateBookingAPI.as_view(), name='api_rental_guru_update_booking'),
     path('api/bookings/by-source-id/<str:source_id>/', views.RentalGuruUpdateBookingBySourceIdAPI.as_view(), name='api_rental_guru_update_booking_by_source_id'),
     path('api/payments/', views.RentalGuruCreatePaymentAPI.as_view(), name='api_rental_guru_create_payment'),
     path('api/payments/<int:pk>/', views.RentalGuruUpdatePaymentAPI.as_view(), name='api_rental_guru_update_payment'),
+    path('api/changes/', views.ChangeFeedAPI.as_view(), name='api_change_feed'),
     # Chat interface URLs
     path('chat/', views.chat_list, name='chat_list'),
     path('chat/<str:conversation_sid>/', views.chat_detail, name='chat_detail'),
@@ -57,6 +64,7 @@ urlpatterns = [
     path('chat/<str:conversation_sid>/apartment-kb/', views.update_chat_apartment_kb, name='update_chat_apartment_kb'),
     path('chat/<str:conversation_sid>/messages/<int:message_id>/delete/', views.delete_chat_message, name='delete_chat_message'),
     path('chat/<str:conversation_sid>/load-more/', views.load_more_messages, name='load_more_messages'),
+    path('chat/<str:conversation_sid>/stream/', views.chat_message_stream, name='chat_message_stream'),
     path('chat/templates/', views.chat_template_list, name='chat_template_list'),
     path('chat/templates/create/', views.chat_template_create, name='chat_template_create'),
     # AI Management
@@ -64,6 +72,9 @@ urlpatterns = [
     path('globalknowledgebase/', RedirectView.as_view(url='/ai-management/', permanent=True)),
     # Database Activity Monitoring
     path('database-activity/', views.database_activity, name='database_activity'),
+    path('database-activity/queries/', views.database_query_activity, name='database_query_activity'),
+    path('performance/', views.performance_dashboard, name='performance_dashboard'),
+    path('performance/profiles/<int:profile_id>/download/', views.performance_profile_download, name='performance_profile_download'),
 
 ]
 
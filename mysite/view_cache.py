@@ -0,0 +1,208 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) and rendered response caching
+for read-heavy calendar and API views.
+
+Every save or delete of a model in TRACKED_MODELS bumps that model's
+``model:<Name>`` row in ReferenceDataVersion (see mysite/signals.py; the
+audit_bulk helpers bump after QuerySet.update()/bulk_create()/bulk_update()).
+A view decorated with ``conditional_view(models=...)`` reads the rows of the
+models it depends on in one query and derives its ETag from them, the view
+name, the path and query string, the caller's scope and today's date (the
+calendars mark past days and start at the current month).
+
+- A matching If-None-Match / If-Modified-Since gets a 304 without running
+  the view.
+- With ``cache_body=True`` the rendered 200 response is kept in the default
+  Django cache under its ETag, so other requests with the same parameters,
+  scope and data versions are served without running the view either.
+
+The scope defaults to the user id (pages show the logged in user's email and
+managers only see their apartments) or ``anon``; a scope function returning
+None disables caching for that request. Requests with pending
+django.contrib.messages are never cached, since the page has to show them.
+
+Bumps made inside a transaction are collected and applied once, after it
+commits, one row at a time in name order: the shared version rows are not
+locked for the rest of the writer's transaction, concurrent writers cannot
+deadlock on them, and views never see a version for data that is not
+committed yet.
+
+Call ``bump_model_versions('Booking', ...)`` after writes that bypass both
+the signals and mysite/audit_bulk.py.
+
+Usage:
+    from mysite.view_cache import conditional_view
+
+    @user_has_role('Admin', 'Manager')
+    @conditional_view(models=('Apartment', 'Booking'), cache_body=True)
+    def calendar(request):
+        ...
+"""
+import datetime
+import hashlib
+import json
+import threading
+from functools import wraps
+
+VERSION_PREFIX = 'model:'
+BODY_CACHE_PREFIX = 'view_cache:'
+BODY_CACHE_SECONDS = 300
+
+# Models read by the conditional views; saves of anything else are not counted
+TRACKED_MODELS = frozenset({
+    'Apartment', 'ApartmentPrice', 'Booking', 'CalendarNote', 'Cleaning', 'HandymanBlockedSlot',
+    'HandymanCalendar', 'Parking', 'ParkingBooking', 'PaymenType', 'Payment', 'User',
+})
+
+
+# Version names bumped by the current thread's open transaction
+_pending = threading.local()
+
+
+def _version_name(model_name):
+    return f"{VERSION_PREFIX}{model_name}"
+
+
+def _bump_pending():
+    """on_commit callback: bump every collected version row, one short UPDATE each, in name order."""
+    from django.db.models import F
+    from django.utils import timezone
+    from mysite.models import ReferenceDataVersion
+
+    names, _pending.names = sorted(getattr(_pending, 'names', ())), set()
+    now = timezone.now()
+    for name in names:
+        if not ReferenceDataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now):
+            ReferenceDataVersion.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+def bump_model_versions(*model_names):
+    """Invalidate ETags and cached responses of every view reading ``model_names`` once the transaction commits."""
+    from django.db import connection, transaction
+
+    names = {_version_name(name) for name in model_names if name in TRACKED_MODELS}
+    if not names:
+        return
+    pending = getattr(_pending, 'names', None)
+    if pending is None:
+        pending = _pending.names = set()
+    # One callback per transaction; register again when it already ran or a rollback discarded it
+    register = not pending or not any(entry[1] is _bump_pending for entry in connection.run_on_commit)
+    pending.update(names)
+    if register:
+        transaction.on_commit(_bump_pending, robust=True)
+
+
+def model_versions(model_names):
+    """{model name: (version, updated_at)} for ``model_names``; (0, None) if never bumped."""
+    from mysite.models import ReferenceDataVersion
+
+    rows = ReferenceDataVersion.objects.filter(
+        name__in=[_version_name(name) for name in model_names]
+    ).values_list('name', 'version', 'updated_at')
+    stamps = {name[len(VERSION_PREFIX):]: (version, updated_at) for name, version, updated_at in rows}
+    return {name: stamps.get(name, (0, None)) for name in model_names}
+
+
+def user_scope(request):
+    """Cache scope of the logged in user (``user:<id>:<role>``) or ``anon``."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}:{getattr(user, 'role', '')}"
+    return 'anon'
+
+
+def _has_pending_messages(request):
+    from django.contrib.messages import get_messages
+    try:
+        return len(get_messages(request)) > 0
+    except Exception:
+        return False
+
+
+def view_validators(request, view_name, model_names, scope):
+    """(etag, last_modified) for ``view_name`` as seen by ``scope`` right now."""
+    from django.utils import timezone
+
+    today = timezone.localdate()
+    stamps = model_versions(model_names)
+    payload = json.dumps([
+        view_name,
+        request.path,
+        sorted(request.GET.lists()),
+        scope,
+        today.isoformat(),
+        [[name, version, updated_at.isoformat() if updated_at else None]
+         for name, (version, updated_at) in sorted(stamps.items())],
+    ])
+    etag = '"%s"' % hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    # The page changes at midnight even without writes
+    midnight = timezone.make_aware(datetime.datetime.combine(today, datetime.time.min))
+    last_modified = max([midnight] + [updated_at for _, updated_at in stamps.values() if updated_at])
+    return etag, last_modified
+
+
+def _cached_body(etag):
+    from django.core.cache import cache
+    from django.http import HttpResponse
+
+    entry = cache.get(BODY_CACHE_PREFIX + etag)
+    if entry is None:
+        return None
+    content, content_type = entry
+    return HttpResponse(content, content_type=content_type)
+
+
+def _store_body(etag, response, timeout):
+    from django.core.cache import cache
+
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        cache.set(BODY_CACHE_PREFIX + etag, (response.content, response['Content-Type']), timeout)
+
+
+def conditional_view(models, scope=user_scope, cache_body=False, timeout=BODY_CACHE_SECONDS):
+    """
+    Serve GET/HEAD requests of the decorated view conditionally (see module
+    docstring). ``models`` are the TRACKED_MODELS names the view reads;
+    ``scope(request)`` returns the cache scope or None to bypass.
+    """
+    unknown = set(models) - TRACKED_MODELS
+    if unknown:
+        raise ValueError(f"conditional_view: untracked models {sorted(unknown)}")
+    model_names = tuple(sorted(models))
+
+    def decorator(view_func):
+        view_name = f"{view_func.__module__}.{view_func.__qualname__}"
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+            from django.utils.http import http_date
+
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            request_scope = scope(request)
+            if request_scope is None or _has_pending_messages(request):
+                return view_func(request, *args, **kwargs)
+
+            etag, last_modified = view_validators(request, view_name, model_names, request_scope)
+            response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+            if response is None and cache_body:
+                response = _cached_body(etag)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+                if cache_body:
+                    _store_body(etag, response, timeout)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Cookie',))
+            return response
+
+        return _wrapped_view
+
+    return decorator
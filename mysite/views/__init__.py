@@ -10,21 +10,26 @@ from .login import CustomLogoutView, custom_login_view
 from .generic_view import users, apartment_prices, bookings, cleanings, payment_methods, payment_types, payments, ai_management_view
 from .apartments_view import apartments_view as apartments
 from .payment_sync import sync_payments
-from .payment_sync_v2 import sync_payments_v2, fetch_db_payments_for_matching, match_selection_v2, fetch_merged_db_payments_for_file
+from .payment_sync_v2 import sync_payments_v2, fetch_db_payments_for_matching, match_selection_v2, match_selections_batch_v2, fetch_merged_db_payments_for_file, payment_sync_reference_data
 from .docuseal import docuseal_callback
 from .booking_availability import booking_availability
 from .one_link_contract import create_booking_by_link
 from .handmade_calendar import handyman_calendar
 from .parking_calendar import parking_calendar
+from .report_export import report_export_status, report_export_download
+from .performance import performance_dashboard, performance_profile_download
 from .booking_api import (
     ApartmentBookingDates,
     UpdateApartmentPriceByRooms,
     UpdateSingleApartmentPrice,
+    BulkUpdateApartmentPrices,
     RentalGuruCreateBookingAPI,
+    RentalGuruBatchImportBookingsAPI,
     RentalGuruUpdateBookingAPI,
     RentalGuruUpdateBookingBySourceIdAPI,
     RentalGuruCreatePaymentAPI,
     RentalGuruUpdatePaymentAPI,
+    ChangeFeedAPI,
 )
 from .calendar_notes import (
     create_calendar_note,
@@ -41,7 +46,8 @@ from .chat import (
     update_chat_apartment_kb,
     delete_chat_message,
     load_more_messages,
+    chat_message_stream,
     chat_template_list,
     chat_template_create,
 )
-from .database_activity import database_activity
\ No newline at end of file
+from .database_activity import database_activity, database_query_activity
\ No newline at end of file
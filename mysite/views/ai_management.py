@@ -7,6 +7,7 @@ from ..models import AIManagement
 from ..forms import AIManagementForm
 from .utils import handle_post_request, get_related_fields, parse_query, get_model_fields, DateEncoder
 from ..decorators import user_has_role
+from ..model_catalog import openrouter_catalog
 
 def serialize_field(value):
     from datetime import datetime, date
@@ -75,50 +76,6 @@ def ai_management_view(request):
     current_model_obj = AIManagement.objects.filter(prompt_key='ai_conversation_model').first()
     current_model = current_model_obj.content if current_model_obj else 'openai/gpt-4o-mini'
 
-    def _format_context_length(n):
-        if n is None:
-            return None
-        try:
-            n = int(n)
-            if n >= 1_000_000:
-                return f"{n // 1_000_000}M"
-            if n >= 1000:
-                return f"{n // 1000}k"
-            return str(n)
-        except (ValueError, TypeError):
-            return None
-
-    # Fetch models from OpenRouter API
-    openrouter_models = []
-    try:
-        import requests
-        import os
-        api_key = os.environ.get('OPENROUTER_API_KEY')
-        if api_key:
-            response = requests.get(
-                "https://openrouter.ai/api/v1/models",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                for m in data.get('data', []):
-                    pricing = m.get('pricing', {})
-                    prompt_price = float(pricing.get('prompt', 0)) * 1000000
-                    completion_price = float(pricing.get('completion', 0)) * 1000000
-                    ctx = m.get('context_length')
-                    openrouter_models.append({
-                        'value': m.get('id'),
-                        'label': m.get('name'),
-                        'prompt_price': f"{prompt_price:.2f}",
-                        'completion_price': f"{completion_price:.2f}",
-                        'context_length': ctx,
-                        'context_length_display': _format_context_length(ctx),
-                    })
-                # Sort by label
-                openrouter_models.sort(key=lambda x: x['label'])
-    except Exception as e:
-        print(f"Error fetching OpenRouter models: {e}")
-
     # Fallback/Static AI Model options if API fails or for core models
     ai_models = [
         {'value': 'openai/gpt-4o', 'label': 'GPT-4o', 'context_length_display': '128k'},
@@ -128,9 +85,8 @@ def ai_management_view(request):
         {'value': 'anthropic/claude-3.5-sonnet', 'label': 'Claude 3.5 Sonnet', 'context_length_display': '200k'},
     ]
     
-    # Use OpenRouter models if available
-    if openrouter_models:
-        ai_models = openrouter_models
+    # Cached OpenRouter catalog; no network I/O on the request path
+    ai_models = openrouter_catalog.get(fallback=ai_models)
 
     context = {
         'items': items_on_page,
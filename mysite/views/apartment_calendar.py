@@ -11,10 +11,12 @@ from dateutil.relativedelta import relativedelta
 from django.http import HttpResponseBadRequest
 from ..models import Apartment, Booking, Cleaning, Payment
 from ..decorators import user_has_role
+from ..view_cache import conditional_view
 from .utils import generate_weeks, DateEncoder, handle_post_request, stringify_keys, aggregate_data, get_model_fields
 
 
 @user_has_role('Admin', 'Manager')
+@conditional_view(models=('Apartment', 'Booking', 'Cleaning', 'Payment', 'PaymenType', 'User'), cache_body=True)
 def apartment(request):
     apartment_id = request.GET.get('apartment.id', 22)
     year = request.GET.get('year')
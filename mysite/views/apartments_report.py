@@ -1,15 +1,17 @@
 from django.shortcuts import render, redirect
-from ..models import Apartment, Booking, Payment, ApartmentPrice
+from ..models import Apartment, Booking, Payment
 from django.db.models import Q, Sum, Prefetch
 import json
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
 from ..decorators import user_has_role
+from ..price_timeline import preload_price_timelines
 from .utils import calculate_unique_booked_days, aggregate_profit_by_category, calculate_total_booked_days, aggregate_data, stringify_keys
-from .booking_report import get_google_sheets_service, share_document_with_user
+from mysite.report_export import (
+    CHUNK_SIZE, STYLE_HEADER, STYLE_HIGHLIGHT, ExportReport, ExportSheet, StyledRow, start_export_job,
+)
 import logging
 from datetime import datetime
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
@@ -338,9 +340,14 @@ def apartment_report(request):
             logger.info(f'Found {booking_count} bookings')
             
             if bookings.exists():
-                report_url = generate_apartment_excel(bookings, start_date, end_date)
-                logger.info(f'Apartment report created {report_url}')
-                return redirect(report_url)
+                params = {
+                    'report_start_date': report_start_date,
+                    'report_end_date': report_end_date,
+                    'manager_id': request.user.id if request.user.role == 'Manager' else None,
+                }
+                job = start_export_job('apartment', request.GET.get('export_format', 'sheets'), params, user=request.user)
+                logger.info(f'Apartment report export job #{job.pk} started')
+                return redirect('report_export_status', job_id=job.pk)
         return redirect(referer_url)
     except Exception as e:
         logger.info(f"Error: Generating Apartment Report Error, {str(e)}")
@@ -349,230 +356,98 @@ def apartment_report(request):
         return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
-def generate_apartment_excel(bookings, start_date, end_date):
-    sheets_service, drive_service = get_google_sheets_service()
+def apartment_report_bookings(bookings):
+    return bookings.select_related(
+        'apartment',
+        'tenant'
+    ).prefetch_related(
+        Prefetch(
+            'payments',
+            queryset=Payment.objects.select_related('payment_type').filter(
+                payment_type__type='In',
+                payment_type__name__in=['Rent', 'Hold Deposit']
+            )
+        )
+    )
 
-    title_start = start_date.strftime('%B %d %Y')
-    title_end = end_date.strftime('%B %d %Y')
 
-    spreadsheet_body = {
-        'properties': {
-            'title': f"Apartment Report: {title_start} - {title_end}"
-        },
-        'sheets': [{
-            'properties': {
-                'title': 'Apartment Report'
-            }
-        }]
-    }
-    spreadsheet = sheets_service.create(body=spreadsheet_body).execute()
-    spreadsheet_id = spreadsheet.get('spreadsheetId')
-    
-    # Get the actual sheet ID from the created spreadsheet
-    sheet_id = spreadsheet['sheets'][0]['properties']['sheetId']
-    logger.info(f'Created spreadsheet with sheet ID: {sheet_id}')
+def apartment_row(booking, price_timelines, period_start, period_end):
+    apartment_name = booking.apartment.name if booking.apartment else ''
+    apartment_id = booking.apartment.id if booking.apartment else None
+    default_price = booking.apartment.default_price if booking.apartment else 0
 
-    rows = prepare_apartment_rows(bookings, start_date, end_date)
-    insert_apartment_rows(sheets_service, spreadsheet_id, rows, sheet_id)
+    # Clamp booking dates to requested period
+    clamped_start = max(booking.start_date, period_start)
+    clamped_end = min(booking.end_date, period_end)
 
-    share_document_with_user(drive_service, spreadsheet_id)
+    days = (clamped_end - clamped_start).days if (clamped_start and clamped_end) else 0
+    days = days if days > 0 else 0
 
-    return f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit'
+    # Filter payments from prefetched data
+    rent_and_deposit_payments = [
+        p for p in booking.payments.all()
+        if p.payment_date >= clamped_start and p.payment_date <= clamped_end
+    ]
 
+    total_payment = sum(float(p.amount) for p in rent_and_deposit_payments)
+    payment_found = len(rent_and_deposit_payments) > 0
 
-def build_price_cache(apartment_ids, period_start, period_end):
-    """
-    Build a cache of all apartment prices for the period.
-    Returns: dict[apartment_id] -> list of (effective_date, price) tuples
-    """
-    logger.info(f"Building price cache for apartments: {apartment_ids}")
-    
-    price_cache = defaultdict(list)
-    
-    # Fetch all relevant prices at once
-    prices = ApartmentPrice.objects.filter(
-        apartment_id__in=apartment_ids,
-        effective_date__lte=period_end
-    ).select_related('apartment').order_by('apartment_id', '-effective_date')
-    
-    for price in prices:
-        price_cache[price.apartment_id].append({
-            'effective_date': price.effective_date,
-            'price': float(price.price)
-        })
-    
-    # Also get default prices
-    default_prices = Apartment.objects.filter(
-        id__in=apartment_ids
-    ).values('id', 'default_price')
-    
-    for apt in default_prices:
-        if apt['id'] not in price_cache or not price_cache[apt['id']]:
-            price_cache[apt['id']].append({
-                'effective_date': date(2000, 1, 1),
-                'price': float(apt['default_price'] or 0)
-            })
-    
-    logger.info(f"Price cache built with {len(price_cache)} apartments")
-    return price_cache
-
-
-def get_price_for_date_cached(price_cache, apartment_id, target_date, default_price):
-    """Get price from cache for a specific date"""
-    if apartment_id not in price_cache:
-        return float(default_price or 0)
-    
-    # Prices are already sorted by effective_date descending
-    for price_entry in price_cache[apartment_id]:
-        if price_entry['effective_date'] <= target_date:
-            return price_entry['price']
-    
-    return float(default_price or 0)
-
-
-def calculate_daily_price_optimized(price_cache, apartment_id, default_price, start_date, end_date):
+    adr_payments = float(total_payment) / days if days > 0 else 0
+
+    # Sum daily prices over the price timeline segments of the stay
+    daily_price_sum = 0.0
+    if apartment_id and days > 0:
+        daily_price_sum = price_timelines[apartment_id].daily_price_sum(
+            clamped_start, clamped_end, default_price
+        )
+
+    adr_price_table = (daily_price_sum / days) if days > 0 else 0
+
+    # Calculate price difference
+    price_difference = adr_payments - adr_price_table if days > 0 else 0
+
+    renter = booking.tenant.full_name if booking.tenant else ''
+
+    return {
+        'booking_id': booking.id,
+        'apartment_name': apartment_name,
+        'start_date': clamped_start.isoformat() if days > 0 else '',
+        'end_date': clamped_end.isoformat() if days > 0 else '',
+        'days': days,
+        'total_payment': float(total_payment),
+        'adr_payments': round(adr_payments, 2),
+        'adr_price_table': round(adr_price_table, 2),
+        'price_difference': round(price_difference, 2),
+        'renter': renter,
+        'payment_found': payment_found,
+    }
+
+
+def iter_apartment_rows(bookings, period_start, period_end, chunk_size=CHUNK_SIZE):
     """
-    Optimized calculation of average daily price across a period.
-    Instead of querying DB for each day, uses cached prices and calculates ranges.
+    Stream report rows for ``bookings``. Bookings are read with
+    iterator(chunk_size) so payments are prefetched one chunk at a time, and
+    price timelines are loaded once for the distinct apartment ids.
     """
-    if apartment_id not in price_cache or not price_cache[apartment_id]:
-        monthly_price = float(default_price or 0)
-        days = (end_date - start_date).days
-        return (monthly_price / 30.0) * days if days > 0 else 0
-    
-    # Get all prices that could affect this period
-    relevant_prices = [p for p in price_cache[apartment_id] 
-                      if p['effective_date'] <= end_date]
-    
-    if not relevant_prices:
-        monthly_price = float(default_price or 0)
-        days = (end_date - start_date).days
-        return (monthly_price / 30.0) * days if days > 0 else 0
-    
-    # Sort by effective_date ascending for easier processing
-    relevant_prices = sorted(relevant_prices, key=lambda x: x['effective_date'])
-    
-    total_daily_sum = 0.0
-    current_date = start_date
-    
-    # Find which price applies at the start
-    current_price_idx = 0
-    for i, price_entry in enumerate(relevant_prices):
-        if price_entry['effective_date'] <= start_date:
-            current_price_idx = i
-    
-    while current_date < end_date:
-        # Find the next price change date
-        next_price_date = end_date
-        if current_price_idx + 1 < len(relevant_prices):
-            next_change = relevant_prices[current_price_idx + 1]['effective_date']
-            if next_change < end_date:
-                next_price_date = next_change
-        
-        # Calculate days at current price
-        days_at_price = (min(next_price_date, end_date) - current_date).days
-        monthly_price = relevant_prices[current_price_idx]['price']
-        daily_price = monthly_price / 30.0
-        total_daily_sum += daily_price * days_at_price
-        
-        current_date = next_price_date
-        current_price_idx += 1
-    
-    return total_daily_sum
+    apartment_ids = list(
+        bookings.exclude(apartment__isnull=True).order_by().values_list('apartment_id', flat=True).distinct()
+    )
+    price_timelines = preload_price_timelines(apartment_ids)
+
+    bookings = apartment_report_bookings(bookings).order_by('apartment__name', 'start_date', 'id')
+    for booking in bookings.iterator(chunk_size=chunk_size):
+        yield apartment_row(booking, price_timelines, period_start, period_end)
 
 
 def prepare_apartment_rows(bookings, period_start, period_end):
     """
-    Optimized version with:
-    - Single query to prefetch all related data
-    - Price caching to avoid N+1 queries
-    - JSON export for debugging
+    Build all report rows as a list and export them to JSON for debugging.
     """
-    logger.info(f"Starting to prepare rows for {bookings.count() if hasattr(bookings, 'count') else len(bookings)} bookings")
-    
-    # OPTIMIZATION 1: Prefetch all related data in a single query
-    bookings = bookings.select_related(
-        'apartment',
-        'tenant'
-    ).prefetch_related(
-        Prefetch(
-            'payments',
-            queryset=Payment.objects.select_related('payment_type').filter(
-                payment_type__type='In',
-                payment_type__name__in=['Rent', 'Hold Deposit']
-            )
-        )
-    )
-    
-    # Convert to list to avoid multiple DB hits
-    bookings_list = list(bookings)
-    logger.info(f"Loaded {len(bookings_list)} bookings with related data")
-    
-    # OPTIMIZATION 2: Build price cache for all apartments at once
-    apartment_ids = [b.apartment.id for b in bookings_list if b.apartment]
-    price_cache = build_price_cache(apartment_ids, period_start, period_end)
-    
-    rows = []
-    
-    for idx, booking in enumerate(bookings_list):
-        if idx % 50 == 0:
-            logger.info(f"Processing booking {idx + 1}/{len(bookings_list)}")
-        
-        apartment_name = booking.apartment.name if booking.apartment else ''
-        apartment_id = booking.apartment.id if booking.apartment else None
-        default_price = booking.apartment.default_price if booking.apartment else 0
-        
-        # Clamp booking dates to requested period
-        clamped_start = max(booking.start_date, period_start)
-        clamped_end = min(booking.end_date, period_end)
-
-        days = (clamped_end - clamped_start).days if (clamped_start and clamped_end) else 0
-        days = days if days > 0 else 0
-
-        # Filter payments from prefetched data
-        rent_and_deposit_payments = [
-            p for p in booking.payments.all()
-            if p.payment_date >= clamped_start and p.payment_date <= clamped_end
-        ]
-        
-        total_payment = sum(float(p.amount) for p in rent_and_deposit_payments)
-        payment_found = len(rent_and_deposit_payments) > 0
-        
-        adr_payments = float(total_payment) / days if days > 0 else 0
-
-        # OPTIMIZATION 3: Use cached prices with range calculation
-        daily_price_sum = 0.0
-        if apartment_id and days > 0:
-            daily_price_sum = calculate_daily_price_optimized(
-                price_cache, apartment_id, default_price, clamped_start, clamped_end
-            )
-        
-        adr_price_table = (daily_price_sum / days) if days > 0 else 0
-
-        # Calculate price difference
-        price_difference = adr_payments - adr_price_table if days > 0 else 0
-
-        renter = booking.tenant.full_name if booking.tenant else ''
-
-        rows.append({
-            'booking_id': booking.id,
-            'apartment_name': apartment_name,
-            'start_date': clamped_start.isoformat() if days > 0 else '',
-            'end_date': clamped_end.isoformat() if days > 0 else '',
-            'days': days,
-            'total_payment': float(total_payment),
-            'adr_payments': round(adr_payments, 2),
-            'adr_price_table': round(adr_price_table, 2),
-            'price_difference': round(price_difference, 2),
-            'renter': renter,
-            'payment_found': payment_found,
-        })
-    
+    rows = list(iter_apartment_rows(bookings, period_start, period_end))
     logger.info(f"Completed processing all {len(rows)} bookings")
-    
+
     # DEBUGGING: Export to JSON file
     try:
-        import os
         debug_file = '/tmp/apartment_report_debug.json'
         with open(debug_file, 'w') as f:
             json.dump({
@@ -585,113 +460,49 @@ def prepare_apartment_rows(bookings, period_start, period_end):
         logger.info(f"Debug data exported to {debug_file}")
     except Exception as e:
         logger.info(f"Could not export debug JSON: {e}")
-    
+
     return rows
 
 
-def insert_apartment_rows(sheets_service, spreadsheet_id, rows, sheet_id):
-    headers = [
-        'Apartment', 'Start Date', 'End Date', 'Days',
-        'Total Rent Payment', 'ADR (Payments)', 'ADR (Price Table)', 
-        'Price Difference', 'Renter Name', 'Payment Found'
-    ]
-    
-    # Convert row dictionaries to lists in the correct order
-    values = [headers]
-    for row in rows:
-        values.append([
-            row['apartment_name'],
-            row['start_date'],
-            row['end_date'],
-            row['days'],
-            row['total_payment'],
-            row['adr_payments'],
-            row['adr_price_table'],
-            row['price_difference'],
-            row['renter'],
-            'Yes' if row['payment_found'] else 'No'
-        ])
-    
-    # Insert data
-    data_range = 'Apartment Report!A1'
-    sheets_service.values().update(
-        spreadsheetId=spreadsheet_id,
-        range=data_range,
-        valueInputOption='USER_ENTERED',
-        body={'values': values}
-    ).execute()
-    
-    # Apply conditional formatting to color rows red where payment is not found
-    requests = []
-    
-    # Add conditional formatting for rows where Payment Found = "No"
-    # This will color the entire row red
-    for idx, row in enumerate(rows):
-        if not row['payment_found']:
-            row_number = idx + 2  # +2 because headers are row 1, data starts at row 2
-            requests.append({
-                'repeatCell': {
-                    'range': {
-                        'sheetId': sheet_id,
-                        'startRowIndex': row_number - 1,
-                        'endRowIndex': row_number,
-                        'startColumnIndex': 0,
-                        'endColumnIndex': 10
-                    },
-                    'cell': {
-                        'userEnteredFormat': {
-                            'backgroundColor': {
-                                'red': 1.0,
-                                'green': 0.8,
-                                'blue': 0.8
-                            }
-                        }
-                    },
-                    'fields': 'userEnteredFormat.backgroundColor'
-                }
-            })
-    
-    # Format header row (bold + background color)
-    requests.append({
-        'repeatCell': {
-            'range': {
-                'sheetId': sheet_id,
-                'startRowIndex': 0,
-                'endRowIndex': 1,
-                'startColumnIndex': 0,
-                'endColumnIndex': 10
-            },
-            'cell': {
-                'userEnteredFormat': {
-                    'textFormat': {
-                        'bold': True
-                    },
-                    'backgroundColor': {
-                        'red': 0.85,
-                        'green': 0.85,
-                        'blue': 0.85
-                    }
-                }
-            },
-            'fields': 'userEnteredFormat(textFormat,backgroundColor)'
-        }
-    })
-    
-    # Auto-resize columns
-    requests.append({
-        'autoResizeDimensions': {
-            'dimensions': {
-                'sheetId': sheet_id,
-                'dimension': 'COLUMNS',
-                'startIndex': 0,
-                'endIndex': 10
-            }
-        }
-    })
-    
-    # Apply all formatting
-    if requests:
-        sheets_service.batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={'requests': requests}
-        ).execute()
+APARTMENT_EXPORT_COLUMNS = [
+    'Apartment', 'Start Date', 'End Date', 'Days',
+    'Total Rent Payment', 'ADR (Payments)', 'ADR (Price Table)',
+    'Price Difference', 'Renter Name', 'Payment Found'
+]
+
+
+def export_apartment_report(params):
+    """
+    Report source for mysite.report_export. Rows where no rent payment was
+    found are highlighted; the sink coalesces them into ranges.
+    """
+    period_start = datetime.strptime(params['report_start_date'], "%B %d %Y").date()
+    period_end = datetime.strptime(params['report_end_date'], "%B %d %Y").date()
+    bookings = Booking.objects.exclude(status='Cancelled')
+    if params.get('manager_id'):
+        bookings = bookings.filter(apartment__managers__id=params['manager_id'])
+    bookings = bookings.filter(start_date__lte=period_end, end_date__gte=period_start)
+
+    def rows():
+        yield StyledRow(APARTMENT_EXPORT_COLUMNS, STYLE_HEADER)
+        for row in iter_apartment_rows(bookings, period_start, period_end):
+            values = [
+                row['apartment_name'],
+                row['start_date'],
+                row['end_date'],
+                row['days'],
+                row['total_payment'],
+                row['adr_payments'],
+                row['adr_price_table'],
+                row['price_difference'],
+                row['renter'],
+                'Yes' if row['payment_found'] else 'No'
+            ]
+            yield values if row['payment_found'] else StyledRow(values, STYLE_HIGHLIGHT)
+
+    title = f"Apartment Report: {period_start.strftime('%B %d %Y')} - {period_end.strftime('%B %d %Y')}"
+    return ExportReport(
+        title,
+        [ExportSheet('Apartment Report', rows(), columns=len(APARTMENT_EXPORT_COLUMNS))],
+        total_rows=bookings.count(),
+    )
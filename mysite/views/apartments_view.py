@@ -8,6 +8,7 @@ import json
 from ..models import Apartment, User
 from ..forms import ApartmentForm
 from ..decorators import user_has_role
+from ..price_timeline import preload_price_timelines
 from .utils import DateEncoder, parse_query
 
 
@@ -97,6 +98,7 @@ def apartments_view(request):
     items_on_page = paginator.get_page(page)
     
     # Serialize apartments for JavaScript
+    preload_price_timelines([apt.id for apt in items_on_page])
     items_list = []
     for apt in items_on_page:
         item = {
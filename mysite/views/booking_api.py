@@ -8,11 +8,12 @@ from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from rest_framework import status
 from rest_framework.parsers import JSONParser
-from ..models import Apartment, Booking, ApartmentPrice, Payment
+from ..models import Apartment, Booking, Payment
 from ..forms import BookingForm, PaymentForm
 from datetime import datetime, timedelta, date
 from django.db.models import Q, Prefetch
 from django.http import QueryDict
+from django.utils.decorators import method_decorator
 from django.contrib.auth.models import AnonymousUser
 from types import SimpleNamespace
 from contextlib import contextmanager
@@ -22,6 +23,11 @@ import os
 import sys
 
 from ..request_context import get_current_user, set_current_user
+from ..price_timeline import preload_price_timelines
+from ..view_cache import conditional_view
+from ..price_upsert import parse_price_entries, upsert_apartment_prices
+from ..booking_import import import_bookings
+from ..change_feed import DEFAULT_LIMIT as DEFAULT_FEED_LIMIT, head_cursor, read_changes
 
 
 RENTAL_GURU_SOURCE = 'Rental Guru'
@@ -351,6 +357,16 @@ def _serialize_booking(booking):
         'payments': payments,
     }
 
+def _api_token_scope(request):
+    """Conditional GET scope for token-authenticated APIs; invalid tokens bypass the cache."""
+    auth_token = request.GET.get('auth_token')
+    return 'api' if auth_token and auth_token == os.environ.get('API_AUTH_TOKEN') else None
+
+
+@method_decorator(conditional_view(
+    models=('Apartment', 'ApartmentPrice', 'Booking', 'Payment', 'PaymenType', 'User'),
+    scope=_api_token_scope, cache_body=True,
+), name='dispatch')
 class ApartmentBookingDates(APIView):
     renderer_classes = [JSONRenderer]  # This ensures JSON response
     
@@ -388,7 +404,6 @@ class ApartmentBookingDates(APIView):
             ).filter(
                 Q(end_date__isnull=True) | Q(end_date__gte=today)
             ).prefetch_related(
-                'prices',
                 Prefetch('booked_apartments', queryset=future_bookings_qs),
             ).order_by('id')
         else:
@@ -418,20 +433,18 @@ class ApartmentBookingDates(APIView):
                 return None
             return base_price + (surcharge or 0)
         
+        price_timelines = preload_price_timelines([apartment.id for apartment in apartments])
+
         # For each apartment, get its bookings and pricing
         for apartment in apartments:
-            # Get current price
-            current_price = apartment.current_price
-            
+            price_timeline = price_timelines[apartment.id]
+
             # Get the current active price (most recent price with effective_date <= today)
-            current_active_price = apartment.prices.filter(
-                effective_date__lte=today
-            ).order_by('-effective_date').first()
+            current_active_price = price_timeline.entry_on(today)
+            current_price = current_active_price.price if current_active_price else None
             
             # Get all future prices (effective_date > today)
-            future_prices = apartment.prices.filter(
-                effective_date__gt=today
-            ).order_by('effective_date')
+            future_prices = price_timeline.after(today)
             
             # Calculate rating surcharge (daily rate needs to be converted to monthly)
             rating_surcharge_per_day = apartment.get_rating_surcharge_per_day()
@@ -543,42 +556,24 @@ class UpdateSingleApartmentPrice(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find the apartment
         try:
-            apartment = Apartment.objects.get(id=apartment_id)
-        except Apartment.DoesNotExist:
+            with rental_guru_user_tracking_context():
+                change, = upsert_apartment_prices([{
+                    'apartment_id': apartment_id,
+                    'effective_date': effective_date,
+                    'price': new_price,
+                    'notes': notes,
+                }])
+        except Apartment.DoesNotExist as e:
             return Response(
-                {"error": f"Apartment with id {apartment_id} not found"}, 
+                {"error": str(e)}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        # Check if a price already exists for this date
-        existing_price = ApartmentPrice.objects.filter(
-            apartment=apartment,
-            effective_date=effective_date
-        ).first()
-        
-        with rental_guru_user_tracking_context():
-            if existing_price:
-                existing_price.price = new_price
-                existing_price.notes = notes
-                existing_price.save()
-                action = "updated"
-                price_record = existing_price
-            else:
-                price_record = ApartmentPrice(
-                    apartment=apartment,
-                    price=new_price,
-                    effective_date=effective_date,
-                    notes=notes
-                )
-                price_record.save()
-                action = "created"
+        apartment, price_record = change.apartment, change.record
+        action = "created" if change.action == "created" else "updated"
         
         # Get all prices for this apartment since the effective date
-        prices_since_date = apartment.prices.filter(
-            effective_date__gte=effective_date
-        ).order_by('effective_date')
+        prices_since_date = apartment.price_timeline.since(effective_date)
         
         
         pricing_data = []
@@ -661,57 +656,25 @@ class UpdateApartmentPriceByRooms(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find apartments with the specified number of bedrooms
-        apartments = Apartment.objects.filter(bedrooms=number_of_rooms)
-        
-        if not apartments.exists():
+        try:
+            with rental_guru_user_tracking_context():
+                changes = upsert_apartment_prices([{
+                    'number_of_rooms': number_of_rooms,
+                    'effective_date': effective_date,
+                    'price': new_price,
+                    'notes': notes,
+                }])
+        except Apartment.DoesNotExist as e:
             return Response(
-                {"error": f"No apartments found with {number_of_rooms} rooms"}, 
+                {"error": str(e)}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Create new price records for all matching apartments
-        created_prices = []
-        skipped_apartments = []
-        updated_count = 0
-        
-        with rental_guru_user_tracking_context():
-            for apartment in apartments:
-                existing_price = ApartmentPrice.objects.filter(
-                    apartment=apartment,
-                    effective_date=effective_date
-                ).first()
-                
-                if existing_price:
-                    existing_price.price = new_price
-                    existing_price.notes = notes
-                    existing_price.save()
-                    created_prices.append({
-                        "apartment_id": apartment.id,
-                        "apartment_name": apartment.name,
-                        "price": float(new_price),
-                        "effective_date": effective_date.strftime("%Y-%m-%d"),
-                        "notes": notes,
-                        "action": "updated"
-                    })
-                    updated_count += 1
-                else:
-                    apartment_price = ApartmentPrice(
-                        apartment=apartment,
-                        price=new_price,
-                        effective_date=effective_date,
-                        notes=notes
-                    )
-                    apartment_price.save()
-                    created_prices.append({
-                        "apartment_id": apartment.id,
-                        "apartment_name": apartment.name,
-                        "price": float(apartment_price.price),
-                        "effective_date": apartment_price.effective_date.strftime("%Y-%m-%d"),
-                        "notes": apartment_price.notes,
-                        "action": "created"
-                    })
-                    updated_count += 1
+        created_prices = [
+            {**_serialize_price_change(change), "action": "created" if change.action == "created" else "updated"}
+            for change in changes
+        ]
+        updated_count = len(created_prices)
         
         response_data = {
             "message": f"Successfully processed price updates for {updated_count} apartments with {number_of_rooms} rooms",
@@ -726,6 +689,49 @@ class UpdateApartmentPriceByRooms(APIView):
         return Response(response_data, content_type='application/json')
 
 
+def _serialize_price_change(change):
+    return {
+        "apartment_id": change.apartment.id,
+        "apartment_name": change.apartment.name,
+        "price": float(change.record.price),
+        "effective_date": change.record.effective_date.strftime("%Y-%m-%d"),
+        "notes": change.record.notes or "",
+        "action": change.action,
+    }
+
+
+class BulkUpdateApartmentPrices(APIView):
+    """Many (apartment selector, effective_date, price) entries in one call; see mysite/price_upsert.py."""
+    renderer_classes = [JSONRenderer]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        err = _api_auth_error_response(request)
+        if err:
+            return err
+        _log_rental_guru_request(request, dict(request.data))
+
+        try:
+            entries = parse_price_entries(request.data.get('prices'), default_notes=request.data.get('notes') or '')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with rental_guru_user_tracking_context():
+                changes = upsert_apartment_prices(entries)
+        except Apartment.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        counts = {action: 0 for action in ('created', 'updated', 'unchanged')}
+        for change in changes:
+            counts[change.action] += 1
+        return Response({
+            'message': f"Successfully processed {len(changes)} price records from {len(entries)} entries",
+            'created_count': counts['created'],
+            'updated_count': counts['updated'],
+            'unchanged_count': counts['unchanged'],
+            'price_records': [_serialize_price_change(change) for change in changes],
+        }, content_type='application/json')
+
 class RentalGuruCreateBookingAPI(APIView):
     renderer_classes = [JSONRenderer]
     parser_classes = [JSONParser]
@@ -749,6 +755,27 @@ class RentalGuruCreateBookingAPI(APIView):
         return Response({'booking': _serialize_booking(booking)}, status=status.HTTP_201_CREATED)
 
 
+class RentalGuruBatchImportBookingsAPI(APIView):
+    """Upsert many bookings with nested payments by source_id; see mysite/booking_import.py."""
+    renderer_classes = [JSONRenderer]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        err = _api_auth_error_response(request)
+        if err:
+            return err
+        body = dict(request.data)
+        _log_rental_guru_request(request, body)
+        try:
+            with rental_guru_user_tracking_context():
+                results = import_bookings(body.get('bookings'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        counts = {action: 0 for action in ('created', 'updated', 'unchanged', 'error')}
+        for result in results:
+            counts[result['action']] += 1
+        return Response({**{f'{action}_count': n for action, n in counts.items()}, 'results': results})
+
 class RentalGuruUpdateBookingAPI(APIView):
     renderer_classes = [JSONRenderer]
     parser_classes = [JSONParser]
@@ -858,4 +885,22 @@ class RentalGuruUpdatePaymentAPI(APIView):
         payment = Payment.objects.select_related(
             'payment_type', 'payment_method', 'bank'
         ).get(pk=form.instance.pk)
-        return Response({'payment': _serialize_payment(payment)})
\ No newline at end of file
+        return Response({'payment': _serialize_payment(payment)})
+
+class ChangeFeedAPI(APIView):
+    """Booking / payment / price / apartment changes after a cursor; see mysite/change_feed.py."""
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        err = _api_auth_error_response(request)
+        if err:
+            return err
+        cursor = request.GET.get('cursor', '')
+        models = [m.strip() for m in request.GET.get('models', '').split(',') if m.strip()]
+        try:
+            if cursor == 'latest':
+                return Response({'changes': [], 'cursor': head_cursor(), 'has_more': False})
+            page = read_changes(cursor, models=models, limit=request.GET.get('limit') or DEFAULT_FEED_LIMIT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page, content_type='application/json')
@@ -1,17 +1,18 @@
 from django.shortcuts import render
-from ..models import Apartment, Booking, Payment, CalendarNote
+from ..models import Apartment, Booking, Payment
 from django.db.models import Q
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from ..decorators import user_has_role
-from datetime import timedelta
+from ..calendar_note_intervals import CalendarNoteIntervals
+from ..price_timeline import preload_price_timelines
+from ..view_cache import conditional_view
 from calendar import monthrange
 from django.db.models import Prefetch
-import datetime
-import json
-import base64
 
 @user_has_role('Admin', "Manager")
+@conditional_view(models=('Apartment', 'ApartmentPrice', 'Booking', 'CalendarNote', 'Payment', 'PaymenType', 'User'),
+                  cache_body=True)
 def booking_availability(request):
     current_apartment_type = request.GET.get('apartment_type', '')
     booking_status = request.GET.get('booking_status', '')
@@ -76,53 +77,12 @@ def booking_availability(request):
         )
     )
 
-    # Fetch calendar notes overlapping the displayed window
+    # Calendar notes overlapping the displayed window, kept as intervals
     apartment_ids = list(apartments.values_list('id', flat=True))
+    preload_price_timelines(apartment_ids)
     apartments_for_notes = list(apartments.values('id', 'name').order_by('name'))
-    notes_qs = CalendarNote.objects.filter(
-        start_date__lte=end_date,
-        end_date__gte=start_date,
-    ).filter(
-        Q(apartment__isnull=True) | Q(apartment_id__in=apartment_ids)
-    ).select_related('apartment')
-
-    # Expand notes into per-date maps (window is small: 3 months)
-    global_notes_by_date = {}
-    apt_notes_by_date = {}
-    global_note_items_by_date = {}
-    apt_note_items_by_date = {}
-
-    def _daterange(d1, d2):
-        cur = d1
-        while cur <= d2:
-            yield cur
-            cur += timedelta(days=1)
-
-    for note in notes_qs:
-        clipped_start = max(note.start_date, start_date)
-        clipped_end = min(note.end_date, end_date)
-        for d in _daterange(clipped_start, clipped_end):
-            if note.apartment_id is None:
-                global_notes_by_date.setdefault(d, []).append(note.note)
-                global_note_items_by_date.setdefault(d, []).append({
-                    'id': note.id,
-                    'apartment_id': None,
-                    'apartment_name': None,
-                    'start_date': note.start_date.isoformat(),
-                    'end_date': note.end_date.isoformat(),
-                    'note': note.note,
-                })
-            else:
-                apt_notes_by_date.setdefault(note.apartment_id, {}).setdefault(d, []).append(note.note)
-                apt_note_items_by_date.setdefault(note.apartment_id, {}).setdefault(d, []).append({
-                    'id': note.id,
-                    'apartment_id': note.apartment_id,
-                    'apartment_name': note.apartment.name if note.apartment else None,
-                    'start_date': note.start_date.isoformat(),
-                    'end_date': note.end_date.isoformat(),
-                    'note': note.note,
-                })
-    
+    note_intervals = CalendarNoteIntervals.load(start_date, end_date, apartment_ids)
+
     # Prepare monthly data
     monthly_data = []
     current_month = start_date
@@ -183,12 +143,6 @@ def booking_availability(request):
             
             for day in range(1, days_in_month + 1):
                 date_obj = current_month.replace(day=day)
-                calendar_notes = (global_notes_by_date.get(date_obj, []) +
-                                  apt_notes_by_date.get(apartment.id, {}).get(date_obj, []))
-                calendar_note_items = (global_note_items_by_date.get(date_obj, []) +
-                                       apt_note_items_by_date.get(apartment.id, {}).get(date_obj, []))
-                calendar_notes_b64 = base64.b64encode(json.dumps(calendar_notes).encode('utf-8')).decode('ascii')
-                calendar_note_items_b64 = base64.b64encode(json.dumps(calendar_note_items).encode('utf-8')).decode('ascii')
                 apartment_data['days'][day] = {
                     'status': 'Available',
                     'is_start': False,
@@ -200,9 +154,7 @@ def booking_availability(request):
                     'booking_data': [],  # List of booking data strings
                     'booking_ids': [],  # List of booking IDs
                     'raiting': apartment.raiting,
-                    'has_calendar_note': bool(calendar_notes),
-                    'calendar_notes_b64': calendar_notes_b64,
-                    'calendar_note_items_b64': calendar_note_items_b64,
+                    'has_calendar_note': note_intervals.has_note(apartment.id, date_obj),
                 }
 
                 day_bookings = [b for b in bookings if b.start_date <= date_obj <= b.end_date]
@@ -357,6 +309,7 @@ def booking_availability(request):
         'monthly_data': monthly_data,
         'apartments': Apartment.objects.values_list('name', flat=True).distinct(),
         'apartments_for_notes': apartments_for_notes,
+        'calendar_notes_payload': note_intervals.to_payload(),
         'apartment_types': Apartment.TYPES,
         'current_apartment_type': current_apartment_type,
         'current_booking_status': booking_status,
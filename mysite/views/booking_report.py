@@ -11,6 +11,9 @@ from django.db.models import Sum
 from dateutil.relativedelta import relativedelta
 import logging
 from datetime import datetime
+from mysite.report_export import (
+    CHUNK_SIZE, STYLE_HEADER, ExportReport, ExportSheet, StyledRow, start_export_job,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,210 +35,208 @@ def booking_report(request):
             start_date = datetime.strptime(report_start_date, "%B %d %Y")
             end_date = datetime.strptime(report_end_date, "%B %d %Y")
             bookings = bookings.filter(start_date__gte=start_date, end_date__lte=end_date)
-            if (bookings):
-                booking_report_url = generate_excel(bookings, report_start_date, report_end_date)
-                logger.info(f'Report created {booking_report_url}')
-
-                return redirect(booking_report_url)
+            if bookings.exists():
+                params = {
+                    'report_start_date': report_start_date,
+                    'report_end_date': report_end_date,
+                    'manager_id': request.user.id if request.user.role == 'Manager' else None,
+                }
+                job = start_export_job('booking', request.GET.get('export_format', 'sheets'), params, user=request.user)
+                logger.info(f'Booking report export job #{job.pk} started')
+                return redirect('report_export_status', job_id=job.pk)
         return redirect(referer_url)
     except Exception as e:
         logger.info(f"Error: Generating Booking Report Error, {str(e)}")
         return redirect(referer_url)
 
 
-def generate_excel(bookings, start_date, end_date):
-    try:
-        sheets_service, drive_service = get_google_sheets_service()
-        logger.info("Got GOOGLE Services")
-        # Create a new spreadsheet
-        spreadsheet_body = {
-            'properties': {
-                'title': f"Booking Report: {start_date} - {end_date}"
-            },
-            'sheets': [{
-                'properties': {
-                    'title': 'Booking Report'
-                }
-            }]
-        }
-        spreadsheet = sheets_service.create(body=spreadsheet_body).execute()
-        spreadsheet_id = spreadsheet.get('spreadsheetId')
-        logger.info(f"Spredsheet created {spreadsheet_id}")
-        data = prepare_data(bookings)
+BOOKING_STATS_FIELDS = ('animals', 'source', 'is_rent_car', 'car_price', 'car_rent_days', 'car_model', 'visit_purpose')
+
+
+class BookingReportStats:
+    """Running totals for the booking report; fed one booking (or values() dict) at a time."""
+
+    def __init__(self):
+        self.total_bookings = 0
+        self.total_animals = 0
+        self.total_animals_cats = 0
+        self.total_animals_dogs = 0
+        self.total_animals_other = 0
+        self.total_sources = 0
+        self.total_sources_airbnb = 0
+        self.total_sources_referal = 0
+        self.total_sources_returning = 0
+        self.total_sources_other = 0
+        self.total_cars_rent = 0
+        self.car_price_sum = 0
+        self.car_price_min = None
+        self.car_price_max = None
+        self.car_rent_days_sum = 0
+        self.car_rent_days_min = None
+        self.car_rent_days_max = None
+        self.car_models = {}
+        self.total_visit_purpose = 0
+        self.total_visit_purpose_tourism = 0
+        self.total_visit_purpose_work = 0
+        self.total_visit_purpose_medical = 0
+        self.total_visit_purpose_repair = 0
+        self.total_visit_purpose_relocation = 0
+        self.total_visit_purpose_other = 0
+
+    def add(self, booking):
+        get = booking.get if isinstance(booking, dict) else lambda name: getattr(booking, name)
+        self.total_bookings += 1
 
-        # Insert summary data into the Summary sheet
-        insert_report_data(sheets_service, spreadsheet_id, data)
-
-
-        share_document_with_user(drive_service, spreadsheet_id)
-
-        # Generate and return the link to the spreadsheet
-        excel_link = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit'
-        return excel_link
-    except Exception as e:
-        logger.info("ERROR: Error while generating Excel Report", e)
-        return ""
-
-
-def prepare_data(bookings: Booking):
-    total_bookings = bookings.count()
-    data = []
-    
-    total_animals = 0
-    total_animals_cats = 0
-    total_animals_dogs = 0
-    total_animals_other = 0
-    
-    total_sources = 0
-    total_sources_airbnb = 0
-    total_sources_referal = 0
-    total_sources_returning = 0
-    total_sources_other = 0
-    
-    total_cars_rent = 0
-    car_prices = []
-    car_rent_days = []
-    car_models = {}
-    
-    total_visit_purpose = 0
-    total_visit_purpose_tourism = 0
-    total_visit_purpose_work = 0
-    total_visit_purpose_medical = 0
-    total_visit_purpose_repair = 0
-    total_visit_purpose_relocation = 0
-    total_visit_purpose_other = 0
-    
-    for booking in bookings:
-        row = { 
-            "booking_id": booking.id,
-            "apartment": booking.apartment.name, 
-            "tenant": booking.tenant.full_name, 
-            "tenant_number": int(booking.tenants_n) if booking.tenants_n else 0, 
-            "booking_days": (booking.end_date - booking.start_date).days, 
-            "visit_purpose": booking.visit_purpose, 
-            "is_car_rented": booking.is_rent_car,
-            "car_price": int(booking.car_price) if booking.car_price else 0, 
-            "car_rent_days": booking.car_rent_days, 
-            "car_model": booking.car_model,
-            "animals" : booking.animals,
-            "source" : booking.source,
-        }
-        data.append(row)
-        
         # Animals
-        if booking.animals:
-            total_animals += 1
-            if booking.animals == 'Cat':
-                total_animals_cats += 1
-            elif booking.animals == 'Dog':
-                total_animals_dogs += 1
+        animals = get('animals')
+        if animals:
+            self.total_animals += 1
+            if animals == 'Cat':
+                self.total_animals_cats += 1
+            elif animals == 'Dog':
+                self.total_animals_dogs += 1
             else:
-                total_animals_other += 1
-        
+                self.total_animals_other += 1
+
         # Sources
-        if booking.source:
-            total_sources += 1
-            if booking.source == 'Airbnb':
-                total_sources_airbnb += 1
-            elif booking.source == 'Referral':
-                total_sources_referal += 1
-            elif booking.source == 'Returning':
-                total_sources_returning += 1
+        source = get('source')
+        if source:
+            self.total_sources += 1
+            if source == 'Airbnb':
+                self.total_sources_airbnb += 1
+            elif source == 'Referral':
+                self.total_sources_referal += 1
+            elif source == 'Returning':
+                self.total_sources_returning += 1
             else:
-                total_sources_other += 1
-        
+                self.total_sources_other += 1
+
         # Cars
-        if booking.is_rent_car:
-            total_cars_rent += 1
-            car_prices.append(booking.car_price)
-            car_rent_days.append(booking.car_rent_days)
-            if booking.car_model in car_models:
-                car_models[booking.car_model] += 1
-            else:
-                car_models[booking.car_model] = 1
-        
+        if get('is_rent_car'):
+            self.total_cars_rent += 1
+            price = get('car_price')
+            days = get('car_rent_days')
+            self.car_price_sum += price
+            self.car_price_min = price if self.car_price_min is None else min(self.car_price_min, price)
+            self.car_price_max = price if self.car_price_max is None else max(self.car_price_max, price)
+            self.car_rent_days_sum += days
+            self.car_rent_days_min = days if self.car_rent_days_min is None else min(self.car_rent_days_min, days)
+            self.car_rent_days_max = days if self.car_rent_days_max is None else max(self.car_rent_days_max, days)
+            car_model = get('car_model')
+            self.car_models[car_model] = self.car_models.get(car_model, 0) + 1
+
         # Visit Purpose
-        if booking.visit_purpose:
-            total_visit_purpose += 1
-            if booking.visit_purpose == 'Tourism':
-                total_visit_purpose_tourism += 1
-            elif booking.visit_purpose == 'Work Travel':
-                total_visit_purpose_work += 1
-            elif booking.visit_purpose == 'Medical':
-                total_visit_purpose_medical += 1
-            elif booking.visit_purpose == 'House Repair':
-                total_visit_purpose_repair += 1
-            elif booking.visit_purpose == 'Relocation':
-                total_visit_purpose_relocation += 1
+        visit_purpose = get('visit_purpose')
+        if visit_purpose:
+            self.total_visit_purpose += 1
+            if visit_purpose == 'Tourism':
+                self.total_visit_purpose_tourism += 1
+            elif visit_purpose == 'Work Travel':
+                self.total_visit_purpose_work += 1
+            elif visit_purpose == 'Medical':
+                self.total_visit_purpose_medical += 1
+            elif visit_purpose == 'House Repair':
+                self.total_visit_purpose_repair += 1
+            elif visit_purpose == 'Relocation':
+                self.total_visit_purpose_relocation += 1
             else:
-                total_visit_purpose_other += 1
-    
-    # Calculate car model statistics
-    sorted_car_models = sorted(car_models.items(), key=lambda x: x[1], reverse=True)
-    sorted_car_models = sorted(car_models.items(), key=lambda x: x[1], reverse=True)
-    top_3_cars_model_name = [model[0] for model in sorted_car_models[:3]]
-    top_3_cars_model_count = [model[1] for model in sorted_car_models[:3]]
-    top_3_cars_model_percent = [int((count / total_cars_rent) * 100) for count in top_3_cars_model_count]
-
-    top_3_cars_models = ", ".join(
-        [f"{name}: {count} ({percent}%)" for name, count, percent in zip(top_3_cars_model_name, top_3_cars_model_count, top_3_cars_model_percent)]
-    )
-    
+                self.total_visit_purpose_other += 1
+
+    def as_dict(self):
+        def percent(part, whole):
+            return int((part / whole) * 100) if whole else 0
+
+        total_bookings = self.total_bookings
+        total_animals = self.total_animals
+        total_sources = self.total_sources
+        total_cars_rent = self.total_cars_rent
+        total_visit_purpose = self.total_visit_purpose
+
+        # Calculate car model statistics
+        sorted_car_models = sorted(self.car_models.items(), key=lambda x: x[1], reverse=True)[:3]
+        top_3_cars_models = ", ".join(
+            [f"{name}: {count} ({percent(count, total_cars_rent)}%)" for name, count in sorted_car_models]
+        )
+
+        return {
+            # Total Bookings
+            'total_bookings': total_bookings,
+            # Animals
+            'total_animals': total_animals,
+            'total_animals_percent': percent(total_animals, total_bookings),
+            'total_animals_cats': self.total_animals_cats,
+            'total_animals_cats_percent': percent(self.total_animals_cats, total_animals),
+            'total_animals_dogs': self.total_animals_dogs,
+            'total_animals_dogs_percent': percent(self.total_animals_dogs, total_animals),
+            'total_animals_other': self.total_animals_other,
+            'total_animals_other_percent': percent(self.total_animals_other, total_animals),
+            # Sources
+            'total_sources': total_sources,
+            'total_sources_percent': percent(total_sources, total_bookings),
+            'total_sources_airbnb': self.total_sources_airbnb,
+            'total_sources_airbnb_percent': percent(self.total_sources_airbnb, total_sources),
+            'total_sources_referal': self.total_sources_referal,
+            'total_sources_referal_percent': percent(self.total_sources_referal, total_sources),
+            'total_sources_returning': self.total_sources_returning,
+            'total_sources_returning_percent': percent(self.total_sources_returning, total_sources),
+            'total_sources_other': self.total_sources_other,
+            'total_sources_other_percent': percent(self.total_sources_other, total_sources),
+            # Cars
+            'total_cars_rent': total_cars_rent,
+            'total_cars_rent_percent': percent(total_cars_rent, total_bookings),
+            'top_3_cars_models': top_3_cars_models,
+            "min_car_rent_price": int(self.car_price_min) if total_cars_rent else 0,
+            "max_car_rent_price": int(self.car_price_max) if total_cars_rent else 0,
+            "avg_car_rent_price": int(self.car_price_sum / total_cars_rent) if total_cars_rent else 0,
+            "min_car_rent_days": int(self.car_rent_days_min) if total_cars_rent else 0,
+            "max_car_rent_days": int(self.car_rent_days_max) if total_cars_rent else 0,
+            "avg_car_rent_days": int(self.car_rent_days_sum / total_cars_rent) if total_cars_rent else 0,
+            # Visit Purpose
+            'total_visit_purpose': total_visit_purpose,
+            'total_visit_purpose_percent': percent(total_visit_purpose, total_bookings),
+            'total_visit_purpose_tourism': self.total_visit_purpose_tourism,
+            'total_visit_purpose_tourism_percent': percent(self.total_visit_purpose_tourism, total_visit_purpose),
+            'total_visit_purpose_work': self.total_visit_purpose_work,
+            'total_visit_purpose_work_percent': percent(self.total_visit_purpose_work, total_visit_purpose),
+            'total_visit_purpose_medical': self.total_visit_purpose_medical,
+            'total_visit_purpose_medical_percent': percent(self.total_visit_purpose_medical, total_visit_purpose),
+            'total_visit_purpose_repair': self.total_visit_purpose_repair,
+            'total_visit_purpose_repair_percent': percent(self.total_visit_purpose_repair, total_visit_purpose),
+            'total_visit_purpose_relocation': self.total_visit_purpose_relocation,
+            'total_visit_purpose_relocation_percent': percent(self.total_visit_purpose_relocation, total_visit_purpose),
+            'total_visit_purpose_other': self.total_visit_purpose_other,
+            'total_visit_purpose_other_percent': percent(self.total_visit_purpose_other, total_visit_purpose),
+        }
+
+
+def booking_row(booking):
     return {
-        "data": data,
-        # Total Bookings
-        'total_bookings': total_bookings,
-        # Animals
-        'total_animals': total_animals,
-        'total_animals_percent': int((total_animals / total_bookings) * 100) if total_bookings else 0,
-        'total_animals_cats': total_animals_cats,
-        'total_animals_cats_percent': int((total_animals_cats / total_animals) * 100) if total_animals else 0,
-        'total_animals_dogs': total_animals_dogs,
-        'total_animals_dogs_percent': int((total_animals_dogs / total_animals) * 100) if total_animals else 0,
-        'total_animals_other': total_animals_other,
-        'total_animals_other_percent': int((total_animals_other / total_animals) * 100) if total_animals else 0,
-        # Sources
-        'total_sources': total_sources,
-        'total_sources_percent': int((total_sources / total_bookings) * 100) if total_bookings else 0,
-        'total_sources_airbnb': total_sources_airbnb,
-        'total_sources_airbnb_percent': int((total_sources_airbnb / total_sources) * 100) if total_sources else 0,
-        'total_sources_referal': total_sources_referal,
-        'total_sources_referal_percent': int((total_sources_referal / total_sources) * 100) if total_sources else 0,
-        'total_sources_returning': total_sources_returning,
-        'total_sources_returning_percent': int((total_sources_returning / total_sources) * 100) if total_sources else 0,
-        'total_sources_other': total_sources_other,
-        'total_sources_other_percent': int((total_sources_other / total_sources) * 100) if total_sources else 0,
-        # Cars
-        'total_cars_rent': total_cars_rent,
-        'total_cars_rent_percent': int((total_cars_rent / total_bookings) * 100) if total_bookings else 0,
-        'top_3_cars_models': top_3_cars_models,
-        "min_car_rent_price": int(min(car_prices)) if car_prices else 0,
-        "max_car_rent_price": int(max(car_prices)) if car_prices else 0,
-        "avg_car_rent_price": int(sum(car_prices) / len(car_prices)) if car_prices else 0,
-        "min_car_rent_days": int(min(car_rent_days)) if car_rent_days else 0,
-        "max_car_rent_days": int(max(car_rent_days)) if car_rent_days else 0,
-        "avg_car_rent_days": int(sum(car_rent_days) / len(car_rent_days)) if car_rent_days else 0,
-        # Visit Purpose
-        'total_visit_purpose': total_visit_purpose,
-        'total_visit_purpose_percent': int((total_visit_purpose / total_bookings) * 100) if total_bookings else 0,
-        'total_visit_purpose_tourism': total_visit_purpose_tourism,
-        'total_visit_purpose_tourism_percent': int((total_visit_purpose_tourism / total_visit_purpose) * 100) if total_visit_purpose else 0,
-        'total_visit_purpose_work': total_visit_purpose_work,
-        'total_visit_purpose_work_percent': int((total_visit_purpose_work / total_visit_purpose) * 100) if total_visit_purpose else 0,
-        'total_visit_purpose_medical': total_visit_purpose_medical,
-        'total_visit_purpose_medical_percent': int((total_visit_purpose_medical / total_visit_purpose) * 100) if total_visit_purpose else 0,
-        'total_visit_purpose_repair': total_visit_purpose_repair,
-        'total_visit_purpose_repair_percent': int((total_visit_purpose_repair / total_visit_purpose) * 100) if total_visit_purpose else 0,
-        'total_visit_purpose_relocation': total_visit_purpose_relocation,
-        'total_visit_purpose_relocation_percent': int((total_visit_purpose_relocation / total_visit_purpose) * 100) if total_visit_purpose else 0,
-        'total_visit_purpose_other': total_visit_purpose_other,
-        'total_visit_purpose_other_percent': int((total_visit_purpose_other / total_visit_purpose) * 100) if total_visit_purpose else 0,
+        "booking_id": booking.id,
+        "apartment": booking.apartment.name if booking.apartment else '',
+        "tenant": booking.tenant.full_name if booking.tenant else '',
+        "tenant_number": int(booking.tenants_n) if booking.tenants_n else 0,
+        "booking_days": (booking.end_date - booking.start_date).days,
+        "visit_purpose": booking.visit_purpose,
+        "is_car_rented": booking.is_rent_car,
+        "car_price": int(booking.car_price) if booking.car_price else 0,
+        "car_rent_days": booking.car_rent_days,
+        "car_model": booking.car_model,
+        "animals": booking.animals,
+        "source": booking.source,
     }
 
 
-def insert_report_data(sheets_service, spreadsheet_id, data):
-    # Prepare the report values
-    report_values = [
+def prepare_data(bookings: Booking):
+    stats = BookingReportStats()
+    data = []
+    for booking in bookings.select_related('apartment', 'tenant'):
+        stats.add(booking)
+        data.append(booking_row(booking))
+    return {"data": data, **stats.as_dict()}
+
+
+def booking_stats_rows(data):
+    return [
         ["Total Bookings", data['total_bookings']],
         ["Total Animals", data['total_animals']],
         ["Total Animals Percent", data['total_animals_percent']],
@@ -280,42 +281,45 @@ def insert_report_data(sheets_service, spreadsheet_id, data):
         ["Total Other Visit Purpose Percent", data['total_visit_purpose_other_percent']],
     ]
 
-    # Add a blank row to separate statistics from the data rows
-    report_values.append([])
-
-    # Add column names for the row data
-    report_values.append([
-        "Booking ID", "Apartment", "Tenant", "Tenant Number", "Booking Days",
-        "Visit Purpose", "Is Car Rented", "Car Price", "Car Rent Days",
-        "Car Model", "Animals", "Source"
-    ])
-
-    # Add the data rows
-    for row in data['data']:
-        report_values.append([
-            row['booking_id'],
-            row['apartment'],
-            row['tenant'],
-            row['tenant_number'],
-            row['booking_days'],
-            row['visit_purpose'],
-            row['is_car_rented'],
-            row['car_price'],
-            row['car_rent_days'],
-            row['car_model'],
-            row['animals'],
-            row['source']
-        ])
-
-    # Define the range where the data will be inserted
-    data_range = 'Booking Report!A1'
-
-    # Update the spreadsheet with the report values
-    sheets_service.values().update(
-        spreadsheetId=spreadsheet_id, range=data_range,
-        valueInputOption='USER_ENTERED', body={'values': report_values}).execute()
-
-    logger.info(f"Created Booking Report Sheet for {spreadsheet_id}")
+
+BOOKING_EXPORT_COLUMNS = [
+    "Booking ID", "Apartment", "Tenant", "Tenant Number", "Booking Days",
+    "Visit Purpose", "Is Car Rented", "Car Price", "Car Rent Days",
+    "Car Model", "Animals", "Source"
+]
+
+
+def export_booking_report(params):
+    """
+    Report source for mysite.report_export. Statistics come from a first
+    streaming pass over values() rows, then booking rows are streamed again
+    so neither pass keeps the bookings in memory.
+    """
+    start_date = datetime.strptime(params['report_start_date'], "%B %d %Y")
+    end_date = datetime.strptime(params['report_end_date'], "%B %d %Y")
+    bookings = Booking.objects.exclude(status='Cancelled')
+    if params.get('manager_id'):
+        bookings = bookings.filter(apartment__managers__id=params['manager_id'])
+    bookings = bookings.filter(start_date__gte=start_date, end_date__lte=end_date).order_by('start_date', 'id')
+
+    stats = BookingReportStats()
+    for values in bookings.values(*BOOKING_STATS_FIELDS).iterator(chunk_size=CHUNK_SIZE):
+        stats.add(values)
+
+    def rows():
+        yield from booking_stats_rows(stats.as_dict())
+        yield []
+        yield StyledRow(BOOKING_EXPORT_COLUMNS, STYLE_HEADER)
+        for booking in bookings.select_related('apartment', 'tenant').iterator(chunk_size=CHUNK_SIZE):
+            yield list(booking_row(booking).values())
+
+    title = f"Booking Report: {params['report_start_date']} - {params['report_end_date']}"
+    return ExportReport(
+        title,
+        [ExportSheet('Booking Report', rows(), columns=len(BOOKING_EXPORT_COLUMNS))],
+        total_rows=stats.total_bookings,
+    )
+
 
 def get_google_sheets_service():
     SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
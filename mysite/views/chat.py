@@ -1,11 +1,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Max, Q
+from django.db.models import Q
 from django.utils import timezone
-from django.core.paginator import Paginator
+from mysite import chat_stream
+from mysite.chat_directory import get_chat_directory
 from mysite.models import TwilioConversation, TwilioMessage, User, ChatMessageTemplate
 from mysite.views.messaging import (
     send_messsage_by_sid,
@@ -29,6 +31,7 @@ ASSISTANT_IDENTITY = "ASSISTANT"
 ASSISTANT_PROJECTED_PHONE = "+13153524379"
 # Other system phones that can appear as authors.
 SYSTEM_PHONES = {"+13153524379", "+17282001917", MANAGER_PHONE, MANAGER_PHONE_2, MANAGER_PHONE_3}
+MESSAGES_PAGE_SIZE = 50
 
 
 def _is_e164(value: str) -> bool:
@@ -55,10 +58,11 @@ def _dedupe_preserve_order(items):
     return out
 
 
-def _build_conversation_participants(conversation):
+def _build_conversation_participants(conversation, authors=None, users_by_phone=None):
     """
     Build a participant list based on booking + message authors, enriched with user names.
     Each item includes `formatted` in the requested: number (name).
+    ``authors`` (most recent first) and ``users_by_phone`` may be preloaded (see mysite/chat_directory.py).
     """
     raw_candidates = []
 
@@ -73,12 +77,12 @@ def _build_conversation_participants(conversation):
             raw_candidates.append(tenant_phone)
 
     # Add any author values we have stored for this conversation.
-    try:
-        raw_candidates.extend(
-            [a for a in conversation.messages.values_list("author", flat=True).distinct() if a]
-        )
-    except Exception:
-        pass
+    if authors is None:
+        try:
+            authors = list(conversation.messages.values_list("author", flat=True).distinct())
+        except Exception:
+            authors = []
+    raw_candidates.extend([a for a in authors if a])
 
     # Ensure we always include manager + assistant.
     raw_candidates.extend([MANAGER_PHONE, MANAGER_PHONE_2, MANAGER_PHONE_3, ASSISTANT_IDENTITY, "Virtual Assistant"])
@@ -89,10 +93,11 @@ def _build_conversation_participants(conversation):
     phones = [x for x in raw_candidates if _is_e164(x)]
     phones = _dedupe_preserve_order(phones)
 
-    users_by_phone = {}
-    if phones:
-        for u in User.objects.filter(phone__in=phones).only("phone", "full_name", "role"):
-            users_by_phone[(u.phone or "").strip()] = u
+    if users_by_phone is None:
+        users_by_phone = {}
+        if phones:
+            for u in User.objects.filter(phone__in=phones).only("phone", "full_name", "role"):
+                users_by_phone[(u.phone or "").strip()] = u
 
     participants = []
     assistant_added = False
@@ -163,6 +168,45 @@ def _build_author_display_map(participants):
     return author_map
 
 
+def _message_payload(message, author_display_map):
+    """JSON shape of a message used by load_more_messages and the live stream."""
+    raw_author = (message.author or "").strip()
+    return {
+        'id': message.id,
+        'author': message.author,
+        'author_display': author_display_map.get(raw_author, _format_number_name(raw_author, "Unknown")),
+        'body': message.body,
+        'direction': message.direction,
+        'timestamp': message.message_timestamp.isoformat(),
+        'formatted_time': message.message_timestamp.strftime('%b %d, %Y at %I:%M %p'),
+        'ai_response': message.ai_response,
+        'ai_sent_to_chat': message.ai_sent_to_chat,
+        'ai_kb_updated': message.ai_kb_updated,
+        'ai_kb_changes': message.ai_kb_changes,
+        'forwarded_to_group_sid': message.forwarded_to_group_sid,
+    }
+
+
+def _message_cursor(message):
+    return chat_stream.encode_cursor(message.message_timestamp, message.id)
+
+
+def _messages_before(conversation, cursor):
+    """
+    Up to MESSAGES_PAGE_SIZE messages before ``cursor`` ((message_timestamp, id),
+    None for the newest), oldest first, and whether older ones exist.
+    """
+    messages = conversation.messages.order_by('-message_timestamp', '-id')
+    if cursor is not None:
+        timestamp, message_id = cursor
+        messages = messages.filter(
+            Q(message_timestamp__lt=timestamp) | Q(message_timestamp=timestamp, id__lt=message_id)
+        )
+    page = list(messages[:MESSAGES_PAGE_SIZE + 1])
+    has_older = len(page) > MESSAGES_PAGE_SIZE
+    return page[:MESSAGES_PAGE_SIZE][::-1], has_older
+
+
 @login_required
 def chat_list(request):
     """
@@ -171,46 +215,23 @@ def chat_list(request):
     # Get search query
     search_query = request.GET.get('q', '').strip()
     
-    # Get all conversations with their latest message timestamp
-    base_conversations = TwilioConversation.objects.annotate(
-        last_message_time=Max('messages__message_timestamp')
-    ).filter(
-        last_message_time__isnull=False  # Only conversations with messages
-    )
-
-    total_all_conversations = base_conversations.count()
-
-    conversations = base_conversations
+    # Shared sidebar summary: display info, latest message and count per conversation
+    directory = get_chat_directory()
+    conversation_data = directory.rows
+    total_all_conversations = len(conversation_data)
     
     # Apply search filter if provided
     if search_query:
-        conversations = conversations.filter(
+        matching_ids = set(TwilioConversation.objects.filter(
             Q(booking__tenant__full_name__icontains=search_query) |
             Q(booking__tenant__phone__icontains=search_query) |
             Q(apartment__name__icontains=search_query) |
             Q(friendly_name__icontains=search_query) |
             Q(messages__author__icontains=search_query)
-        ).distinct()
-    
-    conversations = conversations.order_by('-last_message_time')
+        ).values_list('id', flat=True))
+        conversation_data = [row for row in conversation_data if row['conversation'].pk in matching_ids]
 
-    total_conversations = conversations.count()
-    
-    # Prepare conversation data with display information
-    conversation_data = []
-    for conv in conversations:
-        # Get tenant info from conversation messages
-        display_info = get_conversation_display_info(conv)
-        
-        # Get latest message preview
-        latest_message = conv.messages.order_by('-message_timestamp').first()
-        
-        conversation_data.append({
-            'conversation': conv,
-            'display_info': display_info,
-            'latest_message': latest_message,
-            'message_count': conv.messages.count(),
-        })
+    total_conversations = len(conversation_data)
     
     return render(request, 'chat/chat_list.html', {
         'title': 'Chat Interface',
@@ -228,20 +249,12 @@ def chat_detail(request, conversation_sid):
     """
     conversation = get_object_or_404(TwilioConversation, conversation_sid=conversation_sid)
     
-    # Get messages with pagination
-    chat_messages = conversation.messages.order_by('message_timestamp')
-    paginator = Paginator(chat_messages, 50)  # Show 50 messages per page
-
-    # Default to the latest page so the UI opens at the bottom (most recent messages).
-    page_number = request.GET.get('page')
-    if not page_number:
-        page_number = paginator.num_pages or 1
+    # Newest page first, keyset on (message_timestamp, id): no COUNT and no OFFSET
+    page_messages, has_older = _messages_before(conversation, None)
 
-    page_messages = paginator.get_page(page_number)
-    
-    # Get conversation display info
-    display_info = get_conversation_display_info(conversation)
-    author_display_map = _build_author_display_map(display_info.get("participants") or [])
+    directory = get_chat_directory()
+    display_info = directory.display_info(conversation)
+    author_display_map = directory.author_display_map(conversation)
 
     # Add display author to messages for the template
     for m in page_messages:
@@ -252,23 +265,10 @@ def chat_detail(request, conversation_sid):
         ChatMessageTemplate.objects.order_by("name", "-created_at").values("id", "name", "body")
     )
 
-    # Get all conversations for sidebar
-    all_conversations = TwilioConversation.objects.annotate(
-        last_message_time=Max('messages__message_timestamp')
-    ).filter(
-        last_message_time__isnull=False
-    ).order_by('-last_message_time')
-    
-    sidebar_conversations = []
-    for conv in all_conversations:
-        sidebar_info = get_conversation_display_info(conv)
-        latest_message = conv.messages.order_by('-message_timestamp').first()
-        sidebar_conversations.append({
-            'conversation': conv,
-            'display_info': sidebar_info,
-            'latest_message': latest_message,
-            'is_active': conv.conversation_sid == conversation_sid,
-        })
+    sidebar_conversations = [
+        {**row, 'is_active': row['conversation'].conversation_sid == conversation_sid}
+        for row in directory.rows
+    ]
     
     return render(request, 'chat/chat_detail.html', {
         'title': f'Chat - {display_info["name"]}',
@@ -278,8 +278,10 @@ def chat_detail(request, conversation_sid):
         'sidebar_conversations': sidebar_conversations,
         'outbound_author_display': author_display_map.get(ASSISTANT_IDENTITY, _format_number_name(ASSISTANT_PROJECTED_PHONE, "Assistant")),
         'chat_templates': chat_templates,
-        'messages_page_number': page_messages.number,
-        'messages_has_previous': page_messages.has_previous(),
+        'messages_before': _message_cursor(page_messages[0]) if has_older else '',
+        'messages_has_previous': has_older,
+        'stream_cursor': chat_stream.conversation_cursor(conversation),
+        'stream_mode': 'sse' if isinstance(request, ASGIRequest) else 'poll',
     })
 
 
@@ -387,6 +389,7 @@ def send_message(request, conversation_sid):
                                 sent_message.ai_response = ai_resp
                                 sent_message.ai_sent_to_chat = False
                                 sent_message.save(update_fields=['ai_response', 'ai_sent_to_chat', 'updated_at'])
+                                chat_stream.notify_conversation(conversation_sid)
                             log_ai_customer_sent(conversation_sid, ai_resp)
                 except Exception as e:
                     log_exception(error=e, context="Chat - AI answer (client)", additional_info={'conversation_sid': conversation_sid})
@@ -533,41 +536,18 @@ def load_more_messages(request, conversation_sid):
     try:
         conversation = get_object_or_404(TwilioConversation, conversation_sid=conversation_sid)
         
-        # Get pagination parameters
-        page = int(request.GET.get('page', 1))
-        
-        # Get messages
-        chat_messages = conversation.messages.order_by('message_timestamp')
-        paginator = Paginator(chat_messages, 50)
-        page_messages = paginator.get_page(page)
+        # Messages older than the ``before`` cursor (oldest first); newest page without one
+        before = chat_stream.decode_cursor(request.GET.get('before'))
+        page_messages, has_older = _messages_before(conversation, before)
         
         # Prepare message data for JSON response
-        display_info = get_conversation_display_info(conversation)
-        author_display_map = _build_author_display_map(display_info.get("participants") or [])
-        messages_data = []
-        for message in page_messages:
-            raw_author = (message.author or "").strip()
-            messages_data.append({
-                'id': message.id,
-                'author': message.author,
-                'author_display': author_display_map.get(raw_author, _format_number_name(raw_author, "Unknown")),
-                'body': message.body,
-                'direction': message.direction,
-                'timestamp': message.message_timestamp.isoformat(),
-                'formatted_time': message.message_timestamp.strftime('%b %d, %Y at %I:%M %p'),
-                'ai_response': message.ai_response,
-                'ai_sent_to_chat': message.ai_sent_to_chat,
-                'ai_kb_updated': message.ai_kb_updated,
-                'ai_kb_changes': message.ai_kb_changes,
-                'forwarded_to_group_sid': message.forwarded_to_group_sid,
-            })
+        author_display_map = get_chat_directory().author_display_map(conversation)
+        messages_data = [_message_payload(message, author_display_map) for message in page_messages]
         
         return JsonResponse({
             'messages': messages_data,
-            'has_next': page_messages.has_next(),
-            'has_previous': page_messages.has_previous(),
-            'current_page': page,
-            'total_pages': paginator.num_pages,
+            'has_previous': has_older,
+            'before': _message_cursor(page_messages[0]) if has_older else None,
         })
         
     except Exception as e:
@@ -579,6 +559,37 @@ def load_more_messages(request, conversation_sid):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["GET"])
+def chat_message_stream(request, conversation_sid):
+    """
+    New and AI-updated messages (see mysite/chat_stream.py): a Server-Sent Events
+    stream under ASGI, one JSON short poll under WSGI. Resumes after the
+    ``Last-Event-ID`` header, or ``?cursor=`` for the page's first connection and polls.
+    """
+    conversation = get_object_or_404(TwilioConversation, conversation_sid=conversation_sid)
+    raw_cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    cursor = chat_stream.decode_cursor(raw_cursor)
+    if cursor is None:
+        raw_cursor = chat_stream.conversation_cursor(conversation)
+        cursor = chat_stream.decode_cursor(raw_cursor)
+    sent = chat_stream.decode_sent(raw_cursor)
+
+    author_display_map = get_chat_directory().author_display_map(conversation)
+
+    def serialize(message):
+        return _message_payload(message, author_display_map)
+
+    # Under WSGI a waiting stream would hold a sync worker, so answer at once and let the page poll
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(chat_stream.poll_changes(conversation, cursor, serialize, sent))
+    events = chat_stream.astream_events(conversation, cursor, serialize, sent=sent)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_http_methods(["GET"])
 def chat_template_list(request):
@@ -626,10 +637,12 @@ def chat_template_create(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def get_conversation_display_info(conversation):
+def get_conversation_display_info(conversation, authors=None, users_by_phone=None, tenants_by_phone=None):
     """
     Get display information for a conversation sidebar
     Returns dict with name, apartment, booking dates, and phone
+    ``authors`` (most recent first), ``users_by_phone`` and ``tenants_by_phone``
+    may be preloaded so no queries run (see mysite/chat_directory.py).
     """
     display_info = {
         'name': 'Unknown',
@@ -664,9 +677,12 @@ def get_conversation_display_info(conversation):
             system_phones = list(SYSTEM_PHONES)
             system_identities = ["ASSISTANT", "Virtual Assistant"]
             
-            customer_messages = conversation.messages.exclude(
-                author__in=system_phones + system_identities
-            ).values_list('author', flat=True).distinct()
+            if authors is not None:
+                customer_messages = [a for a in authors if a and a not in system_phones + system_identities]
+            else:
+                customer_messages = conversation.messages.exclude(
+                    author__in=system_phones + system_identities
+                ).values_list('author', flat=True).distinct()
             
             if customer_messages:
                 # Use first customer phone found
@@ -675,7 +691,10 @@ def get_conversation_display_info(conversation):
                 
                 # Try to find tenant by phone
                 try:
-                    tenant = User.objects.filter(phone=customer_phone, role='Tenant').first()
+                    if tenants_by_phone is not None:
+                        tenant = tenants_by_phone.get(customer_phone)
+                    else:
+                        tenant = User.objects.filter(phone=customer_phone, role='Tenant').first()
                     if tenant:
                         display_info['name'] = tenant.full_name or customer_phone
                     else:
@@ -687,7 +706,7 @@ def get_conversation_display_info(conversation):
                 display_info['name'] = conversation.friendly_name or f"Conversation {conversation.conversation_sid[:8]}"
         
         # Always build participants (used in list + header + message author labels)
-        participants = _build_conversation_participants(conversation)
+        participants = _build_conversation_participants(conversation, authors, users_by_phone)
         display_info['participants'] = participants
         display_info['participants_text'] = ", ".join([p["formatted"] for p in participants])
 
@@ -695,7 +714,7 @@ def get_conversation_display_info(conversation):
         
     except Exception as e:
         display_info['name'] = conversation.friendly_name or f"Conversation {conversation.conversation_sid[:8]}"
-        participants = _build_conversation_participants(conversation)
+        participants = _build_conversation_participants(conversation, authors, users_by_phone)
         display_info['participants'] = participants
         display_info['participants_text'] = ", ".join([p["formatted"] for p in participants])
         return display_info
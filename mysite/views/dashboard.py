@@ -9,10 +9,12 @@ from collections import defaultdict
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from ..decorators import user_has_role
+from ..view_cache import conditional_view
 from .utils import generate_weeks, DateEncoder, handle_post_request, get_model_fields
 
 
 @user_has_role('Admin', "Manager")
+@conditional_view(models=('Apartment', 'Booking', 'Cleaning', 'Payment', 'PaymenType', 'User'), cache_body=True)
 def index(request):
 
     page = request.GET.get('page', 1)
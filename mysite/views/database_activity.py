@@ -2,7 +2,8 @@
 Database Activity Monitoring View
 Provides a comprehensive interface to monitor all database changes, errors, and system logs.
 """
-from django.shortcuts import render
+from django.shortcuts import render, redirect
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.db.models import Count, Q, F
@@ -10,6 +11,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from mysite.models import AuditLog, ErrorLog, SystemLog, Payment, Booking, Cleaning, Apartment, User
 from mysite.unified_logger import log_info
+from mysite import activity_rollup, query_inspector
 import json
 
 
@@ -384,83 +386,80 @@ def database_activity(request):
     # Models to exclude from monitoring
     EXCLUDED_MODELS = ['Migration', 'ErrorLog', 'SystemLog', 'TwilioConversation', 'TwilioMessage']
     
+    # Closed hours are counted from the activity rollups (mysite/activity_rollup.py, compacted by cron)
+    
     # === AUDIT LOGS ===
-    audit_logs = AuditLog.objects.filter(timestamp__gte=start_date).exclude(model_name__in=EXCLUDED_MODELS)
+    # Filters as rollup dimension lookups, applied to the raw rows through raw_lookups
+    audit_filters = {}
+    excluded_kinds = list(EXCLUDED_MODELS)
     
     if action_filter:
-        audit_logs = audit_logs.filter(action=action_filter)
+        audit_filters['action'] = action_filter
     if model_filter:
         if model_filter == 'Parking':
-            audit_logs = audit_logs.filter(model_name='Parking')
+            audit_filters['kind'] = 'Parking'
         else:
-            audit_logs = audit_logs.filter(model_name__icontains=model_filter)
+            audit_filters['kind__icontains'] = model_filter
     if user_filter:
-        audit_logs = audit_logs.filter(changed_by__icontains=user_filter)
+        audit_filters['user__icontains'] = user_filter
+    if apartment_filter and apartment_filter.lower() == 'parking':
+        # ParkingBooking also has an 'apartment' field, keep it out when filtering by 'parking'
+        excluded_kinds.append('ParkingBooking')
+    audit_excludes = {'kind__in': excluded_kinds}
+    
+    audit_logs = AuditLog.objects.filter(
+        timestamp__gte=start_date, **activity_rollup.raw_lookups('audit', audit_filters)
+    ).exclude(**activity_rollup.raw_lookups('audit', audit_excludes))
+    
     if apartment_filter:
-        # Filter by apartment name in object_repr or in new_values/old_values fields
-        # Also exclude ParkingBooking if filtering by apartment to avoid confusion, 
-        # as ParkingBooking also has an 'apartment' field but user wants to separate them
+        # Indexed apartment_id captured at write time (see signals.get_audit_contexts), or the
+        # captured name for deleted apartments and rows without an apartment id (parking)
         audit_logs = audit_logs.filter(
-            Q(object_repr__icontains=apartment_filter) |
-            Q(new_values__icontains=apartment_filter) |
-            Q(old_values__icontains=apartment_filter)
+            Q(apartment_id__in=Apartment.objects.filter(name__icontains=apartment_filter).values('id')) |
+            Q(apartment_name__icontains=apartment_filter)
         )
-        if apartment_filter.lower() == 'parking':
-            audit_logs = audit_logs.exclude(model_name='ParkingBooking')
-            
     if search_query:
         audit_logs = audit_logs.filter(
             Q(object_repr__icontains=search_query) |
             Q(model_name__icontains=search_query) |
             Q(changed_by__icontains=search_query)
         )
+    if search_query or apartment_filter:
+        # Free-text search and apartment names are not rollup dimensions: one conditional-aggregation query
+        audit_summary = audit_logs.aggregate(
+            create=Count('id', filter=Q(action='create')),
+            update=Count('id', filter=Q(action='update')),
+            delete=Count('id', filter=Q(action='delete')),
+        )
+    else:
+        audit_summary = activity_rollup.count_by('audit', 'action', start_date, filters=audit_filters, excludes=audit_excludes)
     # Summary statistics for audit logs (calculated before pagination)
-    total_audit_logs = audit_logs.count()
-    creates_count = audit_logs.filter(action='create').count()
-    updates_count = audit_logs.filter(action='update').count()
-    deletes_count = audit_logs.filter(action='delete').count()
+    creates_count = audit_summary.get('create', 0)
+    updates_count = audit_summary.get('update', 0)
+    deletes_count = audit_summary.get('delete', 0)
+    total_audit_logs = creates_count + updates_count + deletes_count
     
-    # Pagination - paginate the full queryset (Django will handle it efficiently)
+    # Pagination - paginate the full queryset, reusing the total instead of a second COUNT
     page = request.GET.get('page', 1)
     # Use 50 items per page
     paginator = Paginator(audit_logs.order_by('-timestamp'), 50)
+    paginator.count = total_audit_logs
     page_obj = paginator.get_page(page)
     
-    # Build logs_by_date from the CURRENT PAGE's logs
-    logs_by_date = {}
-    
-    # Pre-fetch tenant names for booking-related objects to avoid N+1
-    booking_ids = []
-    payment_booking_ids = []
-    cleaning_booking_ids = []
-    notification_booking_ids = []
+    # Map model names to URL keys for linking
+    MODEL_URL_MAP = {
+        'Payment': 'payments',
+        'Booking': 'bookings',
+        'Cleaning': 'cleanings',
+        'Apartment': 'apartments',
+        'User': 'users',
+        'Parking': 'parking',
+        'ParkingBooking': 'parking-bookings',
+        'Notification': 'notifications',
+    }
     
-    for log in page_obj.object_list:
-        if log.model_name == 'Booking':
-            booking_ids.append(log.object_id)
-        elif log.model_name in ['Payment', 'Cleaning', 'Notification']:
-            bid = None
-            # Check new_values and old_values for 'booking' field
-            # It could be an ID (int/str) or a string representation (e.g., "815 Flamingo")
-            for vals in [log.new_values, log.old_values]:
-                if vals and vals.get('booking'):
-                    val = vals.get('booking')
-                    if str(val).isdigit():
-                        bid = val
-                        break
-                    # If it's not a digit, it might be a string representation like "815 Flamingo"
-                    # In that case, we can't easily get the ID without another query, 
-                    # but AuditLog usually stores the ID for ForeignKey fields in JSON.
-                    # Let's check if there's a booking_id field or similar if 'booking' is a string.
-            if bid:
-                if log.model_name == 'Payment':
-                    payment_booking_ids.append(bid)
-                elif log.model_name == 'Cleaning':
-                    cleaning_booking_ids.append(bid)
-                elif log.model_name == 'Notification':
-                    notification_booking_ids.append(bid)
-    
-    # Build logs_by_date from the CURRENT PAGE's logs
+    # Build logs_by_date from the CURRENT PAGE's logs; booking/apartment/tenant
+    # links come from the log's own context columns, no per-row lookups
     logs_by_date = {}
     
     for log in page_obj.object_list:
@@ -477,92 +476,7 @@ def database_activity(request):
                 'logs': []
             }
         
-        # Add extended data to log object if it's booking-related
-        log.tenant_name = None
-        log.tenant_id = None
-        log.booking_id = None
-        log.booking_repr = None
-        log.apartment_name = None
-        log.apartment_id = None
-        log.model_url_key = None
-        
-        # Map model names to URL keys for linking
-        MODEL_URL_MAP = {
-            'Payment': 'payments',
-            'Booking': 'bookings',
-            'Cleaning': 'cleanings',
-            'Apartment': 'apartments',
-            'User': 'users',
-            'Parking': 'parking',
-            'ParkingBooking': 'parking-bookings',
-            'Notification': 'notifications',
-        }
         log.model_url_key = MODEL_URL_MAP.get(model_name)
-        
-        # 1. Try to find IDs in log data
-        booking_id = None
-        if model_name == 'Booking':
-            booking_id = log.object_id
-        else:
-            for vals in [log.new_values, log.old_values]:
-                if vals and vals.get('booking'):
-                    val = vals.get('booking')
-                    if isinstance(val, dict) and 'id' in val:
-                        booking_id = val['id']
-                        break
-                    elif str(val).isdigit():
-                        booking_id = val
-                        break
-        
-        # 2. If we have a booking ID, get extended info
-        if booking_id:
-            try:
-                booking = Booking.objects.filter(id=int(booking_id)).select_related('tenant', 'apartment').first()
-                if booking:
-                    log.booking_id = booking.id
-                    log.booking_repr = str(booking)
-                    if booking.tenant:
-                        log.tenant_name = booking.tenant.full_name
-                        log.tenant_id = booking.tenant.id
-                    if booking.apartment:
-                        log.apartment_name = booking.apartment.name
-                        log.apartment_id = booking.apartment.id
-            except (ValueError, TypeError):
-                pass
-        
-        # 3. Fallback: If no data yet, check if the object itself still exists
-        if not log.tenant_name or not log.apartment_name:
-            try:
-                from django.apps import apps
-                model_class = apps.get_model('mysite', model_name)
-                obj = model_class.objects.filter(id=log.object_id).first()
-                if obj:
-                    # Check for booking attribute
-                    if hasattr(obj, 'booking') and obj.booking:
-                        log.booking_id = obj.booking.id
-                        log.booking_repr = str(obj.booking)
-                        if obj.booking.tenant:
-                            log.tenant_name = obj.booking.tenant.full_name
-                            log.tenant_id = obj.booking.tenant.id
-                        if obj.booking.apartment:
-                            log.apartment_name = obj.booking.apartment.name
-                            log.apartment_id = obj.booking.apartment.id
-                    # Or if it's a booking itself
-                    elif model_name == 'Booking':
-                        log.booking_id = obj.id
-                        log.booking_repr = str(obj)
-                        if hasattr(obj, 'tenant') and obj.tenant:
-                            log.tenant_name = obj.tenant.full_name
-                            log.tenant_id = obj.tenant.id
-                        if hasattr(obj, 'apartment') and obj.apartment:
-                            log.apartment_name = obj.apartment.name
-                            log.apartment_id = obj.apartment.id
-                    # Or if it's an apartment
-                    elif model_name == 'Apartment':
-                        log.apartment_name = obj.name
-                        log.apartment_id = obj.id
-            except Exception:
-                pass
 
         logs_by_date[date_key][model_name][f"{log.action}s"] += 1
         # Store all logs from current page
@@ -588,11 +502,24 @@ def database_activity(request):
             Q(error_type__icontains=search_query)
         )
     
-    # Error statistics
-    total_errors = error_logs.count()
+    # Error statistics (rollups unless filtering on fields they do not keep)
+    if error_type_filter or resolved_filter or search_query:
+        total_errors = error_logs.count()
+        critical_errors = error_logs.filter(severity='critical').count()
+        high_errors = error_logs.filter(severity='high').count()
+    else:
+        error_filters = {}
+        if severity_filter:
+            error_filters['action'] = severity_filter
+        if source_filter:
+            error_filters['kind'] = source_filter
+        if user_filter:
+            error_filters['user__icontains'] = user_filter
+        by_severity = activity_rollup.count_by('error', 'action', start_date, filters=error_filters)
+        total_errors = sum(by_severity.values())
+        critical_errors = by_severity.get('critical', 0)
+        high_errors = by_severity.get('high', 0)
     unresolved_errors = error_logs.filter(resolved=False).count()
-    critical_errors = error_logs.filter(severity='critical').count()
-    high_errors = error_logs.filter(severity='high').count()
     
     # Group errors by date
     errors_by_date = {}
@@ -618,14 +545,26 @@ def database_activity(request):
         )
     
     # System log statistics
-    total_system_logs = system_logs.count()
-    info_logs = system_logs.filter(level='info').count()
-    warning_logs = system_logs.filter(level='warning').count()
-    error_level_logs = system_logs.filter(level='error').count()
+    if search_query:
+        by_level = {row['level']: row['n'] for row in system_logs.values('level').annotate(n=Count('id')).order_by()}
+    else:
+        system_filters = {}
+        if log_level_filter:
+            system_filters['action'] = log_level_filter
+        if log_category_filter:
+            system_filters['kind'] = log_category_filter
+        if user_filter:
+            system_filters['user__icontains'] = user_filter
+        by_level = activity_rollup.count_by('system', 'action', start_date, filters=system_filters)
+    total_system_logs = sum(by_level.values())
+    info_logs = by_level.get('info', 0)
+    warning_logs = by_level.get('warning', 0)
+    error_level_logs = by_level.get('error', 0)
     
     # Get unique values for filters (excluding unwanted models)
     # Don't filter by date - show ALL models that have ever been logged
-    unique_models = AuditLog.objects.exclude(model_name__in=EXCLUDED_MODELS).values_list('model_name', flat=True).distinct().order_by('model_name')
+    logged = activity_rollup.distinct_values('audit', 'kind', 'user')
+    unique_models = sorted(logged['kind'] - set(EXCLUDED_MODELS) - {''})
     
     # Get all managers and admins for the "Changed By" filter
     manager_admin_users = User.objects.filter(
@@ -633,9 +572,7 @@ def database_activity(request):
     ).values_list('full_name', flat=True).order_by('full_name')
     
     # Also include unique users from audit logs (for "System" and other automated entries)
-    audit_users = AuditLog.objects.exclude(
-        model_name__in=EXCLUDED_MODELS
-    ).values_list('changed_by', flat=True).distinct()
+    audit_users = logged['user'] - {''}
     
     # Combine both lists and remove duplicates
     unique_users = sorted(set(list(manager_admin_users) + list(audit_users)))
@@ -711,3 +648,36 @@ def database_activity(request):
     
     return render(request, 'database_activity.html', context)
 
+
+
+
+@login_required
+def database_query_activity(request):
+    """
+    Per-request SQL query counts, DB time and likely N+1 patterns recorded by
+    QueryInspectorMiddleware (in-process ring buffer, newest first).
+    POST clears the buffer; ?format=json returns the raw entries.
+    """
+    if request.method == 'POST':
+        query_inspector.clear()
+        return redirect('database_query_activity')
+
+    entries = query_inspector.recent_requests()
+    if request.GET.get('n_plus_one'):
+        entries = [entry for entry in entries if entry['n_plus_one']]
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'threshold': query_inspector.N_PLUS_ONE_THRESHOLD,
+            'requests': [{**entry, 'at': entry['at'].isoformat()} for entry in entries],
+        })
+
+    context = {
+        'title': 'Query Activity',
+        'entries': entries,
+        'views': query_inspector.view_summary(entries),
+        'enabled': query_inspector.ENABLED,
+        'threshold': query_inspector.N_PLUS_ONE_THRESHOLD,
+        'buffer_size': query_inspector.BUFFER_SIZE,
+        'n_plus_one_only': bool(request.GET.get('n_plus_one')),
+    }
+    return render(request, 'database_query_activity.html', context)
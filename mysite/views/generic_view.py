@@ -11,6 +11,7 @@ from .utils import handle_post_request, MODEL_MAP, get_related_fields, parse_que
 from .utils import DateEncoder
 from datetime import datetime
 from itertools import chain
+from mysite.price_timeline import preload_price_timelines
 
 @user_has_role('Admin')
 def users(request):
@@ -240,6 +241,7 @@ def generic_view(request, model_name, form_class, template_name, pages=30):
     
     # Add computed fields to objects for template access
     if model_name.lower() == 'apartment':
+        preload_price_timelines([apartment.id for apartment in items_on_page])
         for apartment in items_on_page:
             current_price = apartment.current_price
             apartment.current_price_display = f"${current_price}" if current_price else "No price set"
@@ -285,15 +287,15 @@ def generic_view(request, model_name, form_class, template_name, pages=30):
             item['current_price_display'] = f"${current_price}" if current_price else "No price set"
             
             # Add pricing history count
-            item['price_count'] = original_obj.prices.count()
+            price_timeline = original_obj.price_timeline
+            item['price_count'] = len(price_timeline)
             
             # Add future price changes count
-            future_prices_count = original_obj.get_future_prices().count()
+            future_prices_count = len(original_obj.get_future_prices())
             item['future_prices_count'] = future_prices_count
             
             # Add latest price date
-            latest_price = original_obj.prices.first()  # Already ordered by -effective_date in model
-            item['latest_price_date'] = latest_price.effective_date if latest_price else None
+            item['latest_price_date'] = price_timeline.dates[-1] if price_timeline.dates else None
             
             # Add managers M2M serialization
             item['managers'] = [m.id for m in original_obj.managers.all()]
@@ -10,6 +10,7 @@ from collections import defaultdict
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from ..decorators import user_has_role
+from ..view_cache import conditional_view
 from .utils import generate_weeks, DateEncoder, get_model_fields, send_handyman_telegram_notification
 from mysite.forms import HandymanCalendarForm
 from django.http import JsonResponse
@@ -237,6 +238,7 @@ def handle_block_request(request):
         )
         return JsonResponse({'error': str(e)}, status=500)
 
+@conditional_view(models=('Apartment', 'HandymanBlockedSlot', 'HandymanCalendar'), cache_body=True)
 def handyman_calendar(request):
     page = request.GET.get('page', 1)
     is_manager = request.GET.get('user') == 'manager'
@@ -6,6 +6,7 @@ from twilio.base.exceptions import TwilioRestException
 from django.views.decorators.csrf import csrf_exempt
 import re
 from mysite.unified_logger import log_error, log_info, log_warning, logger
+from mysite import chat_stream
 from mysite.group_chat_logger import (
     log_message_received,
     log_ai_customer_start,
@@ -266,6 +267,7 @@ def save_message_to_db(message_sid, conversation_sid, author, body, direction='i
             
             if created:
                 log_info(f"Saved message to DB: {message_sid} from {author}", category='sms')
+                chat_stream.notify_conversation(conversation_sid)
             else:
                 log_info(f"Message already exists in DB: {message_sid}", category='sms')
                 
@@ -876,11 +878,15 @@ def _update_message_ai_result(message_sid, **kwargs):
         from mysite.models import TwilioMessage
         from mysite.signals import get_current_user_info
 
+        messages = TwilioMessage.objects.filter(message_sid=message_sid)
+        # queryset updates skip auto_now; the live chat stream reads changes by updated_at
         audit_queryset_update(
-            TwilioMessage.objects.filter(message_sid=message_sid),
+            messages,
             changed_by=get_current_user_info(),
+            updated_at=timezone.now(),
             **kwargs,
         )
+        chat_stream.notify_conversation(messages.values_list('conversation_sid', flat=True).first())
     except Exception as e:
         log_error(e, "Error updating message AI metadata", source='web')
 
@@ -15,17 +15,14 @@ from mysite.forms import HandymanCalendarForm
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from mysite.forms import CustomFieldMixin
+from mysite.parking_occupancy import ParkingOccupancyGrid, current_parking_rooms
+from mysite.view_cache import conditional_view
 
 
 
+@conditional_view(models=('Apartment', 'Booking', 'Parking', 'ParkingBooking', 'User'), cache_body=True)
 def parking_calendar(request):
     status = request.GET.get('status', None)
-    if status:
-        parking_bookings = ParkingBooking.objects.filter(status=status)
-    else:
-        parking_bookings = ParkingBooking.objects.all()
-
-    parkings = Parking.objects.all().order_by('building', 'number')
 
     if request.method == 'POST':
         if 'add_booking' in request.POST or 'edit_booking' in request.POST or 'delete_booking' in request.POST:
@@ -38,82 +35,45 @@ def parking_calendar(request):
     start_date = (current_date.replace(day=1) + relativedelta(months=page_offset * 3)).replace(day=1)
     end_date = start_date + relativedelta(months=3, days=-1)
 
-    parking_bookings = parking_bookings.filter(start_date__lte=end_date, end_date__gte=start_date)
+    # One query for spots, one for overlapping bookings, one for current rooms
+    grid = ParkingOccupancyGrid.load(start_date, end_date, status=status)
+    parking_rooms = current_parking_rooms([parking.id for parking in grid.parkings], current_date)
 
     monthly_data = []
-    current_month = start_date
-    while current_month <= end_date:
-        days_in_month = monthrange(current_month.year, current_month.month)[1]
-        month_end = current_month.replace(day=days_in_month)
-        month_start = current_month
-
+    parking_rows = [
+        {
+            'id': parking.id,
+            'number': parking.number,
+            'building': parking.building,
+            'associated_room': parking.associated_room,
+            'notes': parking.notes,
+            'months': [],
+        }
+        for parking in grid.parkings
+    ]
+    payload_cache = {}
+    for month_start, month_end in grid.months():
         month_data = {
-            'month_name': current_month.strftime('%B %Y'),
+            'month_name': month_start.strftime('%B %Y'),
             'parkings': [],
-            'days_in_month': days_in_month,
-            'month_occupancy': 0,
-            'total_bookings': 0,
-            'total_spots': len(parkings) * days_in_month
+            'days_in_month': month_end.day,
         }
+        month_data.update(grid.month_stats(month_start, month_end))
 
-        total_booked_days = 0
-        for parking in parkings:
-            parking_data = {
+        for row, parking in enumerate(grid.parkings):
+            days = grid.day_cells(row, month_start, month_end, payload_cache)
+            month_data['parkings'].append({
                 'id': parking.id,
                 'number': parking.number,
                 'building': parking.building,
                 'associated_room': parking.associated_room,
                 'notes': parking.notes,
-                'parking_room': next((booking.apartment.apartment_n for booking in ParkingBooking.objects.filter(
-                    Q(end_date__gt=timezone.now().date()),
-                    parking=parking,
-                    status='Booked'
-                ).select_related('apartment')), None),
-                'days': {},
-            }
-            bookings_for_parking = parking_bookings.filter(parking=parking)
-            for day in range(1, days_in_month + 1):
-                date_obj = current_month.replace(day=day)
-                parking_data['days'][day] = {
-                    'status': 'Available',
-                    'is_start': False,
-                    'is_end': False,
-                    'tenant_name': "", 
-                    'day': date_obj.strftime('%Y-%m-%d'),  # Changed to YYYY-MM-DD format for input[type=date]
-                    'notes': "",
-                }
-                
-                # Check for bookings on this day
-                for p_booking in bookings_for_parking:
-                    if p_booking.start_date <= date_obj <= p_booking.end_date:
-                        # This day is within a booking period
-                        parking_data['days'][day].update({
-                            'status': p_booking.status,
-                            'is_start': date_obj == p_booking.start_date,
-                            'is_end': date_obj == p_booking.end_date,
-                            'tenant_name': p_booking.booking.tenant.full_name if p_booking.booking and p_booking.booking.tenant else "",
-                            'notes': p_booking.notes or "",
-                            'id': p_booking.id,
-                            'apartment_id': p_booking.apartment.id if p_booking.apartment else "",
-                            'booking_id': p_booking.booking.id if p_booking.booking else "",
-                            'apartment_name': p_booking.apartment.name if p_booking.apartment else "",
-                            'status': p_booking.status,
-                            'start_date': p_booking.start_date.strftime('%Y-%m-%d'),
-                            'end_date': p_booking.end_date.strftime('%Y-%m-%d')
-                        })
-                        if p_booking.status == 'Booked':
-                            total_booked_days += 1
-                        break
-
-            month_data['parkings'].append(parking_data)
-
-        # Calculate occupancy percentage
-        if month_data['total_spots'] > 0:
-            month_data['month_occupancy'] = round((total_booked_days / month_data['total_spots']) * 100)
-        month_data['total_bookings'] = total_booked_days
+                'parking_room': parking_rooms.get(parking.id),
+                'days': days,
+            })
+            parking_rows[row]['months'].append(days)
 
         monthly_data.append(month_data)
-        current_month += relativedelta(months=1)
     
     # Get apartments and bookings for dropdowns
     apartments = Apartment.objects.filter(
@@ -145,6 +105,7 @@ def parking_calendar(request):
 
     context = {
         'monthly_data': monthly_data,
+        'parking_rows': parking_rows,
         'buildings_json': buildings_json,
         'parking_data_json': parking_data_json,
         'apartments_json': apartments_json,
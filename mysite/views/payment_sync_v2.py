@@ -3,18 +3,30 @@ from ..models import PaymentMethod, Payment, Apartment, PaymenType, Booking
 from ..forms import PaymentForm
 from datetime import datetime
 from ..decorators import user_has_role
+from ..reference_data import get_reference_data
+from ..keyword_matcher import BookingContextMatcher, PaymentKeywordMatcher
+from ..payment_payload import PaymentColumns, reference_etag, reference_payload
+from ..trace_writer import TraceWriter, parse_sample_rates, snapshot
+from ..model_catalog import openrouter_catalog
+from .. import ai_match_cache
 from django.contrib import messages
 import json
 import os
 from datetime import timedelta
 import re
 import csv
+import codecs
+from functools import lru_cache
 from .utils import get_model_fields
-from django.core import serializers
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from openai import OpenAI
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 import uuid
 from pathlib import Path
 from django.conf import settings
@@ -23,7 +35,6 @@ from django.conf import settings
 PAYMENT_KEY_SEPARATOR = "###||###"
 
 logger = logging.getLogger(__name__)
-trace_logger = logging.getLogger("mysite.payment_sync_v2_trace")
 
 
 def _log(step, **fields):
@@ -76,10 +87,52 @@ def _trace_path():
 
 
 def _trace_max_chars():
+    return _env_int("PAYMENT_SYNC_V2_TRACE_MAX_CHARS", 20000)
+
+
+def _env_int(name, default):
     try:
-        return int(os.getenv("PAYMENT_SYNC_V2_TRACE_MAX_CHARS") or "20000")
+        return int(os.getenv(name) or default)
     except Exception:
-        return 20000
+        return default
+
+
+_trace_writer_instance = None
+_trace_writer_lock = threading.Lock()
+
+
+def _trace_writer():
+    """
+    Process-wide background writer for the trace file (see mysite/trace_writer.py).
+    Env knobs:
+    - PAYMENT_SYNC_V2_TRACE_SAMPLE: default sample rate 0..1 (default 1)
+    - PAYMENT_SYNC_V2_TRACE_SAMPLE_STEPS: per-step rates, e.g. "fetch_db_payments_for_matching.db_payments_after_suggestions=0.1"
+    - PAYMENT_SYNC_V2_TRACE_MAX_BYTES: rotate when the file passes this size (default 50MB); rotation is also daily
+    - PAYMENT_SYNC_V2_TRACE_BACKUPS: gzip archives to keep (default 20)
+    - PAYMENT_SYNC_V2_TRACE_QUEUE: events buffered before new ones are dropped (default 1000)
+    - PAYMENT_SYNC_V2_TRACE_MAX_EVENT_BYTES: larger events keep only a data preview (default 1MB)
+    """
+    global _trace_writer_instance
+    if _trace_writer_instance is not None:
+        return _trace_writer_instance
+    with _trace_writer_lock:
+        if _trace_writer_instance is None:
+            try:
+                sample_rate = float(os.getenv("PAYMENT_SYNC_V2_TRACE_SAMPLE") or "1")
+            except Exception:
+                sample_rate = 1.0
+            _trace_writer_instance = TraceWriter(
+                _trace_path(),
+                max_bytes=_env_int("PAYMENT_SYNC_V2_TRACE_MAX_BYTES", 50 * 1024 * 1024),
+                backup_count=_env_int("PAYMENT_SYNC_V2_TRACE_BACKUPS", 20),
+                rotate_daily=str(os.getenv("PAYMENT_SYNC_V2_TRACE_ROTATE_DAILY", "1")).strip().lower()
+                not in ("0", "false", "no", "off"),
+                queue_size=_env_int("PAYMENT_SYNC_V2_TRACE_QUEUE", 1000),
+                sample_rate=sample_rate,
+                step_sample_rates=parse_sample_rates(os.getenv("PAYMENT_SYNC_V2_TRACE_SAMPLE_STEPS")),
+                max_event_bytes=_env_int("PAYMENT_SYNC_V2_TRACE_MAX_EVENT_BYTES", 1024 * 1024),
+            )
+    return _trace_writer_instance
 
 
 def _clip(value, max_chars):
@@ -96,14 +149,23 @@ def _trace_event(request, step, payload):
     Structured JSONL trace:
     - Records real request/response + intermediate transformed data
     - Gated by PAYMENT_SYNC_V2_TRACE=1
+    - Only queues the event: serialization, rotation and the rid index
+      (<trace>.jsonl.idx) happen on the trace writer thread. The payload's
+      dicts and lists are copied here first, so callers may keep changing them.
     """
     if not _trace_enabled():
         return
 
     rid = _request_id(request)
+    writer = _trace_writer()
+    if not writer.should_sample(rid, step):
+        writer.sampled_out += 1
+        return
+
     base = {
         "rid": rid,
         "step": step,
+        "ts": time.time(),
         "user": _user_tag(request),
         "path": getattr(request, "path", None),
         "method": getattr(request, "method", None),
@@ -135,77 +197,28 @@ def _trace_event(request, step, payload):
         except Exception:
             return {"_type": type(obj).__name__, "repr": _clip(repr(obj), max_chars)}
 
-    event = {**base, "data": normalize(payload)}
-
-    # Primary: Django logger (configured in settings.py to write JSONL file)
     try:
-        trace_logger.info(json.dumps(event, default=str, ensure_ascii=False))
-        return
-    except Exception:
-        pass
-
-    # Fallback: direct file write (in case logger isn't configured)
-    try:
-        trace_file = Path(_trace_path())
-        trace_file.parent.mkdir(parents=True, exist_ok=True)
-        with trace_file.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(event, default=str, ensure_ascii=False) + "\n")
+        writer.submit({**base, "data": snapshot(normalize(payload))})
     except Exception as e:
         # Never break the request because tracing failed
         _log("trace.write_failed", rid=rid, step=step, error=str(e), trace_path=_trace_path())
 
 
-def _format_context_length(n):
-    """Format context length for display, e.g. 128000 -> '128k', 1000000 -> '1M'."""
-    if n is None:
-        return None
-    try:
-        n = int(n)
-        if n >= 1_000_000:
-            return f"{n // 1_000_000}M"
-        if n >= 1000:
-            return f"{n // 1000}k"
-        return str(n)
-    except (ValueError, TypeError):
-        return None
+DEFAULT_AI_MODELS = [
+    {'value': 'google/gemini-3-flash-preview', 'label': 'Gemini 3 Flash Preview', 'context_length_display': '1M'},
+    {'value': 'openai/gpt-4o', 'label': 'GPT-4o', 'context_length_display': '128k'},
+    {'value': 'openai/gpt-4o-mini', 'label': 'GPT-4o Mini', 'context_length_display': '128k'},
+    {'value': 'anthropic/claude-3.5-sonnet', 'label': 'Claude 3.5 Sonnet', 'context_length_display': '200k'},
+]
 
 
 def _get_openrouter_ai_models():
-    """Fetch AI models from OpenRouter API. Returns list of {value, label, prompt_price?, completion_price?, context_length_display}."""
-    try:
-        import requests
-        api_key = os.environ.get('OPENROUTER_API_KEY')
-        if api_key:
-            response = requests.get(
-                "https://openrouter.ai/api/v1/models",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                models = []
-                for m in data.get('data', []):
-                    pricing = m.get('pricing', {})
-                    prompt_price = float(pricing.get('prompt', 0)) * 1000000
-                    completion_price = float(pricing.get('completion', 0)) * 1000000
-                    ctx = m.get('context_length')
-                    models.append({
-                        'value': m.get('id'),
-                        'label': m.get('name'),
-                        'prompt_price': f"{prompt_price:.2f}",
-                        'completion_price': f"{completion_price:.2f}",
-                        'context_length': ctx,
-                        'context_length_display': _format_context_length(ctx),
-                    })
-                models.sort(key=lambda x: x['label'])
-                return models
-    except Exception as e:
-        _log("_get_openrouter_ai_models.error", error=str(e))
-    return [
-        {'value': 'google/gemini-3-flash-preview', 'label': 'Gemini 3 Flash Preview', 'context_length_display': '1M'},
-        {'value': 'openai/gpt-4o', 'label': 'GPT-4o', 'context_length_display': '128k'},
-        {'value': 'openai/gpt-4o-mini', 'label': 'GPT-4o Mini', 'context_length_display': '128k'},
-        {'value': 'anthropic/claude-3.5-sonnet', 'label': 'Claude 3.5 Sonnet', 'context_length_display': '200k'},
-    ]
+    """
+    AI models from the cached OpenRouter catalog (see mysite/model_catalog.py).
+    Returns list of {value, label, prompt_price?, completion_price?, context_length_display}.
+    No network I/O here; falls back to DEFAULT_AI_MODELS until a list was fetched once.
+    """
+    return openrouter_catalog.get(fallback=DEFAULT_AI_MODELS)
 
 
 @user_has_role('Admin')
@@ -213,9 +226,6 @@ def sync_payments_v2(request):
     """Payment sync v2."""
     rid = _request_id(request)
     _log("sync_payments_v2.enter", rid=rid, method=request.method, user=_user_tag(request))
-    payment_methods_qs = PaymentMethod.objects.all()
-    apartments_qs = Apartment.objects.all()
-    payment_types_qs = PaymenType.objects.all()
 
     ai_models = _get_openrouter_ai_models()
 
@@ -233,9 +243,6 @@ def sync_payments_v2(request):
             'matched_groups': json.dumps([]),
             'total_file_payments': 0,
             'total_db_payments': 0,
-            'payment_methods': get_json(payment_methods_qs),
-            'apartments': get_json(apartments_qs),
-            'payment_types': get_json(payment_types_qs),
             'model_fields': get_model_fields(PaymentForm(request)),
         }
     }
@@ -341,26 +348,27 @@ def build_demo_matching_data():
 
     raw = get_demo_file_payments_raw()
     today = date.today()
+    ref = get_reference_data()
 
     def _resolve_bank(name):
         if not name:
             return None
-        return PaymentMethod.objects.filter(name__iexact=name, type="Bank").first()
+        return ref.payment_method_by_name(name, type="Bank")
 
     def _resolve_pm(name):
         if not name:
             return None
-        return PaymentMethod.objects.filter(name__iexact=name, type="Payment Method").first()
+        return ref.payment_method_by_name(name, type="Payment Method")
 
     def _resolve_pt(name, ptype):
         if not name or not ptype:
             return None
-        return PaymenType.objects.filter(name__iexact=name, type=ptype).first()
+        return ref.payment_type_by_name(name, type=ptype)
 
     def _resolve_apt(name):
         if not name:
             return None
-        return Apartment.objects.filter(name=name).first()
+        return ref.apartment_by_name(name)
 
     file_payments = []
     for r in raw:
@@ -432,9 +440,6 @@ def build_demo_matching_data():
         "date_delta": 4,
         "db_days_before": db_days_before,
         "db_days_after": db_days_after,
-        "payment_methods": get_json(PaymentMethod.objects.all()),
-        "apartments": get_json(Apartment.objects.all()),
-        "payment_types": get_json(PaymenType.objects.all()),
     }
 
 
@@ -465,12 +470,25 @@ def process_csv_upload(request):
     )
     
     # Load reference data
-    payment_methods = PaymentMethod.objects.all()
-    apartments = Apartment.objects.all()
-    payment_types = PaymenType.objects.all()
+    ref = get_reference_data()
+    payment_methods = ref.payment_methods
+    apartments = ref.apartments
+    payment_types = ref.payment_types
+    matcher = ref.memo(
+        'payment_sync_v2.keyword_matcher',
+        lambda: PaymentKeywordMatcher(payment_methods, apartments, payment_types),
+    )
     
-    # Parse CSV file
-    file_payments = parse_csv_file(request, csv_file, payment_methods, apartments, payment_types)
+    # Parse CSV file as a stream; each batch is serialized right away so only
+    # compact JSON-ready rows are kept, and the date range is tracked as we go
+    file_payments = []
+    start_date_raw = end_date_raw = None
+    for batch in iter_csv_payment_batches(request, csv_file, payment_methods, apartments, payment_types, matcher=matcher):
+        for payment in batch:
+            payment_day = payment['payment_date'].date()
+            start_date_raw = payment_day if start_date_raw is None else min(start_date_raw, payment_day)
+            end_date_raw = payment_day if end_date_raw is None else max(end_date_raw, payment_day)
+            file_payments.append(serialize_payment(payment))
     _log("process_csv_upload.parsed", rid=rid, file_payments=len(file_payments))
     
     if not file_payments:
@@ -487,13 +505,9 @@ def process_csv_upload(request):
             'total_file_payments': 0,
             'total_db_payments': 0,
             'model_fields': get_model_fields(PaymentForm(request)),
-            'payment_methods': get_json(payment_methods),
-            'apartments': get_json(apartments),
-            'payment_types': get_json(payment_types),
         }
 
     # Enrich file payments with booking-derived apartment candidates (same window as matching)
-    start_date_raw, end_date_raw = extract_date_range(file_payments)
     if start_date_raw and end_date_raw:
         date_from = start_date_raw - timedelta(days=int(db_days_before))
         date_to = end_date_raw + timedelta(days=int(db_days_after))
@@ -504,28 +518,22 @@ def process_csv_upload(request):
         file_payments = enrich_file_payments_with_booking_apartments(file_payments, list(bookings_qs))
 
     # Query all DB payments for period based on file dates + config days
-    serialized_file_payments = [serialize_payment(p) for p in file_payments]
-    start_date, end_date = extract_date_range(serialized_file_payments)
-    db_payments_list = []
-    if start_date and end_date:
-        all_db_qs = query_db_payments_custom(start_date, end_date, db_days_before, db_days_after)
-        db_payments_list = get_json_list(all_db_qs)
-    _log("process_csv_upload.db_payments", rid=rid, count=len(db_payments_list))
+    db_payments = PaymentColumns()
+    if start_date_raw and end_date_raw:
+        db_payments = PaymentColumns(query_db_payments_custom(start_date_raw, end_date_raw, db_days_before, db_days_after))
+    _log("process_csv_upload.db_payments", rid=rid, count=len(db_payments))
 
     return {
-        'file_payments_json': json.dumps(serialized_file_payments, default=str),
-        'db_payments_json': json.dumps(db_payments_list),
+        'file_payments_json': json.dumps(file_payments, default=str),
+        'db_payments_json': db_payments.to_json(),
         'matched_groups': json.dumps([]),
         'total_file_payments': len(file_payments),
-        'total_db_payments': len(db_payments_list),
+        'total_db_payments': len(db_payments),
         'model_fields': get_model_fields(PaymentForm(request)),
         'amount_delta': amount_delta,
         'date_delta': date_delta,
         'db_days_before': db_days_before,
         'db_days_after': db_days_after,
-        'payment_methods': get_json(payment_methods),
-        'apartments': get_json(apartments),
-        'payment_types': get_json(payment_types),
     }
 
 
@@ -568,52 +576,13 @@ def query_db_payments_custom(start_date, end_date, db_days_before, db_days_after
 
 
 def get_json_list(db_model):
-    items_json_data = serializers.serialize('json', db_model)
-    data_list = json.loads(items_json_data)
-    items_list = [{'id': item['pk'], **item['fields']} for item in data_list]
-
-    for item, original_obj in zip(items_list, db_model):
-        if hasattr(original_obj, 'booking') and original_obj.booking:
-            tenant = getattr(original_obj.booking, 'tenant', None)
-            item["tenant_name"] = (getattr(tenant, 'full_name', '') or '') if tenant else ''
-            item['booking_display'] = _format_booking_display(original_obj.booking)
-        else:
-            item["tenant_name"] = ""
-            item['booking_display'] = None
-        if hasattr(original_obj, 'apartmentName'):
-            item['apartment_name'] = original_obj.apartmentName
-        elif hasattr(original_obj, 'apartment') and original_obj.apartment:
-            item['apartment_name'] = original_obj.apartment.name
-        elif hasattr(original_obj, 'booking') and original_obj.booking and original_obj.booking.apartment:
-            item['apartment_name'] = original_obj.booking.apartment.name
-        # Add bank_name
-        if hasattr(original_obj, 'bank') and original_obj.bank:
-            item['bank_name'] = original_obj.bank.name
-        else:
-            item['bank_name'] = None
-        # Add payment_type_name and payment_type_obj
-        if hasattr(original_obj, 'payment_type') and original_obj.payment_type:
-            item['payment_type_name'] = f"{original_obj.payment_type.name} ({original_obj.payment_type.type})"
-            item['payment_type_obj'] = {
-                'id': original_obj.payment_type.id,
-                'name': original_obj.payment_type.name,
-                'type': original_obj.payment_type.type,
-            }
-        else:
-            item['payment_type_name'] = None
-            item['payment_type_obj'] = None
-        # Add payment_method_name
-        if hasattr(original_obj, 'payment_method') and original_obj.payment_method:
-            item['payment_method_name'] = original_obj.payment_method.name
-        else:
-            item['payment_method_name'] = None
-
-    return items_list
+    """Payment queryset as row dicts (see PaymentColumns for the compact payload)."""
+    return PaymentColumns(db_model).rows()
 
 
 def normalize_file_payments_for_matching(file_payments):
     """Ensure file payments have datetime `payment_date`, numeric `amount`, `payment_type_type`, and list fields."""
-    payment_type_map = {pt.id: pt.type for pt in PaymenType.objects.all()}
+    payment_types_by_id = get_reference_data().payment_types_by_id
     normalized = []
     for p in file_payments or []:
         p2 = dict(p)
@@ -629,7 +598,8 @@ def normalize_file_payments_for_matching(file_payments):
         if not p2.get('payment_type_type'):
             pt_id = p2.get('payment_type')
             if pt_id is not None:
-                p2['payment_type_type'] = payment_type_map.get(int(pt_id))
+                payment_type = payment_types_by_id.get(int(pt_id))
+                p2['payment_type_type'] = payment_type.type if payment_type else None
         # Ensure list fields (migrate legacy singular to list for backward compat)
         for list_key, legacy_key in [
             ('apartment_candidates', 'apartment_name'),
@@ -701,8 +671,8 @@ def _query_merged_db_payments_for_keys(keys):
     )
 
 
-def apply_ai_suggestions_to_db_payments(db_payments_list, matched_groups):
-    """Adds `is_matched` + `matched_criteria` fields to db payment dicts based on best suggested match."""
+def apply_ai_suggestions_to_db_payments(db_payments, matched_groups):
+    """Adds `is_matched` + `matched_criteria` columns to PaymentColumns based on best suggested match."""
     best_by_db_id = {}
     for group in matched_groups or []:
         file_payment = group.get('file_payment') or {}
@@ -719,15 +689,18 @@ def apply_ai_suggestions_to_db_payments(db_payments_list, matched_groups):
             if prev is None or score > prev['score']:
                 best_by_db_id[db_id] = {'score': score, 'file_id': file_id}
 
-    for p in db_payments_list:
-        db_id = p.get('id')
+    is_matched = []
+    matched_criteria = []
+    for db_id in db_payments.column('id'):
         best = best_by_db_id.get(db_id)
         if best and best['score'] >= 40:
-            p['is_matched'] = True
-            p['matched_criteria'] = f"AI suggestion: file {best['file_id']} (score {best['score']})"
+            is_matched.append(True)
+            matched_criteria.append(f"AI suggestion: file {best['file_id']} (score {best['score']})")
         else:
-            p['is_matched'] = False
-            p['matched_criteria'] = p.get('matched_criteria') or ''
+            is_matched.append(False)
+            matched_criteria.append('')
+    db_payments.set_column('is_matched', is_matched)
+    db_payments.set_column('matched_criteria', matched_criteria)
 
 
 @user_has_role('Admin')
@@ -768,19 +741,14 @@ def fetch_db_payments_for_matching(request):
     )
 
     db_payments_qs = query_db_payments_custom(start_date, end_date, db_days_before, db_days_after)
-    db_payments_list = get_json_list(db_payments_qs)
     merged_keys = _extract_merged_keys_from_file_payments(file_payments)
     merged_db_qs = _query_merged_db_payments_for_keys(merged_keys)
-    merged_db_list = get_json_list(merged_db_qs)
-    if merged_db_list:
-        existing_ids = {p.get('id') for p in db_payments_list}
-        for p in merged_db_list:
-            if p.get('id') not in existing_ids:
-                db_payments_list.append(p)
+    # Window payments first, then merged payments that are not in the window
+    db_payments = PaymentColumns(db_payments_qs, merged_db_qs)
     _trace_event(
         request,
         "fetch_db_payments_for_matching.db_payments_list",
-        db_payments_list,
+        db_payments.to_payload(),
     )
 
     _log(
@@ -788,16 +756,15 @@ def fetch_db_payments_for_matching(request):
         rid=rid,
         start_date=start_date,
         end_date=end_date,
-        db_payments=len(db_payments_list),
+        db_payments=len(db_payments),
     )
 
     if matching_mode == 'manual':
         # No matching, just return DB payments
-        for p in db_payments_list:
-            p['is_matched'] = False
-            p['matched_criteria'] = p.get('matched_criteria') or ''
-        _log("fetch_db_payments_for_matching.return_manual", rid=rid, db_payments=len(db_payments_list))
-        resp = {'db_payments': db_payments_list, 'matched_groups': []}
+        db_payments.set_column('is_matched', [False] * len(db_payments))
+        db_payments.set_column('matched_criteria', [''] * len(db_payments))
+        _log("fetch_db_payments_for_matching.return_manual", rid=rid, db_payments=len(db_payments))
+        resp = {'db_payments': db_payments.to_payload(), 'matched_groups': []}
         _trace_event(request, "fetch_db_payments_for_matching.response_json", resp)
         return JsonResponse(resp)
 
@@ -820,20 +787,20 @@ def fetch_db_payments_for_matching(request):
         "fetch_db_payments_for_matching.matched_groups_raw",
         serialize_matched_groups(matched_groups),
     )
-    apply_ai_suggestions_to_db_payments(db_payments_list, matched_groups)
-    _trace_event(request, "fetch_db_payments_for_matching.db_payments_after_suggestions", db_payments_list)
+    apply_ai_suggestions_to_db_payments(db_payments, matched_groups)
+    _trace_event(request, "fetch_db_payments_for_matching.db_payments_after_suggestions", db_payments.to_payload())
 
-    matched_count = sum(1 for p in db_payments_list if p.get("is_matched"))
+    matched_count = sum(1 for is_matched in db_payments.column('is_matched') if is_matched)
     _log(
         "fetch_db_payments_for_matching.return_auto",
         rid=rid,
         matched_groups=len(matched_groups or []),
         db_matched=matched_count,
-        db_payments=len(db_payments_list),
+        db_payments=len(db_payments),
     )
 
     resp = {
-        'db_payments': db_payments_list,
+        'db_payments': db_payments.to_payload(),
         'matched_groups': serialize_matched_groups(matched_groups),
     }
     _trace_event(request, "fetch_db_payments_for_matching.response_json", resp)
@@ -862,8 +829,7 @@ def fetch_merged_db_payments_for_file(request):
     )
 
     merged_db_qs = _query_merged_db_payments_for_keys(merged_keys)
-    merged_db_list = get_json_list(merged_db_qs)
-    resp = {'db_payments': merged_db_list}
+    resp = {'db_payments': PaymentColumns(merged_db_qs).to_payload()}
     _trace_event(request, "fetch_merged_db_payments_for_file.response_json", resp)
     return JsonResponse(resp)
 
@@ -1394,38 +1360,13 @@ def _extract_json_array(text):
     return None
 
 
-def _ai_match_with_openrouter(model, base_prompt, custom_prompt, composite, candidate_payments, request=None):
-    client, err = _openrouter_client()
-    if err:
-        if request is not None:
-            _trace_event(request, "_ai_match_with_openrouter.no_client", {"error": err, "model": model})
-        return None, err
+AI_MATCH_TIMEOUT_SECONDS = 60
+AI_MATCH_BATCH_MAX_WORKERS = 4
+AI_MATCH_BATCH_MAX_SELECTIONS = 50
 
-    _log(
-        "_ai_match_with_openrouter.start",
-        model=model,
-        base_prompt_len=len(base_prompt or ""),
-        custom_prompt_len=len(custom_prompt or ""),
-        candidate_count=len(candidate_payments or []),
-        amount_total=composite.get("amount_total"),
-        date_from=composite.get("date_from"),
-        date_to=composite.get("date_to"),
-    )
-    if request is not None:
-        _trace_event(
-            request,
-            "_ai_match_with_openrouter.start",
-            {
-                "model": model,
-                "base_prompt_len": len(base_prompt or ""),
-                "custom_prompt_len": len(custom_prompt or ""),
-                "candidate_count": len(candidate_payments or []),
-                "amount_total": composite.get("amount_total"),
-                "date_from": composite.get("date_from"),
-                "date_to": composite.get("date_to"),
-            },
-        )
 
+def _build_ai_match_messages(base_prompt, custom_prompt, composite, candidate_payments):
+    """System/user messages for one AI match request (plus the pieces, for tracing)."""
     # Minify candidate payload (sparse: only include fields when set, to save tokens)
     candidate_payload = []
     for p in candidate_payments or []:
@@ -1500,23 +1441,20 @@ def _ai_match_with_openrouter(model, base_prompt, custom_prompt, composite, cand
         f"Composite selection:\n{json.dumps(composite_desc, ensure_ascii=False)}\n\n"
         f"DB candidates (choose best matches):\n{json.dumps(candidate_payload, ensure_ascii=False)}"
     )
-    if request is not None:
-        # Record the actual prompts/messages we send (clipped by trace settings).
-        _trace_event(
-            request,
-            "_ai_match_with_openrouter.prompts",
-            {
-                "model": model,
-                "base_prompt": (base_prompt or ""),
-                "custom_prompt": (custom_prompt or ""),
-                "instructions_final": instructions,
-                "system_msg": system_msg,
-                "user_msg": user_msg,
-                "composite_desc": composite_desc,
-                "candidate_payload": candidate_payload,
-            },
-        )
+    return {
+        'instructions': instructions,
+        'system_msg': system_msg,
+        'user_msg': user_msg,
+        'composite_desc': composite_desc,
+        'candidate_payload': candidate_payload,
+    }
+
 
+def _request_ai_match(client, model, system_msg, user_msg, timeout=None):
+    """
+    The OpenRouter call alone: no DB access and no request tracing, so batches run it in worker threads.
+    Returns (parsed, error, usage, content_preview).
+    """
     try:
         resp = client.chat.completions.create(
             model=model,
@@ -1525,13 +1463,13 @@ def _ai_match_with_openrouter(model, base_prompt, custom_prompt, composite, cand
                 {"role": "user", "content": user_msg},
             ],
             temperature=0,
+            timeout=timeout or AI_MATCH_TIMEOUT_SECONDS,
         )
     except Exception as e:
         _log("_ai_match_with_openrouter.request_failed", model=model, error=str(e))
-        if request is not None:
-            _trace_event(request, "_ai_match_with_openrouter.request_failed", {"model": model, "error": str(e)})
-        return None, f"OpenRouter request failed: {e}"
+        return None, f"OpenRouter request failed: {e}", None, None
 
+    usage = ai_match_cache.usage_from_response(resp)
     content = None
     try:
         content = resp.choices[0].message.content
@@ -1539,26 +1477,123 @@ def _ai_match_with_openrouter(model, base_prompt, custom_prompt, composite, cand
         content = None
 
     parsed = _extract_json_array(content)
+    content_preview = str(content)[:220] if content is not None else None
     if not isinstance(parsed, list):
-        _log(
-            "_ai_match_with_openrouter.bad_response",
-            model=model,
-            content_preview=(str(content)[:220] if content is not None else None),
+        _log("_ai_match_with_openrouter.bad_response", model=model, content_preview=content_preview)
+        return None, "AI did not return a JSON array", usage, content_preview
+
+    _log("_ai_match_with_openrouter.ok", model=model, returned=len(parsed), **usage)
+    return parsed, None, usage, content_preview
+
+
+def _ai_match_with_openrouter(model, base_prompt, custom_prompt, composite, candidate_payments, request=None,
+                              stats=None, timeout=None):
+    """
+    AI matches for one selection, answered from the AI match cache when the model,
+    prompts and candidates are unchanged (see mysite/ai_match_cache.py).
+    Returns (parsed, error); `stats` (AIMatchStats) collects hits and token usage.
+    """
+    _log(
+        "_ai_match_with_openrouter.start",
+        model=model,
+        base_prompt_len=len(base_prompt or ""),
+        custom_prompt_len=len(custom_prompt or ""),
+        candidate_count=len(candidate_payments or []),
+        amount_total=composite.get("amount_total"),
+        date_from=composite.get("date_from"),
+        date_to=composite.get("date_to"),
+    )
+    if request is not None:
+        _trace_event(
+            request,
+            "_ai_match_with_openrouter.start",
+            {
+                "model": model,
+                "base_prompt_len": len(base_prompt or ""),
+                "custom_prompt_len": len(custom_prompt or ""),
+                "candidate_count": len(candidate_payments or []),
+                "amount_total": composite.get("amount_total"),
+                "date_from": composite.get("date_from"),
+                "date_to": composite.get("date_to"),
+            },
         )
+
+    built = _build_ai_match_messages(base_prompt, custom_prompt, composite, candidate_payments)
+    system_msg = built['system_msg']
+    user_msg = built['user_msg']
+    if request is not None:
+        # Record the actual prompts/messages we send (clipped by trace settings).
+        _trace_event(
+            request,
+            "_ai_match_with_openrouter.prompts",
+            {
+                "model": model,
+                "base_prompt": (base_prompt or ""),
+                "custom_prompt": (custom_prompt or ""),
+                "instructions_final": built['instructions'],
+                "system_msg": system_msg,
+                "user_msg": user_msg,
+                "composite_desc": built['composite_desc'],
+                "candidate_payload": built['candidate_payload'],
+            },
+        )
+
+    cache_key = ai_match_cache.match_cache_key(model, system_msg, user_msg, candidate_payments or [])
+    cached = ai_match_cache.lookup([cache_key], stats).get(cache_key)
+    if cached is not None:
+        _log("_ai_match_with_openrouter.cache_hit", model=model, returned=len(cached.response), key=cache_key[:12])
         if request is not None:
-            _trace_event(
-                request,
-                "_ai_match_with_openrouter.bad_response",
-                {"model": model, "content_preview": (str(content)[:220] if content is not None else None)},
-            )
-        return None, "AI did not return a JSON array"
+            _trace_event(request, "_ai_match_with_openrouter.cache_hit", {"model": model, "key": cache_key, "returned": len(cached.response)})
+        return cached.response, None
 
-    _log("_ai_match_with_openrouter.ok", model=model, returned=len(parsed))
+    client, err = _openrouter_client()
+    if err:
+        if stats is not None:
+            stats.miss(error=True)
+        if request is not None:
+            _trace_event(request, "_ai_match_with_openrouter.no_client", {"error": err, "model": model})
+        return None, err
+
+    parsed, error, usage, content_preview = _request_ai_match(client, model, system_msg, user_msg, timeout=timeout)
+    if stats is not None:
+        stats.miss(usage, error=error is not None)
+    if error:
+        if request is not None:
+            step = "_ai_match_with_openrouter.bad_response" if usage else "_ai_match_with_openrouter.request_failed"
+            _trace_event(request, step, {"model": model, "error": error, "content_preview": content_preview})
+        return None, error
+
+    ai_match_cache.store(cache_key, model, parsed, [p.id for p in candidate_payments or []], usage)
     if request is not None:
-        _trace_event(request, "_ai_match_with_openrouter.ok", {"model": model, "returned": len(parsed)})
+        _trace_event(request, "_ai_match_with_openrouter.ok", {"model": model, "returned": len(parsed), "usage": usage})
     return parsed, None
 
 
+def _ai_candidates_from_json(ai_json, candidate_payments):
+    """AI answer -> sorted match candidates; ids the model made up are dropped."""
+    by_id = {p.id: p for p in candidate_payments}
+    out_candidates = []
+    for item in ai_json:
+        try:
+            db_id = int(item.get('db_id'))
+        except Exception:
+            continue
+        p = by_id.get(db_id)
+        if not p:
+            continue
+        score = _safe_float(item.get('score'), 0.0)
+        score = max(0.0, min(100.0, score))
+        out_candidates.append({
+            'type': 'ai',
+            'db_payment': _payment_to_rich_dict(p),
+            'score': round(score, 2),
+            'match_type': str(item.get('match_type') or 'ai'),
+            'criteria': str(item.get('criteria') or ''),
+        })
+    out_candidates.sort(key=lambda c: c.get('score', 0), reverse=True)
+    return out_candidates
+
+
 @user_has_role('Admin')
 def match_selection_v2(request):
     """
@@ -1664,6 +1699,7 @@ def match_selection_v2(request):
     # AI result
     ai_candidates = None
     ai_error = None
+    ai_stats = ai_match_cache.AIMatchStats()
     if mode in ('ai', 'both'):
         top_candidates = _ai_prefilter_top100(db_qs, composite, amount_delta)
         _log("match_selection_v2.ai_prefilter", rid=rid, candidates=len(top_candidates))
@@ -1679,30 +1715,11 @@ def match_selection_v2(request):
             composite=composite,
             candidate_payments=top_candidates,
             request=request,
+            stats=ai_stats,
         )
         _trace_event(request, "match_selection_v2.ai_raw_json", {"ai_json": ai_json, "ai_error": ai_error})
         if ai_json is not None:
-            by_id = {p.id: p for p in top_candidates}
-            out_candidates = []
-            for item in ai_json:
-                try:
-                    db_id = int(item.get('db_id'))
-                except Exception:
-                    continue
-                p = by_id.get(db_id)
-                if not p:
-                    continue
-                score = _safe_float(item.get('score'), 0.0)
-                score = max(0.0, min(100.0, score))
-                out_candidates.append({
-                    'type': 'ai',
-                    'db_payment': _payment_to_rich_dict(p),
-                    'score': round(score, 2),
-                    'match_type': str(item.get('match_type') or 'ai'),
-                    'criteria': str(item.get('criteria') or ''),
-                })
-            out_candidates.sort(key=lambda c: c.get('score', 0), reverse=True)
-            ai_candidates = out_candidates
+            ai_candidates = _ai_candidates_from_json(ai_json, top_candidates)
             _log("match_selection_v2.ai_done", rid=rid, returned=len(ai_candidates))
             _trace_event(request, "match_selection_v2.ai_candidates", ai_candidates)
         else:
@@ -1719,6 +1736,8 @@ def match_selection_v2(request):
         'matched_payments': matched_payments,
         'scoring_version': 2,
     }
+    if mode in ('ai', 'both'):
+        payload['ai_stats'] = ai_stats.as_dict()
     _log(
         "match_selection_v2.return",
         rid=rid,
@@ -1731,11 +1750,140 @@ def match_selection_v2(request):
     return JsonResponse(payload)
 
 
-def parse_csv_file(request, csv_file, payment_methods, apartments, payment_types):
-    """Parse CSV file and extract payment data"""
+@user_has_role('Admin')
+def match_selections_batch_v2(request):
+    """
+    POST AI matching for several selections at once:
+    {selections: [{selected_file_ids, selected_file_payments}], ai_model, ai_base_prompt,
+     ai_custom_prompt, amount_delta, max_workers?, timeout?}
+    Cached selections are answered from the AI match cache with one query; the others
+    call OpenRouter concurrently, at most max_workers at a time, each with its own timeout.
+    Returns {results: [{selected_key, matched_payments, cached, error}], ai_stats}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body.decode('utf-8') or '{}')
+    except Exception:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    rid = _request_id(request)
+    _trace_event(request, "match_selections_batch_v2.request_json", data)
+    selections = data.get('selections') or []
+    if not isinstance(selections, list) or not selections:
+        return JsonResponse({'error': 'No selections provided'}, status=400)
+    if len(selections) > AI_MATCH_BATCH_MAX_SELECTIONS:
+        return JsonResponse({'error': f'At most {AI_MATCH_BATCH_MAX_SELECTIONS} selections per batch'}, status=400)
+
+    amount_delta = int(data.get('amount_delta', 100))
+    ai_model = (data.get('ai_model') or 'google/gemini-3-flash-preview').strip()
+    ai_base_prompt = (data.get('ai_base_prompt') or data.get('ai_prompt') or '').strip()
+    ai_custom_prompt = (data.get('ai_custom_prompt') or '').strip()
+    max_workers = max(1, min(int(data.get('max_workers') or AI_MATCH_BATCH_MAX_WORKERS), AI_MATCH_BATCH_MAX_WORKERS))
+    timeout = max(1.0, min(_safe_float(data.get('timeout'), AI_MATCH_TIMEOUT_SECONDS), AI_MATCH_TIMEOUT_SECONDS))
+    stats = ai_match_cache.AIMatchStats()
+
+    # Candidates and prompts are prepared here (DB work stays on the request thread)
+    results = []
+    jobs = []
+    for selection in selections:
+        selected_file_ids = [str(x) for x in (selection.get('selected_file_ids') or []) if str(x).strip()]
+        result = {'selected_key': '+'.join(sorted(selected_file_ids)), 'matched_payments': [], 'cached': False, 'error': None}
+        results.append(result)
+        composite = _build_composite_from_selected_file_payments(selection.get('selected_file_payments') or [])
+        if not selected_file_ids:
+            result['error'] = 'No selected_file_ids provided'
+            continue
+        if not composite.get('date_from') or not composite.get('date_to'):
+            result['error'] = 'Could not determine date range from selected_file_payments'
+            continue
+        db_qs = Payment.objects.filter(
+            payment_date__range=(composite['date_from'] - timedelta(days=30), composite['date_to'] + timedelta(days=30))
+        ).exclude(payment_status='Merged').select_related('payment_type', 'payment_method', 'apartment', 'booking__tenant', 'bank')
+        candidates = _ai_prefilter_top100(db_qs, composite, amount_delta)
+        built = _build_ai_match_messages(ai_base_prompt, ai_custom_prompt, composite, candidates)
+        key = ai_match_cache.match_cache_key(ai_model, built['system_msg'], built['user_msg'], candidates)
+        jobs.append((result, candidates, built, key))
+
+    cached = ai_match_cache.lookup([key for _, _, _, key in jobs], stats)
+    pending = {}
+    for result, candidates, built, key in jobs:
+        entry = cached.get(key)
+        if entry is not None:
+            result['cached'] = True
+            result['matched_payments'] = _ai_candidates_from_json(entry.response, candidates)
+        else:
+            # Identical selections in one batch share a single request
+            pending.setdefault(key, (built, candidates, []))[2].append(result)
+
+    if pending:
+        client, err = _openrouter_client()
+        if err:
+            for _, _, waiting in pending.values():
+                stats.miss(error=True)
+                for result in waiting:
+                    result['error'] = err
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {
+                    pool.submit(_request_ai_match, client, ai_model, built['system_msg'], built['user_msg'], timeout): key
+                    for key, (built, _, _) in pending.items()
+                }
+                for future in as_completed(futures):
+                    key = futures[future]
+                    _, candidates, waiting = pending[key]
+                    parsed, error, usage, _ = future.result()
+                    stats.miss(usage, error=error is not None)
+                    if error:
+                        for result in waiting:
+                            result['error'] = error
+                        continue
+                    ai_match_cache.store(key, ai_model, parsed, [p.id for p in candidates], usage)
+                    for result in waiting:
+                        result['matched_payments'] = _ai_candidates_from_json(parsed, candidates)
+
+    payload = {'results': results, 'ai_stats': stats.as_dict(), 'scoring_version': 2}
+    _log("match_selections_batch_v2.return", rid=rid, selections=len(selections), model_requests=len(pending),
+         max_workers=max_workers, **stats.as_dict())
+    _trace_event(request, "match_selections_batch_v2.response_json", payload)
+    return JsonResponse(payload)
+
+
+CSV_READ_CHUNK_BYTES = 64 * 1024
+CSV_BATCH_ROWS = 1000
+
+
+def iter_csv_lines(csv_file, chunk_size=CSV_READ_CHUNK_BYTES):
+    """Decode an uploaded file incrementally and yield its lines (same splitting as str.splitlines)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if hasattr(csv_file, "chunks"):
+        chunks = csv_file.chunks(chunk_size)
+    else:
+        chunks = iter(lambda: csv_file.read(chunk_size), b"")
+    pending = ""
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        lines = text.splitlines(True)
+        # Keep an unterminated last line for the next chunk
+        pending = lines.pop() if lines and lines[-1].splitlines() == [lines[-1]] else ""
+        for line in lines:
+            yield line.splitlines()[0]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield from pending.splitlines()
+
+
+def iter_csv_payment_batches(request, csv_file, payment_methods, apartments, payment_types, matcher=None, batch_size=CSV_BATCH_ROWS):
+    """
+    Parse a bank statement CSV as a stream and yield lists of up to `batch_size` parsed payments.
+    Only one chunk of the file and one batch of rows are held at a time; `N{id}` booking
+    references are resolved with one query per batch.
+    """
     rid = _request_id(request)
-    file_data = csv_file.read().decode("utf-8")
-    lines = [line for line in file_data.splitlines() if line.strip()]
+    if matcher is None:
+        matcher = PaymentKeywordMatcher(payment_methods, apartments, payment_types)
+    lines = (line for line in iter_csv_lines(csv_file) if line.strip())
 
     # Find header row
     start_index = None
@@ -1747,24 +1895,51 @@ def parse_csv_file(request, csv_file, payment_methods, apartments, payment_types
     if start_index is None:
         messages.error(request, "CSV file does not contain the expected header.")
         _log("parse_csv_file.no_header", rid=rid, filename=getattr(csv_file, "name", None))
-        return []
+        return
 
-    payment_data = []
+    parsed_total = 0
+    batch = []
+    for idx, line in enumerate(lines, start=start_index):
+        batch.append((idx, line))
+        if len(batch) >= batch_size:
+            payments = _parse_csv_batch(request, batch, matcher)
+            parsed_total += len(payments)
+            yield payments
+            batch = []
+    if batch:
+        payments = _parse_csv_batch(request, batch, matcher)
+        parsed_total += len(payments)
+        yield payments
+
+    _log("parse_csv_file.done", rid=rid, parsed=parsed_total)
+
+
+def _parse_csv_batch(request, rows, matcher):
+    """Parse (idx, line) rows, resolving their booking references in one query."""
+    rid = _request_id(request)
+    split_rows = [(idx, _split_payment_csv_line(line)) for idx, line in rows]
+    booking_ids = {
+        bid for bid in (_extract_booking_id_from_notes(parsed[1]) for _, parsed in split_rows if parsed) if bid
+    }
+    bookings_by_id = Booking.objects.select_related('apartment').in_bulk(booking_ids) if booking_ids else {}
 
-    # Process each line
-    for idx, line in enumerate(lines[start_index:], start=start_index):
-        if not line or not line.strip():
-            continue
+    payments = []
+    for idx, parsed in split_rows:
         try:
-            payment = parse_csv_row(line, idx, payment_methods, apartments, payment_types)
+            payment = _parse_split_csv_row(parsed, idx, matcher, bookings_by_id)
             if payment:
-                payment_data.append(payment)
+                payments.append(payment)
         except Exception as e:
             messages.warning(request, f"Error parsing row {idx}: {str(e)}")
             _log("parse_csv_file.row_error", rid=rid, row=idx, error=str(e))
-            continue
+    return payments
 
-    _log("parse_csv_file.done", rid=rid, parsed=len(payment_data))
+
+def parse_csv_file(request, csv_file, payment_methods, apartments, payment_types, matcher=None):
+    """Parse CSV file and extract payment data"""
+    payment_data = []
+    for batch in iter_csv_payment_batches(request, csv_file, payment_methods, apartments, payment_types, matcher=matcher):
+        payment_data.extend(batch)
     return payment_data
 
 
@@ -1773,10 +1948,11 @@ def enrich_file_payments_with_booking_apartments(file_payments, bookings):
     Adds booking-derived apartments and tenants into file payment candidates lists.
     Preserves N-extracted booking (from parse) — only adds from match_booking_context.
     """
+    matcher = BookingContextMatcher(bookings)
     for p in file_payments or []:
         desc = p.get("notes") or ""
         existing_apt = p.get("apartment_candidates") or []
-        booking_apts, booking_tenants = match_booking_context_candidates(desc, bookings)
+        booking_apts, booking_tenants = matcher.candidates(desc)
         p["apartment_candidates"] = _unique_non_empty(list(existing_apt) + list(booking_apts))
 
         existing_tenant = p.get("tenant_candidates") or []
@@ -1795,9 +1971,20 @@ def preprocess_csv_line(line):
     return corrected_line
 
 
-def parse_csv_row(line, idx, payment_methods, apartments, payment_types):
-    """Parse a single CSV row into payment data"""
+def parse_csv_row(line, idx, payment_methods, apartments, payment_types, matcher=None):
+    """Parse a single CSV row into payment data. Pass a PaymentKeywordMatcher built once per file."""
     parsed = _split_payment_csv_line(line)
+    if not parsed:
+        return None
+    if matcher is None:
+        matcher = PaymentKeywordMatcher(payment_methods, apartments, payment_types)
+    bid = _extract_booking_id_from_notes(parsed[1])
+    bookings_by_id = Booking.objects.select_related('apartment').in_bulk([bid]) if bid else {}
+    return _parse_split_csv_row(parsed, idx, matcher, bookings_by_id)
+
+
+def _parse_split_csv_row(parsed, idx, matcher, bookings_by_id):
+    """Build payment data from a `_split_payment_csv_line` result; bookings come from `bookings_by_id`."""
     if not parsed:
         return None
 
@@ -1808,14 +1995,12 @@ def parse_csv_row(line, idx, payment_methods, apartments, payment_types):
     if amount_float == 0:
         return None
 
-    # Determine payment type based on amount + keywords
-    payment_type = match_payment_type(description, amount_float, payment_types)
-
-    # Match payment method
-    payment_method_to_assign = match_payment_method(description, payment_methods)
-
-    # Match apartment (name/keywords only). Booking-based candidates are added later.
-    apartment_candidates = match_apartment_candidates(description, apartments)
+    # Payment type (amount + keywords), payment method and apartment (name/keywords only)
+    # in one pass over the description. Booking-based candidates are added later.
+    classified = matcher.classify(description, amount_float)
+    payment_type = classified['payment_type']
+    payment_method_to_assign = classified['payment_method']
+    apartment_candidates = classified['apartment_candidates']
     apartment_to_assign = apartment_candidates[0] if len(apartment_candidates) == 1 else None
 
     # Extract booking ID from notes (N{number} pattern) and attach booking if found
@@ -1823,7 +2008,7 @@ def parse_csv_row(line, idx, payment_methods, apartments, payment_types):
     booking_display = None
     bid = _extract_booking_id_from_notes(description)
     if bid:
-        booking = Booking.objects.filter(id=bid).select_related('apartment').first()
+        booking = bookings_by_id.get(bid)
         if booking:
             booking_display = _format_booking_display(booking)
             apt_name = getattr(getattr(booking, 'apartment', None), 'name', None) if booking.apartment else None
@@ -1837,9 +2022,7 @@ def parse_csv_row(line, idx, payment_methods, apartments, payment_types):
     extracted_id = extract_id_from_description(description)
 
     # Get bank (PaymentMethod rows with type='Bank')
-    ba_bank = payment_methods.filter(type="Bank", name__iexact="BA").first()
-    if not ba_bank:
-        ba_bank = payment_methods.filter(type="Bank", name__icontains="bank of america").first()
+    ba_bank = matcher.default_bank
 
     parsed_date = parse_payment_date(date_str.strip())
     if not parsed_date:
@@ -1953,7 +2136,7 @@ def match_payment_method(description, payment_methods):
     
     # Special case for mobile deposits
     if 'deposit *mobile' in description_lower:
-        return payment_methods.filter(name="Check").first()
+        return next((pm for pm in payment_methods if pm.name == "Check"), None)
     
     # Check for keyword match
     for payment_method in payment_methods:
@@ -1977,7 +2160,7 @@ def match_payment_type(description, amount_float, payment_types):
     description_lower = (description or "").strip().lower()
     direction = "In" if amount_float > 0 else "Out"
 
-    candidates = payment_types.filter(type=direction)
+    candidates = [pt for pt in payment_types if pt.type == direction]
 
     # 1) direct name match
     for pt in candidates:
@@ -2005,10 +2188,10 @@ def match_payment_type(description, amount_float, payment_types):
         return best
 
     # 3) default
-    other = payment_types.filter(name="Other", type=direction).first()
+    other = next((pt for pt in candidates if pt.name == "Other"), None)
     if other:
         return other
-    return candidates.first()
+    return candidates[0] if candidates else None
 
 
 def _normalize_match_text(s):
@@ -2182,9 +2365,14 @@ def _format_booking_display(booking):
     return f"{start_str} - {end_str}"
 
 
+@lru_cache(maxsize=4096)
+def _payment_key_date(date_str):
+    return datetime.strptime(date_str, '%m/%d/%Y').strftime('%m/%d/%Y').zfill(10)
+
+
 def generate_payment_key(date_str, amount_float, description):
     """Generate unique payment key"""
-    date_formatted = datetime.strptime(date_str, '%m/%d/%Y').strftime('%m/%d/%Y').zfill(10)
+    date_formatted = _payment_key_date(date_str)
     amount_formatted = remove_trailing_zeros_from_str(str(amount_float))
     return date_formatted + amount_formatted + description
 
@@ -2516,27 +2704,19 @@ def serialize_matched_groups(matched_groups):
     return serialized
 
 
-def get_json(db_model):
-    """Convert Django queryset to JSON"""
-    items_json_data = serializers.serialize('json', db_model)
-    data_list = json.loads(items_json_data)
-    items_list = [{'id': item['pk'], **item['fields']} for item in data_list]
-    
-    for item, original_obj in zip(items_list, db_model):
-        if hasattr(original_obj, 'booking') and original_obj.booking:
-            tenant = getattr(original_obj.booking, 'tenant', None)
-            item["tenant_name"] = (getattr(tenant, 'full_name', '') or '') if tenant else ''
-        else:
-            item["tenant_name"] = ""
-        if hasattr(original_obj, 'apartmentName'):
-            item['apartment_name'] = original_obj.apartmentName
-        # Add bank_name
-        if hasattr(original_obj, 'bank') and original_obj.bank:
-            item['bank_name'] = original_obj.bank.name
-        else:
-            item['bank_name'] = None
-    
-    return json.dumps(items_list)
+def _reference_data_etag(request):
+    return reference_etag(get_reference_data())
+
+
+@user_has_role('Admin')
+@condition(etag_func=_reference_data_etag)
+def payment_sync_reference_data(request):
+    """Payment methods, apartments and payment types for the sync page; cached by the browser via ETag."""
+    ref = get_reference_data()
+    body = ref.memo('payment_sync_v2.reference_payload', lambda: json.dumps(reference_payload(ref)))
+    response = HttpResponse(body, content_type='application/json')
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 def _default_payment_type_pk():
@@ -2722,8 +2902,9 @@ def create_new_payment(payment_info):
     )
 
 
+@lru_cache(maxsize=4096)
 def parse_payment_date(date_str):
-    """Parse date string into a date object"""
+    """Parse date string into a date object (cached: statement rows repeat the same dates)"""
     if not date_str:
         return None
     
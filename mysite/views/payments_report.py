@@ -9,6 +9,15 @@ from googleapiclient.discovery import build
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from urllib.parse import urlencode
+from django.db.models import CharField, DecimalField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, TruncMonth
+from dateutil.relativedelta import relativedelta
+from decimal import Decimal
+from itertools import groupby
+import math
+from mysite.report_export import (
+    CHUNK_SIZE, STYLE_HEADER, ExportReport, ExportSheet, StyledRow, start_export_job,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -42,6 +51,15 @@ def paymentReport(request):
         last_day = calendar.monthrange(start_date.year, start_date.month)[1]
         end_date = datetime(start_date.year, start_date.month, last_day)
 
+    if isExcel:
+        # Exports stream from the database in a background job instead of
+        # reusing the in-memory page data below
+        params = {key: value for key, value in request.GET.items() if key not in ('isExcel', 'export_format')}
+        params['start_date'] = start_date.strftime('%B %d %Y')
+        params['end_date'] = end_date.strftime('%B %d %Y')
+        job = start_export_job('payments', request.GET.get('export_format', 'sheets'), params, user=request.user)
+        return HttpResponseRedirect(reverse('report_export_status', args=[job.pk]))
+
     # Query for fetching apartments
     apartments = Apartment.objects.all().order_by(
         'name').values_list('name', flat=True)
@@ -50,108 +68,16 @@ def paymentReport(request):
     payment_types = PaymenType.objects.all()
     payment_methods = PaymentMethod.objects.all()
 
-    payments_within_range = Payment.objects.filter(
-        payment_date__range=[start_date, end_date]
-    )
-
-    if payment_direction_filter:
-        if payment_direction_filter == "In":
-            payments_within_range = payments_within_range.filter(payment_type__type="In")
-        elif payment_direction_filter == "Out":
-            payments_within_range = payments_within_range.filter(payment_type__type="Out")
-
-    if payment_category_filter:
-        payments_within_range = payments_within_range.filter(
-            payment_type__category=payment_category_filter
-        )
-
-    payments_within_range = payments_within_range.select_related(
-        'payment_type', 'payment_method', 'bank'
-    ).order_by(
-        'payment_date'
-    )
-
-    if apartment_filter:
-        if apartment_filter == "None_Booking":
-            payments_within_range = [
-                payment for payment in payments_within_range
-                if not payment.booking
-            ]
-        elif apartment_filter == "None_Apart":
-            payments_within_range = [
-                payment for payment in payments_within_range
-                if (not payment.booking) and (not payment.apartment)
-            ]
-        else: 
-            filtered_payments = []
-            for payment in payments_within_range:
-                logger.info(f"Checking payment {payment.id}:")
-                logger.info(f"- Has booking: {bool(payment.booking)}")
-                if payment.booking and payment.booking.apartment:
-                    logger.info(f"- Booking apartment: {payment.booking.apartment.name}")
-                logger.info(f"- Has direct apartment: {bool(payment.apartment)}")
-                if payment.apartment:
-                    logger.info(f"- Direct apartment: {payment.apartment.name}")
-                
-                if payment.booking and payment.booking.apartment and payment.booking.apartment.name == apartment_filter:
-                    logger.info(f"✓ Payment {payment.id} matched through booking")
-                    filtered_payments.append(payment)
-                elif payment.apartment and payment.apartment.name == apartment_filter:
-                    logger.info(f"✓ Payment {payment.id} matched through direct apartment")
-                    filtered_payments.append(payment)
-                else:
-                    logger.info(f"✗ Payment {payment.id} did not match filter {apartment_filter}")
-                
-            payments_within_range = filtered_payments
-
-    if apartment_type_filter:
-        payments_within_range = [payment for payment in payments_within_range if (
-            (payment.booking and payment.booking.apartment and payment.booking.apartment.apartment_type == apartment_type_filter) or
-            (payment.apartment and payment.apartment.apartment_type ==
-             apartment_type_filter)
-        )]
-
-    if payment_type_filter:
-        payments_within_range = [payment for payment in payments_within_range
-                                 if payment.payment_type.id == int(payment_type_filter)]
-    if payment_method_filter:
-        payments_within_range = [payment for payment in payments_within_range
-                                 if payment.payment_method and payment.payment_method.id == int(payment_method_filter)]
-
-    if payment_status_filter:
-        payments_within_range = [payment for payment in payments_within_range
-                                 if payment.payment_status == payment_status_filter]
-
-    if tenant_search:
-        tenant_search_lower = tenant_search.lower()
-        filtered_payments = []
-        
-        for payment in payments_within_range:
-            # Check tenant name and email (if booking exists)
-            tenant_match = False
-            if payment.booking:
-                if (payment.booking.tenant.full_name and tenant_search_lower in payment.booking.tenant.full_name.lower()) or \
-                   (payment.booking.tenant.email and tenant_search_lower in payment.booking.tenant.email.lower()):
-                    tenant_match = True
-            
-            # Check amount match
-            amount_match = False
-            if payment.amount:
-                try:
-                    # Try exact amount match
-                    search_amount = float(tenant_search)
-                    if float(payment.amount) == search_amount:
-                        amount_match = True
-                except ValueError:
-                    # If not a valid number, try partial string match in amount
-                    if tenant_search in str(payment.amount):
-                        amount_match = True
-            
-            # Include payment if it matches tenant info OR amount
-            if tenant_match or amount_match:
-                filtered_payments.append(payment)
-        
-        payments_within_range = filtered_payments
+    payments_within_range = list(filter_payments(start_date, end_date, {
+        'apartment': apartment_filter,
+        'payment_type': payment_type_filter,
+        'apartment_type': apartment_type_filter,
+        'payment_method': payment_method_filter,
+        'payment_status': payment_status_filter,
+        'payment_category': payment_category_filter,
+        'payment_direction': payment_direction_filter,
+        'tenant_search': tenant_search,
+    }))
 
     in_colors = [
         "text-emerald-300",
@@ -203,12 +129,6 @@ def paymentReport(request):
             current_month = current_month.replace(month=current_month.month+1)
 
     summary = aggregate_summary(payments_within_range)
-    excel_link = ""
-    if isExcel:
-        excel_link = generate_excel(
-            summary, monthly_data, start_date, end_date)
-        if (excel_link):
-            return HttpResponseRedirect(excel_link)
 
     context = {
         'start_date': start_date.strftime('%B %d %Y'),
@@ -233,107 +153,173 @@ def paymentReport(request):
     return render(request, 'payment_report.html', context)
 
 
-def generate_excel(summary, monthly_data, start_date, end_date):
-    try:
-        sheets_service, drive_service = get_google_sheets_service()
-        logger.info("Got GOOGLE Services")
-        # Create a new spreadsheet
-        spreadsheet_body = {
-            'properties': {
-                'title': f"Payment Report: {start_date.strftime('%B %d %Y')} - {end_date.strftime('%B %d %Y')}"
-            },
-            'sheets': [{
-                'properties': {
-                    'title': 'Summary'
-                }
-            }]
-        }
-        spreadsheet = sheets_service.create(body=spreadsheet_body).execute()
-        spreadsheet_id = spreadsheet.get('spreadsheetId')
-        logger.info(f"Spredsheet created {spreadsheet_id}")
+def filter_payments(start_date, end_date, filters):
+    """
+    Payments for the report as a single queryset; every report filter is
+    applied in SQL so the page and the streaming export share one query.
+    """
+    payments = Payment.objects.filter(payment_date__range=[start_date, end_date])
+
+    direction = filters.get('payment_direction')
+    if direction in ('In', 'Out'):
+        payments = payments.filter(payment_type__type=direction)
+
+    if filters.get('payment_category'):
+        payments = payments.filter(payment_type__category=filters['payment_category'])
+
+    apartment_filter = filters.get('apartment')
+    if apartment_filter == "None_Booking":
+        payments = payments.filter(booking__isnull=True)
+    elif apartment_filter == "None_Apart":
+        payments = payments.filter(booking__isnull=True, apartment__isnull=True)
+    elif apartment_filter:
+        payments = payments.filter(
+            Q(booking__apartment__name=apartment_filter) | Q(apartment__name=apartment_filter)
+        )
+
+    apartment_type_filter = filters.get('apartment_type')
+    if apartment_type_filter:
+        payments = payments.filter(
+            Q(booking__apartment__apartment_type=apartment_type_filter) |
+            Q(apartment__apartment_type=apartment_type_filter)
+        )
 
-        # Insert summary data into the Summary sheet
-        insert_summary_data(sheets_service, spreadsheet_id, summary)
+    if filters.get('payment_type'):
+        payments = payments.filter(payment_type_id=int(filters['payment_type']))
+    if filters.get('payment_method'):
+        payments = payments.filter(payment_method_id=int(filters['payment_method']))
+    if filters.get('payment_status'):
+        payments = payments.filter(payment_status=filters['payment_status'])
 
-        # Generate and insert monthly data reports
-        for month_data in monthly_data:
-            insert_monthly_data_report(
-                sheets_service, spreadsheet_id, month_data)
+    tenant_search = filters.get('tenant_search')
+    if tenant_search:
+        # Tenant name/email OR amount (exact when numeric, partial text otherwise)
+        match = Q(booking__tenant__full_name__icontains=tenant_search) | Q(booking__tenant__email__icontains=tenant_search)
+        try:
+            search_amount = float(tenant_search)
+        except ValueError:
+            search_amount = None
+        if search_amount is None:
+            payments = payments.annotate(amount_text=Cast('amount', CharField()))
+            match |= Q(amount_text__contains=tenant_search)
+        elif math.isfinite(search_amount):
+            match |= Q(amount=Decimal(str(search_amount)))
+        payments = payments.filter(match)
+
+    return payments.select_related(
+        'payment_type', 'payment_method', 'bank', 'apartment', 'booking__apartment', 'booking__tenant'
+    ).order_by('payment_date', 'id')
+
+
+def _payment_totals():
+    """Completed/Merged and Pending income and expense sums in one aggregate query."""
+    done = Q(payment_status__in=['Completed', 'Merged'])
+    pending = Q(payment_status='Pending')
+    zero = Value(Decimal('0.00'), output_field=DecimalField())
+    return {
+        'income': Coalesce(Sum('amount', filter=done & Q(payment_type__type='In')), zero),
+        'outcome': Coalesce(Sum('amount', filter=done & Q(payment_type__type='Out')), zero),
+        'pending_income': Coalesce(Sum('amount', filter=pending & Q(payment_type__type='In')), zero),
+        'pending_outcome': Coalesce(Sum('amount', filter=pending & Q(payment_type__type='Out')), zero),
+    }
 
-        share_document_with_user(drive_service, spreadsheet_id)
 
-        # Generate and return the link to the spreadsheet
-        excel_link = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit'
-        return excel_link
-    except Exception as e:
-        logger.info("ERROR: Error while generating Excel Report")
-        return ""
-
-
-def insert_summary_data(sheets_service, spreadsheet_id, summary):
-    summary_values = [
-        ['Completed Revenue:', f"${summary['total_income']}"],
-        ['Pending Revenue:', f"${summary['total_pending_income']}"],
-        ['Expense:', f"-${summary['total_expense']}"],
-        ['Pending Expense:', f"-${summary['total_pending_outcome']}"],
-        ['Profit:', f"${summary['total_profit']}"],
-        ['Pending Profit:', f"${summary['total_pending_profit']}"]
+def _with_profit(totals):
+    totals['profit'] = totals['income'] - totals['outcome']
+    totals['pending_profit'] = totals['pending_income'] - totals['pending_outcome']
+    return totals
+
+
+PAYMENT_EXPORT_COLUMNS = ["Payment Date", "Payment Notes", "Payment Amount", "Payment Type",
+                          "Payment Method", "Bank", "Apartment", "Tenant", "Status"]
+
+
+def payment_export_row(payment):
+    amount = payment.amount
+    if payment.payment_type.type == "Out":
+        amount = -amount  # Make the amount negative for "Out" payments
+    booking = payment.booking
+    return [
+        str(payment.payment_date),
+        payment.notes,
+        f"${amount:.2f}",
+        payment.payment_type.name,
+        payment.payment_method.name if payment.payment_method else '',
+        payment.bank.name if payment.bank else '',
+        booking.apartment.name if booking and booking.apartment else '',
+        booking.tenant.full_name if booking and booking.tenant else '',
+        payment.payment_status,
     ]
-    summary_range = 'Summary!A1:B6'
-    sheets_service.values().update(
-        spreadsheetId=spreadsheet_id, range=summary_range,
-        valueInputOption='USER_ENTERED', body={'values': summary_values}).execute()
-
-    logger.info(f"Created Summary Sheet for {spreadsheet_id}")
-
-
-def insert_monthly_data_report(sheets_service, spreadsheet_id, month_data):
-    month_sheet_title = month_data['month_name'].replace(' ', '_')
-    # Add a new sheet for the month
-    sheets_service.batchUpdate(spreadsheetId=spreadsheet_id, body={
-        'requests': [{'addSheet': {'properties': {'title': month_sheet_title}}}]
-    }).execute()
-
-    # Combine month summary and payment details
-    month_summary_values = [
-        [f"{month_data['month_name']} Report"],
-        ["Completed Revenue:", f"${month_data['income']}"],
-        ["Pending Revenue:", f"${month_data['pending_income']}"],
-        ["Expense:", f"-${month_data['outcome']}"],
-        ["Pending Expense:", f"-${month_data['pending_outcome']}"],
-        ["Profit:", f"${month_data['profit']}"],
-        ["Pending Profit:", f"${month_data['pending_profit']}"],
-        [],  # Empty row for spacing
-        ["Payment Date", "Payment Notes", "Payment Amount", "Payment Type",
-            "Payment Method", "Bank", "Apartment", "Tenant", "Status"]
+
+
+def export_payment_report(params):
+    """
+    Report source for mysite.report_export: a Summary sheet plus one sheet per
+    month. Totals come from aggregate queries; payment rows are streamed once
+    in date order and split into month sheets as the month changes.
+    """
+    start_date = datetime.strptime(params['start_date'], '%B %d %Y')
+    end_date = datetime.strptime(params['end_date'], '%B %d %Y')
+    payments = filter_payments(start_date, end_date, params)
+
+    summary = _with_profit(payments.aggregate(**_payment_totals()))
+    monthly_totals = {
+        (row['month'].year, row['month'].month): _with_profit(row)
+        for row in payments.order_by().annotate(month=TruncMonth('payment_date'))
+        .values('month').annotate(**_payment_totals())
+    }
+    total_rows = payments.count()
+
+    months = []
+    current_month = start_date.replace(day=1)
+    while current_month <= end_date:
+        months.append((current_month.year, current_month.month))
+        current_month += relativedelta(months=1)
+
+    summary_rows = [
+        ['Completed Revenue:', f"${summary['income']}"],
+        ['Pending Revenue:', f"${summary['pending_income']}"],
+        ['Expense:', f"-${summary['outcome']}"],
+        ['Pending Expense:', f"-${summary['pending_outcome']}"],
+        ['Profit:', f"${summary['profit']}"],
+        ['Pending Profit:', f"${summary['pending_profit']}"],
     ]
-    # Append payment details to summary values
-    for payment in month_data['payments']:
-        amount = payment.amount
-        if payment.payment_type.type == "Out":
-            amount = -amount  # Make the amount negative for "Out" payments
-        
-        month_summary_values.append([
-            str(payment.payment_date), 
-            payment.notes, 
-            f"${amount:.2f}",  # Format amount with 2 decimal places
-            payment.payment_type.name,
-            payment.payment_method.name if payment.payment_method else '', 
-            payment.bank.name if payment.bank else '',
-            payment.booking.apartment.name if payment.booking and payment.booking.apartment else '',
-            payment.booking.tenant.full_name if payment.booking else '', 
-            payment.payment_status
-        ])
-
-    # Insert data into the month sheet
-    month_range = f'{month_sheet_title}!A1'
-    sheets_service.values().batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body={'valueInputOption': 'USER_ENTERED', 'data': [
-            {'range': month_range, 'values': month_summary_values}]}
-    ).execute()
-
-    logger.info(f"Created Sheet for {month_sheet_title}")
+
+    def sheets():
+        yield ExportSheet('Summary', iter(summary_rows), columns=2)
+        stream = groupby(
+            payments.iterator(chunk_size=CHUNK_SIZE),
+            key=lambda p: (p.payment_date.year, p.payment_date.month),
+        )
+        pending = next(stream, None)
+        for year, month in months:
+            month_name = f"{calendar.month_name[month]} {year}"
+            totals = monthly_totals.get((year, month)) or _with_profit({
+                'income': 0, 'outcome': 0, 'pending_income': 0, 'pending_outcome': 0,
+            })
+            group = ()
+            if pending is not None and pending[0] == (year, month):
+                group = pending[1]
+
+            def month_rows(group=group, month_name=month_name, totals=totals):
+                yield [f"{month_name} Report"]
+                yield ["Completed Revenue:", f"${totals['income']}"]
+                yield ["Pending Revenue:", f"${totals['pending_income']}"]
+                yield ["Expense:", f"-${totals['outcome']}"]
+                yield ["Pending Expense:", f"-${totals['pending_outcome']}"]
+                yield ["Profit:", f"${totals['profit']}"]
+                yield ["Pending Profit:", f"${totals['pending_profit']}"]
+                yield []
+                yield StyledRow(PAYMENT_EXPORT_COLUMNS, STYLE_HEADER)
+                for payment in group:
+                    yield payment_export_row(payment)
+
+            yield ExportSheet(month_name.replace(' ', '_'), month_rows(), columns=len(PAYMENT_EXPORT_COLUMNS))
+            if group:
+                pending = next(stream, None)
+
+    title = f"Payment Report: {start_date.strftime('%B %d %Y')} - {end_date.strftime('%B %d %Y')}"
+    return ExportReport(title, sheets(), total_rows=total_rows)
 
 
 def get_google_sheets_service():
@@ -0,0 +1,69 @@
+import os
+from datetime import timedelta
+
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+
+from ..decorators import user_has_role
+from ..models import RequestProfile
+from mysite import perf_telemetry
+
+
+@user_has_role('Admin')
+def performance_dashboard(request):
+    """
+    Slowest endpoints (p50/p95/p99) over the selected window, p95 regressions
+    against the previous week, a daily p95 trend per endpoint and stored profiles.
+    POST flushes this worker's pending latency counts first.
+    """
+    if request.method == 'POST':
+        perf_telemetry.latency_aggregator.flush()
+        return redirect(request.get_full_path())
+
+    try:
+        hours = max(1, min(int(request.GET.get('hours', 24)), 24 * 90))
+    except ValueError:
+        hours = 24
+    since = perf_telemetry.period_start(timezone.now() - timedelta(hours=hours))
+    endpoints = perf_telemetry.endpoint_summary(since)
+
+    trend_view = request.GET.get('view', '')
+    trend_method = request.GET.get('method', 'GET')
+    trend = perf_telemetry.daily_p95(trend_view, trend_method) if trend_view else []
+    max_trend = max((p95 or 0 for _, p95, _ in trend), default=0)
+
+    selected_profile = None
+    if request.GET.get('profile'):
+        selected_profile = RequestProfile.objects.filter(pk=request.GET['profile']).first()
+
+    context = {
+        'title': 'Performance',
+        'hours': hours,
+        'endpoints': endpoints[:50],
+        'regressions': perf_telemetry.regressions(),
+        'trend_view': trend_view,
+        'trend_method': trend_method,
+        'trend': [{'day': day, 'p95': p95, 'count': count,
+                   'width': round(100 * (p95 or 0) / max_trend) if max_trend else 0} for day, p95, count in trend],
+        'profiles': RequestProfile.objects.defer('summary')[:30],
+        'selected_profile': selected_profile,
+        'pending': perf_telemetry.latency_aggregator.pending(),
+        'flush_seconds': perf_telemetry.FLUSH_SECONDS,
+        'profile_header': perf_telemetry.PROFILE_HEADER,
+        'profile_flag': perf_telemetry.PROFILE_QUERY_FLAG,
+    }
+    return render(request, 'performance_dashboard.html', context)
+
+
+@user_has_role('Admin')
+def performance_profile_download(request, profile_id):
+    profile = get_object_or_404(RequestProfile, pk=profile_id)
+    if not profile.file_path:
+        raise Http404("Profile has no dump file")
+
+    # Only serve files the profiler wrote
+    file_path = os.path.realpath(profile.file_path)
+    if not file_path.startswith(os.path.realpath(perf_telemetry.PROFILE_DIR) + os.sep) or not os.path.exists(file_path):
+        raise Http404("Profile file not found")
+    return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=os.path.basename(file_path))
@@ -0,0 +1,59 @@
+import os
+
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+
+from ..decorators import user_has_role
+from ..models import ReportExportJob
+from mysite.report_export import EXPORT_DIR, fail_stale_jobs
+
+
+def job_payload(job):
+    return {
+        'id': job.pk,
+        'report': job.report,
+        'export_format': job.export_format,
+        'status': job.status,
+        'rows_written': job.rows_written,
+        'total_rows': job.total_rows,
+        'progress': job.progress_percent,
+        'result_url': job.result_url,
+        'download_url': reverse('report_export_download', args=[job.pk]) if job.file_path else None,
+        'error': job.error,
+    }
+
+
+def visible_jobs(user):
+    """Admins see every export job, other users only the ones they started."""
+    if user.role == 'Admin':
+        return ReportExportJob.objects.all()
+    return ReportExportJob.objects.filter(requested_by=user)
+
+
+@user_has_role('Admin', 'Manager')
+def report_export_status(request, job_id):
+    jobs = visible_jobs(request.user).filter(pk=job_id)
+    fail_stale_jobs(jobs)
+    job = get_object_or_404(jobs)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(job_payload(job))
+
+    context = {
+        'job': job,
+        'title': 'Report Export',
+    }
+    return render(request, 'report_export_status.html', context)
+
+
+@user_has_role('Admin', 'Manager')
+def report_export_download(request, job_id):
+    job = get_object_or_404(visible_jobs(request.user), pk=job_id, status='done')
+    if not job.file_path:
+        raise Http404("Export has no local file")
+
+    # Only serve files the export engine wrote
+    file_path = os.path.realpath(job.file_path)
+    if not file_path.startswith(os.path.realpath(EXPORT_DIR) + os.sep) or not os.path.exists(file_path):
+        raise Http404("Export file not found")
+    return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=os.path.basename(file_path))